@@ -0,0 +1,372 @@
+"""Headless multi-stream FER: N sources, one model, cross-stream dynamic batching.
+
+Each source (webcam index, video file or synthetic generator) gets its own thread with
+its own capture, FaceDetector, TemporalSmoother and per_frame.csv. Face crops from all
+streams go to one DynamicBatcher (src/fer/realtime/batcher.py): the first waiting crop
+opens a batch that closes after --max-batch crops or --max-wait-ms, and the student model
+runs once per batch. The model is loaded once, however many streams there are.
+
+Report (multistream_report.json): per run, aggregate FPS over all streams, batch-size
+histogram, and per stream the FPS plus end-to-end frame latency and inference wait
+(p50/p95/p99, via StageTimer). --sweep repeats the run with the first 1, 2, 4, ... sources
+to show how throughput and latency scale with the stream count.
+
+Video files and synthetic sources are read as fast as possible unless --pace-fps
+simulates live cameras. `--sources synthetic --repeat 8` gives eight synthetic cameras.
+
+Usage (PowerShell):
+  .\.venv\Scripts\python.exe demo\multistream_demo.py --sources webcam:0 webcam:1 --model-ckpt outputs\students\RUN\best.pt
+  .\.venv\Scripts\python.exe demo\multistream_demo.py --sources synthetic --repeat 8 --pace-fps 30 --duration 20 --sweep --always-infer
+  .\.venv\Scripts\python.exe demo\multistream_demo.py --sources recordings\a.mp4 recordings\b.mp4 --detector dnn --max-batch 16 --max-wait-ms 4
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import cv2  # type: ignore
+import numpy as np
+
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+import demo.realtime_demo as rd  # noqa: E402
+from src.fer.inference.labels import CANONICAL_7  # noqa: E402
+from src.fer.realtime.batcher import DynamicBatcher  # noqa: E402
+from src.fer.realtime.smoothing import TemporalSmoother  # noqa: E402
+from src.fer.realtime.sources import open_source  # noqa: E402
+from src.fer.realtime.stage_timer import StageTimer  # noqa: E402
+
+
+def _run_stream(
+    index: int,
+    source: str,
+    *,
+    detector: "rd.FaceDetector",
+    batcher: DynamicBatcher,
+    model_meta: Dict[str, object],
+    params: "rd.Params",
+    args: argparse.Namespace,
+    out_dir: Path,
+    stop: threading.Event,
+    results: Dict[int, Dict[str, object]],
+) -> None:
+    try:
+        cap, input_name = open_source(
+            source,
+            synthetic_frames=int(args.max_frames),
+            synthetic_face=args.synthetic_face,
+            synthetic_seed=index,
+        )
+    except Exception as e:
+        # Malformed specs ('webcam:x', 'synthetic:640') must still leave a result for main().
+        results[index] = {"input": source, "error": repr(e)}
+        return
+    if not cap.isOpened():
+        results[index] = {"input": input_name, "error": f"failed to open source: {source}"}
+        return
+
+    smoother = TemporalSmoother(len(CANONICAL_7), vote_window=params.vote_window)
+    timer = StageTimer(enabled=True, warmup=int(args.warmup_frames))
+    stream_dir = out_dir / f"stream_{index:02d}"
+    stream_dir.mkdir(parents=True, exist_ok=True)
+    frames_csv = stream_dir / "per_frame.csv"
+
+    period = 1.0 / float(args.pace_fps) if args.pace_fps and args.pace_fps > 0 else 0.0
+    frame_index = 0
+    faces_found = 0
+    t_start = time.time()
+    t_next = time.perf_counter()
+    try:
+        with frames_csv.open("w", newline="", encoding="utf-8") as f_frames:
+            w_frames = csv.DictWriter(
+                f_frames,
+                fieldnames=[
+                    "frame_index",
+                    "time_sec",
+                    "manual_label",
+                    "pred_label",
+                    *[f"prob_{name}" for name in CANONICAL_7],
+                    "detector",
+                    "model",
+                    "ckpt",
+                ],
+            )
+            w_frames.writeheader()
+
+            while not stop.is_set():
+                if args.max_frames and frame_index >= int(args.max_frames):
+                    break
+                if period:
+                    # Simulated camera: frames become available every `period` seconds.
+                    delay = t_next - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                    t_next = max(t_next + period, time.perf_counter())
+                timer.start_frame()
+                ok, frame = cap.read()
+                if not ok:
+                    break
+                timer.lap("read")
+                tsec = time.time() - t_start
+
+                face_box = rd._largest_face(detector.detect(frame))
+                timer.lap("detect")
+
+                probs = [0.0] * len(CANONICAL_7)
+                pred_idx: Optional[int] = None
+                if face_box is not None:
+                    faces_found += 1
+                elif args.always_infer:
+                    fh, fw = frame.shape[:2]
+                    side = min(fh, fw) // 2
+                    face_box = ((fw - side) // 2, (fh - side) // 2, side, side)
+
+                if face_box is not None:
+                    crop = rd._crop_with_margin(frame, face_box)
+                    timer.lap("crop")
+                    _logits, probs_arr = batcher.submit(crop).result()
+                    probs = probs_arr.tolist()
+                    timer.lap("infer")
+                    pred_idx = smoother.update(
+                        probs,
+                        ema_alpha=params.ema_alpha,
+                        hysteresis_delta=params.hysteresis_delta,
+                        vote_window=params.vote_window,
+                        vote_min_count=params.vote_min_count,
+                    )
+                    timer.lap("smooth")
+
+                w_frames.writerow(
+                    {
+                        "frame_index": frame_index,
+                        "time_sec": f"{tsec:.6f}",
+                        "manual_label": "",
+                        "pred_label": CANONICAL_7[pred_idx] if pred_idx is not None else "(unstable)",
+                        **{f"prob_{name}": f"{float(probs[i]):.6f}" for i, name in enumerate(CANONICAL_7)},
+                        "detector": args.detector,
+                        "model": model_meta.get("model"),
+                        "ckpt": model_meta.get("ckpt"),
+                    }
+                )
+                timer.lap("log")
+                timer.end_frame()
+                frame_index += 1
+    except Exception as e:
+        results[index] = {"input": input_name, "error": repr(e)}
+        return
+    finally:
+        cap.release()
+
+    summary = timer.summary()
+    stages: Dict[str, Dict[str, float]] = summary["stages"]  # type: ignore[assignment]
+    results[index] = {
+        "input": input_name,
+        "per_frame_csv": str(frames_csv),
+        "frames_total": int(frame_index),
+        "faces_found": int(faces_found),
+        "frames": summary["frames"],
+        "fps": summary["fps"],
+        "latency_ms": {k: stages[k] for k in ("frame", "infer", "detect") if k in stages},
+    }
+
+
+def _stream_counts(n: int, sweep: bool) -> List[int]:
+    if not sweep:
+        return [n]
+    counts = []
+    k = 1
+    while k < n:
+        counts.append(k)
+        k *= 2
+    return counts + [n]
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Multi-stream FER with one shared, dynamically batched model.")
+    ap.add_argument(
+        "--sources",
+        type=str,
+        nargs="+",
+        required=True,
+        help="Sources: 'webcam:N', video file paths, 'synthetic[:WxH]'.",
+    )
+    ap.add_argument("--repeat", type=int, default=1, help="Repeat the source list (e.g. one synthetic source x 8).")
+    ap.add_argument(
+        "--model-ckpt",
+        type=Path,
+        default=None,
+        help="Student checkpoint (.pt) or float-input .onnx. Default: best student under outputs/students/.",
+    )
+    ap.add_argument("--temperature", type=float, default=None)
+    ap.add_argument("--temperature-json", type=Path, default=None)
+    ap.add_argument("--device", type=str, default="auto", choices=["auto", "cpu", "cuda", "dml"])
+    ap.add_argument("--detector", type=str, choices=["yunet", "dnn", "haar"], default="yunet")
+    ap.add_argument("--max-batch", type=int, default=16, help="Largest cross-stream inference batch.")
+    ap.add_argument(
+        "--max-wait-ms",
+        type=float,
+        default=5.0,
+        help="How long the first crop of a batch waits for crops from other streams.",
+    )
+    ap.add_argument("--pace-fps", type=float, default=0.0, help="Pace file/synthetic sources like cameras (0 = unpaced).")
+    ap.add_argument("--max-frames", type=int, default=0, help="Frames per stream (0 = until --duration / source end).")
+    ap.add_argument("--duration", type=float, default=0.0, help="Seconds per run (0 = until --max-frames / source end).")
+    ap.add_argument("--warmup-frames", type=int, default=10, help="Frames per stream excluded from the statistics.")
+    ap.add_argument("--sweep", action="store_true", help="Run with the first 1, 2, 4, ... sources, then all of them.")
+    ap.add_argument("--threads", type=int, default=0, help="Pin OpenCV / torch / onnxruntime CPU threads (0 = defaults).")
+    ap.add_argument("--synthetic-face", type=Path, default=None, help="Face image pasted by synthetic sources.")
+    ap.add_argument(
+        "--always-infer",
+        action="store_true",
+        help="Classify a center crop when no face is detected (keeps every frame in the inference queue).",
+    )
+    ap.add_argument(
+        "--output-dir",
+        type=Path,
+        default=REPO_ROOT / "demo" / "outputs" / ("multistream_" + time.strftime("%Y%m%d_%H%M%S")),
+    )
+    args = ap.parse_args()
+
+    sources = list(args.sources) * max(1, int(args.repeat))
+    if not args.max_frames and not args.duration and any(s.lower().startswith(("webcam", "synthetic")) for s in sources):
+        raise SystemExit("Live/synthetic sources never end: pass --max-frames or --duration.")
+
+    ckpt_path: Optional[Path] = args.model_ckpt or rd._find_best_student_ckpt()
+    if ckpt_path is None:
+        raise SystemExit("No checkpoint provided and no student checkpoints found under outputs/students/.")
+    if not ckpt_path.exists():
+        raise SystemExit(f"Checkpoint not found: {ckpt_path}")
+
+    infer_batch, model_meta = rd._load_student_batch(
+        ckpt_path,
+        temperature=args.temperature,
+        temperature_json=args.temperature_json,
+        prefer_device=str(args.device),
+        threads=int(args.threads),
+    )
+    if int(args.threads) > 0:
+        cv2.setNumThreads(int(args.threads))
+        if "torch" in sys.modules:
+            sys.modules["torch"].set_num_threads(int(args.threads))
+
+    # One detector per stream: OpenCV detectors keep per-call state and are not shared across threads.
+    model_dir = REPO_ROOT / "demo" / "models"
+    detectors = [rd.FaceDetector(args.detector, model_dir=model_dir) for _ in sources]
+    params = rd.Params()
+
+    batcher = DynamicBatcher(infer_batch, max_batch=int(args.max_batch), max_wait_ms=float(args.max_wait_ms)).start()
+    # Warm the model at the largest batch so the first measured frames do not pay for it.
+    warm = np.zeros((int(model_meta["image_size"]), int(model_meta["image_size"]), 3), dtype=np.uint8)
+    infer_batch([warm] * int(args.max_batch))
+
+    out_dir: Path = args.output_dir
+    out_dir.mkdir(parents=True, exist_ok=True)
+    runs: List[Dict[str, object]] = []
+    try:
+        for n in _stream_counts(len(sources), bool(args.sweep)):
+            run_dir = out_dir / f"streams_{n:02d}"
+            stop = threading.Event()
+            results: Dict[int, Dict[str, object]] = {}
+            batcher.reset_stats()
+            threads = [
+                threading.Thread(
+                    target=_run_stream,
+                    args=(i, sources[i]),
+                    kwargs={
+                        "detector": detectors[i],
+                        "batcher": batcher,
+                        "model_meta": model_meta,
+                        "params": params,
+                        "args": args,
+                        "out_dir": run_dir,
+                        "stop": stop,
+                        "results": results,
+                    },
+                    name=f"stream-{i}",
+                    daemon=True,
+                )
+                for i in range(n)
+            ]
+            t0 = time.perf_counter()
+            for th in threads:
+                th.start()
+            if args.duration:
+                deadline = t0 + float(args.duration)
+                while any(th.is_alive() for th in threads) and time.perf_counter() < deadline:
+                    time.sleep(0.05)
+                stop.set()
+            for th in threads:
+                th.join()
+            wall = time.perf_counter() - t0
+
+            streams = [
+                results.get(i, {"input": sources[i], "error": "stream thread exited without a result"}) for i in range(n)
+            ]
+            ok = [s for s in streams if "error" not in s]
+            frames = sum(int(s["frames_total"]) for s in ok)
+            p95 = [s["latency_ms"]["frame"]["p95_ms"] for s in ok if "frame" in s["latency_ms"]]  # type: ignore[index]
+            run = {
+                "streams": n,
+                "wall_sec": round(wall, 3),
+                "frames_total": frames,
+                "aggregate_fps": round(frames / wall, 2) if wall > 0 else 0.0,
+                "worst_stream_p95_ms": max(p95) if p95 else None,
+                "batcher": batcher.stats(),
+                "per_stream": streams,
+            }
+            runs.append(run)
+
+            print(
+                f"{n:2d} stream(s): {run['aggregate_fps']:8.2f} FPS total | mean batch "
+                f"{run['batcher'].get('mean_batch', 0)} | worst p95 frame latency {run['worst_stream_p95_ms']} ms"
+            )
+            for i, s in enumerate(streams):
+                if "error" in s:
+                    print(f"    [{i}] {s['input']}: ERROR {s['error']}")
+                    continue
+                lat = s["latency_ms"]
+                fr = lat.get("frame", {})  # type: ignore[union-attr]
+                inf = lat.get("infer", {})  # type: ignore[union-attr]
+                print(
+                    f"    [{i}] {s['input']}: {s['fps']} FPS | frame p50 {fr.get('p50_ms')} / p95 {fr.get('p95_ms')} ms"
+                    f" | infer wait p50 {inf.get('p50_ms')} / p95 {inf.get('p95_ms')} ms"
+                )
+    finally:
+        batcher.close()
+
+    report = {
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "sources": sources,
+        "detector": args.detector,
+        "model": model_meta,
+        "max_batch": int(args.max_batch),
+        "max_wait_ms": float(args.max_wait_ms),
+        "pace_fps": float(args.pace_fps),
+        "threads": int(args.threads),
+        "cpu_count": os.cpu_count(),
+        "params": {
+            "ema_alpha": params.ema_alpha,
+            "hysteresis_delta": params.hysteresis_delta,
+            "vote_window": params.vote_window,
+            "vote_min_count": params.vote_min_count,
+        },
+        "runs": runs,
+    }
+    report_path = out_dir / "multistream_report.json"
+    report_path.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"\nWrote: {report_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
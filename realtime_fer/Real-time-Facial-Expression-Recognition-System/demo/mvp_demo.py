@@ -7,7 +7,7 @@ import sys
 import time
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Optional
+from typing import TYPE_CHECKING, Optional
 
 import cv2  # type: ignore
 
@@ -29,16 +29,16 @@ try:
 except Exception:
     pass
 
-from src.fer.nl.llm_openai import try_generate_reply_openai  # noqa: E402
-from src.fer.nl.llm_azure_openai import try_generate_reply_azure_openai  # noqa: E402
-from src.fer.nl.tts_azure import speak_azure  # noqa: E402
-from src.fer.nl.stt_azure import AzureContinuousSTT, listen_once_azure  # noqa: E402
-from src.fer.nl.prosody import ProsodyResult, analyze_wav, record_mic_to_wav  # noqa: E402
 from src.fer.nl.offline_dialogue import (  # noqa: E402
     OfflinePersona,
     generate_offline_reply,
 )
 
+# NL backends are imported in main() only when selected (--llm/--tts/--stt/--prosody).
+if TYPE_CHECKING:
+    from src.fer.nl.prosody import ProsodyResult
+    from src.fer.nl.stt_azure import AzureContinuousSTT
+
 
 @dataclass(frozen=True)
 class Persona:
@@ -184,6 +184,12 @@ def main() -> int:
         / "mobilenetv3_large_100_img224_seed1337_CE_20251223_225031"
         / "best.pt",
     )
+    ap.add_argument(
+        "--infer-url",
+        type=str,
+        default=None,
+        help="Use a running scripts/serve_inference.py (e.g. http://127.0.0.1:8765) instead of loading --model-ckpt.",
+    )
     ap.add_argument(
         "--persona",
         type=str,
@@ -267,11 +273,22 @@ def main() -> int:
 
     persona = _pick_persona(args.persona)
 
-    if not args.model_ckpt.exists():
+    if not args.infer_url and not args.model_ckpt.exists():
         raise SystemExit(f"Checkpoint not found: {args.model_ckpt}")
 
     speak_enabled = bool(args.speak) and (not bool(args.no_speak))
 
+    if str(args.llm) == "openai":
+        from src.fer.nl.llm_openai import try_generate_reply_openai
+    elif str(args.llm) == "azure-openai":
+        from src.fer.nl.llm_azure_openai import try_generate_reply_azure_openai
+    if str(args.tts) == "azure":
+        from src.fer.nl.tts_azure import speak_azure
+    if str(args.stt) == "azure":
+        from src.fer.nl.stt_azure import AzureContinuousSTT, listen_once_azure
+    if str(args.prosody) != "off":
+        from src.fer.nl.prosody import analyze_wav, record_mic_to_wav
+
     prosody: Optional[ProsodyResult] = None
     prosody_ms: Optional[float] = None
     prosody_record_ms: Optional[float] = None
@@ -300,7 +317,12 @@ def main() -> int:
     log_path = args.log_path or (REPO_ROOT / "outputs" / "sessions" / f"mvp_{stamp}.jsonl")
     logger: Optional[SessionLogger] = SessionLogger(log_path) if log_enabled else None
 
-    infer, _meta = rd._load_student_from_checkpoint(args.model_ckpt, prefer_device=str(args.device))
+    if args.infer_url:
+        from src.fer.inference.service import InferenceClient
+
+        infer = InferenceClient(str(args.infer_url)).infer
+    else:
+        infer, _meta = rd._load_student_from_checkpoint(args.model_ckpt, prefer_device=str(args.device))
 
     detector = rd.FaceDetector(args.detector, model_dir=REPO_ROOT / "demo" / "models")
 
@@ -316,9 +338,7 @@ def main() -> int:
 
     params = rd.Params()
 
-    ema_probs: Optional[list[float]] = None
-    hyster_idx: Optional[int] = None
-    votes = rd.deque(maxlen=params.vote_window)
+    smoother = rd.TemporalSmoother(len(rd.CANONICAL_7), vote_window=params.vote_window)
 
     last_emotion = "neutral"
     last_conf = 0.0
@@ -580,21 +600,17 @@ def main() -> int:
             crop = rd._crop_with_margin(frame, face_box)
             _logits, probs = infer(crop)
 
-            if ema_probs is None:
-                ema_probs = list(probs)
-            else:
-                a = float(params.ema_alpha)
-                ema_probs = [a * e + (1.0 - a) * p for e, p in zip(ema_probs, probs)]
-
-            hyster_idx = rd._apply_hysteresis(ema_probs, hyster_idx, params.hysteresis_delta)
-
-            votes = rd.deque(votes, maxlen=params.vote_window)
-            if hyster_idx is not None:
-                votes.append(int(hyster_idx))
-            pred_idx = rd._vote_smooth(votes, window=params.vote_window, min_count=params.vote_min_count)
+            pred_idx = smoother.update(
+                probs,
+                ema_alpha=params.ema_alpha,
+                hysteresis_delta=params.hysteresis_delta,
+                vote_window=params.vote_window,
+                vote_min_count=params.vote_min_count,
+            )
 
         if pred_idx is not None:
             last_emotion = rd.CANONICAL_7[pred_idx]
+            ema_probs = smoother.ema_probs()
             if ema_probs is not None:
                 last_conf = float(max(ema_probs))
             else:
@@ -6,7 +6,7 @@ import json
 import os
 import sys
 import time
-from collections import Counter, deque
+from collections import Counter
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Deque, Dict, List, Optional, Tuple
@@ -20,7 +20,12 @@ DEFAULT_RN18_RUN_DIR = (
 )
 sys.path.insert(0, str(REPO_ROOT))
 
-from src.fer.data.manifest_dataset import CANONICAL_7  # noqa: E402
+from src.fer.inference.labels import CANONICAL_7  # noqa: E402
+from src.fer.realtime.change_gate import ChangeGatedInfer  # noqa: E402
+from src.fer.realtime.smoothing import TemporalSmoother  # noqa: E402
+from src.fer.realtime.sources import open_source  # noqa: E402
+from src.fer.realtime.stage_timer import StageTimer  # noqa: E402
+from src.fer.utils.checkpoint_io import load_checkpoint_args, load_model_state  # noqa: E402
 
 
 @dataclass
@@ -122,8 +127,8 @@ def _load_teacher_from_checkpoint(ckpt_path: Path, *, prefer_device: str = "cuda
     _sys.modules[str(spec.name)] = mod
     spec.loader.exec_module(mod)  # type: ignore[attr-defined]
 
-    ckpt = torch.load(str(ckpt_path), map_location="cpu", weights_only=False)
-    ckpt_args = ckpt.get("args") or {}
+    # Sidecar args + inference-only weights (falls back to the full checkpoint for legacy files).
+    ckpt_args = load_checkpoint_args(ckpt_path)
 
     model_name = str(ckpt_args.get("model", "resnet18"))
     embed_dim = int(ckpt_args.get("embed_dim", 512))
@@ -138,7 +143,7 @@ def _load_teacher_from_checkpoint(ckpt_path: Path, *, prefer_device: str = "cuda
         arc_m=float(ckpt_args.get("arcface_m", 0.35)),
         pretrained=False,
     )
-    model.load_state_dict(ckpt.get("model", {}), strict=True)
+    model.load_state_dict(load_model_state(ckpt_path), strict=True)
     model.eval()
 
     device_info = mod.get_best_device(prefer=str(prefer_device))
@@ -147,17 +152,10 @@ def _load_teacher_from_checkpoint(ckpt_path: Path, *, prefer_device: str = "cuda
 
     # Build eval transform aligned to training.
     from PIL import Image
-    from torchvision import transforms as T
-
-    resize = int(round(image_size * 1.15))
-    tfm = T.Compose(
-        [
-            T.Resize((resize, resize)),
-            T.CenterCrop((image_size, image_size)),
-            T.ToTensor(),
-            T.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
-        ]
-    )
+
+    from src.fer.inference.transforms import build_eval_transform
+
+    tfm = build_eval_transform(image_size=image_size, use_clahe=False)
 
     def infer(face_bgr) -> Tuple[List[float], List[float]]:
         # Returns (logits, probs)
@@ -226,6 +224,31 @@ def _find_best_student_ckpt() -> Optional[Path]:
     return best[2]
 
 
+def _resolve_student_temperature(
+    *, temperature: Optional[float], temperature_json: Optional[Path], run_dirs: List[Path]
+) -> float:
+    # Explicit value > explicit JSON > first run folder calibration.json > 1.0.
+    t: Optional[float] = None
+    if temperature is not None:
+        t = float(temperature)
+    else:
+        cand = None
+        if temperature_json is not None:
+            cand = temperature_json
+        else:
+            for run_dir in run_dirs:
+                run_cal = run_dir / "calibration.json"
+                if run_cal.exists():
+                    cand = run_cal
+                    break
+        if cand is not None:
+            t = _read_temperature_from_json(cand)
+
+    if t is None:
+        t = 1.0
+    return float(max(0.5, min(10.0, t)))
+
+
 def _load_student_from_checkpoint(
     ckpt_path: Path,
     *,
@@ -237,37 +260,16 @@ def _load_student_from_checkpoint(
 
     from src.fer.utils.device import get_best_device
 
-    try:
-        ckpt = torch.load(str(ckpt_path), map_location="cpu", weights_only=False)
-    except TypeError:
-        ckpt = torch.load(str(ckpt_path), map_location="cpu")
-
-    ckpt_args = ckpt.get("args") or {}
+    ckpt_args = load_checkpoint_args(ckpt_path)
     model_name = str(ckpt_args.get("model", "mobilenetv3_large_100"))
     image_size = int(ckpt_args.get("image_size", 224))
     use_clahe = bool(ckpt_args.get("use_clahe", False))
     clahe_clip = float(ckpt_args.get("clahe_clip", 2.0))
     clahe_tile = int(ckpt_args.get("clahe_tile", 8))
 
-    # Determine temperature scaling.
-    t: Optional[float] = None
-    if temperature is not None:
-        t = float(temperature)
-    else:
-        cand = None
-        if temperature_json is not None:
-            cand = temperature_json
-        else:
-            # Try run folder calibration.json
-            run_cal = ckpt_path.parent / "calibration.json"
-            if run_cal.exists():
-                cand = run_cal
-        if cand is not None:
-            t = _read_temperature_from_json(cand)
-
-    if t is None:
-        t = 1.0
-    t = float(max(0.5, min(10.0, t)))
+    t = _resolve_student_temperature(
+        temperature=temperature, temperature_json=temperature_json, run_dirs=[ckpt_path.parent]
+    )
 
     # Build student model.
     try:
@@ -278,24 +280,22 @@ def _load_student_from_checkpoint(
     device_info = get_best_device(str(prefer_device))
     device = device_info.device
     student = timm.create_model(model_name, pretrained=False, num_classes=len(CANONICAL_7))
-    student.load_state_dict(ckpt.get("model", {}), strict=True)
+    student.load_state_dict(load_model_state(ckpt_path), strict=True)
     student.eval()
     student = student.to(device)
 
     # Keep transforms aligned to training (teacher transforms).
-    import importlib
+    from PIL import Image
+
+    from src.fer.inference.transforms import build_eval_transform
 
-    train_teacher = importlib.import_module("scripts.train_teacher")
-    val_tf = train_teacher.build_transforms(
+    val_tf = build_eval_transform(
         image_size=image_size,
-        train=False,
         use_clahe=use_clahe,
         clahe_clip=clahe_clip,
         clahe_tile=clahe_tile,
     )
 
-    from PIL import Image
-
     def infer(face_bgr) -> Tuple[List[float], List[float]]:
         rgb = cv2.cvtColor(face_bgr, cv2.COLOR_BGR2RGB)
         img = Image.fromarray(rgb)
@@ -319,6 +319,226 @@ def _load_student_from_checkpoint(
     return infer, meta
 
 
+def _open_student_onnx(
+    onnx_path: Path,
+    *,
+    temperature: Optional[float] = None,
+    temperature_json: Optional[Path] = None,
+    threads: int = 0,
+):
+    """onnxruntime CPU session + preprocessing/temperature settings for a student ONNX."""
+    try:
+        import onnxruntime as ort  # type: ignore
+    except Exception as e:
+        raise RuntimeError("onnxruntime is required to run ONNX students.") from e
+
+    # <stem>_onnx_export_meta.json written next to the model by the export/quantize scripts.
+    meta_path = onnx_path.with_name(onnx_path.stem + "_onnx_export_meta.json")
+    export_meta: Dict[str, object] = {}
+    if meta_path.exists():
+        export_meta = json.loads(meta_path.read_text(encoding="utf-8"))
+    ckpt_str = export_meta.get("checkpoint")
+    ckpt_path = Path(str(ckpt_str)) if ckpt_str else None
+    ckpt_args = load_checkpoint_args(ckpt_path) if ckpt_path is not None and ckpt_path.exists() else {}
+    quant = export_meta.get("quantization") if isinstance(export_meta.get("quantization"), dict) else {}
+
+    run_dirs = [onnx_path.parent] + ([ckpt_path.parent] if ckpt_path is not None else [])
+    cfg: Dict[str, object] = {
+        "model": str(export_meta.get("model") or ckpt_args.get("model") or onnx_path.stem),
+        "image_size": int(export_meta.get("image_size") or ckpt_args.get("image_size") or 224),
+        "use_clahe": bool(ckpt_args.get("use_clahe", quant.get("use_clahe", False))),
+        "clahe_clip": float(ckpt_args.get("clahe_clip", 2.0)),
+        "clahe_tile": int(ckpt_args.get("clahe_tile", 8)),
+        "temperature": _resolve_student_temperature(
+            temperature=temperature, temperature_json=temperature_json, run_dirs=run_dirs
+        ),
+        "quantized": bool(quant),
+        "export_meta": export_meta,
+    }
+
+    so = ort.SessionOptions()
+    if int(threads) > 0:
+        so.intra_op_num_threads = int(threads)
+    sess = ort.InferenceSession(str(onnx_path), sess_options=so, providers=["CPUExecutionProvider"])
+    return sess, cfg
+
+
+def _load_student_from_onnx(
+    onnx_path: Path,
+    *,
+    temperature: Optional[float] = None,
+    temperature_json: Optional[Path] = None,
+    threads: int = 0,
+):
+    """Student ONNX (fp32 or INT8 from scripts/quantize_student_onnx.py) on onnxruntime (CPU)."""
+    import numpy as np
+
+    sess, cfg = _open_student_onnx(
+        onnx_path, temperature=temperature, temperature_json=temperature_json, threads=threads
+    )
+    export_meta: Dict[str, object] = cfg["export_meta"]  # type: ignore[assignment]
+    model_name = str(cfg["model"])
+    image_size = int(cfg["image_size"])
+    use_clahe = bool(cfg["use_clahe"])
+    clahe_clip = float(cfg["clahe_clip"])
+    clahe_tile = int(cfg["clahe_tile"])
+    t = float(cfg["temperature"])
+    input_name = sess.get_inputs()[0].name
+    output_names = [o.name for o in sess.get_outputs()]
+
+    if sess.get_inputs()[0].type == "tensor(uint8)":
+        # export_student_onnx.py --bake-preprocess: the graph takes the BGR crop as-is.
+        probs_idx = output_names.index("probs") if "probs" in output_names else None
+        if probs_idx is not None and export_meta.get("temperature") is not None:
+            t = float(export_meta["temperature"])  # baked into the graph's softmax
+
+        def infer_baked(face_bgr) -> Tuple[List[float], List[float]]:
+            outs = sess.run(None, {input_name: np.ascontiguousarray(face_bgr, dtype=np.uint8)[None]})
+            logits = outs[0][0].astype(np.float64)
+            if probs_idx is not None:
+                return logits.tolist(), outs[probs_idx][0].astype(np.float64).tolist()
+            z = logits / float(t)
+            e = np.exp(z - z.max())
+            return logits.tolist(), (e / e.sum()).tolist()
+
+        meta = {
+            "ckpt": str(onnx_path),
+            "model": model_name,
+            "image_size": image_size,
+            "device": "onnxruntime:cpu (baked preprocess)",
+            "temperature": float(t),
+            "use_clahe": False,
+        }
+        return infer_baked, meta
+
+    # numpy/PIL preprocessing: the ONNX path never imports torch.
+    from src.fer.inference.transforms import preprocess_bgr
+
+    def infer(face_bgr) -> Tuple[List[float], List[float]]:
+        x = preprocess_bgr(
+            face_bgr, image_size=image_size, use_clahe=use_clahe, clahe_clip=clahe_clip, clahe_tile=clahe_tile
+        )
+        logits = sess.run(None, {input_name: x})[0][0].astype(np.float64)
+        z = logits / float(t)
+        e = np.exp(z - z.max())
+        probs = e / e.sum()
+        return logits.tolist(), probs.tolist()
+
+    meta = {
+        "ckpt": str(onnx_path),
+        "model": model_name,
+        "image_size": image_size,
+        "device": "onnxruntime:cpu" + (" (int8)" if cfg["quantized"] else ""),
+        "temperature": float(t),
+        "use_clahe": bool(use_clahe),
+    }
+    return infer, meta
+
+
+def _load_student_batch(
+    ckpt_path: Path,
+    *,
+    temperature: Optional[float] = None,
+    temperature_json: Optional[Path] = None,
+    prefer_device: str = "auto",
+    threads: int = 0,
+):
+    """Batched student (.pt on torch or float-input .onnx): infer_batch(crops) -> (logits, probs).
+
+    Crops are preprocessed with preprocess_bgr (identical to the eval transform) and stacked;
+    both outputs are float arrays of shape [len(crops), 7]. Used by the offline/multi-stream
+    runners, where faces from many frames are classified in one forward pass.
+    """
+    import numpy as np
+
+    from src.fer.inference.transforms import preprocess_bgr
+
+    if ckpt_path.suffix.lower() == ".onnx":
+        sess, cfg = _open_student_onnx(
+            ckpt_path, temperature=temperature, temperature_json=temperature_json, threads=threads
+        )
+        inp = sess.get_inputs()[0]
+        if inp.type != "tensor(float)":
+            raise RuntimeError(
+                f"{ckpt_path.name} takes raw uint8 crops (--bake-preprocess); batching needs a float-input export."
+            )
+        # Exports without --dynamic-batch have a fixed batch dim of 1: run them crop by crop.
+        fixed_batch = isinstance(inp.shape[0], int)
+
+        def run(x):
+            if not fixed_batch:
+                return sess.run(None, {inp.name: x})[0]
+            return np.concatenate([sess.run(None, {inp.name: x[i : i + 1]})[0] for i in range(x.shape[0])])
+
+        device = "onnxruntime:cpu" + (" (int8)" if cfg["quantized"] else "")
+
+    else:
+        import torch
+
+        from src.fer.utils.device import get_best_device
+
+        try:
+            import timm  # type: ignore
+        except Exception as e:
+            raise RuntimeError("timm is required to run student checkpoints.") from e
+
+        ckpt_args = load_checkpoint_args(ckpt_path)
+        cfg = {
+            "model": str(ckpt_args.get("model", "mobilenetv3_large_100")),
+            "image_size": int(ckpt_args.get("image_size", 224)),
+            "use_clahe": bool(ckpt_args.get("use_clahe", False)),
+            "clahe_clip": float(ckpt_args.get("clahe_clip", 2.0)),
+            "clahe_tile": int(ckpt_args.get("clahe_tile", 8)),
+            "temperature": _resolve_student_temperature(
+                temperature=temperature, temperature_json=temperature_json, run_dirs=[ckpt_path.parent]
+            ),
+        }
+        torch_device = get_best_device(str(prefer_device)).device
+        student = timm.create_model(str(cfg["model"]), pretrained=False, num_classes=len(CANONICAL_7))
+        student.load_state_dict(load_model_state(ckpt_path), strict=True)
+        student.eval()
+        student = student.to(torch_device)
+
+        def run(x):
+            with torch.no_grad():
+                return student(torch.from_numpy(x).to(torch_device)).float().cpu().numpy()
+
+        device = str(torch_device)
+
+    image_size = int(cfg["image_size"])
+    use_clahe = bool(cfg["use_clahe"])
+    clahe_clip = float(cfg["clahe_clip"])
+    clahe_tile = int(cfg["clahe_tile"])
+    t = float(cfg["temperature"])
+
+    def infer_batch(crops: List) -> Tuple[np.ndarray, np.ndarray]:
+        if not crops:
+            empty = np.zeros((0, len(CANONICAL_7)), dtype=np.float32)
+            return empty, empty.copy()
+        x = np.concatenate(
+            [
+                preprocess_bgr(
+                    c, image_size=image_size, use_clahe=use_clahe, clahe_clip=clahe_clip, clahe_tile=clahe_tile
+                )
+                for c in crops
+            ]
+        )
+        logits = np.asarray(run(x), dtype=np.float32)
+        z = logits.astype(np.float64) / float(t)
+        e = np.exp(z - z.max(axis=1, keepdims=True))
+        return logits, e / e.sum(axis=1, keepdims=True)
+
+    meta = {
+        "ckpt": str(ckpt_path),
+        "model": str(cfg["model"]),
+        "image_size": image_size,
+        "device": device,
+        "temperature": t,
+        "use_clahe": use_clahe,
+    }
+    return infer_batch, meta
+
+
 class FaceDetector:
     def __init__(self, method: str, *, model_dir: Path) -> None:
         self.method = method
@@ -401,23 +621,42 @@ class FaceDetector:
             blob = cv2.dnn.blobFromImage(frame_bgr, 1.0, (300, 300), (104.0, 177.0, 123.0))
             self._dnn.setInput(blob)
             det = self._dnn.forward()
-            out: List[Tuple[int, int, int, int]] = []
-            for i in range(det.shape[2]):
-                conf = float(det[0, 0, i, 2])
-                if conf < 0.5:
-                    continue
-                x1 = int(det[0, 0, i, 3] * w)
-                y1 = int(det[0, 0, i, 4] * h)
-                x2 = int(det[0, 0, i, 5] * w)
-                y2 = int(det[0, 0, i, 6] * h)
-                out.append((x1, y1, max(0, x2 - x1), max(0, y2 - y1)))
-            return out
+            return self._ssd_boxes(det[0, 0], w, h)
 
         assert self._haar is not None
         gray = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2GRAY)
         faces = self._haar.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(60, 60))
         return [(int(x), int(y), int(w), int(h)) for (x, y, w, h) in faces]
 
+    def detect_batch(self, frames_bgr: List) -> List[List[Tuple[int, int, int, int]]]:
+        """detect() for several frames; the DNN detector runs them as one blobFromImages batch."""
+        if self.method != "dnn" or len(frames_bgr) <= 1:
+            return [self.detect(f) for f in frames_bgr]
+        assert self._dnn is not None
+        blob = cv2.dnn.blobFromImages(frames_bgr, 1.0, (300, 300), (104.0, 177.0, 123.0))
+        self._dnn.setInput(blob)
+        # SSD DetectionOutput: [1, 1, K, 7] rows of (image_id, label, conf, x1, y1, x2, y2).
+        rows = self._dnn.forward()[0, 0]
+        out: List[List[Tuple[int, int, int, int]]] = []
+        for i, f in enumerate(frames_bgr):
+            h, w = f.shape[:2]
+            out.append(self._ssd_boxes(rows[rows[:, 0] == i], w, h))
+        return out
+
+    @staticmethod
+    def _ssd_boxes(rows, w: int, h: int) -> List[Tuple[int, int, int, int]]:
+        out: List[Tuple[int, int, int, int]] = []
+        for r in rows:
+            conf = float(r[2])
+            if conf < 0.5:
+                continue
+            x1 = int(r[3] * w)
+            y1 = int(r[4] * h)
+            x2 = int(r[5] * w)
+            y2 = int(r[6] * h)
+            out.append((x1, y1, max(0, x2 - x1), max(0, y2 - y1)))
+        return out
+
 
 def _largest_face(faces: List[Tuple[int, int, int, int]]) -> Optional[Tuple[int, int, int, int]]:
     if not faces:
@@ -465,6 +704,9 @@ def _draw_label_bar(frame_bgr, *, manual_label_idx: Optional[int]) -> Tuple[int,
     return (0, y1, w, bar_h)
 
 
+# Reference (list/Counter) implementations of the smoothing steps. The demo loops use
+# TemporalSmoother; these are kept to verify it bit-exactly on recorded sessions
+# (tools/diagnostics/verify_temporal_smoother.py).
 def _apply_hysteresis(
     probs: List[float], current_idx: Optional[int], delta: float
 ) -> Optional[int]:
@@ -594,7 +836,7 @@ def main() -> int:
         "--source",
         type=str,
         default="webcam",
-        help="'webcam' or a video file path.",
+        help="'webcam', a video file path, or 'synthetic[:WxH]' (generated frames with one moving face).",
     )
     ap.add_argument("--camera-index", type=int, default=0)
     ap.add_argument(
@@ -609,7 +851,8 @@ def main() -> int:
         type=Path,
         default=None,
         help=(
-            "Model checkpoint (.pt) for inference. "
+            "Model checkpoint (.pt) for inference; with --model-kind student also a .onnx "
+            "(fp32 or INT8 from scripts/quantize_student_onnx.py, run on onnxruntime CPU). "
             "If omitted: uses the default teacher, or auto-picks best student from outputs/students/ based on macro-F1."
         ),
     )
@@ -642,29 +885,90 @@ def main() -> int:
         help="Output directory for CSV artifacts.",
     )
 
+    ap.add_argument(
+        "--headless",
+        action="store_true",
+        help="No window, overlays or key handling; frames are processed as fast as they can be read.",
+    )
+    ap.add_argument(
+        "--benchmark",
+        action="store_true",
+        help="Time read/detect/crop/infer/smooth per frame and write benchmark.json (FPS, p50/p95/p99).",
+    )
+    ap.add_argument("--max-frames", type=int, default=0, help="Stop after N frames (0 = until the source ends).")
+    ap.add_argument("--warmup-frames", type=int, default=10, help="Benchmark: frames excluded from the statistics.")
+    ap.add_argument(
+        "--threads",
+        type=int,
+        default=0,
+        help="Pin OpenCV / torch / onnxruntime CPU threads (0 = library defaults).",
+    )
+    ap.add_argument("--synthetic-face", type=Path, default=None, help="Face image pasted by --source synthetic.")
+    ap.add_argument(
+        "--infer-url",
+        type=str,
+        default=None,
+        help="Use a running scripts/serve_inference.py (e.g. http://127.0.0.1:8765) instead of loading a model.",
+    )
+    ap.add_argument(
+        "--always-infer",
+        action="store_true",
+        help="Classify a center crop when no face is detected (keeps inference in every benchmark frame).",
+    )
+    ap.add_argument(
+        "--skip-threshold",
+        type=float,
+        default=0.0,
+        help=(
+            "Reuse the last prediction while the face crop's 16x16 grayscale thumbnail differs from the "
+            "last inferred one by less than this mean fraction (e.g. 0.02; 0 = infer every frame)."
+        ),
+    )
+    ap.add_argument(
+        "--skip-max-stale",
+        type=int,
+        default=5,
+        help="With --skip-threshold: infer at least every N+1 frames, even without change.",
+    )
+
     args = ap.parse_args()
+    headless = bool(args.headless)
 
     out_dir: Path = args.output_dir
     out_dir.mkdir(parents=True, exist_ok=True)
 
     model_kind = str(args.model_kind)
     ckpt_path: Optional[Path] = args.model_ckpt
-    if ckpt_path is None:
+    if ckpt_path is None and not args.infer_url:
         if model_kind == "teacher":
             ckpt_path = DEFAULT_RN18_RUN_DIR / "best.pt"
         else:
             ckpt_path = _find_best_student_ckpt()
 
-    if ckpt_path is None:
-        raise SystemExit("No checkpoint provided and no student checkpoints found under outputs/students/.")
-    if not ckpt_path.exists():
-        raise SystemExit(f"Checkpoint not found: {ckpt_path}")
+    if not args.infer_url:
+        if ckpt_path is None:
+            raise SystemExit("No checkpoint provided and no student checkpoints found under outputs/students/.")
+        if not ckpt_path.exists():
+            raise SystemExit(f"Checkpoint not found: {ckpt_path}")
 
     prefer_device = str(args.device)
-    if model_kind == "teacher":
+    if args.infer_url:
+        # Model runs in scripts/serve_inference.py; --model-ckpt/--model-kind/--device are the server's.
+        from src.fer.inference.service import InferenceClient
+
+        client = InferenceClient(str(args.infer_url))
+        infer, model_meta = client.infer, client.meta()
+    elif model_kind == "teacher":
         # Default teacher preference is CUDA for responsiveness; override with --device when needed.
         teacher_prefer = prefer_device if prefer_device != "auto" else "cuda"
         infer, model_meta = _load_teacher_from_checkpoint(ckpt_path, prefer_device=teacher_prefer)
+    elif ckpt_path.suffix.lower() == ".onnx":
+        infer, model_meta = _load_student_from_onnx(
+            ckpt_path,
+            temperature=args.temperature,
+            temperature_json=args.temperature_json,
+            threads=int(args.threads),
+        )
     else:
         infer, model_meta = _load_student_from_checkpoint(
             ckpt_path,
@@ -673,25 +977,33 @@ def main() -> int:
             prefer_device=prefer_device,
         )
 
+    if int(args.threads) > 0:
+        cv2.setNumThreads(int(args.threads))
+        if "torch" in sys.modules:
+            sys.modules["torch"].set_num_threads(int(args.threads))
+
+    gate: Optional[ChangeGatedInfer] = None
+    if float(args.skip_threshold) > 0:
+        gate = ChangeGatedInfer(infer, threshold=float(args.skip_threshold), max_stale=int(args.skip_max_stale))
+        infer = gate
+
     model_dir = REPO_ROOT / "demo" / "models"
     detector = FaceDetector(args.detector, model_dir=model_dir)
 
-    if args.source.lower() == "webcam":
-        cap = cv2.VideoCapture(int(args.camera_index))
-        input_name = f"webcam:{args.camera_index}"
-    else:
-        cap = cv2.VideoCapture(str(args.source))
-        input_name = str(args.source)
+    cap, input_name = open_source(
+        str(args.source),
+        camera_index=int(args.camera_index),
+        synthetic_frames=int(args.max_frames),
+        synthetic_face=args.synthetic_face,
+    )
 
     if not cap.isOpened():
         raise SystemExit(f"Failed to open source: {args.source}")
 
     params = Params()
 
-    # Smoothing state
-    ema_probs: Optional[List[float]] = None
-    hyster_idx: Optional[int] = None
-    votes: Deque[int] = deque(maxlen=params.vote_window)
+    # Smoothing state (EMA -> hysteresis -> vote), updated in place per frame.
+    smoother = TemporalSmoother(len(CANONICAL_7), vote_window=params.vote_window)
 
     # Manual labeling state
     manual_idx: Optional[int] = None
@@ -722,9 +1034,12 @@ def main() -> int:
         w_frames.writeheader()
 
         win = "FER Demo"
-        cv2.namedWindow(win, cv2.WINDOW_NORMAL)
+        if not headless:
+            cv2.namedWindow(win, cv2.WINDOW_NORMAL)
 
         bar_rect = (0, 0, 0, 0)
+        timer = StageTimer(enabled=bool(args.benchmark), warmup=int(args.warmup_frames))
+        faces_found = 0
 
         def _set_manual(idx: Optional[int], frame_index: int, tsec: float) -> None:
             nonlocal manual_idx, current_event
@@ -764,15 +1079,20 @@ def main() -> int:
             _on_mouse.pending = idx  # type: ignore[attr-defined]
 
         _on_mouse.pending = None  # type: ignore[attr-defined]
-        cv2.setMouseCallback(win, _on_mouse)
+        if not headless:
+            cv2.setMouseCallback(win, _on_mouse)
 
         frame_index = 0
         t_start = time.time()
 
         while True:
+            if args.max_frames and frame_index >= int(args.max_frames):
+                break
+            timer.start_frame()
             ok, frame = cap.read()
             if not ok:
                 break
+            timer.lap("read")
 
             now = time.time()
             tsec = now - t_start
@@ -785,36 +1105,63 @@ def main() -> int:
 
             faces = detector.detect(frame)
             face_box = _largest_face(faces)
+            timer.lap("detect")
 
             probs = [0.0] * len(CANONICAL_7)
             pred_idx: Optional[int] = None
 
             if face_box is not None:
-                x, y, w, h = face_box
-                cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 220, 220), 2)
+                faces_found += 1
+            else:
+                if gate is not None:
+                    # Face lost: the next crop (center-crop fallback or a new face) must be inferred.
+                    gate.reset()
+                if args.always_infer:
+                    fh, fw = frame.shape[:2]
+                    side = min(fh, fw) // 2
+                    face_box = ((fw - side) // 2, (fh - side) // 2, side, side)
+
+            if face_box is not None:
                 crop = _crop_with_margin(frame, face_box)
+                timer.lap("crop")
                 _logits, probs = infer(crop)
-
-                # EMA
-                if ema_probs is None:
-                    ema_probs = list(probs)
-                else:
-                    a = float(params.ema_alpha)
-                    ema_probs = [a * e + (1.0 - a) * p for e, p in zip(ema_probs, probs)]
-
-                # Hysteresis
-                hyster_idx = _apply_hysteresis(ema_probs, hyster_idx, params.hysteresis_delta)
-
-                # Vote window
-                votes = deque(votes, maxlen=params.vote_window)
-                if hyster_idx is not None:
-                    votes.append(int(hyster_idx))
-                pred_idx = _vote_smooth(votes, window=params.vote_window, min_count=params.vote_min_count)
+                timer.lap("infer")
+
+                pred_idx = smoother.update(
+                    probs,
+                    ema_alpha=params.ema_alpha,
+                    hysteresis_delta=params.hysteresis_delta,
+                    vote_window=params.vote_window,
+                    vote_min_count=params.vote_min_count,
+                )
+                timer.lap("smooth")
 
             pred_label = CANONICAL_7[pred_idx] if pred_idx is not None else "(unstable)"
             manual_label = CANONICAL_7[manual_idx] if manual_idx is not None else ""
 
+            # Log per-frame
+            row = {
+                "frame_index": frame_index,
+                "time_sec": f"{tsec:.6f}",
+                "manual_label": manual_label,
+                "pred_label": pred_label,
+                **{f"prob_{name}": f"{float(probs[i]):.6f}" for i, name in enumerate(CANONICAL_7)},
+                "detector": args.detector,
+                "model": model_meta.get("model"),
+                "ckpt": model_meta.get("ckpt"),
+            }
+            w_frames.writerow(row)
+            timer.lap("log")
+
+            if headless:
+                timer.end_frame()
+                frame_index += 1
+                continue
+
             # UI overlays
+            if face_box is not None:
+                x, y, w, h = face_box
+                cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 220, 220), 2)
             cv2.putText(
                 frame,
                 f"src={input_name} det={args.detector} pred={pred_label} manual={manual_label}",
@@ -851,23 +1198,12 @@ def main() -> int:
                     )
 
             bar_rect = _draw_label_bar(frame, manual_label_idx=manual_idx)
+            timer.lap("draw")
 
             cv2.imshow(win, frame)
 
-            # Log per-frame
-            row = {
-                "frame_index": frame_index,
-                "time_sec": f"{tsec:.6f}",
-                "manual_label": manual_label,
-                "pred_label": pred_label,
-                **{f"prob_{name}": f"{float(probs[i]):.6f}" for i, name in enumerate(CANONICAL_7)},
-                "detector": args.detector,
-                "model": model_meta.get("model"),
-                "ckpt": model_meta.get("ckpt"),
-            }
-            w_frames.writerow(row)
-
             key = cv2.waitKey(1) & 0xFF
+            timer.lap("display")
             if key == ord("q"):
                 break
             if key == ord("o"):
@@ -898,6 +1234,7 @@ def main() -> int:
             if key == ord("m"):
                 params.vote_min_count = min(params.vote_window, params.vote_min_count + 1)
 
+            timer.end_frame()
             frame_index += 1
 
     # Finalize last event
@@ -975,7 +1312,36 @@ def main() -> int:
     )
 
     cap.release()
-    cv2.destroyAllWindows()
+    if not headless:
+        cv2.destroyAllWindows()
+
+    gate_json = out_dir / "change_gate.json"
+    if gate is not None:
+        gate_json.write_text(json.dumps(gate.stats(), indent=2), encoding="utf-8")
+        gs = gate.stats()
+        print(f"\nChange gate: skipped {gs['skipped']}/{gs['calls']} inferences ({gs['skip_fraction']:.1%})")
+
+    bench_json = out_dir / "benchmark.json"
+    if args.benchmark:
+        bench = {
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "input": input_name,
+            "headless": headless,
+            "detector": args.detector,
+            "model": model_meta,
+            "threads": int(args.threads),
+            "cv2_threads": int(cv2.getNumThreads()),
+            "cpu_count": os.cpu_count(),
+            "always_infer": bool(args.always_infer),
+            "frames_total": int(frame_index),
+            "faces_found": int(faces_found),
+            "change_gate": gate.stats() if gate is not None else None,
+            **timer.summary(),
+        }
+        bench_json.write_text(json.dumps(bench, indent=2), encoding="utf-8")
+        print(f"\nBenchmark: {bench['frames']} frames | {bench['fps']} FPS | faces found {faces_found}/{frame_index}")
+        for name, st in bench["stages"].items():  # type: ignore[union-attr]
+            print(f"  {name:8s} p50 {st['p50_ms']:8.3f} ms | p95 {st['p95_ms']:8.3f} | p99 {st['p99_ms']:8.3f}")
 
     print("\nWrote artifacts:")
     print(f"- {frames_csv}")
@@ -983,6 +1349,10 @@ def main() -> int:
     print(f"- {summary_csv}")
     print(f"- {per_class_csv}")
     print(f"- {thresholds_json}")
+    if gate is not None:
+        print(f"- {gate_json}")
+    if args.benchmark:
+        print(f"- {bench_json}")
     return 0
 
 
@@ -16,6 +16,7 @@ REPO_ROOT = Path(__file__).resolve().parents[1]
 sys.path.insert(0, str(REPO_ROOT))
 
 from src.fer.data.manifest_dataset import CANONICAL_7, ManifestImageDataset, build_splits, read_manifest  # noqa: E402
+from src.fer.utils.checkpoint_io import load_checkpoint_args, load_model_state  # noqa: E402
 
 # Reuse metric logic from the training script to keep outputs consistent.
 from scripts.train_student import fit_temperature, metrics_from_logits  # noqa: E402
@@ -70,12 +71,8 @@ def main() -> int:
     if not ckpt_path.exists():
         raise SystemExit(f"Checkpoint not found: {ckpt_path}")
 
-    try:
-        ckpt = torch.load(ckpt_path, map_location="cpu", weights_only=False)
-    except TypeError:
-        ckpt = torch.load(ckpt_path, map_location="cpu")
-
-    ckpt_args = ckpt.get("args") if isinstance(ckpt.get("args"), dict) else {}
+    # Sidecar args only; weights are loaded once the model is built.
+    ckpt_args = load_checkpoint_args(ckpt_path)
 
     model_name = args.model or str(ckpt_args.get("model") or "mobilenetv3_large_100")
     image_size = int(args.image_size or ckpt_args.get("image_size") or 224)
@@ -144,7 +141,7 @@ def main() -> int:
         raise RuntimeError("timm is required for evaluation.") from e
 
     student = timm.create_model(model_name, pretrained=False, num_classes=len(CANONICAL_7)).to(device)
-    student.load_state_dict(ckpt.get("model", {}), strict=True)
+    student.load_state_dict(load_model_state(ckpt_path), strict=True)
     student.eval()
 
     all_logits: List[torch.Tensor] = []
@@ -0,0 +1,422 @@
+"""Evaluate many student checkpoints against one decoded eval split.
+
+`eval_student_checkpoint.py` re-reads the manifest, re-decodes every eval image and
+rebuilds the model per invocation. This engine:
+- decodes + preprocesses the eval split once per preprocessing config (image size,
+  CLAHE) into a uint8 tensor cache on disk (reused across invocations);
+- evaluates N checkpoints against it: one thread per CUDA device, or a process pool on
+  CPU where every worker memory-maps the same cache;
+- writes the usual per-checkpoint calibration.json / reliabilitymetrics.json /
+  eval_meta.json plus a combined comparison table (compare_student_runs.py format).
+
+Normalization is applied per batch with the same ops as ToTensor + Normalize, so logits
+match `eval_student_checkpoint.py` for the same checkpoint and batch size.
+
+Usage (PowerShell):
+  .\.venv\Scripts\python.exe scripts\eval_student_checkpoints.py --eval-manifest Training_data_cleaned\classification_manifest_eval_only.csv --glob "outputs/students/KD/*/best.pt"
+  .\.venv\Scripts\python.exe scripts\eval_student_checkpoints.py --eval-manifest Training_data_cleaned\classification_manifest_eval_only.csv --checkpoint a\best.pt --checkpoint b\best.pt --workers 4
+"""
+
+from __future__ import annotations
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Sequence, Tuple
+
+import torch
+from torch.amp import autocast
+from torch.utils.data import DataLoader
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+from src.fer.data.eval_cache import normalize_uint8_batch, split_normalize  # noqa: E402
+from src.fer.data.manifest_dataset import CANONICAL_7, ManifestImageDataset  # noqa: E402
+from src.fer.utils.checkpoint_io import load_checkpoint_args, load_model_state  # noqa: E402
+
+from scripts.eval_student_checkpoint import _pick_eval_rows  # noqa: E402
+from scripts.train_student import fit_temperature, metrics_from_logits  # noqa: E402
+from tools.diagnostics.compare_student_runs import (  # noqa: E402
+    RunSummary,
+    _infer_mode_from_dirname,
+    _maybe_read_last_aux,
+    render_markdown_table,
+)
+
+
+_MEAN = (0.485, 0.456, 0.406)
+_STD = (0.229, 0.224, 0.225)
+
+
+@dataclass(frozen=True)
+class Preproc:
+    image_size: int
+    use_clahe: bool
+    clahe_clip: float
+    clahe_tile: int
+
+
+@dataclass(frozen=True)
+class EvalJob:
+    checkpoint: Path
+    model_name: str
+    preproc: Preproc
+    cache_path: Path
+    out_dir: Path
+    device: str
+    batch_size: int
+    use_amp: bool
+    max_batches: int
+    threads: int
+    meta: Dict[str, Any]
+
+
+def _resolve_preproc(ckpt_args: Dict[str, Any], args: argparse.Namespace) -> Preproc:
+    # Same defaults/overrides as eval_student_checkpoint.py.
+    return Preproc(
+        image_size=int(args.image_size or ckpt_args.get("image_size") or 224),
+        use_clahe=bool(args.use_clahe) or bool(ckpt_args.get("use_clahe") or False),
+        clahe_clip=float(ckpt_args.get("clahe_clip") or args.clahe_clip),
+        clahe_tile=int(ckpt_args.get("clahe_tile") or args.clahe_tile),
+    )
+
+
+def _uint8_transform(p: Preproc):
+    """Eval transform of train_teacher.build_transforms, stopping before ToTensor/Normalize."""
+    import importlib
+
+    train_teacher = importlib.import_module("scripts.train_teacher")
+    full = train_teacher.build_transforms(
+        image_size=p.image_size,
+        train=False,
+        use_clahe=p.use_clahe,
+        clahe_clip=p.clahe_clip,
+        clahe_tile=p.clahe_tile,
+    )
+    return split_normalize(full)[0]
+
+
+def _normalize_batch(x_u8: torch.Tensor, device: torch.device) -> torch.Tensor:
+    return normalize_uint8_batch(x_u8, device, mean=_MEAN, std=_STD)
+
+
+def _cache_key(rows: Sequence[object], p: Preproc, limit: int) -> str:
+    h = hashlib.blake2b(digest_size=10)
+    h.update(json.dumps([p.image_size, p.use_clahe, p.clahe_clip, p.clahe_tile, int(limit)]).encode("utf-8"))
+    for r in rows:
+        h.update(
+            f"{r.image_path}|{r.label}|{r.bbox_top}|{r.bbox_left}|{r.bbox_right}|{r.bbox_bottom}\n".encode("utf-8")  # type: ignore[attr-defined]
+        )
+    return h.hexdigest()
+
+
+def build_eval_cache(
+    rows: Sequence[object],
+    *,
+    data_root: Path,
+    preproc: Preproc,
+    cache_dir: Path,
+    limit: int,
+    num_workers: int,
+) -> Path:
+    """Decode + preprocess rows once into <cache_dir>/<key>.pt ({"x": uint8 NCHW, "y": int64})."""
+    rows = list(rows)[: limit] if limit > 0 else list(rows)
+    cache_path = cache_dir / f"eval_{_cache_key(rows, preproc, limit)}.pt"
+    if cache_path.exists():
+        print(f"Eval cache hit: {cache_path}")
+        return cache_path
+
+    ds = ManifestImageDataset(rows, out_root=data_root, transform=_uint8_transform(preproc))
+    n = len(ds)
+    s = int(preproc.image_size)
+    xs = torch.empty((n, 3, s, s), dtype=torch.uint8)
+    ys = torch.empty((n,), dtype=torch.int64)
+    dl_kwargs: Dict[str, Any] = {"batch_size": 256, "shuffle": False, "num_workers": int(num_workers)}
+    if int(num_workers) > 0:
+        dl_kwargs["prefetch_factor"] = 1 if os.name == "nt" else 2
+    t0 = time.perf_counter()
+    i = 0
+    for x, y, _src in DataLoader(ds, **dl_kwargs):
+        xs[i : i + x.shape[0]] = x
+        ys[i : i + x.shape[0]] = y
+        i += int(x.shape[0])
+    print(f"Decoded {n} eval images ({preproc}) in {time.perf_counter() - t0:.1f}s")
+
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    tmp = cache_path.with_name(cache_path.name + ".tmp")
+    torch.save({"x": xs, "y": ys}, str(tmp))
+    os.replace(tmp, cache_path)
+    return cache_path
+
+
+def _load_cache(path: Path) -> Tuple[torch.Tensor, torch.Tensor]:
+    try:
+        d = torch.load(str(path), map_location="cpu", weights_only=True, mmap=True)
+    except TypeError:
+        d = torch.load(str(path), map_location="cpu")
+    return d["x"], d["y"]
+
+
+def eval_checkpoint(job: EvalJob) -> Dict[str, Any]:
+    """Evaluate one checkpoint on a cached eval split and write its metrics files."""
+    try:
+        import timm  # type: ignore
+    except Exception as e:
+        raise RuntimeError("timm is required for evaluation.") from e
+
+    if job.threads > 0:
+        torch.set_num_threads(int(job.threads))
+
+    device = torch.device(job.device)
+    use_amp = bool(job.use_amp) and device.type == "cuda"
+    xs, ys = _load_cache(job.cache_path)
+
+    student = timm.create_model(job.model_name, pretrained=False, num_classes=len(CANONICAL_7)).to(device)
+    student.load_state_dict(load_model_state(job.checkpoint), strict=True)
+    student.eval()
+
+    all_logits: List[torch.Tensor] = []
+    bs = int(job.batch_size)
+    with torch.no_grad():
+        for bi, start in enumerate(range(0, int(xs.shape[0]), bs)):
+            x = _normalize_batch(xs[start : start + bs], device)
+            with autocast(device.type if use_amp else "cpu", enabled=use_amp):
+                logits = student(x)
+            all_logits.append(logits.detach().float().cpu())
+            if job.max_batches and (bi + 1) >= int(job.max_batches):
+                break
+
+    logits = torch.cat(all_logits, dim=0)
+    y = ys[: logits.shape[0]].clone()
+
+    raw = metrics_from_logits(logits, y, num_classes=len(CANONICAL_7))
+    t_star = fit_temperature(logits, y, init_t=1.2)
+    scaled = metrics_from_logits(logits / float(t_star), y, num_classes=len(CANONICAL_7))
+
+    out_dir = job.out_dir
+    out_dir.mkdir(parents=True, exist_ok=True)
+    calib = {"mode": "global", "global_temperature": float(t_star)}
+    (out_dir / "calibration.json").write_text(json.dumps(calib, indent=2), encoding="utf-8")
+    rel = {
+        "raw": raw,
+        "temperature_scaled": {"mode": "global", "global_temperature": float(t_star), **scaled},
+    }
+    (out_dir / "reliabilitymetrics.json").write_text(json.dumps(rel, indent=2), encoding="utf-8")
+    meta = dict(job.meta)
+    meta.update({"time": time.strftime("%Y-%m-%d %H:%M:%S"), "device": job.device, "eval_cache": str(job.cache_path)})
+    (out_dir / "eval_meta.json").write_text(json.dumps(meta, indent=2), encoding="utf-8")
+    return {"checkpoint": str(job.checkpoint), "out_dir": str(out_dir), "raw": raw, "ts": scaled}
+
+
+def _run_device_queue(jobs: List[EvalJob], results: Dict[Path, Dict[str, Any]], lock: threading.Lock) -> None:
+    for job in jobs:
+        res = eval_checkpoint(job)
+        with lock:
+            results[job.checkpoint] = res
+        print(f"[{job.device}] {job.checkpoint}: macro_f1={float(res['raw']['macro_f1']):.4f}")
+
+
+def run_jobs(jobs: List[EvalJob], *, workers: int) -> Dict[Path, Dict[str, Any]]:
+    results: Dict[Path, Dict[str, Any]] = {}
+    if not jobs:
+        return results
+    if jobs[0].device.startswith("cuda"):
+        # One thread per device; each device works through its own checkpoint queue.
+        by_device: Dict[str, List[EvalJob]] = {}
+        for j in jobs:
+            by_device.setdefault(j.device, []).append(j)
+        lock = threading.Lock()
+        with ThreadPoolExecutor(max_workers=len(by_device)) as ex:
+            futs = [ex.submit(_run_device_queue, q, results, lock) for q in by_device.values()]
+            for f in futs:
+                f.result()
+        return results
+
+    if int(workers) <= 1:
+        for j in jobs:
+            results[j.checkpoint] = eval_checkpoint(j)
+            print(f"[cpu] {j.checkpoint}: macro_f1={float(results[j.checkpoint]['raw']['macro_f1']):.4f}")
+        return results
+    with ProcessPoolExecutor(max_workers=int(workers)) as ex:
+        futs = {ex.submit(eval_checkpoint, j): j for j in jobs}
+        for f, j in futs.items():
+            results[j.checkpoint] = f.result()
+            print(f"[cpu] {j.checkpoint}: macro_f1={float(results[j.checkpoint]['raw']['macro_f1']):.4f}")
+    return results
+
+
+def _comparison_rows(jobs: List[EvalJob], results: Dict[Path, Dict[str, Any]]) -> List[RunSummary]:
+    rows: List[RunSummary] = []
+    for j in jobs:
+        res = results.get(j.checkpoint)
+        if res is None:
+            continue
+        run_dir = j.checkpoint.parent.resolve()
+        negl, nl, epochs = _maybe_read_last_aux(run_dir / "history.json")
+        label = run_dir.name if j.checkpoint.name == "best.pt" else f"{run_dir.name}/{j.checkpoint.name}"
+        rel = json.loads((j.out_dir / "reliabilitymetrics.json").read_text(encoding="utf-8"))
+        rows.append(
+            RunSummary(
+                run_dir=j.out_dir,
+                label=label,
+                mode=_infer_mode_from_dirname(run_dir.name),
+                epochs=epochs,
+                negl=negl,
+                nl=nl,
+                raw=rel.get("raw") or {},
+                ts=rel.get("temperature_scaled") or {},
+            )
+        )
+    return rows
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Evaluate many student checkpoints on one decoded eval split.")
+    ap.add_argument("--checkpoint", type=Path, action="append", default=[], help="Checkpoint .pt (repeatable)")
+    ap.add_argument("--glob", action="append", default=[], help="Glob(s) of checkpoints, e.g. outputs/students/KD/*/best.pt")
+    ap.add_argument("--eval-manifest", type=Path, required=True, help="CSV manifest to evaluate on")
+    ap.add_argument("--eval-split", type=str, default="test", choices=["val", "test"], help="Split to evaluate")
+    ap.add_argument("--eval-data-root", type=Path, default=REPO_ROOT, help="Data root used to resolve relative image paths")
+
+    ap.add_argument("--model", type=str, default=None, help="Override timm model name for all checkpoints")
+    ap.add_argument("--image-size", type=int, default=None, help="Override image size for all checkpoints")
+
+    ap.add_argument("--batch-size", type=int, default=256)
+    ap.add_argument("--num-workers", type=int, default=4, help="DataLoader workers for the one-time decode")
+    ap.add_argument("--seed", type=int, default=1337)
+
+    ap.add_argument("--use-clahe", action="store_true", help="Force CLAHE on for eval (defaults to checkpoint args if present)")
+    ap.add_argument("--clahe-clip", type=float, default=2.0)
+    ap.add_argument("--clahe-tile", type=int, default=8)
+
+    ap.add_argument("--use-amp", action="store_true", help="Use AMP autocast when on CUDA")
+    ap.add_argument("--max-batches", type=int, default=0)
+
+    ap.add_argument(
+        "--devices",
+        type=str,
+        default=None,
+        help="Comma-separated devices, e.g. cuda:0,cuda:1 (default: all visible GPUs, else cpu)",
+    )
+    ap.add_argument("--workers", type=int, default=0, help="CPU process pool size (0 = min(#checkpoints, cpu_count/2))")
+    ap.add_argument(
+        "--cache-dir",
+        type=Path,
+        default=REPO_ROOT / "outputs" / "evals" / "_cache",
+        help="Where decoded eval tensors are cached (reused across invocations)",
+    )
+    ap.add_argument(
+        "--out-root",
+        type=Path,
+        default=None,
+        help="Per-checkpoint outputs go to <out-root>/<run>__<manifest>__<split>__<stamp> (default: outputs/evals/students)",
+    )
+    ap.add_argument("--compare-out", type=Path, default=None, help="Markdown comparison table (default: <out-root>/compare_<stamp>.md)")
+    args = ap.parse_args()
+
+    ckpts: List[Path] = list(args.checkpoint)
+    for pat in args.glob:
+        ckpts.extend(Path(m) for m in sorted(glob.glob(pat, recursive=True)))
+    ckpts = list(dict.fromkeys(p.resolve() for p in ckpts))
+    missing = [p for p in ckpts if not p.exists()]
+    if missing:
+        raise SystemExit(f"Checkpoint not found: {missing[0]}")
+    if not ckpts:
+        raise SystemExit("Provide --checkpoint and/or --glob.")
+
+    eval_rows, counts = _pick_eval_rows(
+        manifest_path=args.eval_manifest,
+        data_root=args.eval_data_root,
+        split=str(args.eval_split),
+        seed=int(args.seed),
+    )
+    if not eval_rows:
+        raise SystemExit(
+            f"No eval rows found for split={args.eval_split} in {args.eval_manifest}. "
+            f"(counts={counts})"
+        )
+
+    if args.devices:
+        devices = [d.strip() for d in args.devices.split(",") if d.strip()]
+    elif torch.cuda.is_available():
+        devices = [f"cuda:{i}" for i in range(torch.cuda.device_count())]
+    else:
+        devices = ["cpu"]
+    on_cpu = not devices[0].startswith("cuda")
+    workers = int(args.workers) or max(1, min(len(ckpts), (os.cpu_count() or 2) // 2))
+    threads = max(1, (os.cpu_count() or 1) // workers) if on_cpu and workers > 1 else 0
+
+    stamp = time.strftime("%Y%m%d_%H%M%S")
+    out_root = args.out_root or (REPO_ROOT / "outputs" / "evals" / "students")
+    limit = int(args.max_batches) * int(args.batch_size) if int(args.max_batches) > 0 else 0
+
+    caches: Dict[Preproc, Path] = {}
+    jobs: List[EvalJob] = []
+    for i, ckpt_path in enumerate(ckpts):
+        ckpt_args = load_checkpoint_args(ckpt_path)
+        model_name = args.model or str(ckpt_args.get("model") or "mobilenetv3_large_100")
+        preproc = _resolve_preproc(ckpt_args, args)
+        if preproc not in caches:
+            caches[preproc] = build_eval_cache(
+                eval_rows,
+                data_root=args.eval_data_root,
+                preproc=preproc,
+                cache_dir=args.cache_dir,
+                limit=limit,
+                num_workers=int(args.num_workers),
+            )
+        run_name = ckpt_path.parent.name if ckpt_path.name == "best.pt" else f"{ckpt_path.parent.name}_{ckpt_path.stem}"
+        out_dir = out_root / f"{run_name}__{args.eval_manifest.stem}__{args.eval_split}__{stamp}"
+        jobs.append(
+            EvalJob(
+                checkpoint=ckpt_path,
+                model_name=model_name,
+                preproc=preproc,
+                cache_path=caches[preproc],
+                out_dir=out_dir,
+                device=devices[i % len(devices)],
+                batch_size=int(args.batch_size),
+                use_amp=bool(args.use_amp),
+                max_batches=int(args.max_batches),
+                threads=threads,
+                meta={
+                    "checkpoint": str(ckpt_path),
+                    "checkpoint_run_dir": str(ckpt_path.parent),
+                    "model": model_name,
+                    "image_size": preproc.image_size,
+                    "use_clahe": preproc.use_clahe,
+                    "clahe_clip": preproc.clahe_clip,
+                    "clahe_tile": preproc.clahe_tile,
+                    "eval_manifest": str(args.eval_manifest),
+                    "eval_split": str(args.eval_split),
+                    "eval_data_root": str(args.eval_data_root),
+                    "counts": counts,
+                    "max_batches": int(args.max_batches),
+                },
+            )
+        )
+
+    t0 = time.perf_counter()
+    results = run_jobs(jobs, workers=workers if on_cpu else len(devices))
+    print(f"Evaluated {len(results)} checkpoint(s) in {time.perf_counter() - t0:.1f}s")
+
+    md = render_markdown_table(_comparison_rows(jobs, results))
+    print(md)
+    compare_out = args.compare_out or (out_root / f"compare_{args.eval_manifest.stem}__{args.eval_split}__{stamp}.md")
+    compare_out.parent.mkdir(parents=True, exist_ok=True)
+    compare_out.write_text(md, encoding="utf-8")
+    print(f"Wrote: {compare_out}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
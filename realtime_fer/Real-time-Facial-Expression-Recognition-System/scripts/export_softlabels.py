@@ -0,0 +1,363 @@
+"""Export teacher soft labels (ensemble logits) for KD/DKD student training.
+
+Streams one manifest split (default: train, same split policy as train_student.py)
+through a single DataLoader: every image is decoded once and all teachers and TTA
+views run on the same decoded batch. Output (in --out-dir):
+
+  softlabels.npy            float32 [N, 7] ensemble logits (memory-mappable; pass to
+                            train_student.py --softlabels)
+  softlabels_index.jsonl    {"i", "image_path", "label", "source"} per row
+  softlabels_members.npy    float32 [K, N, 7] per-teacher logits (--save-members)
+  ensemble_metrics.json     accuracy / macro_f1 / nll / ece of the ensemble on the split
+  export_meta.json          teachers, weights, temperatures, TTA, throughput
+
+Rows are processed in shards (shards/part-XXXXX.npy); a re-run with the same inputs
+skips finished shards, so an interrupted export resumes where it stopped.
+
+Ensemble: logits = sum_k w_k * mean_tta(logits_k) / T_k, weights normalized to 1.
+Teachers whose image size differs from the largest one get the decoded batch resized
+on the device (exact when all teachers share the preprocessing).
+
+Usage (PowerShell):
+  .\.venv\Scripts\python.exe scripts\export_softlabels.py --teacher outputs\teachers\A\best.pt --out-dir outputs\softlabels\A_train
+  .\.venv\Scripts\python.exe scripts\export_softlabels.py --teacher outputs\teachers\A\best.pt --teacher outputs\teachers\B\best.pt --weights 0.6,0.4 --use-calibration --tta flip --amp --out-dir outputs\softlabels\AB_flip
+  .\.venv\Scripts\python.exe scripts\export_softlabels.py --config outputs\softlabels\_search\best_config.json --out-dir outputs\softlabels\AB_search
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+from torch.amp import autocast
+from torch.utils.data import DataLoader, Subset
+from torchvision import transforms as T
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+from scripts.train_teacher import build_transforms, load_teacher_checkpoint, metrics_from_logits  # noqa: E402
+from src.fer.data.eval_cache import normalize_uint8_batch, split_normalize  # noqa: E402
+from src.fer.data.manifest_dataset import (  # noqa: E402
+    CANONICAL_7,
+    LABEL_TO_INDEX,
+    ManifestImageDataset,
+    ManifestRow,
+    build_splits,
+    read_manifest,
+)
+from src.fer.utils.device import get_best_device  # noqa: E402
+
+TTA_MODES = ("none", "flip", "crops", "flip+crops")
+
+
+@dataclass(frozen=True)
+class TeacherSpec:
+    checkpoint: str
+    weight: float = 1.0
+    temperature: float = 1.0
+
+
+def _file_stat(path: Path) -> List[int]:
+    st = path.stat()
+    return [int(st.st_size), int(st.st_mtime_ns)]
+
+
+def _calibrated_temperature(checkpoint: Path) -> float:
+    try:
+        calib = json.loads((checkpoint.parent / "calibration.json").read_text(encoding="utf-8"))
+        return float(calib.get("global_temperature") or 1.0)
+    except Exception:
+        return 1.0
+
+
+def _resolve_teachers(args: argparse.Namespace) -> Tuple[List[TeacherSpec], Dict[str, Any]]:
+    cfg: Dict[str, Any] = {}
+    if args.config is not None:
+        cfg = json.loads(args.config.read_text(encoding="utf-8"))
+        specs = [
+            TeacherSpec(
+                checkpoint=str(t["checkpoint"]),
+                weight=float(t.get("weight", 1.0)),
+                temperature=float(t.get("temperature", 1.0)),
+            )
+            for t in cfg.get("teachers", [])
+        ]
+    else:
+        paths = [Path(p) for p in (args.teacher or [])]
+        weights = [float(w) for w in args.weights.split(",")] if args.weights else [1.0] * len(paths)
+        if args.temperatures:
+            temps = [float(t) for t in args.temperatures.split(",")]
+        elif args.use_calibration:
+            temps = [_calibrated_temperature(p) for p in paths]
+        else:
+            temps = [1.0] * len(paths)
+        if not (len(weights) == len(temps) == len(paths)):
+            raise SystemExit("--weights/--temperatures must list one value per --teacher")
+        specs = [TeacherSpec(str(p), w, t) for p, w, t in zip(paths, weights, temps)]
+    if not specs:
+        raise SystemExit("Provide at least one --teacher (or --config with a 'teachers' list)")
+    total = sum(max(0.0, s.weight) for s in specs)
+    if total <= 0:
+        raise SystemExit("Teacher weights must sum to a positive value")
+    specs = [TeacherSpec(s.checkpoint, max(0.0, s.weight) / total, max(1e-6, s.temperature)) for s in specs]
+    return specs, cfg
+
+
+def _fingerprint(rows: Sequence[ManifestRow], specs: Sequence[TeacherSpec], extra: Dict[str, Any]) -> str:
+    h = hashlib.blake2b(digest_size=12)
+    h.update(json.dumps(extra, sort_keys=True).encode("utf-8"))
+    for s in specs:
+        h.update(json.dumps([asdict(s), _file_stat(Path(s.checkpoint))]).encode("utf-8"))
+    for r in rows:
+        h.update(f"{r.image_path}|{r.label}|{r.bbox_top}|{r.bbox_left}|{r.bbox_right}|{r.bbox_bottom}\n".encode("utf-8"))
+    return h.hexdigest()
+
+
+def _center_offset(full: int, crop: int) -> int:
+    # Same rounding as torchvision CenterCrop.
+    return int(round((full - crop) / 2.0))
+
+
+def _views(x: torch.Tensor, *, size: int, tta: str) -> List[torch.Tensor]:
+    """TTA views of a normalized NCHW batch (x is SxS, or the resized canvas for crops)."""
+    views: List[torch.Tensor] = []
+    if "crops" in tta:
+        full = int(x.shape[-1])
+        o = _center_offset(full, size)
+        m = full - size
+        for top, left in ((o, o), (0, 0), (0, m), (m, 0), (m, m)):
+            views.append(x[..., top : top + size, left : left + size])
+    else:
+        views.append(x)
+    if "flip" in tta:
+        views = views + [torch.flip(v, dims=[-1]) for v in views]
+    return views
+
+
+def _atomic_save_npy(path: Path, arr: np.ndarray) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    with tmp.open("wb") as f:
+        np.save(f, arr)
+    os.replace(tmp, path)
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Export teacher (ensemble) soft labels for train_student.py.")
+    ap.add_argument(
+        "--manifest",
+        type=Path,
+        default=REPO_ROOT / "Training_data_cleaned" / "classification_manifest_hq_train.csv",
+    )
+    ap.add_argument("--data-root", type=Path, default=REPO_ROOT / "Training_data_cleaned")
+    ap.add_argument("--split", type=str, choices=["train", "val", "test"], default="train")
+    ap.add_argument("--teacher", type=Path, action="append", help="Teacher checkpoint (.pt); repeat for an ensemble")
+    ap.add_argument("--weights", type=str, default="", help="Comma-separated ensemble weights (default: equal)")
+    ap.add_argument("--temperatures", type=str, default="", help="Comma-separated per-teacher temperatures")
+    ap.add_argument(
+        "--use-calibration",
+        action="store_true",
+        help="Per-teacher temperature from <run>/calibration.json (global_temperature)",
+    )
+    ap.add_argument("--config", type=Path, default=None, help="JSON {'teachers': [{checkpoint, weight, temperature}]}")
+    ap.add_argument("--tta", type=str, choices=list(TTA_MODES), default="none")
+    ap.add_argument("--out-dir", type=Path, required=True)
+    ap.add_argument("--batch-size", type=int, default=512)
+    ap.add_argument("--num-workers", type=int, default=4)
+    ap.add_argument("--shard-size", type=int, default=50000, help="Rows per resumable shard")
+    ap.add_argument("--amp", action="store_true", help="fp16 autocast on CUDA")
+    ap.add_argument("--save-members", action="store_true", help="Also write per-teacher logits (softlabels_members.npy)")
+    ap.add_argument("--keep-shards", action="store_true")
+    ap.add_argument("--overwrite", action="store_true", help="Discard shards from a different export in --out-dir")
+    ap.add_argument("--limit", type=int, default=0, help="Only the first N rows (smoke tests)")
+    args = ap.parse_args()
+
+    specs, cfg = _resolve_teachers(args)
+    if args.config is not None and cfg.get("tta"):
+        args.tta = str(cfg["tta"])
+
+    device_info = get_best_device(prefer="cuda")
+    device = device_info.device
+    use_amp = bool(args.amp) and device_info.backend == "cuda"
+    autocast_device = "cuda" if use_amp else "cpu"
+
+    teachers: List[torch.nn.Module] = []
+    sizes: List[int] = []
+    clahe_cfgs = set()
+    for s in specs:
+        model, ckpt_args = load_teacher_checkpoint(Path(s.checkpoint), device=device)
+        teachers.append(model)
+        sizes.append(int(ckpt_args.get("image_size") or 224))
+        clahe_cfgs.add(
+            (bool(ckpt_args.get("clahe")), float(ckpt_args.get("clahe_clip") or 2.0), int(ckpt_args.get("clahe_tile") or 8))
+        )
+        print(f"Teacher {s.checkpoint}: {ckpt_args.get('model')} @ {sizes[-1]} | w={s.weight:.3f} T={s.temperature:.3f}")
+    if len(clahe_cfgs) > 1:
+        raise SystemExit("Teachers disagree on CLAHE preprocessing; export them separately.")
+    use_clahe, clahe_clip, clahe_tile = next(iter(clahe_cfgs))
+    if use_clahe and "crops" in args.tta:
+        raise SystemExit("--tta crops is not supported for CLAHE teachers (CLAHE runs after the center crop).")
+    base_size = max(sizes)
+    if len(set(sizes)) > 1:
+        print(f"NOTE: teacher image sizes differ {sorted(set(sizes))}; decoding at {base_size} and resizing on device.")
+
+    # Decode-once transform: the eval pipeline up to uint8; with crop TTA only the resize.
+    eval_tf = build_transforms(
+        image_size=base_size, train=False, use_clahe=use_clahe, clahe_clip=clahe_clip, clahe_tile=clahe_tile
+    )
+    u8_tf, mean, std = split_normalize(eval_tf)
+    if "crops" in args.tta:
+        canvas = int(round(base_size * 1.15))
+        u8_tf = T.Compose([T.Resize((canvas, canvas)), T.PILToTensor()])
+
+    rows_all = read_manifest(args.manifest)
+    train_rows, val_rows, test_rows = build_splits(rows_all, out_root=args.data_root)
+    rows = {"train": train_rows, "val": val_rows, "test": test_rows}[str(args.split)]
+    if args.limit:
+        rows = rows[: int(args.limit)]
+    n = len(rows)
+    if n == 0:
+        raise SystemExit(f"No rows in split {args.split!r}")
+
+    out_dir: Path = args.out_dir
+    shard_dir = out_dir / "shards"
+    shard_dir.mkdir(parents=True, exist_ok=True)
+    extra = {"split": str(args.split), "tta": str(args.tta), "shard_size": int(args.shard_size), "sizes": sizes}
+    fp = _fingerprint(rows, specs, extra)
+    state_path = shard_dir / "export_state.json"
+    if state_path.exists():
+        prev = json.loads(state_path.read_text(encoding="utf-8"))
+        if prev.get("fingerprint") != fp:
+            if not args.overwrite:
+                raise SystemExit(f"{shard_dir} holds shards of a different export; pass --overwrite to discard them.")
+            shutil.rmtree(shard_dir)
+            shard_dir.mkdir(parents=True)
+    state_path.write_text(json.dumps({"fingerprint": fp, "rows": n, **extra}, indent=2), encoding="utf-8")
+
+    num_classes = len(CANONICAL_7)
+    k = len(specs)
+    shard_size = max(1, int(args.shard_size))
+    shards = [(i, lo, min(n, lo + shard_size)) for i, lo in enumerate(range(0, n, shard_size))]
+    ds = ManifestImageDataset(rows, out_root=args.data_root, transform=u8_tf)
+    dl_kwargs: Dict[str, Any] = {
+        "batch_size": int(args.batch_size),
+        "shuffle": False,
+        "num_workers": int(args.num_workers),
+        "pin_memory": device_info.backend == "cuda",
+    }
+    if int(args.num_workers) > 0:
+        dl_kwargs["prefetch_factor"] = 1 if os.name == "nt" else 2
+
+    images_done = 0
+    infer_sec = 0.0
+    for si, lo, hi in shards:
+        part = shard_dir / f"part-{si:05d}.npy"
+        members_part = shard_dir / f"members-{si:05d}.npy"
+        if part.exists() and (members_part.exists() or not args.save_members):
+            continue
+        t_shard = time.perf_counter()
+        ens = np.empty((hi - lo, num_classes), dtype=np.float32)
+        members = np.empty((k, hi - lo, num_classes), dtype=np.float32)
+        pos = 0
+        with torch.no_grad():
+            for x_u8, _y, _src in DataLoader(Subset(ds, range(lo, hi)), **dl_kwargs):
+                x = normalize_uint8_batch(x_u8, device, mean=mean, std=std)
+                bsz = int(x.shape[0])
+                acc = torch.zeros((bsz, num_classes), dtype=torch.float32, device=device)
+                for ti, (model, spec, size) in enumerate(zip(teachers, specs, sizes)):
+                    xt = x
+                    if size != base_size:
+                        full = int(round(size * 1.15)) if "crops" in args.tta else size
+                        xt = F.interpolate(x, size=(full, full), mode="bilinear", align_corners=False, antialias=True)
+                    views = _views(xt, size=size, tta=str(args.tta))
+                    with autocast(autocast_device, enabled=use_amp):
+                        logits = model.forward_infer(torch.cat(views, dim=0)).float()
+                    logits = logits.view(len(views), bsz, num_classes).mean(dim=0)
+                    members[ti, pos : pos + bsz] = logits.cpu().numpy()
+                    acc += float(spec.weight) * logits / float(spec.temperature)
+                ens[pos : pos + bsz] = acc.cpu().numpy()
+                pos += bsz
+        if args.save_members:
+            _atomic_save_npy(members_part, members)
+        _atomic_save_npy(part, ens)
+        dt = time.perf_counter() - t_shard
+        infer_sec += dt
+        images_done += hi - lo
+        print(f"shard {si + 1}/{len(shards)}: rows {lo}-{hi} | {(hi - lo) / max(1e-9, dt):.1f} img/s", flush=True)
+
+    # Finalize: concatenate shards into the memory-mappable arrays train_student.py reads.
+    final = np.lib.format.open_memmap(out_dir / "softlabels.npy.tmp", mode="w+", dtype=np.float32, shape=(n, num_classes))
+    for si, lo, hi in shards:
+        final[lo:hi] = np.load(shard_dir / f"part-{si:05d}.npy")
+    final.flush()
+    del final
+    os.replace(out_dir / "softlabels.npy.tmp", out_dir / "softlabels.npy")
+    if args.save_members:
+        mem = np.lib.format.open_memmap(
+            out_dir / "softlabels_members.npy.tmp", mode="w+", dtype=np.float32, shape=(k, n, num_classes)
+        )
+        for si, lo, hi in shards:
+            mem[:, lo:hi] = np.load(shard_dir / f"members-{si:05d}.npy")
+        mem.flush()
+        del mem
+        os.replace(out_dir / "softlabels_members.npy.tmp", out_dir / "softlabels_members.npy")
+
+    index_tmp = out_dir / "softlabels_index.jsonl.tmp"
+    with index_tmp.open("w", encoding="utf-8") as f:
+        for i, r in enumerate(rows):
+            f.write(json.dumps({"i": i, "image_path": r.image_path, "label": r.label, "source": r.source}) + "\n")
+    os.replace(index_tmp, out_dir / "softlabels_index.jsonl")
+
+    logits_all = torch.from_numpy(np.load(out_dir / "softlabels.npy"))
+    y_all = torch.tensor([LABEL_TO_INDEX[r.label] for r in rows], dtype=torch.int64)
+    acc_v, f1_v, per_f1, nll_v, ece_v = metrics_from_logits(logits_all, y_all, num_classes=num_classes)
+    ensemble_metrics = {
+        "split": str(args.split),
+        "n": int(n),
+        "accuracy": acc_v,
+        "macro_f1": f1_v,
+        "per_class_f1": per_f1,
+        "nll": nll_v,
+        "ece": ece_v,
+    }
+    (out_dir / "ensemble_metrics.json").write_text(json.dumps(ensemble_metrics, indent=2), encoding="utf-8")
+
+    throughput = images_done / infer_sec if infer_sec > 0 else None
+    meta = {
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "manifest": str(args.manifest),
+        "data_root": str(args.data_root),
+        "split": str(args.split),
+        "rows": int(n),
+        "teachers": [asdict(s) | {"image_size": sz} for s, sz in zip(specs, sizes)],
+        "tta": str(args.tta),
+        "amp": bool(use_amp),
+        "device": device_info.detail,
+        "batch_size": int(args.batch_size),
+        "fingerprint": fp,
+        "images_exported_this_run": int(images_done),
+        "images_per_sec": throughput,
+        "config": cfg or None,
+    }
+    (out_dir / "export_meta.json").write_text(json.dumps(meta, indent=2), encoding="utf-8")
+    if not args.keep_shards:
+        shutil.rmtree(shard_dir, ignore_errors=True)
+
+    rate = "-" if throughput is None else f"{throughput:.1f} img/s"
+    print(f"Exported {n} rows x {k} teacher(s) (tta={args.tta}) -> {out_dir} | {rate} | ensemble macro_f1 {f1_v:.4f}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -4,21 +4,191 @@ import argparse
 import json
 import sys
 from pathlib import Path
-from typing import Optional
+from typing import Dict, Optional, Tuple
 
+import numpy as np
 import torch
+import torch.nn.functional as F
 
 REPO_ROOT = Path(__file__).resolve().parents[1]
 sys.path.insert(0, str(REPO_ROOT))
 
 from src.fer.data.manifest_dataset import CANONICAL_7  # noqa: E402
+from src.fer.utils.checkpoint_io import load_checkpoint_args, load_model_state  # noqa: E402
 
+# ImageNet normalization used by build_transforms (scripts/train_teacher.py).
+_MEAN = (0.485, 0.456, 0.406)
+_STD = (0.229, 0.224, 0.225)
 
-def _load_ckpt(path: Path) -> dict:
+
+def meta_path_for_onnx(onnx_path: Path) -> Path:
+    # models/student_best.onnx -> models/student_best_onnx_export_meta.json
+    return onnx_path.with_name(onnx_path.stem + "_onnx_export_meta.json")
+
+
+class _BakedPreprocess(torch.nn.Module):
+    """uint8 BGR crops [N, H, W, 3] -> eval transform -> student -> (logits[, probs]).
+
+    Mirrors build_transforms(train=False) without CLAHE: Resize to round(1.15*S),
+    CenterCrop S, RGB, /255, ImageNet normalize. The resize is antialiased bilinear like
+    PIL's (ONNX Resize antialias=1, opset >= 18); what remains is PIL's uint8 rounding.
+    """
+
+    def __init__(self, model: torch.nn.Module, *, image_size: int, temperature: Optional[float]) -> None:
+        super().__init__()
+        self.model = model
+        self.image_size = int(image_size)
+        self.resize = int(round(image_size * 1.15))
+        self.offset = int(round((self.resize - self.image_size) / 2.0))
+        self.temperature = temperature
+        self.register_buffer("mean", torch.tensor(_MEAN).view(1, 3, 1, 1) * 255.0)
+        self.register_buffer("std", torch.tensor(_STD).view(1, 3, 1, 1) * 255.0)
+
+    def preprocess(self, x_u8: torch.Tensor) -> torch.Tensor:
+        x = x_u8.permute(0, 3, 1, 2).flip(1).float()
+        x = F.interpolate(x, size=(self.resize, self.resize), mode="bilinear", align_corners=False, antialias=True)
+        o, s = self.offset, self.image_size
+        return (x[:, :, o : o + s, o : o + s] - self.mean) / self.std
+
+    def forward(self, x_u8: torch.Tensor):
+        logits = self.model(self.preprocess(x_u8))
+        if self.temperature is None:
+            return logits
+        return logits, torch.softmax(logits / float(self.temperature), dim=1)
+
+
+class _WithSoftmax(torch.nn.Module):
+    def __init__(self, model: torch.nn.Module, temperature: float) -> None:
+        super().__init__()
+        self.model = model
+        self.temperature = float(temperature)
+
+    def forward(self, x: torch.Tensor):
+        logits = self.model(x)
+        return logits, torch.softmax(logits / self.temperature, dim=1)
+
+
+def _calibrated_temperature(checkpoint: Path, override: Optional[float]) -> float:
+    t: Optional[float] = override
+    if t is None:
+        try:
+            calib = json.loads((checkpoint.parent / "calibration.json").read_text(encoding="utf-8"))
+            t = float(calib.get("global_temperature"))
+        except Exception:
+            t = None
+    # Same clamp as the demo's student loader.
+    return float(max(0.5, min(10.0, t if t is not None else 1.0)))
+
+
+def _sample_crops(image_size: int, n: int) -> np.ndarray:
+    # Sharp crops well above the model size (a close face from a 1080p webcam): smooth
+    # shading plus a near-Nyquist grating and per-pixel noise, so a resize that aliases
+    # (no antialiasing) shows up in the PIL parity check instead of averaging out.
+    rng = np.random.default_rng(0)
+    side = max(640, int(round(image_size * 2.5)))
+    yy, xx = np.mgrid[0:side, 0:side].astype(np.float32)
+    out = []
+    for i in range(n):
+        shade = 128.0 + 60.0 * np.sin(xx / (side / 6.0) + i) * np.cos(yy / (side / 5.0))
+        grating = 50.0 * np.sign(np.sin((xx * (0.9 + 0.1 * i) + yy * 0.3) * np.pi / 2.0))
+        img = (shade + grating)[..., None] + rng.normal(0.0, 25.0, size=(side, side, 3))
+        out.append(np.clip(img, 0, 255).astype(np.uint8))
+    return np.ascontiguousarray(np.stack(out))
+
+
+def _eager_reference(
+    model: torch.nn.Module, crops: np.ndarray, *, ckpt_args: dict, image_size: int
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    """(model input, logits) of the Python path used by the demos (PIL eval transform -> model)."""
+    import cv2  # type: ignore
+    from PIL import Image
+
+    from scripts.train_teacher import build_transforms
+
+    tf = build_transforms(
+        image_size=image_size,
+        train=False,
+        use_clahe=bool(ckpt_args.get("use_clahe", False)),
+        clahe_clip=float(ckpt_args.get("clahe_clip") or 2.0),
+        clahe_tile=int(ckpt_args.get("clahe_tile") or 8),
+    )
+    x = torch.stack([tf(Image.fromarray(cv2.cvtColor(c, cv2.COLOR_BGR2RGB))) for c in crops])
+    with torch.no_grad():
+        return x, model(x).float()
+
+
+def _parity(
+    onnx_path: Path, feed: np.ndarray, ref_logits: np.ndarray, *, temperature: Optional[float], atol: float
+) -> Dict[str, object]:
     try:
-        return torch.load(path, map_location="cpu", weights_only=False)
-    except TypeError:
-        return torch.load(path, map_location="cpu")
+        import onnxruntime as ort  # type: ignore
+    except Exception:
+        return {"ok": None, "error": "onnxruntime not installed"}
+    try:
+        sess = ort.InferenceSession(str(onnx_path), providers=["CPUExecutionProvider"])
+        name = sess.get_inputs()[0].name
+        fixed = sess.get_inputs()[0].shape[0]
+        if isinstance(fixed, int):
+            outs = [sess.run(None, {name: feed[i : i + fixed]}) for i in range(0, feed.shape[0], fixed)]
+            got = np.concatenate([o[0] for o in outs], axis=0).astype(np.float32)
+        else:
+            got = sess.run(None, {name: feed})[0].astype(np.float32)
+        diff = float(np.abs(got - ref_logits).max())
+        rec: Dict[str, object] = {
+            "ok": bool(diff <= atol),
+            "max_abs_logit_diff": diff,
+            "atol": float(atol),
+            "top1_agreement": float((got.argmax(1) == ref_logits.argmax(1)).mean()),
+            "batch": int(feed.shape[0]),
+        }
+        if temperature is not None:
+            ref_p = torch.softmax(torch.from_numpy(ref_logits) / float(temperature), dim=1).numpy()
+            got_p = torch.softmax(torch.from_numpy(got) / float(temperature), dim=1).numpy()
+            rec["max_abs_prob_diff"] = float(np.abs(got_p - ref_p).max())
+        return rec
+    except Exception as e:
+        return {"ok": False, "error": f"{type(e).__name__}: {e}"}
+
+
+def _optimize_offline(src: Path, dst: Path, *, level: str) -> Optional[str]:
+    """Save onnxruntime's optimized graph (constant folding, fusions) for faster session startup."""
+    try:
+        import onnxruntime as ort  # type: ignore
+
+        so = ort.SessionOptions()
+        so.graph_optimization_level = {
+            "basic": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+            "extended": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+            "all": ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+        }[level]
+        so.optimized_model_filepath = str(dst)
+        ort.InferenceSession(str(src), sess_options=so, providers=["CPUExecutionProvider"])
+        return None
+    except Exception as e:
+        return f"{type(e).__name__}: {e}"
+
+
+def _convert_fp16(src: Path, dst: Path) -> Optional[str]:
+    # fp16 weights/activations with fp32 (or uint8) graph inputs/outputs kept for callers.
+    try:
+        import onnx  # type: ignore
+        from onnxconverter_common import float16  # type: ignore
+
+        m = float16.convert_float_to_float16(onnx.load(str(src)), keep_io_types=True)
+        onnx.save(m, str(dst))
+        return None
+    except Exception as e:
+        return f"{type(e).__name__}: {e}"
+
+
+def _check(path: Path) -> tuple:
+    try:
+        import onnx  # type: ignore
+
+        onnx.checker.check_model(onnx.load(str(path)))
+        return True, None
+    except Exception as e:  # pragma: no cover
+        return False, str(e)
 
 
 def _export(
@@ -27,9 +197,16 @@ def _export(
     out_onnx: Path,
     opset: int,
     dynamic_batch: bool,
+    bake_preprocess: bool = False,
+    softmax: bool = False,
+    temperature: Optional[float] = None,
+    optimize: Optional[str] = None,
+    fp16: bool = False,
+    parity_batch: int = 4,
+    atol: float = 1e-3,
+    pil_tol: float = 0.05,
 ) -> dict:
-    ckpt = _load_ckpt(checkpoint)
-    ckpt_args = ckpt.get("args") if isinstance(ckpt.get("args"), dict) else {}
+    ckpt_args = load_checkpoint_args(checkpoint)
 
     model_name = str(ckpt_args.get("model") or "mobilenetv3_large_100")
     image_size = int(ckpt_args.get("image_size") or 224)
@@ -40,19 +217,40 @@ def _export(
         raise RuntimeError("timm is required to export student to ONNX") from e
 
     model = timm.create_model(model_name, pretrained=False, num_classes=len(CANONICAL_7))
-    model.load_state_dict(ckpt.get("model", {}), strict=True)
+    model.load_state_dict(load_model_state(checkpoint), strict=True)
     model.eval()
 
-    dummy = torch.randn(1, 3, image_size, image_size, dtype=torch.float32)
+    if bake_preprocess and bool(ckpt_args.get("use_clahe", False)):
+        raise SystemExit("--bake-preprocess cannot express CLAHE; export this CLAHE student without it.")
+    t_cal = _calibrated_temperature(checkpoint, temperature) if softmax else None
 
-    out_onnx.parent.mkdir(parents=True, exist_ok=True)
+    crops = _sample_crops(image_size, max(2, int(parity_batch)) if dynamic_batch else 1)
+    requested_opset = int(opset)
+    if bake_preprocess:
+        # Antialiased Resize needs opset 18, and only the dynamo exporter emits it.
+        opset = max(int(opset), 18)
+        wrapper: torch.nn.Module = _BakedPreprocess(model, image_size=image_size, temperature=t_cal).eval()
+        # torch.export specializes size-1 dims, so trace a dynamic batch with two crops.
+        dummy = torch.from_numpy(crops[:2] if dynamic_batch else crops[:1])
+        feed = crops
+        input_names = ["image_bgr_u8"]
+        in_axes = {0: "batch", 1: "height", 2: "width"}
+    else:
+        wrapper = _WithSoftmax(model, t_cal).eval() if t_cal is not None else model
+        dummy = torch.randn(1, 3, image_size, image_size, dtype=torch.float32)
+        feed = torch.randn(crops.shape[0], 3, image_size, image_size, generator=torch.Generator().manual_seed(0)).numpy()
+        input_names = ["input"]
+        in_axes = {0: "batch"}
+    output_names = ["logits", "probs"] if t_cal is not None else ["logits"]
 
-    input_names = ["input"]
-    output_names = ["logits"]
+    out_onnx.parent.mkdir(parents=True, exist_ok=True)
 
     dynamic_axes = None
     if dynamic_batch:
-        dynamic_axes = {"input": {0: "batch"}, "logits": {0: "batch"}}
+        dynamic_axes = {input_names[0]: in_axes, **{name: {0: "batch"} for name in output_names}}
+    elif bake_preprocess:
+        # Crop size always varies; only the batch dimension is fixed.
+        dynamic_axes = {input_names[0]: {1: "height", 2: "width"}}
 
     export_kwargs = dict(
         input_names=input_names,
@@ -62,28 +260,27 @@ def _export(
         dynamic_axes=dynamic_axes,
     )
 
-    # Prefer the legacy exporter when available to avoid requiring extra deps.
+    # Prefer the legacy exporter when available to avoid requiring extra deps; it has no
+    # antialiased resize, so baked graphs go through the dynamo exporter (onnxscript).
     try:
         import inspect
 
         if "dynamo" in inspect.signature(torch.onnx.export).parameters:
-            export_kwargs["dynamo"] = False
+            export_kwargs["dynamo"] = bool(bake_preprocess)
+            if bake_preprocess:
+                # Students are small: keep the weights inside the .onnx file the loaders open.
+                export_kwargs["external_data"] = False
+        elif bake_preprocess:
+            raise SystemExit("--bake-preprocess needs torch.onnx.export(dynamo=True) (torch >= 2.5 + onnxscript).")
+    except SystemExit:
+        raise
     except Exception:
         pass
 
-    torch.onnx.export(model, dummy, str(out_onnx), **export_kwargs)
+    torch.onnx.export(wrapper, dummy, str(out_onnx), **export_kwargs)
 
     # Optional verification if onnx is installed.
-    ok = False
-    err: Optional[str] = None
-    try:
-        import onnx  # type: ignore
-
-        m = onnx.load(str(out_onnx))
-        onnx.checker.check_model(m)
-        ok = True
-    except Exception as e:  # pragma: no cover
-        err = str(e)
+    ok, err = _check(out_onnx)
 
     meta = {
         "checkpoint": str(checkpoint),
@@ -91,10 +288,62 @@ def _export(
         "image_size": image_size,
         "onnx_path": str(out_onnx),
         "opset": int(opset),
+        "opset_requested": requested_opset,
         "dynamic_batch": bool(dynamic_batch),
         "onnx_check_ok": bool(ok),
         "onnx_check_error": err,
     }
+    if not (bake_preprocess or softmax or optimize or fp16):
+        return meta
+
+    # Parity: the graph against the same wrapper in PyTorch (strict), and for baked
+    # preprocessing also against the demos' PIL transform path (resize interpolation differs).
+    with torch.no_grad():
+        out = wrapper(torch.from_numpy(feed))
+        ref = (out[0] if isinstance(out, tuple) else out).float().numpy()
+    meta.update(
+        {
+            "input": {
+                "name": input_names[0],
+                "layout": "NHWC uint8 BGR, any HxW (cv2 crop)" if bake_preprocess else "NCHW float32 normalized",
+            },
+            "outputs": output_names,
+            "baked_preprocess": bool(bake_preprocess),
+            "temperature": t_cal,
+            "parity": _parity(out_onnx, feed, ref, temperature=t_cal, atol=atol),
+        }
+    )
+    if bake_preprocess:
+        pil_x, eager = _eager_reference(model, crops, ckpt_args=ckpt_args, image_size=image_size)
+        assert isinstance(wrapper, _BakedPreprocess)
+        with torch.no_grad():
+            in_diff = (wrapper.preprocess(torch.from_numpy(feed)) - pil_x).abs()
+        eager_np = eager.numpy()
+        meta["parity_vs_pil_transform"] = {
+            "ok": bool(float(in_diff.max()) <= float(pil_tol)),
+            "crop_size": [int(v) for v in crops.shape[1:3]],
+            "mean_abs_input_diff": float(in_diff.mean()),
+            "max_abs_input_diff": float(in_diff.max()),
+            "tolerance": float(pil_tol),
+            "max_abs_logit_diff": float(np.abs(eager_np - ref).max()),
+            "top1_agreement": float((eager_np.argmax(1) == ref.argmax(1)).mean()),
+        }
+
+    variants: Dict[str, Dict[str, object]] = {}
+    if optimize:
+        opt_path = out_onnx.with_name(out_onnx.stem + "_opt.onnx")
+        opt_err = _optimize_offline(out_onnx, opt_path, level=str(optimize))
+        variants["optimized"] = {"onnx_path": str(opt_path), "level": str(optimize), "error": opt_err}
+        if opt_err is None:
+            variants["optimized"]["parity"] = _parity(opt_path, feed, ref, temperature=t_cal, atol=atol)
+    if fp16:
+        fp16_path = out_onnx.with_name(out_onnx.stem + "_fp16.onnx")
+        fp16_err = _convert_fp16(out_onnx, fp16_path)
+        variants["fp16"] = {"onnx_path": str(fp16_path), "error": fp16_err}
+        if fp16_err is None:
+            # fp16 rounding: compare at a looser tolerance.
+            variants["fp16"]["parity"] = _parity(fp16_path, feed, ref, temperature=t_cal, atol=max(atol, 5e-2))
+    meta["variants"] = variants
     return meta
 
 
@@ -102,9 +351,36 @@ def main() -> int:
     ap = argparse.ArgumentParser(description="Export a student checkpoint (.pt) to ONNX for CPU-friendly deployment.")
     ap.add_argument("--checkpoint", type=Path, required=True)
     ap.add_argument("--out", type=Path, required=True)
-    ap.add_argument("--opset", type=int, default=17)
+    ap.add_argument("--opset", type=int, default=17, help="ONNX opset (raised to 18 for --bake-preprocess: antialiased Resize)")
     ap.add_argument("--dynamic-batch", action="store_true")
     ap.add_argument("--meta-out", type=Path, default=None, help="Optional JSON file to write export metadata")
+    ap.add_argument(
+        "--bake-preprocess",
+        action="store_true",
+        help="Graph input is the raw uint8 BGR face crop [N,H,W,3]; resize/crop/normalize run inside the graph",
+    )
+    ap.add_argument(
+        "--softmax",
+        action="store_true",
+        help="Add a 'probs' output: softmax(logits / T) with T from the run's calibration.json",
+    )
+    ap.add_argument("--temperature", type=float, default=None, help="Override T for --softmax")
+    ap.add_argument(
+        "--optimize",
+        type=str,
+        choices=["basic", "extended", "all"],
+        default=None,
+        help="Also save onnxruntime's offline-optimized graph as <out>_opt.onnx ('all' is CPU-specific)",
+    )
+    ap.add_argument("--fp16", action="store_true", help="Also save an fp16 variant as <out>_fp16.onnx (onnxconverter-common)")
+    ap.add_argument("--parity-batch", type=int, default=4)
+    ap.add_argument("--atol", type=float, default=1e-3, help="Max |onnxruntime - torch| logit difference")
+    ap.add_argument(
+        "--pil-tol",
+        type=float,
+        default=0.05,
+        help="--bake-preprocess: max |baked - PIL eval transform| normalized model-input difference; exceeding it fails the export",
+    )
     args = ap.parse_args()
 
     if not args.checkpoint.exists():
@@ -115,13 +391,36 @@ def main() -> int:
         out_onnx=args.out,
         opset=int(args.opset),
         dynamic_batch=bool(args.dynamic_batch),
+        bake_preprocess=bool(args.bake_preprocess),
+        softmax=bool(args.softmax),
+        temperature=args.temperature,
+        optimize=args.optimize,
+        fp16=bool(args.fp16),
+        parity_batch=int(args.parity_batch),
+        atol=float(args.atol),
+        pil_tol=float(args.pil_tol),
     )
 
     if args.meta_out is not None:
         args.meta_out.parent.mkdir(parents=True, exist_ok=True)
         args.meta_out.write_text(json.dumps(meta, indent=2), encoding="utf-8")
 
+    # Each variant gets its own <stem>_onnx_export_meta.json so loaders can open it directly.
+    variants: Dict[str, Dict[str, object]] = meta.get("variants") or {}  # type: ignore[assignment]
+    for name, v in variants.items():
+        if v.get("error") is None:
+            vmeta = {k: val for k, val in meta.items() if k not in ("variants", "parity")}
+            vmeta.update({"onnx_path": v["onnx_path"], "variant": name, "parity": v.get("parity")})
+            meta_path_for_onnx(Path(str(v["onnx_path"]))).write_text(json.dumps(vmeta, indent=2), encoding="utf-8")
+
     print(json.dumps(meta, indent=2))
+    pil = meta.get("parity_vs_pil_transform")
+    if isinstance(pil, dict) and not pil.get("ok"):
+        print(
+            f"ERROR: baked preprocessing differs from the PIL eval transform by {pil['max_abs_input_diff']:.4f} "
+            f"(> --pil-tol {pil['tolerance']}); the ONNX model would see different inputs than the checkpoint."
+        )
+        return 1
     return 0
 
 
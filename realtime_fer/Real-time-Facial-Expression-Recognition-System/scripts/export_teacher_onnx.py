@@ -0,0 +1,284 @@
+"""Export teacher checkpoints (.pt) to ONNX on the CPU, with validation and metadata.
+
+Single export:
+  .\.venv\Scripts\python.exe scripts\export_teacher_onnx.py --checkpoint outputs\teachers\RUN\best.pt --out outputs\teachers\RUN\best.onnx
+
+Watch mode (what train_teacher.py launches in the background): export
+<run>/checkpoint_last.pt -> last.onnx and <run>/best.pt -> best.onnx whenever they
+change, until stdin is closed; `--once` does a single pass and exits.
+  .\.venv\Scripts\python.exe scripts\export_teacher_onnx.py --watch outputs\teachers\RUN --once
+
+Each export is written atomically, checked with onnx.checker and compared against the
+PyTorch forward_infer on a sample batch with onnxruntime (both optional), and described
+in <run>/<name>_onnx_export_meta.json (e.g. best_onnx_export_meta.json).
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import torch
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+from src.fer.utils.checkpoint_io import load_checkpoint_args, read_checkpoint_meta  # noqa: E402
+
+# (checkpoint name, onnx name) pairs exported by watch mode.
+_WATCHED = (("checkpoint_last.pt", "last.onnx"), ("best.pt", "best.onnx"))
+
+
+def meta_path_for_onnx(onnx_path: Path) -> Path:
+    return onnx_path.with_name(onnx_path.stem + "_onnx_export_meta.json")
+
+
+def _stat_key(path: Path) -> Optional[Tuple[int, int, int]]:
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return (int(st.st_ino), int(st.st_size), int(st.st_mtime_ns))
+
+
+def _legacy_exporter_kwargs(opset: int, dynamic_batch: bool) -> dict:
+    export_kwargs = dict(
+        input_names=["input"],
+        output_names=["logits"],
+        dynamic_axes={"input": {0: "batch"}, "logits": {0: "batch"}} if dynamic_batch else None,
+        opset_version=int(opset),
+    )
+    # Force the legacy exporter when available to avoid requiring `onnxscript`.
+    try:
+        import inspect
+
+        if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+            export_kwargs["dynamo"] = False
+    except Exception:
+        pass
+    return export_kwargs
+
+
+class _InferWrapper(torch.nn.Module):
+    def __init__(self, model: torch.nn.Module) -> None:
+        super().__init__()
+        self.model = model
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        return self.model.forward_infer(x)
+
+
+def _parity(onnx_path: Path, wrapper: torch.nn.Module, sample: torch.Tensor, atol: float) -> Dict[str, object]:
+    try:
+        import onnxruntime as ort  # type: ignore
+    except Exception:
+        return {"ok": None, "error": "onnxruntime not installed"}
+    try:
+        sess = ort.InferenceSession(str(onnx_path), providers=["CPUExecutionProvider"])
+        got = sess.run(None, {sess.get_inputs()[0].name: sample.numpy()})[0]
+        with torch.no_grad():
+            ref = wrapper(sample).numpy()
+        diff = float(abs(got - ref).max())
+        return {"ok": bool(diff <= atol), "max_abs_diff": diff, "atol": float(atol), "batch": int(sample.shape[0])}
+    except Exception as e:
+        return {"ok": False, "error": f"{type(e).__name__}: {e}"}
+
+
+def export_teacher_checkpoint(
+    checkpoint: Path,
+    out_onnx: Path,
+    *,
+    opset: int = 17,
+    dynamic_batch: bool = True,
+    parity_batch: int = 4,
+    atol: float = 1e-3,
+) -> dict:
+    """Export one teacher checkpoint on the CPU; returns (and writes) the export metadata."""
+    from scripts.train_teacher import load_teacher_checkpoint
+
+    t0 = time.time()
+    ckpt_meta = read_checkpoint_meta(checkpoint) or {}
+    ckpt_args = load_checkpoint_args(checkpoint)
+    image_size = int(ckpt_args.get("image_size") or 224)
+    meta: Dict[str, object] = {
+        "checkpoint": str(checkpoint),
+        "checkpoint_epoch": ckpt_meta.get("epoch"),
+        "model": str(ckpt_args.get("model") or ""),
+        "image_size": image_size,
+        "onnx_path": str(out_onnx),
+        "opset": int(opset),
+        "dynamic_batch": bool(dynamic_batch),
+    }
+    try:
+        model, _ = load_teacher_checkpoint(checkpoint, device=torch.device("cpu"))
+        wrapper = _InferWrapper(model).eval()
+
+        out_onnx.parent.mkdir(parents=True, exist_ok=True)
+        tmp = out_onnx.with_name(out_onnx.name + ".tmp")
+        dummy = torch.zeros(1, 3, image_size, image_size)
+        torch.onnx.export(wrapper, dummy, str(tmp), **_legacy_exporter_kwargs(opset, dynamic_batch))
+        os.replace(tmp, out_onnx)
+        meta["export_ok"] = True
+    except Exception as e:
+        meta["export_ok"] = False
+        meta["export_error"] = f"{type(e).__name__}: {e}"
+        out_onnx.with_name(out_onnx.name + ".tmp").unlink(missing_ok=True)
+
+    if meta["export_ok"]:
+        # Optional verification if onnx / onnxruntime are installed.
+        try:
+            import onnx  # type: ignore
+
+            onnx.checker.check_model(onnx.load(str(out_onnx)))
+            meta["onnx_check_ok"], meta["onnx_check_error"] = True, None
+        except Exception as e:
+            meta["onnx_check_ok"], meta["onnx_check_error"] = False, str(e)
+
+        g = torch.Generator().manual_seed(0)
+        sample = torch.randn(max(1, int(parity_batch)) if dynamic_batch else 1, 3, image_size, image_size, generator=g)
+        meta["parity"] = _parity(out_onnx, wrapper, sample, atol)
+
+    meta["export_sec"] = round(time.time() - t0, 3)
+    meta_path = meta_path_for_onnx(out_onnx)
+    tmp_meta = meta_path.with_name(meta_path.name + ".tmp")
+    tmp_meta.write_text(json.dumps(meta, indent=2), encoding="utf-8")
+    os.replace(tmp_meta, meta_path)
+    return meta
+
+
+def export_pass(run_dir: Path, seen: Dict[str, Optional[Tuple[int, int, int]]], **kwargs) -> List[dict]:
+    """Export every watched checkpoint whose file changed since `seen` (updated in place)."""
+    results: List[dict] = []
+    done: Dict[Tuple[int, int, int], Path] = {}
+    for ckpt_name, onnx_name in _WATCHED:
+        ckpt = run_dir / ckpt_name
+        key = _stat_key(ckpt)
+        if key is None or seen.get(ckpt_name) == key:
+            continue
+        out = run_dir / onnx_name
+        src = done.get(key)
+        if src is not None and src.exists():
+            # best.pt is a hard link to checkpoint_last.pt in the epoch it improved: same weights.
+            tmp = out.with_name(out.name + ".tmp")
+            shutil.copyfile(src, tmp)
+            os.replace(tmp, out)
+            meta = json.loads(meta_path_for_onnx(src).read_text(encoding="utf-8"))
+            meta.update({"checkpoint": str(ckpt), "onnx_path": str(out), "copied_from": str(src)})
+            meta_path_for_onnx(out).write_text(json.dumps(meta, indent=2), encoding="utf-8")
+        else:
+            meta = export_teacher_checkpoint(ckpt, out, **kwargs)
+            if meta.get("export_ok"):
+                done[key] = out
+        seen[ckpt_name] = key
+        results.append(meta)
+        status = "ok" if meta.get("export_ok") else f"FAILED ({meta.get('export_error')})"
+        print(f"[onnx-export] {ckpt_name} -> {onnx_name}: {status}", flush=True)
+    return results
+
+
+def watch(run_dir: Path, *, poll_sec: float, once: bool, **kwargs) -> None:
+    """Poll run_dir until stdin reaches EOF; any line on stdin triggers an immediate pass."""
+    seen: Dict[str, Optional[Tuple[int, int, int]]] = {}
+    if once:
+        export_pass(run_dir, seen, **kwargs)
+        return
+
+    wake = threading.Event()
+    stop = threading.Event()
+
+    def _read_stdin() -> None:
+        for _ in sys.stdin:
+            wake.set()
+        stop.set()
+        wake.set()
+
+    threading.Thread(target=_read_stdin, daemon=True).start()
+    while not stop.is_set():
+        wake.wait(timeout=float(poll_sec))
+        wake.clear()
+        export_pass(run_dir, seen, **kwargs)
+    # Final pass: the trainer closes stdin only after its last checkpoint is on disk.
+    export_pass(run_dir, seen, **kwargs)
+
+
+class OnnxExportWatcher:
+    """Trainer-side handle of a background `--watch` exporter process (CPU only)."""
+
+    def __init__(self, run_dir: Path, *, threads: int = 1, poll_sec: float = 30.0) -> None:
+        env = dict(os.environ)
+        env["CUDA_VISIBLE_DEVICES"] = ""
+        cmd = [
+            sys.executable,
+            str(Path(__file__).resolve()),
+            "--watch",
+            str(run_dir),
+            "--threads",
+            str(int(threads)),
+            "--poll-sec",
+            str(float(poll_sec)),
+        ]
+        self._proc: Optional[subprocess.Popen] = subprocess.Popen(cmd, stdin=subprocess.PIPE, env=env, cwd=str(REPO_ROOT))
+
+    def notify(self) -> None:
+        """Ask for an export pass now (call once the checkpoint files are written)."""
+        if self._proc is None or self._proc.stdin is None:
+            return
+        try:
+            self._proc.stdin.write(b"\n")
+            self._proc.stdin.flush()
+        except OSError:
+            pass
+
+    def finish(self) -> int:
+        """Let the watcher export the final checkpoints and wait for it to exit."""
+        if self._proc is None:
+            return 0
+        try:
+            if self._proc.stdin is not None:
+                self._proc.stdin.close()
+        except OSError:
+            pass
+        rc = int(self._proc.wait())
+        self._proc = None
+        return rc
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Export teacher checkpoints (.pt) to ONNX on the CPU.")
+    ap.add_argument("--checkpoint", type=Path, default=None)
+    ap.add_argument("--out", type=Path, default=None)
+    ap.add_argument("--watch", type=Path, default=None, help="Run dir to watch (checkpoint_last.pt/best.pt)")
+    ap.add_argument("--once", action="store_true", help="With --watch: export once and exit")
+    ap.add_argument("--poll-sec", type=float, default=30.0)
+    ap.add_argument("--threads", type=int, default=1, help="torch CPU threads (keep low next to training)")
+    ap.add_argument("--opset", type=int, default=17)
+    ap.add_argument("--parity-batch", type=int, default=4)
+    ap.add_argument("--atol", type=float, default=1e-3, help="Max |onnxruntime - torch| logit difference")
+    args = ap.parse_args()
+
+    torch.set_num_threads(max(1, int(args.threads)))
+    kwargs = {"opset": int(args.opset), "parity_batch": int(args.parity_batch), "atol": float(args.atol)}
+
+    if args.watch is not None:
+        watch(args.watch, poll_sec=float(args.poll_sec), once=bool(args.once), **kwargs)
+        return 0
+
+    if args.checkpoint is None or args.out is None:
+        raise SystemExit("Provide --checkpoint and --out, or --watch RUN_DIR")
+    if not args.checkpoint.exists():
+        raise SystemExit(f"Checkpoint not found: {args.checkpoint}")
+    meta = export_teacher_checkpoint(args.checkpoint, args.out, **kwargs)
+    print(json.dumps(meta, indent=2))
+    return 0 if meta.get("export_ok") else 2
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
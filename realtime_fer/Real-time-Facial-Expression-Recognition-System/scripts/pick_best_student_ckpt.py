@@ -1,12 +1,16 @@
 from __future__ import annotations
 
 import json
+import sys
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Any, Optional
+from typing import Optional
 
 
 REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+from src.fer.utils.run_registry import default_registry_path, entries_under, refresh_registry  # noqa: E402
 
 
 @dataclass(frozen=True)
@@ -23,33 +27,26 @@ def _find_best_student(root: Path) -> Optional[BestStudent]:
     best_ckpt: Optional[Path] = None
     best_metrics: Optional[Path] = None
 
-    for metrics_path in root.rglob("reliabilitymetrics.json"):
-        run_dir = metrics_path.parent
-        ckpt_path = run_dir / "best.pt"
-        if not ckpt_path.exists():
-            continue
-
-        try:
-            rel: Any = json.loads(metrics_path.read_text(encoding="utf-8"))
-        except Exception:
+    # Answer from the run registry; only new/changed run dirs get their JSON re-read.
+    # Read-only: the refreshed view is not written back (tools/diagnostics/index_runs.py does that).
+    entries = refresh_registry(
+        default_registry_path(REPO_ROOT), [root], repo_root=REPO_ROOT, load_checkpoint_args=False
+    )
+    for entry in entries_under(entries, root):
+        if "best.pt" not in entry.artifacts or "reliabilitymetrics.json" not in entry.artifacts:
             continue
-
-        raw = rel.get("raw") if isinstance(rel, dict) else None
-        if not isinstance(raw, dict):
+        if not (entry.run_dir / "best.pt").is_file():
             continue
 
-        macro = raw.get("macro_f1")
-        acc = raw.get("accuracy")
-        if not isinstance(macro, (int, float)) or not isinstance(acc, (int, float)):
+        macro = entry.metric("reliabilitymetrics.json", "raw", "macro_f1")
+        acc = entry.metric("reliabilitymetrics.json", "raw", "accuracy")
+        if macro is None or acc is None:
             continue
 
-        macro_f = float(macro)
-        acc_f = float(acc)
-
-        if (macro_f, acc_f) > (best_macro, best_acc):
-            best_macro, best_acc = macro_f, acc_f
-            best_ckpt = ckpt_path
-            best_metrics = metrics_path
+        if (macro, acc) > (best_macro, best_acc):
+            best_macro, best_acc = macro, acc
+            best_ckpt = entry.run_dir / "best.pt"
+            best_metrics = entry.run_dir / "reliabilitymetrics.json"
 
     if best_ckpt is None or best_metrics is None:
         return None
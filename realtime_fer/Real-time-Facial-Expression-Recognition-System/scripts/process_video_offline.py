@@ -0,0 +1,400 @@
+"""Offline (batched) FER over a recorded video, writing the realtime demo's CSV artifacts.
+
+The live demo handles one frame at a time (detect -> crop -> classify, batch size 1). For
+post-session analysis this script runs the same building blocks from demo/realtime_demo.py
+(FaceDetector, largest face + margin crop, student model, TemporalSmoother) in batches:
+- A reader thread decodes the video and hands over batches of --batch-frames frames,
+  so decoding overlaps detection/classification. With --stride K only every K-th frame is
+  decoded (the others are grabbed and dropped).
+- The DNN detector runs each batch as one cv2.dnn.blobFromImages forward pass
+  (yunet/haar fall back to per-frame detection).
+- All face crops of a batch are classified in one forward pass (student .pt on torch or a
+  float-input .onnx; export with --dynamic-batch to batch on onnxruntime too).
+
+Outputs in --output-dir use the demo schema, so scripts/score_live_results.py and
+scripts/sweep_smoothing_params.py work unchanged: per_frame.csv (one row per processed
+frame; frame_index/time_sec are positions in the video), events.csv,
+demoresultssummary.csv, per_class_correctness.csv, thresholds.json, plus
+offline_meta.json with throughput numbers (processed FPS, x realtime).
+
+Manual labels: --manual-events takes the events.csv of a labeled live session recorded
+to this video and fills manual_label by frame range; without it the labels are empty.
+
+Usage (PowerShell):
+  .\.venv\Scripts\python.exe scripts\process_video_offline.py --video recordings\session1.mp4
+  .\.venv\Scripts\python.exe scripts\process_video_offline.py --video recordings\session1.mp4 --stride 2 --batch-frames 32 --manual-events demo\outputs\RUN\events.csv
+  .\.venv\Scripts\python.exe scripts\process_video_offline.py --video recordings\session1.mp4 --model-ckpt outputs\students\RUN\best.onnx --thresholds demo\outputs\RUN\thresholds.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import cv2  # type: ignore
+import numpy as np
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+import demo.realtime_demo as rd  # noqa: E402
+from src.fer.inference.labels import CANONICAL_7  # noqa: E402
+from src.fer.realtime.smoothing import TemporalSmoother  # noqa: E402
+from src.fer.realtime.sources import open_source  # noqa: E402
+
+
+_END = None  # reader -> main sentinel
+
+
+def _read_batches(
+    cap,
+    out: "queue.Queue",
+    *,
+    batch_frames: int,
+    stride: int,
+    max_frames: int,
+    stop: threading.Event,
+    errors: List[BaseException],
+) -> None:
+    """Reader thread: put lists of (frame_index, frame) on `out`, then the _END sentinel."""
+    grab = getattr(cap, "grab", None)
+    batch: List[Tuple[int, np.ndarray]] = []
+    idx = 0
+    try:
+        while not stop.is_set():
+            if max_frames and idx >= max_frames:
+                break
+            if idx % stride and grab is not None:
+                # Skipped frame: demux without the retrieve/convert step.
+                if not grab():
+                    break
+            else:
+                ok, frame = cap.read()
+                if not ok:
+                    break
+                if idx % stride == 0:
+                    batch.append((idx, frame))
+                    if len(batch) >= batch_frames:
+                        out.put(batch)
+                        batch = []
+            idx += 1
+        if batch:
+            out.put(batch)
+    except BaseException as e:  # surfaced by the main thread
+        errors.append(e)
+    finally:
+        out.put(_END)
+
+
+def _read_manual_events(path: Path) -> List[Tuple[int, int, str, Dict[str, str]]]:
+    events: List[Tuple[int, int, str, Dict[str, str]]] = []
+    with path.open("r", newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            label = (row.get("label") or "").strip()
+            if label not in CANONICAL_7:
+                continue
+            try:
+                start, end = int(float(row["start_frame"])), int(float(row["end_frame"]))
+            except Exception:
+                continue
+            events.append((start, end, label, dict(row)))
+    return sorted(events, key=lambda e: e[0])
+
+
+def _manual_label_at(events: List[Tuple[int, int, str, Dict[str, str]]], frame_index: int) -> str:
+    # Events are few and sorted; the last one starting at or before the frame wins.
+    label = ""
+    for start, end, name, _row in events:
+        if start > frame_index:
+            break
+        if frame_index <= end:
+            label = name
+    return label
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Batched offline FER over a video (demo CSV schema).")
+    ap.add_argument("--video", type=str, required=True, help="Video file path (or 'synthetic[:WxH]' for a smoke test).")
+    ap.add_argument(
+        "--model-ckpt",
+        type=Path,
+        default=None,
+        help="Student checkpoint (.pt) or float-input .onnx. Default: best student under outputs/students/.",
+    )
+    ap.add_argument("--temperature", type=float, default=None)
+    ap.add_argument("--temperature-json", type=Path, default=None)
+    ap.add_argument("--device", type=str, default="auto", choices=["auto", "cpu", "cuda", "dml"])
+    ap.add_argument("--detector", type=str, choices=["yunet", "dnn", "haar"], default="dnn")
+    ap.add_argument("--batch-frames", type=int, default=16, help="Frames per detector/classifier batch.")
+    ap.add_argument("--stride", type=int, default=1, help="Process every K-th frame (smoothing runs on those frames).")
+    ap.add_argument("--max-frames", type=int, default=0, help="Stop after N video frames (0 = whole video).")
+    ap.add_argument("--queue-batches", type=int, default=4, help="Decoded batches buffered ahead of the model.")
+    ap.add_argument("--threads", type=int, default=0, help="Pin OpenCV / torch / onnxruntime CPU threads (0 = defaults).")
+    ap.add_argument("--thresholds", type=Path, default=None, help="thresholds.json with smoothing params (demo output).")
+    ap.add_argument("--manual-events", type=Path, default=None, help="events.csv of a labeled live session of this video.")
+    ap.add_argument(
+        "--output-dir",
+        type=Path,
+        default=REPO_ROOT / "demo" / "outputs" / ("offline_" + time.strftime("%Y%m%d_%H%M%S")),
+    )
+    args = ap.parse_args()
+
+    if str(args.video).lower() == "webcam":
+        raise SystemExit("--video must be a file (use demo/realtime_demo.py for the webcam).")
+    stride = max(1, int(args.stride))
+    batch_frames = max(1, int(args.batch_frames))
+
+    ckpt_path: Optional[Path] = args.model_ckpt or rd._find_best_student_ckpt()
+    if ckpt_path is None:
+        raise SystemExit("No checkpoint provided and no student checkpoints found under outputs/students/.")
+    if not ckpt_path.exists():
+        raise SystemExit(f"Checkpoint not found: {ckpt_path}")
+
+    infer_batch, model_meta = rd._load_student_batch(
+        ckpt_path,
+        temperature=args.temperature,
+        temperature_json=args.temperature_json,
+        prefer_device=str(args.device),
+        threads=int(args.threads),
+    )
+    if int(args.threads) > 0:
+        cv2.setNumThreads(int(args.threads))
+        if "torch" in sys.modules:
+            sys.modules["torch"].set_num_threads(int(args.threads))
+
+    detector = rd.FaceDetector(args.detector, model_dir=REPO_ROOT / "demo" / "models")
+
+    params = rd.Params()
+    if args.thresholds is not None:
+        th = json.loads(args.thresholds.read_text(encoding="utf-8"))
+        params.ema_alpha = float(th.get("ema_alpha", params.ema_alpha))
+        params.hysteresis_delta = float(th.get("hysteresis_delta", params.hysteresis_delta))
+        params.vote_window = int(th.get("vote_window", params.vote_window))
+        params.vote_min_count = int(th.get("vote_min_count", params.vote_min_count))
+    smoother = TemporalSmoother(len(CANONICAL_7), vote_window=params.vote_window)
+
+    manual_events = _read_manual_events(args.manual_events) if args.manual_events is not None else []
+
+    cap, input_name = open_source(str(args.video), synthetic_frames=int(args.max_frames))
+    if not cap.isOpened():
+        raise SystemExit(f"Failed to open video: {args.video}")
+    fps = float(cap.get(cv2.CAP_PROP_FPS) or 0.0)
+    if fps <= 0:
+        fps = 30.0
+        print("Warning: video reports no FPS; assuming 30 for time_sec.")
+
+    out_dir: Path = args.output_dir
+    out_dir.mkdir(parents=True, exist_ok=True)
+    frames_csv = out_dir / "per_frame.csv"
+    events_csv = out_dir / "events.csv"
+    summary_csv = out_dir / "demoresultssummary.csv"
+    per_class_csv = out_dir / "per_class_correctness.csv"
+    thresholds_json = out_dir / "thresholds.json"
+    meta_json = out_dir / "offline_meta.json"
+
+    batches: "queue.Queue" = queue.Queue(maxsize=max(1, int(args.queue_batches)))
+    stop = threading.Event()
+    reader_errors: List[BaseException] = []
+    reader = threading.Thread(
+        target=_read_batches,
+        args=(cap, batches),
+        kwargs={
+            "batch_frames": batch_frames,
+            "stride": stride,
+            "max_frames": int(args.max_frames),
+            "stop": stop,
+            "errors": reader_errors,
+        },
+        daemon=True,
+    )
+
+    stage_sec = {"wait_decode": 0.0, "detect": 0.0, "classify": 0.0, "smooth_log": 0.0}
+    frames_processed = 0
+    faces_found = 0
+    last_frame_index = -1
+
+    t_start = time.perf_counter()
+    reader.start()
+    try:
+        with frames_csv.open("w", newline="", encoding="utf-8") as f_frames:
+            w_frames = csv.DictWriter(
+                f_frames,
+                fieldnames=[
+                    "frame_index",
+                    "time_sec",
+                    "manual_label",
+                    "pred_label",
+                    *[f"prob_{name}" for name in CANONICAL_7],
+                    "detector",
+                    "model",
+                    "ckpt",
+                ],
+            )
+            w_frames.writeheader()
+
+            while True:
+                t0 = time.perf_counter()
+                batch = batches.get()
+                t1 = time.perf_counter()
+                stage_sec["wait_decode"] += t1 - t0
+                if batch is _END:
+                    break
+
+                boxes = [rd._largest_face(faces) for faces in detector.detect_batch([f for _i, f in batch])]
+                t2 = time.perf_counter()
+                stage_sec["detect"] += t2 - t1
+
+                crops = [rd._crop_with_margin(f, b) for (_i, f), b in zip(batch, boxes) if b is not None]
+                _logits, probs_all = infer_batch(crops)
+                t3 = time.perf_counter()
+                stage_sec["classify"] += t3 - t2
+
+                k = 0
+                for (frame_index, _frame), box in zip(batch, boxes):
+                    probs = [0.0] * len(CANONICAL_7)
+                    pred_idx: Optional[int] = None
+                    if box is not None:
+                        probs = probs_all[k].tolist()
+                        k += 1
+                        faces_found += 1
+                        pred_idx = smoother.update(
+                            probs,
+                            ema_alpha=params.ema_alpha,
+                            hysteresis_delta=params.hysteresis_delta,
+                            vote_window=params.vote_window,
+                            vote_min_count=params.vote_min_count,
+                        )
+                    w_frames.writerow(
+                        {
+                            "frame_index": frame_index,
+                            "time_sec": f"{frame_index / fps:.6f}",
+                            "manual_label": _manual_label_at(manual_events, frame_index),
+                            "pred_label": CANONICAL_7[pred_idx] if pred_idx is not None else "(unstable)",
+                            **{f"prob_{name}": f"{float(probs[i]):.6f}" for i, name in enumerate(CANONICAL_7)},
+                            "detector": args.detector,
+                            "model": model_meta.get("model"),
+                            "ckpt": model_meta.get("ckpt"),
+                        }
+                    )
+                    last_frame_index = frame_index
+                frames_processed += len(batch)
+                stage_sec["smooth_log"] += time.perf_counter() - t3
+    finally:
+        stop.set()
+        # Unblock a reader waiting on a full queue, then let it finish.
+        while reader.is_alive():
+            try:
+                batches.get_nowait()
+            except queue.Empty:
+                reader.join(timeout=0.05)
+        cap.release()
+    if reader_errors:
+        raise reader_errors[0]
+    wall = time.perf_counter() - t_start
+
+    with events_csv.open("w", newline="", encoding="utf-8") as f_events:
+        w = csv.DictWriter(
+            f_events,
+            fieldnames=["label", "start_frame", "end_frame", "start_time_sec", "end_time_sec", "source"],
+            extrasaction="ignore",
+        )
+        w.writeheader()
+        for _start, _end, _label, row in manual_events:
+            w.writerow(row)
+
+    thresholds_json.write_text(
+        json.dumps(
+            {
+                "ema_alpha": params.ema_alpha,
+                "hysteresis_delta": params.hysteresis_delta,
+                "vote_window": params.vote_window,
+                "vote_min_count": params.vote_min_count,
+                "show_emo_ratio": params.show_emo_ratio,
+            },
+            indent=2,
+        ),
+        encoding="utf-8",
+    )
+
+    with summary_csv.open("w", newline="", encoding="utf-8") as f_sum:
+        w = csv.DictWriter(
+            f_sum,
+            fieldnames=[
+                "time",
+                "input",
+                "detector",
+                "ckpt",
+                "model",
+                "frames_logged",
+                "events_logged",
+                "ema_alpha",
+                "hysteresis_delta",
+                "vote_window",
+                "vote_min_count",
+            ],
+        )
+        w.writeheader()
+        w.writerow(
+            {
+                "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "input": input_name,
+                "detector": args.detector,
+                "ckpt": model_meta.get("ckpt"),
+                "model": model_meta.get("model"),
+                "frames_logged": int(frames_processed),
+                "events_logged": int(len(manual_events)),
+                "ema_alpha": params.ema_alpha,
+                "hysteresis_delta": params.hysteresis_delta,
+                "vote_window": params.vote_window,
+                "vote_min_count": params.vote_min_count,
+            }
+        )
+
+    rd._write_per_class_correctness_summary(
+        per_frame_csv=frames_csv,
+        out_csv=per_class_csv,
+        classes=list(CANONICAL_7),
+    )
+
+    video_sec = (last_frame_index + 1) / fps if last_frame_index >= 0 else 0.0
+    meta = {
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "input": input_name,
+        "video_fps": fps,
+        "detector": args.detector,
+        "model": model_meta,
+        "batch_frames": batch_frames,
+        "stride": stride,
+        "threads": int(args.threads),
+        "cpu_count": os.cpu_count(),
+        "frames_processed": int(frames_processed),
+        "faces_found": int(faces_found),
+        "video_sec": round(video_sec, 3),
+        "wall_sec": round(wall, 3),
+        "processed_fps": round(frames_processed / wall, 2) if wall > 0 else 0.0,
+        "x_realtime": round(video_sec / wall, 2) if wall > 0 else 0.0,
+        "stage_sec": {k: round(v, 3) for k, v in stage_sec.items()},
+    }
+    meta_json.write_text(json.dumps(meta, indent=2), encoding="utf-8")
+
+    print(
+        f"{input_name}: {frames_processed} frames (stride {stride}) in {wall:.2f}s | "
+        f"{meta['processed_fps']} FPS | {meta['x_realtime']}x realtime | faces {faces_found}/{frames_processed}"
+    )
+    print("  " + " | ".join(f"{k} {v:.2f}s" for k, v in stage_sec.items()))
+    print("\nWrote artifacts:")
+    for p in (frames_csv, events_csv, summary_csv, per_class_csv, thresholds_json, meta_json):
+        print(f"- {p}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
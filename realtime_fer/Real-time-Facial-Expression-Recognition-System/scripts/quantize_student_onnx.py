@@ -0,0 +1,291 @@
+"""Static INT8 (QDQ) quantization of an exported student ONNX model.
+
+Calibrates activation ranges on a stratified sample of the manifest's val split (same
+ManifestImageDataset + eval transform as training), writes the QDQ model and compares
+fp32 vs INT8 on an eval split with the student metrics (accuracy / macro-F1 / NLL / ECE),
+plus single-image CPU latency.
+
+Output metadata (<out stem>_onnx_export_meta.json) has the same keys as the fp32
+export meta (e.g. models/student_best_onnx_export_meta.json) plus a `quantization`
+block, so the demo loads the INT8 model like any other student ONNX.
+
+Requires onnxruntime (and onnx for the checker).
+
+Usage (PowerShell):
+  .\.venv\Scripts\python.exe scripts\quantize_student_onnx.py --onnx models\student_best.onnx --out models\student_best_int8.onnx
+  .\.venv\Scripts\python.exe scripts\quantize_student_onnx.py --onnx models\student_best.onnx --out models\student_best_int8.onnx --calib-method percentile --calib-size 1000 --eval-split test
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader, Subset
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+from scripts.export_student_onnx import meta_path_for_onnx  # noqa: E402
+from scripts.train_student import metrics_from_logits  # noqa: E402
+from scripts.train_teacher import build_transforms  # noqa: E402
+from src.fer.data.eval_cache import stratified_indices  # noqa: E402
+from src.fer.data.manifest_dataset import (  # noqa: E402
+    CANONICAL_7,
+    LABEL_TO_INDEX,
+    ManifestImageDataset,
+    ManifestRow,
+    build_splits,
+    read_manifest,
+)
+from src.fer.utils.checkpoint_io import load_checkpoint_args  # noqa: E402
+
+
+def _session(path: Path, *, threads: int):
+    import onnxruntime as ort  # type: ignore
+
+    so = ort.SessionOptions()
+    if int(threads) > 0:
+        so.intra_op_num_threads = int(threads)
+    return ort.InferenceSession(str(path), sess_options=so, providers=["CPUExecutionProvider"])
+
+
+def _fixed_batch(sess) -> Optional[int]:
+    dim = sess.get_inputs()[0].shape[0]
+    return int(dim) if isinstance(dim, int) else None
+
+
+def _batches(ds: ManifestImageDataset, indices: Sequence[int], *, batch_size: int, num_workers: int) -> Iterator[tuple]:
+    dl = DataLoader(Subset(ds, list(indices)), batch_size=int(batch_size), shuffle=False, num_workers=int(num_workers))
+    for x, y, _src in dl:
+        yield x.numpy().astype(np.float32, copy=False), y
+
+
+def _run(sess, ds, indices, *, batch_size: int, num_workers: int) -> tuple:
+    name = sess.get_inputs()[0].name
+    fixed = _fixed_batch(sess)
+    logits: List[np.ndarray] = []
+    ys: List[torch.Tensor] = []
+    for x, y in _batches(ds, indices, batch_size=batch_size, num_workers=num_workers):
+        if fixed is None:
+            logits.append(sess.run(None, {name: x})[0])
+        else:
+            # Exported without --dynamic-batch: feed the batch one fixed-size slice at a time.
+            logits.extend(sess.run(None, {name: x[i : i + fixed]})[0] for i in range(0, x.shape[0], fixed))
+        ys.append(y)
+    return torch.from_numpy(np.concatenate(logits, axis=0)).float(), torch.cat(ys)
+
+
+def _latency_ms(sess, image_size: int, *, iters: int, warmup: int = 5) -> Dict[str, float]:
+    name = sess.get_inputs()[0].name
+    x = np.random.default_rng(0).standard_normal((1, 3, image_size, image_size)).astype(np.float32)
+    for _ in range(int(warmup)):
+        sess.run(None, {name: x})
+    times: List[float] = []
+    for _ in range(max(1, int(iters))):
+        t0 = time.perf_counter()
+        sess.run(None, {name: x})
+        times.append((time.perf_counter() - t0) * 1000.0)
+    times.sort()
+    return {"p50_ms": statistics.median(times), "p95_ms": times[min(len(times) - 1, int(0.95 * len(times)))]}
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Static INT8 QDQ quantization of a student ONNX model (CPU).")
+    ap.add_argument("--onnx", type=Path, required=True, help="fp32 student ONNX (scripts/export_student_onnx.py)")
+    ap.add_argument("--out", type=Path, required=True, help="INT8 ONNX output path")
+    ap.add_argument(
+        "--checkpoint",
+        type=Path,
+        default=None,
+        help="Student checkpoint for image size / CLAHE (default: 'checkpoint' from the fp32 export meta)",
+    )
+    ap.add_argument(
+        "--manifest",
+        type=Path,
+        default=REPO_ROOT / "Training_data_cleaned" / "classification_manifest_hq_train.csv",
+    )
+    ap.add_argument("--data-root", type=Path, default=REPO_ROOT / "Training_data_cleaned")
+    ap.add_argument("--seed", type=int, default=1337, help="build_splits seed (match training)")
+    ap.add_argument("--calib-size", type=int, default=512, help="Stratified val images used for calibration")
+    ap.add_argument(
+        "--calib-method", type=str, choices=["minmax", "entropy", "percentile"], default="minmax"
+    )
+    ap.add_argument("--per-channel", action=argparse.BooleanOptionalAction, default=True)
+    ap.add_argument("--eval-split", type=str, choices=["val", "test"], default="val")
+    ap.add_argument("--eval-max", type=int, default=0, help="Cap eval images (0 = whole split)")
+    ap.add_argument("--batch-size", type=int, default=64)
+    ap.add_argument("--num-workers", type=int, default=0)
+    ap.add_argument("--threads", type=int, default=0, help="onnxruntime intra-op threads for eval/latency (0 = default)")
+    ap.add_argument("--bench-iters", type=int, default=100)
+    args = ap.parse_args()
+
+    try:
+        import onnxruntime  # type: ignore  # noqa: F401
+        from onnxruntime.quantization import (  # type: ignore
+            CalibrationDataReader,
+            CalibrationMethod,
+            QuantFormat,
+            QuantType,
+            quantize_static,
+        )
+    except Exception as e:
+        raise SystemExit(f"onnxruntime (with onnxruntime.quantization) is required: {e}")
+
+    if not args.onnx.exists():
+        raise SystemExit(f"ONNX model not found: {args.onnx}")
+    fp32_meta: Dict[str, object] = {}
+    if meta_path_for_onnx(args.onnx).exists():
+        fp32_meta = json.loads(meta_path_for_onnx(args.onnx).read_text(encoding="utf-8"))
+
+    ckpt_path = args.checkpoint or (Path(str(fp32_meta["checkpoint"])) if fp32_meta.get("checkpoint") else None)
+    ckpt_args: Dict[str, object] = {}
+    if ckpt_path is not None and ckpt_path.exists():
+        ckpt_args = load_checkpoint_args(ckpt_path)
+    image_size = int(fp32_meta.get("image_size") or ckpt_args.get("image_size") or 224)
+    use_clahe = bool(ckpt_args.get("use_clahe", False))
+    clahe_clip = float(ckpt_args.get("clahe_clip") or 2.0)
+    clahe_tile = int(ckpt_args.get("clahe_tile") or 8)
+
+    val_tf = build_transforms(
+        image_size=image_size, train=False, use_clahe=use_clahe, clahe_clip=clahe_clip, clahe_tile=clahe_tile
+    )
+    rows_all = read_manifest(args.manifest)
+    _train_rows, val_rows, test_rows = build_splits(rows_all, out_root=args.data_root, seed=int(args.seed))
+    if not val_rows:
+        raise SystemExit(f"No val rows in {args.manifest} (needed for calibration)")
+
+    def _labels(rows: Sequence[ManifestRow]) -> List[int]:
+        return [LABEL_TO_INDEX[r.label] for r in rows]
+
+    calib_ds = ManifestImageDataset(val_rows, out_root=args.data_root, transform=val_tf)
+    calib_idx = stratified_indices(
+        _labels(val_rows), frac=min(1.0, int(args.calib_size) / max(1, len(val_rows))), seed=int(args.seed)
+    )
+
+    fp32_sess = _session(args.onnx, threads=int(args.threads))
+    input_name = fp32_sess.get_inputs()[0].name
+    if fp32_sess.get_inputs()[0].type != "tensor(float)":
+        raise SystemExit("Quantize the plain float32 export (export_student_onnx.py without --bake-preprocess).")
+    fixed = _fixed_batch(fp32_sess)
+
+    class _ValReader(CalibrationDataReader):
+        def __init__(self) -> None:
+            self._it: Optional[Iterator[tuple]] = None
+
+        def get_next(self):
+            if self._it is None:
+                self._it = _batches(
+                    calib_ds, calib_idx, batch_size=fixed or int(args.batch_size), num_workers=int(args.num_workers)
+                )
+            nxt = next(self._it, None)
+            return None if nxt is None else {input_name: nxt[0]}
+
+        def rewind(self) -> None:
+            self._it = None
+
+    print(f"Calibrating on {len(calib_idx)} stratified val images ({args.calib_method}, per_channel={args.per_channel})")
+    t0 = time.perf_counter()
+    args.out.parent.mkdir(parents=True, exist_ok=True)
+    tmp = args.out.with_name(args.out.stem + ".tmp.onnx")
+    calib_method = {
+        "minmax": CalibrationMethod.MinMax,
+        "entropy": CalibrationMethod.Entropy,
+        "percentile": CalibrationMethod.Percentile,
+    }[str(args.calib_method)]
+    quantize_static(
+        str(args.onnx),
+        str(tmp),
+        _ValReader(),
+        quant_format=QuantFormat.QDQ,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        per_channel=bool(args.per_channel),
+        calibrate_method=calib_method,
+    )
+    os.replace(tmp, args.out)
+    quant_sec = time.perf_counter() - t0
+
+    ok = False
+    err: Optional[str] = None
+    try:
+        import onnx  # type: ignore
+
+        onnx.checker.check_model(onnx.load(str(args.out)))
+        ok = True
+    except Exception as e:  # pragma: no cover
+        err = str(e)
+
+    # fp32 vs INT8 on the eval split (same rows for both).
+    eval_rows = (test_rows or val_rows) if args.eval_split == "test" else val_rows
+    if args.eval_max:
+        eval_rows = eval_rows[: int(args.eval_max)]
+    eval_ds = ManifestImageDataset(eval_rows, out_root=args.data_root, transform=val_tf)
+    eval_idx = range(len(eval_rows))
+    int8_sess = _session(args.out, threads=int(args.threads))
+    kw = {"batch_size": int(args.batch_size), "num_workers": int(args.num_workers)}
+    fp32_logits, y = _run(fp32_sess, eval_ds, eval_idx, **kw)
+    int8_logits, _ = _run(int8_sess, eval_ds, eval_idx, **kw)
+    m_fp32 = metrics_from_logits(fp32_logits, y, num_classes=len(CANONICAL_7))
+    m_int8 = metrics_from_logits(int8_logits, y, num_classes=len(CANONICAL_7))
+    delta = {k: float(m_int8[k]) - float(m_fp32[k]) for k in ("accuracy", "macro_f1", "nll", "ece")}
+    agreement = float((fp32_logits.argmax(dim=1) == int8_logits.argmax(dim=1)).float().mean().item())
+
+    lat_fp32 = _latency_ms(fp32_sess, image_size, iters=int(args.bench_iters))
+    lat_int8 = _latency_ms(int8_sess, image_size, iters=int(args.bench_iters))
+
+    meta = {
+        "checkpoint": fp32_meta.get("checkpoint") or (str(ckpt_path) if ckpt_path is not None else None),
+        "model": fp32_meta.get("model") or ckpt_args.get("model"),
+        "image_size": image_size,
+        "onnx_path": str(args.out),
+        "opset": fp32_meta.get("opset"),
+        "dynamic_batch": fixed is None,
+        "onnx_check_ok": bool(ok),
+        "onnx_check_error": err,
+        "quantization": {
+            "source_onnx": str(args.onnx),
+            "format": "QDQ",
+            "activation_type": "uint8",
+            "weight_type": "int8",
+            "per_channel": bool(args.per_channel),
+            "calib_method": str(args.calib_method),
+            "calib_images": len(calib_idx),
+            "calib_manifest": str(args.manifest),
+            "quantize_sec": round(quant_sec, 3),
+            "eval_split": str(args.eval_split),
+            "eval_images": len(eval_rows),
+            "fp32": m_fp32,
+            "int8": m_int8,
+            "delta": delta,
+            "top1_agreement": agreement,
+            "latency_batch1": {
+                "fp32": lat_fp32,
+                "int8": lat_int8,
+                "speedup_p50": lat_fp32["p50_ms"] / max(1e-9, lat_int8["p50_ms"]),
+            },
+            "use_clahe": use_clahe,
+        },
+    }
+    meta_path_for_onnx(args.out).write_text(json.dumps(meta, indent=2), encoding="utf-8")
+
+    print(
+        f"INT8 vs fp32 on {args.eval_split} ({len(eval_rows)} imgs): "
+        f"acc {delta['accuracy']:+.4f} | macro_f1 {delta['macro_f1']:+.4f} | ece {delta['ece']:+.4f} | "
+        f"agreement {agreement:.4f} | p50 {lat_fp32['p50_ms']:.2f} -> {lat_int8['p50_ms']:.2f} ms "
+        f"({meta['quantization']['latency_batch1']['speedup_p50']:.2f}x)"
+    )
+    print(f"Wrote {args.out} and {meta_path_for_onnx(args.out)}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -2,21 +2,47 @@ from __future__ import annotations
 
 import argparse
 import csv
+import glob
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 
+import numpy as np
+
 
 @dataclass(frozen=True)
-class FrameRow:
-    frame_index: int
-    time_sec: float
-    manual_label: str
-    pred_label: str
+class FrameLog:
+    """Columns of a per_frame.csv as arrays (one entry per parsed row).
+
+    Labels are integer codes into `labels`; -1 means "no manual label" (manual) or
+    "no valid prediction" (pred: empty or '(unstable)').
+    """
+
+    frame_index: np.ndarray  # int64
+    time_sec: np.ndarray  # float64
+    manual: np.ndarray  # int64 codes
+    pred: np.ndarray  # int64 codes
+    labels: Tuple[str, ...]
+    unstable_frames: int
+
+    def __len__(self) -> int:
+        return int(self.time_sec.size)
+
+
+def _is_valid_label(s: str) -> bool:
+    return bool(s) and s != "(unstable)"
 
 
-def _read_per_frame_csv(path: Path) -> List[FrameRow]:
-    rows: List[FrameRow] = []
+def _read_per_frame_csv(path: Path) -> FrameLog:
+    codes: Dict[str, int] = {}
+    frame_index: List[int] = []
+    time_sec: List[float] = []
+    manual: List[int] = []
+    pred: List[int] = []
+    unstable = 0
     with path.open("r", newline="", encoding="utf-8") as f:
         r = csv.DictReader(f)
         for d in r:
@@ -28,23 +54,73 @@ def _read_per_frame_csv(path: Path) -> List[FrameRow]:
                 ts = float(d.get("time_sec") or 0.0)
             except Exception:
                 ts = 0.0
-            rows.append(
-                FrameRow(
-                    frame_index=fi,
-                    time_sec=ts,
-                    manual_label=(d.get("manual_label") or "").strip(),
-                    pred_label=(d.get("pred_label") or "").strip(),
-                )
-            )
-    return rows
+            m = (d.get("manual_label") or "").strip()
+            p = (d.get("pred_label") or "").strip()
+            if p == "(unstable)":
+                unstable += 1
+            frame_index.append(fi)
+            time_sec.append(ts)
+            manual.append(codes.setdefault(m, len(codes)) if m else -1)
+            pred.append(codes.setdefault(p, len(codes)) if _is_valid_label(p) else -1)
+    return FrameLog(
+        frame_index=np.asarray(frame_index, dtype=np.int64),
+        time_sec=np.asarray(time_sec, dtype=np.float64),
+        manual=np.asarray(manual, dtype=np.int64),
+        pred=np.asarray(pred, dtype=np.int64),
+        labels=tuple(codes),
+        unstable_frames=int(unstable),
+    )
 
 
-def _is_valid_label(s: str) -> bool:
-    return bool(s) and s != "(unstable)"
+def _transition_fair_mask(
+    time_sec: np.ndarray,
+    manual: np.ndarray,
+    *,
+    min_hold_ms: float,
+    exclusion_ms: float,
+) -> np.ndarray:
+    """Boolean mask of frames scored by the protocol-lite rule.
+
+    `manual` holds per-frame label codes (-1 = no manual label). Segments are runs of
+    equal codes; a labeled segment lasting at least min_hold_ms contributes the frames
+    whose time lies within [t_start + exclusion, t_end - exclusion].
+    """
+
+    n = int(time_sec.size)
+    if n == 0:
+        return np.zeros((0,), dtype=bool)
+
+    starts = np.concatenate([[0], np.flatnonzero(np.diff(manual)) + 1])
+    ends = np.concatenate([starts[1:] - 1, [n - 1]])
+    t0 = time_sec[starts]
+    t1 = time_sec[ends]
+    dur_ms = np.maximum(0.0, (t1 - t0) * 1000.0)
+    excl = exclusion_ms / 1000.0
+    left_t = t0 + excl
+    right_t = t1 - excl
+    keep = (manual[starts] != -1) & ~(dur_ms < min_hold_ms)
+
+    if not bool(np.all(np.diff(time_sec) >= 0.0)):
+        # Non-monotonic timestamps (clock jumps): compare every frame to its segment bounds.
+        lengths = ends - starts + 1
+        return (
+            np.repeat(keep, lengths)
+            & (np.repeat(left_t, lengths) <= time_sec)
+            & (time_sec <= np.repeat(right_t, lengths))
+        )
+
+    # Sorted timestamps: each kept segment scores one contiguous index range.
+    lo = np.maximum(np.searchsorted(time_sec, left_t, side="left"), starts)
+    hi = np.minimum(np.searchsorted(time_sec, right_t, side="right"), ends + 1)
+    ok = keep & (lo < hi)
+    edges = np.zeros((n + 1,), dtype=np.int64)
+    np.add.at(edges, lo[ok], 1)
+    np.add.at(edges, hi[ok], -1)
+    return np.cumsum(edges[:-1]) > 0
 
 
 def _score_transition_fair(
-    frames: List[FrameRow],
+    frames: FrameLog,
     *,
     min_hold_ms: float,
     exclusion_ms: float,
@@ -54,112 +130,183 @@ def _score_transition_fair(
     - Only score frames where manual_label exists.
     - Ignore frames within +/- exclusion_ms of a manual label change.
     - Ignore segments shorter than min_hold_ms.
+    - Frames without a valid prediction ('(unstable)') count as incorrect.
     """
 
-    if not frames:
+    if not len(frames):
         return {"scored_frames": 0.0, "accuracy": 0.0}
 
-    # Identify manual segments.
-    segments: List[Tuple[int, int, str]] = []
-    start = 0
-    cur = frames[0].manual_label
-    for i in range(1, len(frames)):
-        if frames[i].manual_label != cur:
-            segments.append((start, i - 1, cur))
-            start = i
-            cur = frames[i].manual_label
-    segments.append((start, len(frames) - 1, cur))
-
-    # Build a mask of frames to score.
-    score_mask = [False] * len(frames)
-
-    for seg_start, seg_end, label in segments:
-        if not label:
-            continue
-
-        # Segment duration
-        t0 = frames[seg_start].time_sec
-        t1 = frames[seg_end].time_sec
-        dur_ms = max(0.0, (t1 - t0) * 1000.0)
-        if dur_ms < min_hold_ms:
-            continue
-
-        # Exclude transition zones
-        excl = exclusion_ms / 1000.0
-        left_t = t0 + excl
-        right_t = t1 - excl
-        for i in range(seg_start, seg_end + 1):
-            t = frames[i].time_sec
-            if left_t <= t <= right_t:
-                score_mask[i] = True
-
-    scored = 0
-    correct = 0
-
-    for i, fr in enumerate(frames):
-        if not score_mask[i]:
-            continue
-        if not _is_valid_label(fr.pred_label):
-            # considered incorrect
-            scored += 1
-            continue
-        scored += 1
-        if fr.pred_label == fr.manual_label:
-            correct += 1
+    mask = _transition_fair_mask(
+        frames.time_sec, frames.manual, min_hold_ms=min_hold_ms, exclusion_ms=exclusion_ms
+    )
+    scored = int(mask.sum())
+    correct = int((mask & (frames.pred >= 0) & (frames.pred == frames.manual)).sum())
 
     acc = (correct / scored) if scored else 0.0
     return {"scored_frames": float(scored), "accuracy": float(acc)}
 
 
-def _jitter_rate(frames: List[FrameRow]) -> float:
+def _jitter_rate(frames: FrameLog) -> float:
     """Pred label flips per minute (ignoring '(unstable)')."""
-    preds = [fr.pred_label for fr in frames if _is_valid_label(fr.pred_label)]
-    if len(preds) < 2:
+    preds = frames.pred[frames.pred >= 0]
+    if preds.size < 2:
         return 0.0
-    flips = 0
-    prev = preds[0]
-    for p in preds[1:]:
-        if p != prev:
-            flips += 1
-        prev = p
-    duration_sec = max(1e-6, frames[-1].time_sec - frames[0].time_sec)
+    flips = int(np.count_nonzero(preds[1:] != preds[:-1]))
+    duration_sec = max(1e-6, float(frames.time_sec[-1] - frames.time_sec[0]))
     return float(flips / (duration_sec / 60.0))
 
 
-def main() -> int:
-    ap = argparse.ArgumentParser(description="Score demo per-frame logs against manual labels (protocol-lite).")
-    ap.add_argument("--per-frame", type=Path, required=True, help="per_frame.csv from demo/realtime_demo.py")
-    ap.add_argument("--out", type=Path, required=True, help="Where to write score_results.json")
-    ap.add_argument("--min-hold-ms", type=float, default=600.0)
-    ap.add_argument("--exclusion-ms", type=float, default=250.0)
-    args = ap.parse_args()
-
-    frames = _read_per_frame_csv(args.per_frame)
-    if not frames:
-        raise SystemExit(f"No rows read from: {args.per_frame}")
+def _score_file(per_frame: Path, min_hold_ms: float, exclusion_ms: float) -> Optional[Dict[str, object]]:
+    frames = _read_per_frame_csv(per_frame)
+    if not len(frames):
+        return None
 
     # Basic counts
-    manual_frames = sum(1 for fr in frames if fr.manual_label)
-    unstable_frames = sum(1 for fr in frames if fr.pred_label == "(unstable)")
+    manual_frames = int(np.count_nonzero(frames.manual >= 0))
 
-    scored = _score_transition_fair(frames, min_hold_ms=float(args.min_hold_ms), exclusion_ms=float(args.exclusion_ms))
+    scored = _score_transition_fair(frames, min_hold_ms=float(min_hold_ms), exclusion_ms=float(exclusion_ms))
     jitter = _jitter_rate(frames)
 
-    payload = {
-        "per_frame": str(args.per_frame),
+    return {
+        "per_frame": str(per_frame),
         "frames_total": int(len(frames)),
         "frames_with_manual": int(manual_frames),
-        "unstable_frames": int(unstable_frames),
+        "unstable_frames": int(frames.unstable_frames),
         "protocol": {
-            "min_hold_ms": float(args.min_hold_ms),
-            "exclusion_ms": float(args.exclusion_ms),
+            "min_hold_ms": float(min_hold_ms),
+            "exclusion_ms": float(exclusion_ms),
         },
         "scored": scored,
         "jitter_flips_per_min": float(jitter),
     }
 
+
+def _batch_output_names(paths: List[Path]) -> List[str]:
+    """Unique <name>_score_results.json per input for --out-dir.
+
+    The name is the input's path relative to the common root of all inputs, joined with
+    "__" ("per_frame.csv" itself is dropped), so sessions from different recordings
+    folders that share a directory name do not overwrite each other.
+    """
+    if not paths:
+        return []
+    root = Path(os.path.commonpath([str(p.parent) for p in paths]))
+    if len(paths) == 1:
+        root = root.parent
+    names: List[str] = []
+    used: Dict[str, int] = {}
+    for p in paths:
+        rel = p.relative_to(root)
+        parts = list(rel.parent.parts) + ([] if p.name == "per_frame.csv" else [p.stem])
+        stem = "__".join(parts) or p.parent.name or p.stem
+        n = used.get(stem, 0)
+        used[stem] = n + 1
+        names.append(f"{stem}_score_results.json" if n == 0 else f"{stem}_{n}_score_results.json")
+    return names
+
+
+def _score_batch(
+    paths: List[Path], *, out_dir: Optional[Path], min_hold_ms: float, exclusion_ms: float, workers: int
+) -> List[Dict[str, object]]:
+    results: List[Dict[str, object]] = []
+    out_names = _batch_output_names(paths)
+    n_workers = max(1, min(int(workers) or (os.cpu_count() or 1), len(paths)))
+    with ProcessPoolExecutor(max_workers=n_workers) as ex:
+        futs = [ex.submit(_score_file, p, float(min_hold_ms), float(exclusion_ms)) for p in paths]
+        for path, out_name, fut in zip(paths, out_names, futs):
+            payload = fut.result()
+            if payload is None:
+                print(f"Skipped (no rows): {path}")
+                continue
+            # Default: score_results.json next to each per_frame.csv.
+            if out_dir is None:
+                out = path.parent / "score_results.json"
+            else:
+                out = out_dir / out_name
+            out.parent.mkdir(parents=True, exist_ok=True)
+            out.write_text(json.dumps(payload, indent=2), encoding="utf-8")
+            results.append(payload)
+            print(f"Wrote: {out}")
+    return results
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Score demo per-frame logs against manual labels (protocol-lite).")
+    ap.add_argument("--per-frame", type=Path, default=None, help="per_frame.csv from demo/realtime_demo.py")
+    ap.add_argument("--out", type=Path, default=None, help="Where to write score_results.json")
+    ap.add_argument(
+        "--glob",
+        action="append",
+        default=None,
+        help="Batch mode: glob(s) of per_frame.csv files (repeatable). Writes one score_results.json per session.",
+    )
+    ap.add_argument(
+        "--out-dir",
+        type=Path,
+        default=None,
+        help=(
+            "Batch mode output dir (default: next to each per_frame.csv); files are named after each input's "
+            "path relative to the common root of the matches. Also gets score_results_batch.csv."
+        ),
+    )
+    ap.add_argument("--workers", type=int, default=0, help="Batch mode process pool size (0 = os.cpu_count()).")
+    ap.add_argument("--min-hold-ms", type=float, default=600.0)
+    ap.add_argument("--exclusion-ms", type=float, default=250.0)
+    args = ap.parse_args()
+
+    if args.glob:
+        paths = sorted({Path(m).resolve() for pat in args.glob for m in glob.glob(pat, recursive=True)})
+        if not paths:
+            raise SystemExit(f"No per_frame.csv files matched: {args.glob}")
+        results = _score_batch(
+            paths,
+            out_dir=args.out_dir,
+            min_hold_ms=float(args.min_hold_ms),
+            exclusion_ms=float(args.exclusion_ms),
+            workers=int(args.workers),
+        )
+        if args.out_dir is not None and results:
+            summary = args.out_dir / "score_results_batch.csv"
+            with summary.open("w", newline="", encoding="utf-8") as f:
+                w = csv.DictWriter(
+                    f,
+                    fieldnames=[
+                        "per_frame",
+                        "frames_total",
+                        "frames_with_manual",
+                        "unstable_frames",
+                        "scored_frames",
+                        "accuracy",
+                        "jitter_flips_per_min",
+                    ],
+                )
+                w.writeheader()
+                for res in results:
+                    scored = res["scored"]
+                    assert isinstance(scored, dict)
+                    w.writerow(
+                        {
+                            "per_frame": res["per_frame"],
+                            "frames_total": res["frames_total"],
+                            "frames_with_manual": res["frames_with_manual"],
+                            "unstable_frames": res["unstable_frames"],
+                            "scored_frames": int(scored["scored_frames"]),
+                            "accuracy": f"{float(scored['accuracy']):.6f}",
+                            "jitter_flips_per_min": f"{float(res['jitter_flips_per_min']):.4f}",
+                        }
+                    )
+            print(f"Wrote: {summary}")
+        return 0
+
+    if args.per_frame is None or args.out is None:
+        raise SystemExit("Provide --per-frame and --out, or --glob for batch mode.")
+
+    payload = _score_file(args.per_frame, float(args.min_hold_ms), float(args.exclusion_ms))
+    if payload is None:
+        raise SystemExit(f"No rows read from: {args.per_frame}")
+
     args.out.parent.mkdir(parents=True, exist_ok=True)
-    args.out.write_text(__import__("json").dumps(payload, indent=2), encoding="utf-8")
+    args.out.write_text(json.dumps(payload, indent=2), encoding="utf-8")
     print(f"Wrote: {args.out}")
     return 0
 
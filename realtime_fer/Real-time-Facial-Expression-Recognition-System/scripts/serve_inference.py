@@ -0,0 +1,96 @@
+"""Local FER inference service: one student model, dynamically batched, over localhost HTTP.
+
+Loads the student once (.pt on torch or float-input .onnx on onnxruntime) and serves the
+binary protocol of src/fer/inference/service.py. Concurrent /infer requests (from several
+demos, streams or processes) are merged into batches of up to --max-batch crops, each
+waiting at most --max-wait-ms for company.
+
+Clients: src.fer.inference.service.InferenceClient (same infer(face_bgr) interface as the
+demo loaders); demo/realtime_demo.py and demo/mvp_demo.py take --infer-url.
+Load test: tools/diagnostics/bench_inference_service.py.
+
+Usage (PowerShell):
+  .\.venv\Scripts\python.exe scripts\serve_inference.py --model-ckpt outputs\students\RUN\best.pt
+  .\.venv\Scripts\python.exe scripts\serve_inference.py --model-ckpt outputs\students\RUN\best_int8.onnx --port 8766 --max-batch 32 --max-wait-ms 5 --threads 4
+  .\.venv\Scripts\python.exe demo\realtime_demo.py --infer-url http://127.0.0.1:8765
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+import demo.realtime_demo as rd  # noqa: E402
+from src.fer.inference.service import make_server  # noqa: E402
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Serve a student FER model over localhost HTTP with dynamic batching.")
+    ap.add_argument(
+        "--model-ckpt",
+        type=Path,
+        default=None,
+        help="Student checkpoint (.pt) or float-input .onnx. Default: best student under outputs/students/.",
+    )
+    ap.add_argument("--temperature", type=float, default=None)
+    ap.add_argument("--temperature-json", type=Path, default=None)
+    ap.add_argument("--device", type=str, default="auto", choices=["auto", "cpu", "cuda", "dml"])
+    ap.add_argument("--host", type=str, default="127.0.0.1", help="Bind address (keep it local).")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--max-batch", type=int, default=16)
+    ap.add_argument("--max-wait-ms", type=float, default=3.0, help="Deadline for filling a batch after its first crop.")
+    ap.add_argument("--threads", type=int, default=0, help="Pin torch / onnxruntime CPU threads (0 = defaults).")
+    args = ap.parse_args()
+
+    ckpt_path: Optional[Path] = args.model_ckpt or rd._find_best_student_ckpt()
+    if ckpt_path is None:
+        raise SystemExit("No checkpoint provided and no student checkpoints found under outputs/students/.")
+    if not ckpt_path.exists():
+        raise SystemExit(f"Checkpoint not found: {ckpt_path}")
+
+    infer_batch, model_meta = rd._load_student_batch(
+        ckpt_path,
+        temperature=args.temperature,
+        temperature_json=args.temperature_json,
+        prefer_device=str(args.device),
+        threads=int(args.threads),
+    )
+    if int(args.threads) > 0 and "torch" in sys.modules:
+        sys.modules["torch"].set_num_threads(int(args.threads))
+
+    # Warm up at the largest batch so the first requests do not pay for allocation.
+    size = int(model_meta["image_size"])
+    infer_batch([np.zeros((size, size, 3), dtype=np.uint8)] * int(args.max_batch))
+
+    server = make_server(
+        infer_batch,
+        model_meta,
+        host=str(args.host),
+        port=int(args.port),
+        max_batch=int(args.max_batch),
+        max_wait_ms=float(args.max_wait_ms),
+    )
+    print(
+        f"Serving {model_meta['model']} ({model_meta['device']}) on http://{args.host}:{args.port} "
+        f"| max batch {args.max_batch}, max wait {args.max_wait_ms} ms",
+        flush=True,
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.batcher.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,396 @@
+"""Offline replay of demo smoothing over recorded sessions, swept across a parameter grid.
+
+Loads the logged per-frame probabilities (`prob_*` columns of per_frame.csv) and replays the
+demo pipeline (EMA -> hysteresis -> vote window) for every combination of
+ema_alpha x hysteresis_delta x vote_window x vote_min_count, vectorized:
+- EMA is computed once per alpha (all alphas advance together).
+- Hysteresis state advances for all (alpha, delta) pairs together.
+- Vote windows use per-class cumulative counts, so every window/min-count is O(frames x classes).
+
+Each setting is scored with the same protocol as scripts/score_live_results.py
+(transition-fair accuracy + jitter flips/min), pooled over sessions (sessions run on a
+process pool). Writes one CSV row per setting plus a JSON with the accuracy/jitter Pareto front.
+
+Note: probabilities are replayed from the 6-decimal CSV values; frames where no face was
+detected (all probabilities 0) stay "(unstable)" and do not advance the smoothing state,
+exactly like the live demo.
+
+Usage (PowerShell):
+  .\.venv\Scripts\python.exe scripts\sweep_smoothing_params.py --glob "demo/outputs/*/per_frame.csv" --out-dir outputs/smoothing_sweep
+  .\.venv\Scripts\python.exe scripts\sweep_smoothing_params.py --alphas 0.5:0.95:0.05 --deltas 0:0.2:0.02 --vote-windows 1:31:2 --vote-min-counts 1:16:1
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from itertools import product
+from pathlib import Path
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+from scripts.score_live_results import _transition_fair_mask  # noqa: E402
+
+# Keep in sync with src.fer.data.manifest_dataset.CANONICAL_7 (not imported here to avoid
+# pulling torch/torchvision into the worker processes).
+CANONICAL_7: Tuple[str, ...] = ("Angry", "Disgust", "Fear", "Happy", "Sad", "Surprise", "Neutral")
+
+
+@dataclass(frozen=True)
+class Grid:
+    alphas: Tuple[float, ...]
+    deltas: Tuple[float, ...]
+    windows: Tuple[int, ...]
+    min_counts: Tuple[int, ...]
+
+    def settings(self) -> List[Tuple[float, float, int, int]]:
+        return [
+            (a, d, w, m)
+            for a, d, w, m in product(self.alphas, self.deltas, self.windows, self.min_counts)
+            if m <= w
+        ]
+
+
+@dataclass(frozen=True)
+class Session:
+    path: str
+    time_sec: np.ndarray  # (F,) float64
+    manual: np.ndarray  # (F,) int64; -1 = no manual label, <= -2 = label outside CANONICAL_7
+    probs: np.ndarray  # (F, C) float64
+
+
+def _read_session(path: Path) -> Session:
+    name_to_idx = {name: i for i, name in enumerate(CANONICAL_7)}
+    unknown: Dict[str, int] = {}
+    prob_cols = [f"prob_{name}" for name in CANONICAL_7]
+
+    times: List[float] = []
+    manual: List[int] = []
+    probs: List[List[float]] = []
+    with path.open("r", newline="", encoding="utf-8") as f:
+        for d in csv.DictReader(f):
+            try:
+                int(float(d.get("frame_index") or 0))
+            except Exception:
+                continue
+            try:
+                ts = float(d.get("time_sec") or 0.0)
+            except Exception:
+                ts = 0.0
+            lab = (d.get("manual_label") or "").strip()
+            if not lab:
+                code = -1
+            elif lab in name_to_idx:
+                code = name_to_idx[lab]
+            else:
+                code = unknown.setdefault(lab, -2 - len(unknown))
+            try:
+                row = [float(d.get(c) or 0.0) for c in prob_cols]
+            except ValueError:
+                row = [0.0] * len(prob_cols)
+            times.append(ts)
+            manual.append(code)
+            probs.append(row)
+
+    return Session(
+        path=str(path),
+        time_sec=np.asarray(times, dtype=np.float64),
+        manual=np.asarray(manual, dtype=np.int64),
+        probs=np.asarray(probs, dtype=np.float64).reshape(-1, len(CANONICAL_7)),
+    )
+
+
+def _replay_ema(p: np.ndarray, alphas: np.ndarray) -> np.ndarray:
+    """EMA for every alpha at once: (A, F, C). Same float ops as the demo loop."""
+    out = np.empty((alphas.size,) + p.shape, dtype=np.float64)
+    if p.shape[0] == 0:
+        return out
+    a = alphas[:, None]
+    b = 1.0 - a
+    out[:, 0] = p[0]
+    for t in range(1, p.shape[0]):
+        out[:, t] = a * out[:, t - 1] + b * p[t]
+    return out
+
+
+def _replay_hysteresis(ema: np.ndarray, deltas: np.ndarray) -> np.ndarray:
+    """Hysteresis label sequence for every (alpha, delta): (A, D, F)."""
+    n_a, n_f, _ = ema.shape
+    out = np.empty((n_a, deltas.size, n_f), dtype=np.int8)
+    if n_f == 0:
+        return out
+    top = ema.argmax(axis=2)  # (A, F)
+    top_val = np.take_along_axis(ema, top[:, :, None], axis=2)[:, :, 0]
+    rows = np.arange(n_a)[:, None]
+    cur = np.repeat(top[:, :1], deltas.size, axis=1)
+    out[:, :, 0] = cur
+    d = deltas[None, :]
+    for t in range(1, n_f):
+        switch = top_val[:, t, None] >= ema[rows, t, cur] + d
+        cur = np.where(switch, top[:, t, None], cur)
+        out[:, :, t] = cur
+    return out
+
+
+class _WindowVoter:
+    """Trailing-window majority vote over one hysteresis sequence, for any window length.
+
+    Ties resolve like Counter.most_common: the tied label seen first in the window wins.
+    """
+
+    def __init__(self, h: np.ndarray, num_classes: int) -> None:
+        n = int(h.size)
+        self.h = h
+        self.n = n
+        onehot = h[:, None] == np.arange(num_classes, dtype=h.dtype)[None, :]
+        self.cum = np.zeros((n + 1, num_classes), dtype=np.int32)
+        np.cumsum(onehot, axis=0, out=self.cum[1:])
+        pos = np.where(onehot, np.arange(n, dtype=np.int32)[:, None], np.int32(n))
+        self.next_occ = np.minimum.accumulate(pos[::-1], axis=0)[::-1]
+
+    def vote(self, window: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(label, count) of the window majority per frame."""
+        if window <= 1:
+            return self.h, np.full((self.n,), np.iinfo(np.int32).max, dtype=np.int32)
+        lo = np.maximum(np.arange(self.n) - window + 1, 0)
+        counts = self.cum[1:] - self.cum[lo]
+        best_cnt = counts.max(axis=1)
+        key = np.where(counts == best_cnt[:, None], self.next_occ[lo], np.int32(self.n))
+        return key.argmin(axis=1).astype(np.int8), best_cnt
+
+
+def _count_at_least(values: np.ndarray, thresholds: np.ndarray) -> np.ndarray:
+    """For each threshold m, how many entries of `values` are >= m."""
+    if values.size == 0:
+        return np.zeros(thresholds.shape, dtype=np.int64)
+    v = np.sort(values)
+    return v.size - np.searchsorted(v, thresholds, side="left")
+
+
+def _jitter_flips(pred: np.ndarray) -> np.ndarray:
+    """Label flips between consecutive valid (>= 0) predictions, per row of (S, F)."""
+    n_s, n_f = pred.shape
+    if n_f < 2:
+        return np.zeros((n_s,), dtype=np.int64)
+    valid = pred >= 0
+    idx = np.where(valid, np.arange(n_f, dtype=np.int32)[None, :], np.int32(-1))
+    last = np.maximum.accumulate(idx, axis=1)
+    # Label of the previous valid frame (-1 when there is none yet).
+    flat = last[:, :-1] + (np.arange(n_s, dtype=np.int32) * n_f)[:, None]
+    prev_val = np.where(last[:, :-1] >= 0, pred.ravel()[np.maximum(flat, 0)], -1)
+    cur = pred[:, 1:]
+    return ((cur >= 0) & (prev_val >= 0) & (cur != prev_val)).sum(axis=1)
+
+
+def _sweep_session(path: str, grid: Grid, min_hold_ms: float, exclusion_ms: float) -> Dict[str, object]:
+    sess = _read_session(Path(path))
+    n_frames = int(sess.time_sec.size)
+    settings = grid.settings()
+    index = {s: i for i, s in enumerate(settings)}
+
+    correct = np.zeros((len(settings),), dtype=np.int64)
+    flips = np.zeros((len(settings),), dtype=np.int64)
+    valid = np.zeros((len(settings),), dtype=np.int64)
+
+    mask = _transition_fair_mask(
+        sess.time_sec, sess.manual, min_hold_ms=float(min_hold_ms), exclusion_ms=float(exclusion_ms)
+    )
+    face = np.flatnonzero((sess.probs != 0.0).any(axis=1))
+    face_manual = sess.manual[face]
+    face_mask = mask[face]
+
+    alphas = np.asarray(grid.alphas, dtype=np.float64)
+    deltas = np.asarray(grid.deltas, dtype=np.float64)
+    ema = _replay_ema(sess.probs[face], alphas)
+    hyst = _replay_hysteresis(ema, deltas)
+    mins = np.asarray(grid.min_counts, dtype=np.int64)
+
+    for ai, a in enumerate(grid.alphas):
+        for di, d in enumerate(grid.deltas):
+            voter = _WindowVoter(hyst[ai, di], len(CANONICAL_7))
+            for w in grid.windows:
+                m_arr = mins[mins <= w]
+                if not m_arr.size:
+                    continue
+                best, best_cnt = voter.vote(int(w))
+                sel = [index[(a, d, w, int(m))] for m in m_arr]
+                hit = (best == face_manual) & face_mask
+                correct[sel] = _count_at_least(best_cnt[hit], m_arr)
+                valid[sel] = _count_at_least(best_cnt, m_arr)
+                pred = np.where(best_cnt[None, :] >= m_arr[:, None], best[None, :], np.int8(-1))
+                flips[sel] = _jitter_flips(pred)
+
+    duration_sec = float(sess.time_sec[-1] - sess.time_sec[0]) if n_frames else 0.0
+    return {
+        "path": path,
+        "frames_total": n_frames,
+        "scored_frames": int(mask.sum()),
+        "duration_min": max(1e-6, duration_sec) / 60.0,
+        "correct": correct,
+        "valid": valid,
+        # score_live_results reports 0 jitter when fewer than 2 valid predictions exist.
+        "flips": np.where(valid >= 2, flips, 0),
+    }
+
+
+def _pareto_front(acc: np.ndarray, jitter: np.ndarray) -> List[int]:
+    """Indices not dominated on (max accuracy, min jitter), ordered by jitter."""
+    order = np.lexsort((-acc, jitter))
+    front: List[int] = []
+    best_acc = -np.inf
+    for i in order:
+        if acc[i] > best_acc:
+            front.append(int(i))
+            best_acc = float(acc[i])
+    return front
+
+
+def _parse_values(spec: str, cast) -> Tuple:
+    """'0.5,0.7,0.9' or 'start:stop:step' (inclusive stop)."""
+    spec = spec.strip()
+    if ":" in spec:
+        start, stop, step = (float(x) for x in spec.split(":"))
+        n = int(np.floor((stop - start) / step + 1e-9)) + 1
+        vals = [cast(round(start + i * step, 10)) for i in range(max(0, n))]
+    else:
+        vals = [cast(x) for x in spec.split(",") if x.strip()]
+    return tuple(dict.fromkeys(vals))
+
+
+def _expand_globs(patterns: Sequence[str]) -> List[Path]:
+    out = set()
+    for pat in patterns:
+        if not Path(pat).is_absolute():
+            pat = str(REPO_ROOT / pat)
+        for m in glob.glob(pat, recursive=True):
+            if Path(m).is_file():
+                out.add(Path(m).resolve())
+    return sorted(out)
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Replay demo smoothing over recorded sessions across a parameter grid.")
+    ap.add_argument(
+        "--glob",
+        action="append",
+        default=None,
+        help="Glob(s) for per_frame.csv files (default: demo/outputs/*/per_frame.csv).",
+    )
+    ap.add_argument("--alphas", type=str, default="0.0:0.95:0.05")
+    ap.add_argument("--deltas", type=str, default="0.0:0.2:0.02")
+    ap.add_argument("--vote-windows", type=str, default="1:31:2")
+    ap.add_argument("--vote-min-counts", type=str, default="1:16:1")
+    ap.add_argument("--min-hold-ms", type=float, default=600.0)
+    ap.add_argument("--exclusion-ms", type=float, default=250.0)
+    ap.add_argument("--workers", type=int, default=0, help="Process pool size (0 = os.cpu_count()).")
+    ap.add_argument("--out-dir", type=Path, default=REPO_ROOT / "outputs" / "smoothing_sweep")
+    args = ap.parse_args()
+
+    paths = _expand_globs(args.glob or ["demo/outputs/*/per_frame.csv"])
+    if not paths:
+        raise SystemExit("No per_frame.csv files matched.")
+
+    grid = Grid(
+        alphas=_parse_values(args.alphas, float),
+        deltas=_parse_values(args.deltas, float),
+        windows=_parse_values(args.vote_windows, lambda x: int(float(x))),
+        min_counts=_parse_values(args.vote_min_counts, lambda x: int(float(x))),
+    )
+    settings = grid.settings()
+    if not settings:
+        raise SystemExit("Empty parameter grid (every vote_min_count exceeds every vote_window).")
+    print(f"sessions={len(paths)} settings={len(settings)}")
+
+    t0 = time.perf_counter()
+    workers = int(args.workers) or (os.cpu_count() or 1)
+    correct = np.zeros((len(settings),), dtype=np.int64)
+    flips = np.zeros((len(settings),), dtype=np.int64)
+    valid = np.zeros((len(settings),), dtype=np.int64)
+    scored = 0
+    frames = 0
+    minutes = 0.0
+    with ProcessPoolExecutor(max_workers=min(workers, len(paths))) as ex:
+        futs = [
+            ex.submit(_sweep_session, str(p), grid, float(args.min_hold_ms), float(args.exclusion_ms))
+            for p in paths
+        ]
+        for fut in futs:
+            res = fut.result()
+            correct += res["correct"]
+            flips += res["flips"]
+            valid += res["valid"]
+            scored += int(res["scored_frames"])
+            frames += int(res["frames_total"])
+            minutes += float(res["duration_min"])
+            print(f"- {res['path']}: frames={res['frames_total']}")
+    elapsed = time.perf_counter() - t0
+
+    acc = correct / scored if scored else np.zeros_like(correct, dtype=np.float64)
+    jitter = flips / minutes
+    unstable = 1.0 - valid / max(1, frames)
+    front = _pareto_front(acc, jitter)
+
+    def _row(i: int) -> Dict[str, object]:
+        a, d, w, m = settings[i]
+        return {
+            "ema_alpha": a,
+            "hysteresis_delta": d,
+            "vote_window": w,
+            "vote_min_count": m,
+            "accuracy": float(acc[i]),
+            "jitter_flips_per_min": float(jitter[i]),
+            "unstable_frac": float(unstable[i]),
+        }
+
+    out_dir: Path = args.out_dir
+    out_dir.mkdir(parents=True, exist_ok=True)
+    with (out_dir / "sweep_results.csv").open("w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=list(_row(0).keys()))
+        w.writeheader()
+        for i in range(len(settings)):
+            w.writerow(_row(i))
+
+    payload = {
+        "sessions": [str(p) for p in paths],
+        "frames_total": int(frames),
+        "scored_frames": int(scored),
+        "protocol": {"min_hold_ms": float(args.min_hold_ms), "exclusion_ms": float(args.exclusion_ms)},
+        "grid": {
+            "ema_alpha": list(grid.alphas),
+            "hysteresis_delta": list(grid.deltas),
+            "vote_window": list(grid.windows),
+            "vote_min_count": list(grid.min_counts),
+        },
+        "settings": len(settings),
+        "elapsed_sec": float(elapsed),
+        "pareto_front": [_row(i) for i in front],
+    }
+    (out_dir / "sweep_pareto.json").write_text(json.dumps(payload, indent=2), encoding="utf-8")
+
+    print(f"\nReplayed {len(settings)} settings x {frames} frames in {elapsed:.1f}s")
+    print("Pareto front (accuracy vs jitter):")
+    for i in front:
+        r = _row(i)
+        print(
+            f"  a={r['ema_alpha']:.2f} d={r['hysteresis_delta']:.2f} vote={r['vote_window']}/{r['vote_min_count']}"
+            f"  acc={r['accuracy']:.4f} jitter={r['jitter_flips_per_min']:.2f}/min unstable={r['unstable_frac']:.3f}"
+        )
+    print(f"\nWrote: {out_dir / 'sweep_results.csv'}")
+    print(f"Wrote: {out_dir / 'sweep_pareto.json'}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
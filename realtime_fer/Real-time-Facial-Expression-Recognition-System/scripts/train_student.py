@@ -8,27 +8,55 @@ import os
 import random
 import sys
 import time
+from dataclasses import asdict
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 
 import torch
 import torch.nn.functional as F
 from torch import nn
 from torch.amp import GradScaler, autocast
-from torch.utils.data import DataLoader
+from torch.utils.data import DataLoader, DistributedSampler, Subset
 
 REPO_ROOT = Path(__file__).resolve().parents[1]
 sys.path.insert(0, str(REPO_ROOT))
 
+from src.fer.data.eval_cache import CachedEvalSet, stratified_indices  # noqa: E402
+from src.fer.data.loader_autotune import (  # noqa: E402
+    LoaderConfig,
+    StepTimer,
+    autotune_loader,
+    default_prefetch_factor,
+    preserve_buffers,
+)
 from src.fer.data.manifest_dataset import (  # noqa: E402
     CANONICAL_7,
+    LABEL_TO_INDEX,
     ManifestImageDataset,
     build_splits,
     read_manifest,
 )
 from src.fer.nl.memory import AssociativeMemory  # noqa: E402
 from src.fer.negl.losses import complementary_negative_loss  # noqa: E402
+from src.fer.utils.checkpoint_io import AsyncCheckpointWriter  # noqa: E402
 from src.fer.utils.device import get_best_device  # noqa: E402
+from src.fer.utils.distributed import (  # noqa: E402
+    all_gather_rows,
+    all_reduce_gradients,
+    all_reduce_mean,
+    all_reduce_tensor_,
+    barrier,
+    broadcast_buffers,
+    broadcast_object,
+    broadcast_parameters,
+    device_for_rank,
+    init_distributed,
+    rescale_global_step,
+    shard_range,
+)
+from src.fer.utils.eval_schedule import EvalScheduler  # noqa: E402
+from src.fer.utils.run_registry import record_run  # noqa: E402
+from src.fer.utils.step_profiler import StepProfiler  # noqa: E402
 
 
 try:
@@ -216,7 +244,7 @@ def dkd_loss(
 
 
 def _load_softlabels_index(index_path: Path) -> Dict[str, int]:
-    """Return mapping: image_path -> row index in softlabels.npz."""
+    """Return mapping: image_path -> row index in softlabels.npy/.npz."""
     mapping: Dict[str, int] = {}
     with index_path.open("r", encoding="utf-8") as f:
         for ln in f:
@@ -254,7 +282,7 @@ def main() -> int:
         "--softlabels",
         type=Path,
         default=None,
-        help="softlabels.npz from scripts/export_softlabels.py (required for kd/dkd; not needed for ce)",
+        help="softlabels.npy (or .npz with key 'logits') from scripts/export_softlabels.py (required for kd/dkd)",
     )
     ap.add_argument(
         "--softlabels-index",
@@ -273,7 +301,31 @@ def main() -> int:
     ap.add_argument("--epochs", type=int, default=20)
     ap.add_argument("--batch-size", type=int, default=256)
     ap.add_argument("--num-workers", type=int, default=4)
+    ap.add_argument(
+        "--autotune-loader",
+        action="store_true",
+        help="Time a short warmup window over num_workers/prefetch_factor/pin_memory (and --autotune-batch-sizes) and train with the fastest.",
+    )
+    ap.add_argument("--autotune-steps", type=int, default=20, help="Measured steps per autotune candidate")
+    ap.add_argument(
+        "--autotune-batch-sizes",
+        type=str,
+        default="",
+        help="Comma-separated batch sizes the autotuner may switch to (default: keep --batch-size).",
+    )
     ap.add_argument("--seed", type=int, default=1337)
+    ap.add_argument(
+        "--profile",
+        action="store_true",
+        help="Record per-phase step timings (data/h2d/forward/kd/aux/backward/optimizer) into history.json",
+    )
+    ap.add_argument("--profile-trace-wait", type=int, default=5, help="Steps to skip before the torch.profiler window")
+    ap.add_argument(
+        "--profile-trace-steps",
+        type=int,
+        default=5,
+        help="Steps captured into <output-dir>/profile_trace.json (Chrome trace; 0 = no trace)",
+    )
 
     ap.add_argument("--lr", type=float, default=1e-3)
     ap.add_argument("--weight-decay", type=float, default=0.05)
@@ -350,28 +402,72 @@ def main() -> int:
 
     ap.add_argument("--output-dir", type=Path, default=None)
     ap.add_argument("--resume", type=Path, default=None)
+    ap.add_argument(
+        "--sync-checkpoints",
+        action="store_true",
+        help="Write checkpoints on the training thread (default: snapshot to CPU and write in the background).",
+    )
 
     ap.add_argument("--use-amp", action="store_true")
     ap.add_argument("--eval-every", type=int, default=1)
     ap.add_argument("--max-val-batches", type=int, default=0)
+    ap.add_argument(
+        "--eval-schedule",
+        type=str,
+        choices=["fixed", "adaptive"],
+        default="fixed",
+        help="adaptive: start at --eval-every and double the interval while val macro-F1 is flat.",
+    )
+    ap.add_argument("--eval-max-every", type=int, default=8, help="Largest interval of --eval-schedule adaptive")
+    ap.add_argument(
+        "--eval-flat-delta",
+        type=float,
+        default=0.002,
+        help="Macro-F1 gain below which the curve counts as flat (adaptive schedule)",
+    )
+    ap.add_argument(
+        "--proxy-eval-frac",
+        type=float,
+        default=0.0,
+        help="Between full evals, evaluate a fixed stratified fraction of val (e.g. 0.15; 0 = off)",
+    )
+    ap.add_argument(
+        "--proxy-promote-delta",
+        type=float,
+        default=0.01,
+        help="Run a full eval when the proxy macro-F1 beats its best so far by this much",
+    )
+    ap.add_argument(
+        "--cache-val",
+        action="store_true",
+        help="Decode the val split once and keep it in memory (uint8) across epochs",
+    )
 
     args = ap.parse_args()
 
     if bool(args.use_nl) and str(args.nl_kind) == "negl_gate" and (not bool(args.use_negl)):
         raise SystemExit("--use-nl --nl-kind negl_gate requires --use-negl")
 
-    random.seed(int(args.seed))
-    torch.manual_seed(int(args.seed))
+    # DDP (torchrun): one process per device; rank 0 owns every file write.
+    dist_info = init_distributed()
+    is_main = dist_info.is_main
+
+    random.seed(int(args.seed) + dist_info.rank)
+    torch.manual_seed(int(args.seed) + dist_info.rank)
 
     if args.output_dir is None:
         stamp = time.strftime("%Y%m%d_%H%M%S")
         args.output_dir = REPO_ROOT / "outputs" / "students" / f"{args.model}_img{args.image_size}_seed{args.seed}_{stamp}"
+    args.output_dir = broadcast_object(args.output_dir, dist_info)
 
-    args.output_dir.mkdir(parents=True, exist_ok=True)
-    lock_path = _write_run_lock(args.output_dir, args=args)
-    atexit.register(_remove_run_lock, lock_path)
+    if is_main:
+        args.output_dir.mkdir(parents=True, exist_ok=True)
+        lock_path = _write_run_lock(args.output_dir, args=args)
+        atexit.register(_remove_run_lock, lock_path)
+        record_run(args.output_dir, kind="student", event="start", repo_root=REPO_ROOT, args=args)
+    barrier(dist_info)
 
-    device_info = get_best_device()
+    device_info = device_for_rank(dist_info, get_best_device())
     device = device_info.device
 
     use_amp = bool(args.use_amp) and device.type == "cuda"
@@ -392,10 +488,15 @@ def main() -> int:
 
         import numpy as np
 
-        sl = np.load(args.softlabels)
-        if "logits" not in sl:
-            raise SystemExit(f"softlabels.npz missing key 'logits': {args.softlabels}")
-        teacher_logits_cpu = torch.from_numpy(sl["logits"]).float()
+        if args.softlabels.suffix == ".npy":
+            # Plain [N, 7] array (scripts/export_softlabels.py); memory-mapped, then copied once.
+            sl_logits = np.load(args.softlabels, mmap_mode="r")
+        else:
+            sl = np.load(args.softlabels)
+            if "logits" not in sl:
+                raise SystemExit(f"softlabels.npz missing key 'logits': {args.softlabels}")
+            sl_logits = sl["logits"]
+        teacher_logits_cpu = torch.from_numpy(np.array(sl_logits, dtype=np.float32))
 
         # Load index mapping
         index_path = args.softlabels_index
@@ -444,34 +545,38 @@ def main() -> int:
 
     train_ds = ManifestImageDataset(train_rows, out_root=args.data_root, transform=train_tf, return_path=True)
     val_ds = ManifestImageDataset(val_rows, out_root=args.data_root, transform=val_tf)
+    train_sampler: Optional[DistributedSampler] = None
+    if dist_info.enabled:
+        train_sampler = DistributedSampler(
+            train_ds,
+            num_replicas=dist_info.world_size,
+            rank=dist_info.rank,
+            shuffle=True,
+            seed=int(args.seed),
+            drop_last=True,
+        )
+        # Contiguous, unpadded val shards; eval gathers the full logits.
+        val_ds = Subset(val_ds, list(shard_range(len(val_ds), dist_info)))
+
+    loader_cfg = LoaderConfig(
+        batch_size=int(args.batch_size),
+        num_workers=int(args.num_workers),
+        prefetch_factor=default_prefetch_factor(int(args.num_workers)),
+        pin_memory=(device.type == "cuda"),
+    )
 
-    # Windows can hit "Couldn't open shared file mapping" (error 1455) when too many
-    # prefetched batches are in-flight (large batch_size * num_workers). Reduce prefetch.
-    num_workers = int(args.num_workers)
-    prefetch_factor = 1 if (os.name == "nt" and num_workers > 0) else 2
-
-    train_dl_kwargs = {
-        "batch_size": int(args.batch_size),
-        "shuffle": True,
-        "num_workers": num_workers,
-        "pin_memory": (device.type == "cuda"),
-        "drop_last": True,
-    }
-    val_dl_kwargs = {
-        "batch_size": int(args.batch_size),
-        "shuffle": False,
-        "num_workers": num_workers,
-        "pin_memory": (device.type == "cuda"),
-    }
-    if num_workers > 0:
-        train_dl_kwargs["prefetch_factor"] = prefetch_factor
-        val_dl_kwargs["prefetch_factor"] = prefetch_factor
-        # Avoid re-spawning worker processes every epoch (especially important on Windows).
-        train_dl_kwargs["persistent_workers"] = True
-        val_dl_kwargs["persistent_workers"] = True
+    def _make_train_dl(cfg: LoaderConfig) -> DataLoader:
+        return DataLoader(
+            train_ds, shuffle=train_sampler is None, sampler=train_sampler, drop_last=True, **cfg.dataloader_kwargs()
+        )
+
+    def _make_val_dl(cfg: LoaderConfig, indices: Optional[List[int]] = None) -> DataLoader:
+        kw = cfg.dataloader_kwargs()
+        kw["batch_size"] = int(args.batch_size)
+        return DataLoader(val_ds, shuffle=False, sampler=indices, **kw)
 
-    train_dl = DataLoader(train_ds, **train_dl_kwargs)
-    val_dl = DataLoader(val_ds, **val_dl_kwargs)
+    train_dl = _make_train_dl(loader_cfg)
+    val_dl = _make_val_dl(loader_cfg)
 
     # Student model
     student = timm.create_model(str(args.model), pretrained=True, num_classes=len(CANONICAL_7)).to(device)
@@ -560,12 +665,74 @@ def main() -> int:
     optimizer = torch.optim.AdamW(params, lr=float(args.lr), weight_decay=float(args.weight_decay))
     scaler = GradScaler("cuda", enabled=use_amp)
 
+    if bool(args.autotune_loader):
+
+        def _autotune_step(batch: Tuple[Any, ...]) -> None:
+            x = batch[0].to(device, non_blocking=True)
+            y = batch[1].to(device, non_blocking=True)
+            with autocast(autocast_device, enabled=use_amp):
+                loss = F.cross_entropy(student(x), y)
+            loss.backward()
+            optimizer.zero_grad(set_to_none=True)
+            float(loss.detach().cpu())
+
+        student.train()
+        with preserve_buffers(student):
+            loader_cfg, autotune_trials = autotune_loader(
+                loader_cfg,
+                make_loader=_make_train_dl,
+                step_fn=_autotune_step,
+                cuda=(device.type == "cuda"),
+                batch_sizes=[int(b) for b in str(args.autotune_batch_sizes).split(",") if b.strip()],
+                measure_steps=int(args.autotune_steps),
+                log=print if is_main else None,
+            )
+        # Every rank must train with the same batch size (same steps per epoch).
+        loader_cfg = broadcast_object(loader_cfg, dist_info)
+        args.batch_size = int(loader_cfg.batch_size)
+        args.num_workers = int(loader_cfg.num_workers)
+        train_dl = _make_train_dl(loader_cfg)
+        val_dl = _make_val_dl(loader_cfg)
+        if is_main:
+            (args.output_dir / "loader_autotune.json").write_text(
+                json.dumps({"selected": asdict(loader_cfg), "trials": autotune_trials}, indent=2), encoding="utf-8"
+            )
+            # Re-record args so the registry (and its args_hash) sees the tuned batch_size/num_workers.
+            record_run(args.output_dir, kind="student", event="autotune", repo_root=REPO_ROOT, args=args)
+
+    # This rank's val rows (the shard behind val_ds), for the in-memory cache / proxy subset.
+    val_rows_local = [val_rows[i] for i in shard_range(len(val_rows), dist_info)] if dist_info.enabled else val_rows
+    val_cache: Optional[CachedEvalSet] = None
+    if bool(args.cache_val):
+        if args.max_val_batches:
+            val_rows_local = val_rows_local[: int(args.max_val_batches) * int(args.batch_size)]
+        val_cache = CachedEvalSet.build(
+            val_rows_local,
+            out_root=args.data_root,
+            transform=val_tf,
+            num_workers=int(loader_cfg.num_workers),
+            pin=(device.type == "cuda"),
+            log=print if is_main else None,
+        )
+    proxy_idx = stratified_indices(
+        [LABEL_TO_INDEX[r.label] for r in val_rows_local], frac=float(args.proxy_eval_frac), seed=int(args.seed)
+    )
+    proxy_dl = _make_val_dl(loader_cfg, proxy_idx) if (proxy_idx and val_cache is None) else None
+
+    def _val_batches(proxy: bool = False):
+        if val_cache is not None:
+            return val_cache.batches(int(args.batch_size), device, indices=proxy_idx if proxy else None)
+        return proxy_dl if proxy else val_dl
+
     global_step = 0
     start_epoch = 0
     best_macro_f1 = -1.0
     best_epoch = -1
 
-    def save_ckpt(path: Path, *, epoch: int) -> None:
+    # Checkpoint serialization runs on a background thread (rank 0 only writes).
+    ckpt_writer = AsyncCheckpointWriter(enabled=is_main and not bool(args.sync_checkpoints))
+
+    def save_ckpt(path: Path, *, epoch: int, also: Sequence[Path] = ()) -> None:
         nl_ckpt: Optional[Dict[str, Any]] = None
         if bool(args.use_nl) and nl_kind == "proto" and nl_proj is not None and nl_prototypes is not None and nl_seen is not None:
             nl_ckpt = {
@@ -594,6 +761,9 @@ def main() -> int:
         ckpt = {
             "epoch": int(epoch),
             "global_step": int(global_step),
+            # Lets a resume with a different world size rescale global_step for the LR schedule.
+            "steps_per_epoch": int(len(train_dl)),
+            "world_size": int(dist_info.world_size),
             "model": student.state_dict(),
             # Backward-compat: legacy key used by NL(negl_gate)
             "nl_memory": (nl_gate_memory.state_dict() if nl_gate_memory is not None else None),
@@ -604,7 +774,7 @@ def main() -> int:
             "args": vars(args),
             "best": {"macro_f1": float(best_macro_f1), "epoch": int(best_epoch)},
         }
-        torch.save(ckpt, path)
+        ckpt_writer.save(ckpt, path, also=also)
 
     # Resume
     ckpt_path: Optional[Path] = None
@@ -668,11 +838,16 @@ def main() -> int:
         else:
             print(f"[resume] Checkpoint mode={ckpt_mode} != current mode={args.mode}; skipping optimizer/scaler resume")
         start_epoch = int(ckpt.get("epoch", -1)) + 1
-        global_step = int(ckpt.get("global_step", 0))
+        global_step = rescale_global_step(
+            int(ckpt.get("global_step", 0)),
+            ckpt_steps_per_epoch=int(ckpt.get("steps_per_epoch", 0) or 0),
+            steps_per_epoch=len(train_dl),
+        )
         best = ckpt.get("best") or {}
         best_macro_f1 = float(best.get("macro_f1", best_macro_f1))
         best_epoch = int(best.get("epoch", best_epoch))
-        print(f"Resumed from {ckpt_path} -> start_epoch={start_epoch}")
+        if is_main:
+            print(f"Resumed from {ckpt_path} -> start_epoch={start_epoch}")
 
     # History
     history_path = args.output_dir / "history.json"
@@ -688,12 +863,17 @@ def main() -> int:
     total_steps = int(args.epochs) * max(1, len(train_dl))
     warmup_steps = int(args.warmup_epochs) * max(1, len(train_dl))
 
-    def eval_student() -> Dict[str, object]:
+    # Ranks were seeded differently; start every replica from rank 0's weights.
+    broadcast_parameters(params, dist_info)
+    broadcast_buffers(student, dist_info)
+
+    def eval_student(*, proxy: bool = False) -> Dict[str, object]:
+        # proxy=True: raw metrics on the fixed stratified subset only (no calibration files).
         student.eval()
         all_logits: List[torch.Tensor] = []
         all_y: List[torch.Tensor] = []
         with torch.no_grad():
-            for bi, batch in enumerate(val_dl):
+            for bi, batch in enumerate(_val_batches(proxy)):
                 x, y, _src = batch
                 x = x.to(device, non_blocking=True)
                 y = y.to(device, non_blocking=True)
@@ -701,31 +881,58 @@ def main() -> int:
                     logits = student(x)
                 all_logits.append(logits.detach().float().cpu())
                 all_y.append(y.detach().cpu())
-                if args.max_val_batches and (bi + 1) >= int(args.max_val_batches):
+                if args.max_val_batches and not proxy and (bi + 1) >= int(args.max_val_batches):
                     break
-        logits = torch.cat(all_logits, dim=0)
-        y = torch.cat(all_y, dim=0)
+        logits = torch.cat(all_logits, dim=0) if all_logits else torch.zeros((0, len(CANONICAL_7)))
+        y = torch.cat(all_y, dim=0) if all_y else torch.zeros((0,), dtype=torch.int64)
+        if dist_info.enabled:
+            logits, y = all_gather_rows([logits, y], dist_info)
         raw = metrics_from_logits(logits, y, num_classes=len(CANONICAL_7))
+        if proxy:
+            return {"raw": raw, "n": int(y.numel())}
 
         t_star = fit_temperature(logits, y, init_t=1.2)
         scaled_logits = logits / float(t_star)
         scaled = metrics_from_logits(scaled_logits, y, num_classes=len(CANONICAL_7))
 
-        calib = {
-            "mode": "global",
-            "global_temperature": float(t_star),
-        }
-        (args.output_dir / "calibration.json").write_text(json.dumps(calib, indent=2), encoding="utf-8")
+        if is_main:
+            calib = {
+                "mode": "global",
+                "global_temperature": float(t_star),
+            }
+            (args.output_dir / "calibration.json").write_text(json.dumps(calib, indent=2), encoding="utf-8")
 
-        rel = {
-            "raw": raw,
-            "temperature_scaled": {"mode": "global", "global_temperature": float(t_star), **scaled},
-        }
-        (args.output_dir / "reliabilitymetrics.json").write_text(json.dumps(rel, indent=2), encoding="utf-8")
+            rel = {
+                "raw": raw,
+                "temperature_scaled": {"mode": "global", "global_temperature": float(t_star), **scaled},
+            }
+            (args.output_dir / "reliabilitymetrics.json").write_text(json.dumps(rel, indent=2), encoding="utf-8")
         return {"raw": raw, "temperature_scaled": scaled, "t_star": float(t_star)}
 
+    profiler = StepProfiler(
+        enabled=bool(args.profile),
+        device=device,
+        trace_path=(args.output_dir / "profile_trace.json") if is_main else None,
+        trace_wait=int(args.profile_trace_wait),
+        trace_steps=int(args.profile_trace_steps),
+    )
+
+    eval_sched = EvalScheduler(
+        adaptive=str(args.eval_schedule) == "adaptive",
+        min_every=int(args.eval_every),
+        max_every=int(args.eval_max_every),
+        flat_delta=float(args.eval_flat_delta),
+        proxy=bool(proxy_idx),
+        promote_delta=float(args.proxy_promote_delta),
+        last_epoch=int(args.epochs) - 1,
+    )
+    t_run = time.time()
+
     # Training loop
     for epoch in range(start_epoch, int(args.epochs)):
+        if train_sampler is not None:
+            train_sampler.set_epoch(epoch)
+        nl_seen_start = nl_seen.clone() if (dist_info.enabled and nl_seen is not None) else None
         student.train()
         epoch_loss = 0.0
         epoch_negl = 0.0
@@ -737,8 +944,11 @@ def main() -> int:
         epoch_nl_proto_applied = 0.0
         epoch_nl_proto_sim = 0.0
         t_epoch = time.time()
+        step_timer = StepTimer()
+        profiler.start_epoch()
 
-        for step, batch in enumerate(train_dl):
+        for step, batch in enumerate(step_timer.wrap(profiler.wrap(train_dl))):
+            profiler.switch("h2d")
             x, y, _src, rel_path = batch
             x = x.to(device, non_blocking=True)
             y = y.to(device, non_blocking=True)
@@ -748,6 +958,7 @@ def main() -> int:
             for pg in optimizer.param_groups:
                 pg["lr"] = lr
 
+            profiler.switch("forward")
             with autocast(autocast_device, enabled=use_amp):
                 nl_penultimate: Optional[torch.Tensor] = None
                 if (
@@ -767,6 +978,7 @@ def main() -> int:
 
                 loss = ce
                 if args.mode != "ce":
+                    profiler.switch("kd")
                     # Lookup teacher logits by image_path.
                     assert path_to_i is not None
                     assert teacher_logits_cpu is not None
@@ -798,6 +1010,9 @@ def main() -> int:
                 nl_proto_applied_frac = None
                 nl_proto_sim_mean = None
 
+                if bool(args.use_nl) or bool(args.use_negl):
+                    profiler.switch("aux")
+
                 # NL(proto): prototype memory with momentum smoothing + consistency gating.
                 if bool(args.use_nl) and nl_kind == "proto" and nl_proj is not None and nl_prototypes is not None and nl_seen is not None:
                     nl_w = float(args.nl_weight)
@@ -916,8 +1131,15 @@ def main() -> int:
                     if nl_gate_applied_mean is not None:
                         nl_gate_applied_mean = float(nl_gate_applied_mean)
 
+            profiler.switch("backward")
             optimizer.zero_grad(set_to_none=True)
             scaler.scale(loss).backward()
+            if dist_info.enabled:
+                profiler.switch("grad_sync")
+            # DDP: average (still loss-scaled) gradients of the student and NL modules. Done by hand
+            # because NL(proto) calls forward_features/forward_head outside the module's forward.
+            all_reduce_gradients(params, dist_info)
+            profiler.switch("optimizer")
             scaler.step(optimizer)
             scaler.update()
 
@@ -939,18 +1161,29 @@ def main() -> int:
             if nl_proto_sim_mean is not None:
                 epoch_nl_proto_sim += float(nl_proto_sim_mean)
             global_step += 1
+            profiler.step()
 
         epoch_sec = time.time() - t_epoch
+        profile = profiler.end_epoch()
 
-        # Save last checkpoint every epoch
-        save_ckpt(args.output_dir / "checkpoint_last.pt", epoch=epoch)
+        # Rank 0's BatchNorm statistics are the ones checkpointed and evaluated everywhere.
+        broadcast_buffers(student, dist_info)
+        if nl_seen_start is not None and nl_prototypes is not None and nl_seen is not None:
+            # Each rank updated its prototypes from its own batches; merge before checkpointing.
+            all_reduce_tensor_(nl_prototypes, dist_info, average=True)
+            nl_prototypes.copy_(F.normalize(nl_prototypes, dim=1, eps=1e-6))
+            seen_delta = all_reduce_tensor_(nl_seen - nl_seen_start, dist_info, average=False)
+            nl_seen.copy_(nl_seen_start + seen_delta)
 
         rec: Dict[str, object] = {
             "epoch": int(epoch),
-            "train_loss": float(epoch_loss / max(1, len(train_dl))),
+            "train_loss": all_reduce_mean(float(epoch_loss / max(1, len(train_dl))), dist_info),
             "epoch_sec": float(epoch_sec),
             "lr": float(optimizer.param_groups[0]["lr"]),
+            "loader": {**asdict(loader_cfg), **step_timer.summary()},
         }
+        if profile is not None:
+            rec["profile"] = profile
 
         if bool(args.use_negl):
             rec["negl"] = {
@@ -989,23 +1222,68 @@ def main() -> int:
                     "sim_mean": float(epoch_nl_proto_sim / max(1, len(train_dl))),
                 }
 
-        if int(args.eval_every) and ((epoch + 1) % int(args.eval_every) == 0):
+        is_best = False
+        eval_kind = "skip"
+        if int(args.eval_every):
+            eval_kind = eval_sched.plan(epoch, fixed_full=((epoch + 1) % int(args.eval_every) == 0))
+        if eval_kind == "proxy":
+            t_proxy = time.time()
+            proxy_payload = eval_student(proxy=True)
+            proxy_f1 = float(proxy_payload["raw"]["macro_f1"])  # type: ignore[index]
+            if eval_sched.should_promote(proxy_f1):
+                eval_kind = "full"
+                proxy_payload["promoted"] = True
+            eval_sched.record(epoch, "proxy", proxy_f1, time.time() - t_proxy)
+            rec["proxy_val"] = proxy_payload
+        if eval_kind == "full":
+            t_full = time.time()
             eval_payload = eval_student()
             rec["val"] = eval_payload
             macro_f1 = float(eval_payload["raw"]["macro_f1"])  # type: ignore[index]
+            eval_sched.record(epoch, "full", macro_f1, time.time() - t_full)
             if macro_f1 > best_macro_f1:
                 best_macro_f1 = macro_f1
                 best_epoch = int(epoch)
-                save_ckpt(args.output_dir / "best.pt", epoch=epoch)
+                is_best = True
+
+        rec["eval"] = {
+            "kind": eval_kind,
+            "schedule": str(args.eval_schedule),
+            "cached": val_cache is not None,
+            **eval_sched.summary(time.time() - t_run),
+        }
+
+        # Save last checkpoint every epoch; on improvement best.pt is a link to the same file.
+        if is_main:
+            save_ckpt(
+                args.output_dir / "checkpoint_last.pt",
+                epoch=epoch,
+                also=[args.output_dir / "best.pt"] if is_best else [],
+            )
+            rec["checkpoint_io"] = ckpt_writer.take_stats()
+            # Fail the run on a write error from an earlier background save instead of training on.
+            ckpt_writer.check()
 
         history.append(rec)
+        if not is_main:
+            continue
         history_path.write_text(json.dumps(history, indent=2), encoding="utf-8")
+        record_run(
+            args.output_dir,
+            kind="student",
+            event="checkpoint",
+            repo_root=REPO_ROOT,
+            best={"macro_f1": float(best_macro_f1), "epoch": int(best_epoch)},
+        )
 
         print(
             f"epoch {epoch:03d} | loss {rec['train_loss']:.4f} | lr {rec['lr']:.2e} | epoch_sec {epoch_sec:.1f}"
         )
 
-    print(f"Done. Output: {args.output_dir}")
+    ckpt_writer.close()
+    barrier(dist_info)
+    if is_main:
+        print(f"Done. Output: {args.output_dir}")
     return 0
 
 
@@ -2,6 +2,7 @@ from __future__ import annotations
 
 import argparse
 import atexit
+import contextlib
 import json
 import math
 import os
@@ -17,7 +18,8 @@ import torch
 import torch.nn.functional as F
 from torch import nn
 from torch.amp import GradScaler, autocast
-from torch.utils.data import DataLoader, Sampler
+from torch.nn.parallel import DistributedDataParallel
+from torch.utils.data import DataLoader, Sampler, Subset
 
 REPO_ROOT = Path(__file__).resolve().parents[1]
 sys.path.insert(0, str(REPO_ROOT))
@@ -29,7 +31,32 @@ from src.fer.data.manifest_dataset import (  # noqa: E402
     build_splits,
     read_manifest,
 )
+from src.fer.data.eval_cache import CachedEvalSet, stratified_indices  # noqa: E402
+from src.fer.inference.transforms import IMAGENET_MEAN, IMAGENET_STD, CLAHETransform, eval_resize_size  # noqa: E402
+from src.fer.data.loader_autotune import (  # noqa: E402
+    LoaderConfig,
+    StepTimer,
+    autotune_loader,
+    preserve_buffers,
+)
+from src.fer.utils.checkpoint_io import AsyncCheckpointWriter, load_checkpoint_args, load_model_state  # noqa: E402
 from src.fer.utils.device import get_best_device  # noqa: E402
+from src.fer.utils.distributed import (  # noqa: E402
+    DistInfo,
+    all_gather_rows,
+    all_reduce_mean,
+    barrier,
+    broadcast_buffers,
+    broadcast_object,
+    device_for_rank,
+    init_distributed,
+    rescale_global_step,
+    shard_range,
+)
+from src.fer.utils.eval_schedule import EvalScheduler  # noqa: E402
+from src.fer.utils.run_registry import record_run  # noqa: E402
+from scripts.export_teacher_onnx import OnnxExportWatcher, export_pass  # noqa: E402
+from src.fer.utils.step_profiler import StepProfiler  # noqa: E402
 
 
 try:
@@ -46,16 +73,6 @@ except Exception as e:  # pragma: no cover
     raise RuntimeError("numpy is required for teacher training.") from e
 
 
-try:
-    import cv2  # type: ignore
-
-    _HAS_CV2 = True
-except Exception:
-    cv2 = None
-    _HAS_CV2 = False
-
-
-from PIL import Image  # noqa: E402
 from torchvision import transforms as T  # noqa: E402
 
 
@@ -165,27 +182,6 @@ def _remove_run_lock(lock_path: Path) -> None:
         pass
 
 
-class CLAHETransform:
-    def __init__(self, *, clip_limit: float = 2.0, tile_grid_size: int = 8) -> None:
-        self.clip_limit = float(clip_limit)
-        self.tile_grid_size = int(tile_grid_size)
-
-    def __call__(self, img: Image.Image) -> Image.Image:
-        if not _HAS_CV2:
-            return img
-        arr = np.array(img)
-        # RGB -> LAB
-        lab = cv2.cvtColor(arr, cv2.COLOR_RGB2LAB)
-        l, a, b = cv2.split(lab)
-        clahe = cv2.createCLAHE(
-            clipLimit=self.clip_limit, tileGridSize=(self.tile_grid_size, self.tile_grid_size)
-        )
-        l2 = clahe.apply(l)
-        lab2 = cv2.merge((l2, a, b))
-        rgb2 = cv2.cvtColor(lab2, cv2.COLOR_LAB2RGB)
-        return Image.fromarray(rgb2)
-
-
 def build_transforms(
     *,
     image_size: int,
@@ -205,7 +201,7 @@ def build_transforms(
             ]
         )
     else:
-        resize = int(round(image_size * 1.15))
+        resize = eval_resize_size(image_size)
         ops.extend([T.Resize((resize, resize)), T.CenterCrop((image_size, image_size))])
 
     if use_clahe:
@@ -214,7 +210,7 @@ def build_transforms(
     ops.extend(
         [
             T.ToTensor(),
-            T.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
+            T.Normalize(mean=list(IMAGENET_MEAN), std=list(IMAGENET_STD)),
         ]
     )
 
@@ -234,65 +230,109 @@ def effective_number_weights(counts: List[int], *, beta: float = 0.9999) -> torc
 
 
 class BalancedBatchSampler(Sampler[List[int]]):
+    """Class-balanced batches: >= min_per_class per class, remainder filled uniformly over classes.
+
+    A whole epoch of batches is drawn at once with numpy (per-class minimum block plus a
+    multinomial fill), seeded from (seed, epoch); call `set_epoch` every epoch.
+    `replacement=False` cycles through shuffled per-class permutations instead of drawing
+    with replacement. With `num_replicas > 1` each rank yields a disjoint strided shard
+    of the same epoch (DistributedSampler-style).
+    """
+
     def __init__(
         self,
-        labels: List[int],
+        labels: Sequence[int],
         *,
         num_classes: int,
         batch_size: int,
         min_per_class: int = 2,
         seed: int = 1337,
         drop_last: bool = True,
+        replacement: bool = True,
+        num_replicas: Optional[int] = None,
+        rank: Optional[int] = None,
     ) -> None:
         if batch_size < num_classes * min_per_class:
             raise ValueError(
                 f"batch_size must be >= num_classes*min_per_class ({num_classes*min_per_class}), got {batch_size}"
             )
-        self.labels = labels
+        if num_replicas is None or rank is None:
+            dist_on = torch.distributed.is_available() and torch.distributed.is_initialized()
+            if num_replicas is None:
+                num_replicas = torch.distributed.get_world_size() if dist_on else 1
+            if rank is None:
+                rank = torch.distributed.get_rank() if dist_on else 0
+        if not (0 <= int(rank) < int(num_replicas)):
+            raise ValueError(f"rank must be in [0, {num_replicas}), got {rank}")
+
         self.num_classes = num_classes
         self.batch_size = batch_size
         self.min_per_class = min_per_class
         self.seed = seed
         self.drop_last = drop_last
+        self.replacement = bool(replacement)
+        self.num_replicas = int(num_replicas)
+        self.rank = int(rank)
+        self.epoch = 0
 
-        self.indices_by_class: List[List[int]] = [[] for _ in range(num_classes)]
-        for idx, y in enumerate(labels):
-            if 0 <= y < num_classes:
-                self.indices_by_class[y].append(idx)
+        y = np.asarray(labels, dtype=np.int64)
+        order = np.argsort(y, kind="stable")
+        bounds = np.searchsorted(y[order], np.arange(num_classes + 1))
+        self.indices_by_class: List[np.ndarray] = [order[bounds[c] : bounds[c + 1]] for c in range(num_classes)]
 
         for c in range(num_classes):
-            if not self.indices_by_class[c]:
+            if not len(self.indices_by_class[c]):
                 raise ValueError(f"No samples found for class {c}.")
 
-        self.num_batches = len(labels) // batch_size
-        if not drop_last and len(labels) % batch_size:
-            self.num_batches += 1
+        total = len(y) // batch_size
+        if not drop_last and len(y) % batch_size:
+            total += 1
+        # Per-rank length; without drop_last the last shard is padded with extra batches.
+        if drop_last:
+            self.num_batches = total // self.num_replicas
+        else:
+            self.num_batches = -(-total // self.num_replicas)
 
     def __len__(self) -> int:
         return self.num_batches
 
-    def __iter__(self) -> Iterable[List[int]]:
-        rng = random.Random(self.seed)
-        all_classes = list(range(self.num_classes))
-
-        for _ in range(self.num_batches):
-            batch: List[int] = []
+    def set_epoch(self, epoch: int) -> None:
+        self.epoch = int(epoch)
+
+    def _draw(self, rng: "np.random.Generator", c: int, k: int) -> np.ndarray:
+        pool = self.indices_by_class[c]
+        if self.replacement:
+            return pool[rng.integers(0, len(pool), size=k)]
+        reps = -(-k // len(pool))
+        cycle = rng.permuted(np.broadcast_to(pool, (reps, len(pool))), axis=1)
+        return cycle.reshape(-1)[:k]
+
+    def epoch_batches(self) -> np.ndarray:
+        """All batches of this rank for the current epoch, shape [num_batches, batch_size]."""
+        rng = np.random.default_rng([int(self.seed), int(self.epoch)])
+        n_batches = self.num_batches * self.num_replicas
+        c_all = self.num_classes
+
+        # Per-batch class counts: fixed minimum + uniform multinomial fill.
+        remaining = self.batch_size - c_all * self.min_per_class
+        per_class = rng.multinomial(remaining, np.full(c_all, 1.0 / c_all), size=n_batches)
+        per_class += self.min_per_class
+
+        # Scatter each class's draws into its column block of every batch, then shuffle rows.
+        col0 = np.cumsum(per_class, axis=1) - per_class
+        batches = np.empty((n_batches, self.batch_size), dtype=np.int64)
+        for c in range(c_all):
+            k = per_class[:, c]
+            total = int(k.sum())
+            rows = np.repeat(np.arange(n_batches), k)
+            within = np.arange(total) - np.repeat(np.cumsum(k) - k, k)
+            batches[rows, col0[rows, c] + within] = self._draw(rng, c, total)
+        # Shared draws end here; the per-row shuffle only touches this rank's shard.
+        return rng.permuted(batches[self.rank :: self.num_replicas], axis=1)
 
-            # Ensure per-class minimum.
-            for c in all_classes:
-                pool = self.indices_by_class[c]
-                for _k in range(self.min_per_class):
-                    batch.append(pool[rng.randrange(len(pool))])
-
-            # Fill the rest by sampling classes uniformly (then indices within class).
-            remaining = self.batch_size - len(batch)
-            for _ in range(remaining):
-                c = all_classes[rng.randrange(self.num_classes)]
-                pool = self.indices_by_class[c]
-                batch.append(pool[rng.randrange(len(pool))])
-
-            rng.shuffle(batch)
-            yield batch
+    def __iter__(self) -> Iterable[List[int]]:
+        for row in self.epoch_batches():
+            yield row.tolist()
 
 
 class ArcMarginProduct(nn.Module):
@@ -391,6 +431,28 @@ class TeacherNet(nn.Module):
         z = self.forward_features(x)
         return self.arc_head.infer(z)
 
+    def forward(self, x: torch.Tensor, y: Optional[torch.Tensor] = None, *, margin: float = 0.0) -> torch.Tensor:
+        # Training entry point (DistributedDataParallel only syncs gradients through forward):
+        # plain linear-head logits without labels, ArcFace logits with labels.
+        if y is None:
+            return self.forward_logits(x)
+        return self.forward_arcface(x, y, margin=margin)
+
+
+def load_teacher_checkpoint(path: Path, *, device: torch.device) -> Tuple[TeacherNet, Dict[str, object]]:
+    """TeacherNet rebuilt from a checkpoint's args (no pretrained download), in eval mode, plus those args."""
+    ckpt_args = load_checkpoint_args(path)
+    model = TeacherNet(
+        model_name=str(ckpt_args.get("model")),
+        num_classes=len(CANONICAL_7),
+        embed_dim=int(ckpt_args.get("embed_dim") or 512),
+        arc_s=float(ckpt_args.get("arcface_s") or 30.0),
+        arc_m=float(ckpt_args.get("arcface_m") or 0.35),
+        pretrained=False,
+    )
+    model.load_state_dict(load_model_state(path), strict=True)
+    return model.to(device).eval(), ckpt_args
+
 
 def margin_for_epoch(
     epoch: int,
@@ -481,7 +543,7 @@ def expected_calibration_error(probs: torch.Tensor, y: torch.Tensor, *, n_bins:
 
 def evaluate(
     model: TeacherNet,
-    loader: DataLoader,
+    loader: Iterable[Tuple[torch.Tensor, torch.Tensor, object]],
     *,
     device: torch.device,
     use_amp: bool,
@@ -489,7 +551,10 @@ def evaluate(
     temperature: float = 1.0,
     warmup_plain_logits: bool,
     margin: float,
+    dist_info: Optional[DistInfo] = None,
 ) -> Tuple[torch.Tensor, torch.Tensor]:
+    # With dist_info, `loader` holds this rank's shard; the full logits/labels are
+    # gathered so every rank computes the same metrics as a single-process run.
     model.eval()
     all_logits: List[torch.Tensor] = []
     all_y: List[torch.Tensor] = []
@@ -515,7 +580,11 @@ def evaluate(
             if max_batches and (bi + 1) >= max_batches:
                 break
 
-    return torch.cat(all_logits, dim=0), torch.cat(all_y, dim=0)
+    logits = torch.cat(all_logits, dim=0) if all_logits else torch.zeros((0, len(CANONICAL_7)))
+    y_all = torch.cat(all_y, dim=0) if all_y else torch.zeros((0,), dtype=torch.int64)
+    if dist_info is not None and dist_info.enabled:
+        logits, y_all = all_gather_rows([logits, y_all], dist_info)
+    return logits, y_all
 
 
 def fit_temperature(logits: torch.Tensor, y: torch.Tensor, *, init_t: float = 1.2) -> float:
@@ -674,6 +743,11 @@ def main() -> int:
         default=10,
         help="Save a numbered checkpoint every N epochs (best.pt and checkpoint_last.pt are always maintained).",
     )
+    ap.add_argument(
+        "--sync-checkpoints",
+        action="store_true",
+        help="Write checkpoints/ONNX on the training thread (default: snapshot to CPU and write in the background).",
+    )
     ap.add_argument(
         "--resume",
         type=Path,
@@ -709,6 +783,37 @@ def main() -> int:
         default=1,
         help="Run validation + temperature scaling every N epochs (default: 1).",
     )
+    ap.add_argument(
+        "--eval-schedule",
+        type=str,
+        choices=["fixed", "adaptive"],
+        default="fixed",
+        help="adaptive: start at --eval-every and double the interval while val macro-F1 is flat.",
+    )
+    ap.add_argument("--eval-max-every", type=int, default=8, help="Largest interval of --eval-schedule adaptive")
+    ap.add_argument(
+        "--eval-flat-delta",
+        type=float,
+        default=0.002,
+        help="Macro-F1 gain below which the curve counts as flat (adaptive schedule)",
+    )
+    ap.add_argument(
+        "--proxy-eval-frac",
+        type=float,
+        default=0.0,
+        help="Between full evals, evaluate a fixed stratified fraction of val (e.g. 0.15; 0 = off)",
+    )
+    ap.add_argument(
+        "--proxy-promote-delta",
+        type=float,
+        default=0.01,
+        help="Run a full eval when the proxy macro-F1 beats its best so far by this much",
+    )
+    ap.add_argument(
+        "--cache-val",
+        action="store_true",
+        help="Decode the val split once and keep it in memory (uint8) across epochs",
+    )
 
     ap.add_argument(
         "--temperature-scaling",
@@ -770,12 +875,29 @@ def main() -> int:
     ap.add_argument("--batch-size", type=int, default=64)
     ap.add_argument("--accum-steps", type=int, default=1)
     ap.add_argument("--num-workers", type=int, default=4)
+    ap.add_argument(
+        "--autotune-loader",
+        action="store_true",
+        help="Time a short warmup window over num_workers/prefetch_factor/pin_memory (and --autotune-batch-sizes) and train with the fastest.",
+    )
+    ap.add_argument("--autotune-steps", type=int, default=20, help="Measured steps per autotune candidate")
+    ap.add_argument(
+        "--autotune-batch-sizes",
+        type=str,
+        default="",
+        help="Comma-separated batch sizes the autotuner may switch to (default: keep --batch-size).",
+    )
     ap.add_argument("--val-fraction", type=float, default=0.05)
     ap.add_argument("--seed", type=int, default=1337)
 
     # Balanced mini-batches + class-balanced loss
     ap.add_argument("--min-per-class", type=int, default=2, help="Ensure >=N samples/class per batch")
     ap.add_argument("--cb-beta", type=float, default=0.9999, help="Effective-number weighting beta")
+    ap.add_argument(
+        "--balanced-cycle",
+        action="store_true",
+        help="Balanced sampler draws without replacement (cycling shuffled per-class permutations)",
+    )
 
     # Aug
     ap.add_argument("--clahe", action="store_true", help="Enable CLAHE preprocessing (recommended)")
@@ -787,6 +909,20 @@ def main() -> int:
     ap.add_argument("--max-val-batches", type=int, default=0, help="0 = full val")
     ap.add_argument("--smoke", action="store_true", help="Shortcut: 1 epoch + limited batches")
 
+    # Profiling
+    ap.add_argument(
+        "--profile",
+        action="store_true",
+        help="Record per-phase step timings (data/h2d/forward/backward/optimizer) into history.json",
+    )
+    ap.add_argument("--profile-trace-wait", type=int, default=5, help="Steps to skip before the torch.profiler window")
+    ap.add_argument(
+        "--profile-trace-steps",
+        type=int,
+        default=5,
+        help="Steps captured into <output-dir>/profile_trace.json (Chrome trace; 0 = no trace)",
+    )
+
     # Output
     ap.add_argument("--output-dir", type=Path, default=None)
 
@@ -802,11 +938,17 @@ def main() -> int:
         if args.max_val_batches == 0:
             args.max_val_batches = 25
 
-    torch.manual_seed(args.seed)
-    random.seed(args.seed)
-    np.random.seed(args.seed)
+    # DDP (torchrun): one process per device; rank 0 owns every file write.
+    dist_info = init_distributed()
+    is_main = dist_info.is_main
+
+    # Per-rank seeds decorrelate augmentation/dropout; DDP broadcasts rank 0's initial weights
+    # and the balanced sampler shares args.seed so all ranks shard the same epoch.
+    torch.manual_seed(args.seed + dist_info.rank)
+    random.seed(args.seed + dist_info.rank)
+    np.random.seed(args.seed + dist_info.rank)
 
-    device_info = get_best_device(prefer="cuda")
+    device_info = device_for_rank(dist_info, get_best_device(prefer="cuda"))
     device = device_info.device
     use_amp = device_info.backend == "cuda"
 
@@ -827,15 +969,20 @@ def main() -> int:
         stamp = time.strftime("%Y%m%d_%H%M%S")
         run_name = f"{args.model}_img{args.image_size}_seed{args.seed}_{stamp}"
         args.output_dir = Path("outputs") / "teachers" / run_name
+    # The default run name is time-stamped; every rank must use rank 0's.
+    args.output_dir = broadcast_object(args.output_dir, dist_info)
 
-    args.output_dir.mkdir(parents=True, exist_ok=True)
+    if is_main:
+        args.output_dir.mkdir(parents=True, exist_ok=True)
 
-    # Mark the output directory as "in use".
-    lock_path = _write_run_lock(args.output_dir, args=args)
-    atexit.register(_remove_run_lock, lock_path)
+        # Mark the output directory as "in use".
+        lock_path = _write_run_lock(args.output_dir, args=args)
+        atexit.register(_remove_run_lock, lock_path)
+        record_run(args.output_dir, kind="teacher", event="start", repo_root=REPO_ROOT, args=args)
 
-    if not bool(args.skip_env_snapshot):
-        _write_environment_snapshot(output_dir=args.output_dir, repo_root=REPO_ROOT, device_info=device_info)
+        if not bool(args.skip_env_snapshot):
+            _write_environment_snapshot(output_dir=args.output_dir, repo_root=REPO_ROOT, device_info=device_info)
+    barrier(dist_info)
 
     # Determine whether we'll load weights from a checkpoint (resume/init-from/auto-resume).
     init_from_path: Optional[Path] = args.init_from
@@ -870,17 +1017,26 @@ def main() -> int:
     # Global step for LR schedule continuity (stored in checkpoints).
     global_step = 0
 
-    def _save_checkpoint(path: Path, *, epoch: int, best_macro_f1: float, best_epoch: int) -> None:
+    # Checkpoint writes run on a background thread (rank 0 only writes). Two slots so the
+    # epoch's ONNX-export notify can queue behind its checkpoint write without blocking training.
+    ckpt_writer = AsyncCheckpointWriter(enabled=is_main and not bool(args.sync_checkpoints), max_pending=2)
+
+    def _save_checkpoint(
+        path: Path, *, epoch: int, best_macro_f1: float, best_epoch: int, also: Sequence[Path] = ()
+    ) -> None:
         ckpt = {
             "epoch": epoch,
             "global_step": int(global_step),
+            # Lets a resume with a different world size rescale global_step for the LR schedule.
+            "steps_per_epoch": int(steps_per_epoch),
+            "world_size": int(dist_info.world_size),
             "model": model.state_dict(),
             "optimizer": optimizer.state_dict(),
             "scaler": scaler.state_dict(),
             "args": vars(args),
             "best": {"macro_f1": best_macro_f1, "epoch": best_epoch},
         }
-        torch.save(ckpt, path)
+        ckpt_writer.save(ckpt, path, also=also)
 
     def _export_onnx(path: Path) -> None:
         model.eval()
@@ -912,13 +1068,6 @@ def main() -> int:
 
         torch.onnx.export(wrapper, dummy, str(path), **export_kwargs)
 
-    def _load_model_from_checkpoint(path: Path) -> None:
-        try:
-            ckpt_any = torch.load(path, map_location="cpu", weights_only=False)
-        except TypeError:
-            ckpt_any = torch.load(path, map_location="cpu")
-        model.load_state_dict(ckpt_any.get("model", {}), strict=True)
-
     def _load_checkpoint_any(path: Path) -> dict:
         try:
             return torch.load(path, map_location="cpu", weights_only=False)
@@ -929,11 +1078,11 @@ def main() -> int:
     start_epoch = 0
     best_macro_f1 = -1.0
     best_epoch = -1
+    ckpt_steps_per_epoch = 0
     if init_from_path is not None:
         if not init_from_path.exists():
             raise SystemExit(f"ERROR: --init-from not found: {init_from_path}")
-        ckpt_init = _load_checkpoint_any(init_from_path)
-        model.load_state_dict(ckpt_init.get("model", {}), strict=True)
+        model.load_state_dict(load_model_state(init_from_path), strict=True)
         start_epoch = 0
         best_macro_f1 = -1.0
         best_epoch = -1
@@ -959,14 +1108,18 @@ def main() -> int:
                 try:
                     global_step_ckpt = int(ckpt.get("global_step", 0))
                     global_step = max(0, global_step_ckpt)
+                    ckpt_steps_per_epoch = int(ckpt.get("steps_per_epoch", 0) or 0)
                 except Exception:
                     pass
 
-            print(
-                f"Resumed from: {ckpt_path} (next_epoch={start_epoch}, best_macro_f1={best_macro_f1:.4f} @ {best_epoch})"
-            )
+            if is_main:
+                print(
+                    f"Resumed from: {ckpt_path} (next_epoch={start_epoch}, best_macro_f1={best_macro_f1:.4f} @ {best_epoch})"
+                )
 
     if args.export_onnx_only:
+        if not is_main:
+            return 0
         # Export from the currently loaded weights (resume/init-from/auto-resume already applied).
         try:
             _export_onnx(args.output_dir / "last.onnx")
@@ -1022,30 +1175,97 @@ def main() -> int:
     # Labels for balanced batch sampler
     train_labels = [LABEL_TO_INDEX[r.label] for r in train_rows]
 
-    batch_sampler = BalancedBatchSampler(
-        train_labels,
-        num_classes=len(CANONICAL_7),
-        batch_size=args.batch_size,
-        min_per_class=args.min_per_class,
-        seed=args.seed,
-        drop_last=True,
-    )
+    if dist_info.enabled:
+        # Contiguous, unpadded val shards; evaluate() gathers the full logits.
+        val_ds = Subset(val_ds, list(shard_range(len(val_ds), dist_info)))
 
-    train_loader = DataLoader(
-        train_ds,
-        batch_sampler=batch_sampler,
-        num_workers=args.num_workers,
+    def _make_train_loader(cfg: LoaderConfig) -> Tuple[DataLoader, BalancedBatchSampler]:
+        sampler = BalancedBatchSampler(
+            train_labels,
+            num_classes=len(CANONICAL_7),
+            batch_size=cfg.batch_size,
+            min_per_class=args.min_per_class,
+            seed=args.seed,
+            drop_last=True,
+            replacement=not bool(args.balanced_cycle),
+            num_replicas=dist_info.world_size,
+            rank=dist_info.rank,
+        )
+        kw = cfg.dataloader_kwargs()
+        kw.pop("batch_size")
+        return DataLoader(train_ds, batch_sampler=sampler, **kw), sampler
+
+    # DataLoader's own prefetch default (2) unless autotuned.
+    loader_cfg = LoaderConfig(
+        batch_size=int(args.batch_size),
+        num_workers=int(args.num_workers),
+        prefetch_factor=2,
         pin_memory=(device_info.backend == "cuda"),
-        persistent_workers=(args.num_workers > 0),
     )
-    val_loader = DataLoader(
-        val_ds,
-        batch_size=args.batch_size,
-        shuffle=False,
-        num_workers=args.num_workers,
-        pin_memory=(device_info.backend == "cuda"),
-        persistent_workers=(args.num_workers > 0),
+    if bool(args.autotune_loader) and not bool(args.evaluate_only):
+
+        def _autotune_step(batch: Tuple[torch.Tensor, torch.Tensor, object]) -> None:
+            x, y, _src = batch
+            x = x.to(device, non_blocking=True)
+            y = y.to(device, non_blocking=True)
+            with autocast(autocast_device, enabled=use_amp):
+                loss = F.cross_entropy(model(x), y)
+            loss.backward()
+            optimizer.zero_grad(set_to_none=True)
+            float(loss.detach().cpu())
+
+        model.train()
+        with preserve_buffers(model):
+            loader_cfg, autotune_trials = autotune_loader(
+                loader_cfg,
+                make_loader=lambda cfg: _make_train_loader(cfg)[0],
+                step_fn=_autotune_step,
+                cuda=(device_info.backend == "cuda"),
+                batch_sizes=[int(b) for b in _split_csv_list(args.autotune_batch_sizes)],
+                measure_steps=int(args.autotune_steps),
+                log=print if is_main else None,
+            )
+        # Every rank must train with the same batch size (same steps per epoch).
+        loader_cfg = broadcast_object(loader_cfg, dist_info)
+        args.batch_size = int(loader_cfg.batch_size)
+        args.num_workers = int(loader_cfg.num_workers)
+        if is_main:
+            (args.output_dir / "loader_autotune.json").write_text(
+                json.dumps({"selected": asdict(loader_cfg), "trials": autotune_trials}, indent=2), encoding="utf-8"
+            )
+            # Re-record args so the registry (and its args_hash) sees the tuned batch_size/num_workers.
+            record_run(args.output_dir, kind="teacher", event="autotune", repo_root=REPO_ROOT, args=args)
+
+    train_loader, batch_sampler = _make_train_loader(loader_cfg)
+    val_kw = loader_cfg.dataloader_kwargs()
+    val_kw["batch_size"] = int(args.batch_size)
+    val_loader = DataLoader(val_ds, shuffle=False, **val_kw)
+
+    # This rank's val rows (the shard behind val_ds), for the in-memory cache / proxy subset.
+    val_rows_local = [val_rows[i] for i in shard_range(len(val_rows), dist_info)] if dist_info.enabled else val_rows
+    val_cache: Optional[CachedEvalSet] = None
+    if bool(args.cache_val) and not bool(args.evaluate_only):
+        if args.max_val_batches:
+            val_rows_local = val_rows_local[: int(args.max_val_batches) * int(args.batch_size)]
+        val_cache = CachedEvalSet.build(
+            val_rows_local,
+            out_root=args.out_root,
+            transform=val_tfm,
+            num_workers=int(loader_cfg.num_workers),
+            pin=(device_info.backend == "cuda"),
+            log=print if is_main else None,
+        )
+    proxy_idx = stratified_indices(
+        [LABEL_TO_INDEX[r.label] for r in val_rows_local], frac=float(args.proxy_eval_frac), seed=int(args.seed)
     )
+    proxy_loader: Optional[DataLoader] = None
+    if proxy_idx and val_cache is None:
+        proxy_loader = DataLoader(val_ds, sampler=proxy_idx, **val_kw)
+
+    def _val_batches(proxy: bool = False) -> Iterable[Tuple[torch.Tensor, torch.Tensor, object]]:
+        if val_cache is not None:
+            return val_cache.batches(int(args.batch_size), device, indices=proxy_idx if proxy else None)
+        return proxy_loader if proxy else val_loader  # type: ignore[return-value]
 
     class_counts = [0] * len(CANONICAL_7)
     for y in train_labels:
@@ -1058,6 +1278,10 @@ def main() -> int:
         steps_per_epoch = min(steps_per_epoch, args.max_train_batches)
     total_steps = max(1, steps_per_epoch * args.max_epochs)
     warmup_steps = int(round((args.lr_warmup_epochs * steps_per_epoch)))
+    if global_step > 0:
+        global_step = rescale_global_step(
+            global_step, ckpt_steps_per_epoch=ckpt_steps_per_epoch, steps_per_epoch=int(steps_per_epoch)
+        )
 
     # Write alignment report (repro + integrity)
     class_counts_map = {CANONICAL_7[i]: int(class_counts[i]) for i in range(len(CANONICAL_7))}
@@ -1065,6 +1289,7 @@ def main() -> int:
         "time": time.strftime("%Y-%m-%d %H:%M:%S"),
         "repo_root": str(REPO_ROOT),
         "device": {"backend": device_info.backend, "detail": device_info.detail},
+        "distributed": {"world_size": int(dist_info.world_size), "backend": dist_info.backend or None},
         "paths": {
             "manifest": str(manifest_path_for_train),
             "manifest_sha256": sha256_file(manifest_path_for_train) if manifest_path_for_train.exists() else None,
@@ -1108,7 +1333,9 @@ def main() -> int:
         },
         "batching": {
             "batch_size": int(args.batch_size),
+            "global_batch_size": int(args.batch_size) * int(dist_info.world_size),
             "accum_steps": int(args.accum_steps),
+            "loader": {**asdict(loader_cfg), "autotuned": bool(args.autotune_loader)},
             "min_per_class": int(args.min_per_class),
             "cb_beta": float(args.cb_beta),
         },
@@ -1144,7 +1371,8 @@ def main() -> int:
         "init_from": str(init_from_path) if init_from_path is not None else preserved_init_from,
         "resume": str(ckpt_path) if ckpt_path is not None else None,
     }
-    (args.output_dir / "alignmentreport.json").write_text(json.dumps(align, indent=2), encoding="utf-8")
+    if is_main:
+        (args.output_dir / "alignmentreport.json").write_text(json.dumps(align, indent=2), encoding="utf-8")
 
     # Evaluate-only mode (no training loop)
     if bool(args.evaluate_only):
@@ -1169,6 +1397,8 @@ def main() -> int:
             clahe_tile=args.clahe_tile,
         )
         eval_ds = ManifestImageDataset(eval_rows, out_root=args.out_root, transform=eval_tfm)
+        if dist_info.enabled:
+            eval_ds = Subset(eval_ds, list(shard_range(len(eval_ds), dist_info)))
         eval_loader = DataLoader(
             eval_ds,
             batch_size=args.batch_size,
@@ -1187,7 +1417,10 @@ def main() -> int:
             temperature=1.0,
             warmup_plain_logits=False,
             margin=0.0,
+            dist_info=dist_info,
         )
+        if not is_main:
+            return 0
 
         acc, macro_f1, per_f1, nll, ece = metrics_from_logits(logits, y, num_classes=len(CANONICAL_7))
 
@@ -1271,6 +1504,39 @@ def main() -> int:
         global_step = int(start_epoch) * int(steps_per_epoch)
 
     last_eval: Optional[Dict[str, object]] = None
+    eval_sched = EvalScheduler(
+        adaptive=str(args.eval_schedule) == "adaptive",
+        min_every=int(args.eval_every),
+        max_every=int(args.eval_max_every),
+        flat_delta=float(args.eval_flat_delta),
+        proxy=bool(proxy_idx),
+        promote_delta=float(args.proxy_promote_delta),
+        last_epoch=int(args.max_epochs) - 1,
+    )
+
+    # Gradients are averaged across ranks inside DDP's backward. The linear head and the
+    # ArcFace head are used in different phases, hence find_unused_parameters.
+    train_model: nn.Module = model
+    if dist_info.enabled:
+        train_model = DistributedDataParallel(
+            model,
+            device_ids=[device.index] if device.type == "cuda" else None,
+            find_unused_parameters=True,
+        )
+
+    # ONNX export runs in a separate CPU process that watches checkpoint_last.pt / best.pt, so
+    # the training loop never traces the model or holds a second copy on the device.
+    onnx_watcher: Optional[OnnxExportWatcher] = None
+    if is_main and not args.skip_onnx_during_train:
+        onnx_watcher = OnnxExportWatcher(args.output_dir)
+
+    profiler = StepProfiler(
+        enabled=bool(args.profile),
+        device=device,
+        trace_path=(args.output_dir / "profile_trace.json") if is_main else None,
+        trace_wait=int(args.profile_trace_wait),
+        trace_steps=int(args.profile_trace_steps),
+    )
 
     for epoch in range(start_epoch, int(args.max_epochs)):
         epoch_t0 = time.time()
@@ -1283,15 +1549,19 @@ def main() -> int:
             m_max=float(args.arcface_m),
         )
 
+        batch_sampler.set_epoch(epoch)
         model.train()
         optimizer.zero_grad(set_to_none=True)
         running_loss = 0.0
         seen = 0
+        step_timer = StepTimer()
+        profiler.start_epoch()
 
-        for bi, batch in enumerate(train_loader):
+        for bi, batch in enumerate(step_timer.wrap(profiler.wrap(train_loader))):
             if args.max_train_batches and (bi + 1) > int(args.max_train_batches):
                 break
 
+            profiler.switch("h2d")
             x, y, _src = batch
             x = x.to(device, non_blocking=True)
             y = y.to(device, non_blocking=True)
@@ -1312,17 +1582,24 @@ def main() -> int:
             for pg in optimizer.param_groups:
                 pg["lr"] = lr_now
 
-            with autocast(autocast_device, enabled=use_amp):
-                if warmup_plain:
-                    logits = model.forward_logits(x)
-                else:
-                    logits = model.forward_arcface(x, y, margin=m_epoch)
-                loss = F.cross_entropy(logits, y, weight=class_w)
-                loss = loss / max(1, int(args.accum_steps))
-
-            scaler.scale(loss).backward()
-
-            if ((bi + 1) % int(args.accum_steps)) == 0:
+            profiler.switch("forward")
+            step_now = ((bi + 1) % int(args.accum_steps)) == 0
+            # Skip the gradient all-reduce on accumulation micro-steps.
+            sync_ctx = train_model.no_sync() if (dist_info.enabled and not step_now) else contextlib.nullcontext()
+            with sync_ctx:
+                with autocast(autocast_device, enabled=use_amp):
+                    if warmup_plain:
+                        logits = train_model(x)
+                    else:
+                        logits = train_model(x, y, margin=m_epoch)
+                    loss = F.cross_entropy(logits, y, weight=class_w)
+                    loss = loss / max(1, int(args.accum_steps))
+
+                profiler.switch("backward")
+                scaler.scale(loss).backward()
+
+            if step_now:
+                profiler.switch("optimizer")
                 scaler.step(optimizer)
                 scaler.update()
                 optimizer.zero_grad(set_to_none=True)
@@ -1330,23 +1607,55 @@ def main() -> int:
             running_loss += float(loss.detach().cpu())
             seen += 1
             global_step += 1
+            profiler.step()
 
-        train_loss = running_loss / max(1, seen)
+        train_loss = all_reduce_mean(running_loss / max(1, seen), dist_info)
+        profile = profiler.end_epoch()
 
         eval_every = max(1, int(args.eval_every))
-        do_eval = (epoch == start_epoch) or (eval_every == 1) or ((epoch % eval_every) == 0) or (epoch == int(args.max_epochs) - 1)
-
+        fixed_full = (epoch == start_epoch) or (eval_every == 1) or ((epoch % eval_every) == 0) or (epoch == int(args.max_epochs) - 1)
+        eval_kind = eval_sched.plan(epoch, fixed_full=fixed_full)
+        if last_eval is None:
+            # Safety: the first epoch of a (resumed) run always evaluates.
+            eval_kind = "full"
+
+        proxy_rec: Optional[Dict[str, object]] = None
+        if eval_kind == "proxy":
+            t_proxy = time.time()
+            broadcast_buffers(model, dist_info)
+            p_logits, p_y = evaluate(
+                model,
+                _val_batches(proxy=True),
+                device=device,
+                use_amp=use_amp,
+                temperature=1.0,
+                warmup_plain_logits=warmup_plain,
+                margin=m_epoch,
+                dist_info=dist_info,
+            )
+            p_acc, p_f1, _p_per, _p_nll, _p_ece = metrics_from_logits(p_logits, p_y, num_classes=len(CANONICAL_7))
+            proxy_rec = {"accuracy": p_acc, "macro_f1": p_f1, "n": int(p_y.numel())}
+            if eval_sched.should_promote(p_f1):
+                eval_kind = "full"
+                proxy_rec["promoted"] = True
+            eval_sched.record(epoch, "proxy", p_f1, time.time() - t_proxy)
+
+        do_eval = eval_kind == "full"
         if do_eval:
+            t_full = time.time()
+            # Every rank evaluates rank 0's BatchNorm statistics (the ones checkpointed below).
+            broadcast_buffers(model, dist_info)
             # Eval (raw)
             val_logits, val_y = evaluate(
                 model,
-                val_loader,
+                _val_batches(),
                 device=device,
                 use_amp=use_amp,
                 max_batches=args.max_val_batches,
                 temperature=1.0,
                 warmup_plain_logits=warmup_plain,
                 margin=m_epoch,
+                dist_info=dist_info,
             )
             acc, macro_f1, per_f1, nll, ece = metrics_from_logits(val_logits, val_y, num_classes=len(CANONICAL_7))
 
@@ -1394,6 +1703,7 @@ def main() -> int:
                     },
                 },
             }
+            eval_sched.record(epoch, "full", macro_f1, time.time() - t_full)
         else:
             # Skip eval to save time; reuse last eval snapshot if available.
             if last_eval is None:
@@ -1443,13 +1753,30 @@ def main() -> int:
             },
             "lr": float(optimizer.param_groups[0]["lr"]),
             "timing": {"epoch_sec": epoch_sec, "total_sec": total_sec},
-            "eval": {"ran": bool(do_eval), "every": int(eval_every)},
+            "loader": {**asdict(loader_cfg), **step_timer.summary()},
+            "eval": {
+                "ran": bool(do_eval),
+                "every": int(eval_every),
+                "kind": eval_kind,
+                "schedule": str(args.eval_schedule),
+                "cached": val_cache is not None,
+                **eval_sched.summary(total_sec),
+            },
         }
+        if proxy_rec is not None:
+            epoch_rec["proxy_val"] = proxy_rec
+        if profile is not None:
+            epoch_rec["profile"] = profile
         history.append(epoch_rec)
 
-        # Save artifacts each epoch (small, but helps reproducibility)
-        (args.output_dir / "history.json").write_text(json.dumps(history, indent=2), encoding="utf-8")
+        if not is_main:
+            # History, metrics, checkpoints and ONNX exports are written by rank 0 only.
+            if args.smoke:
+                break
+            continue
 
+        # Save artifacts each epoch (small, but helps reproducibility); history.json is
+        # written after checkpointing so it includes this epoch's checkpoint_io timing.
         reliability = {
             "epoch": epoch,
             "raw": {"accuracy": acc, "macro_f1": macro_f1, "per_class_f1": per_f1, "nll": nll, "ece": ece},
@@ -1475,33 +1802,43 @@ def main() -> int:
         }
         (args.output_dir / "calibration.json").write_text(json.dumps(calibration, indent=2), encoding="utf-8")
 
-        # Checkpointing
-        _save_checkpoint(args.output_dir / "checkpoint_last.pt", epoch=epoch, best_macro_f1=best_macro_f1, best_epoch=best_epoch)
-        if args.checkpoint_every > 0 and ((epoch + 1) % int(args.checkpoint_every) == 0):
-            _save_checkpoint(
-                args.output_dir / f"checkpoint_epoch{epoch:03d}.pt",
-                epoch=epoch,
-                best_macro_f1=best_macro_f1,
-                best_epoch=best_epoch,
-            )
-
         # Best model tracking (only meaningful when eval ran)
-        if do_eval and (macro_f1 > best_macro_f1):
+        is_best = bool(do_eval and (macro_f1 > best_macro_f1))
+        if is_best:
             best_macro_f1 = float(macro_f1)
             best_epoch = int(epoch)
-            _save_checkpoint(args.output_dir / "best.pt", epoch=epoch, best_macro_f1=best_macro_f1, best_epoch=best_epoch)
-            if not args.skip_onnx_during_train:
-                try:
-                    _export_onnx(args.output_dir / "best.onnx")
-                except Exception as e:
-                    print("WARN: ONNX export failed for best model:", e)
 
-        # Always keep a last.onnx for convenience (optionally skipped during training)
-        if not args.skip_onnx_during_train:
-            try:
-                _export_onnx(args.output_dir / "last.onnx")
-            except Exception as e:
-                print("WARN: ONNX export failed for last model:", e)
+        # Checkpointing: one CPU snapshot per epoch; best.pt / numbered checkpoints are links
+        # to the same file.
+        also: List[Path] = []
+        if is_best:
+            also.append(args.output_dir / "best.pt")
+        if args.checkpoint_every > 0 and ((epoch + 1) % int(args.checkpoint_every) == 0):
+            also.append(args.output_dir / f"checkpoint_epoch{epoch:03d}.pt")
+        _save_checkpoint(
+            args.output_dir / "checkpoint_last.pt",
+            epoch=epoch,
+            best_macro_f1=best_macro_f1,
+            best_epoch=best_epoch,
+            also=also,
+        )
+
+        # last.onnx / best.onnx: the exporter process picks the new files up once they are written.
+        if onnx_watcher is not None:
+            ckpt_writer.submit("onnx export notify", onnx_watcher.notify)
+
+        epoch_rec["checkpoint_io"] = ckpt_writer.take_stats()
+        # Fail the run on a write error from an earlier background save instead of training on.
+        ckpt_writer.check()
+        (args.output_dir / "history.json").write_text(json.dumps(history, indent=2), encoding="utf-8")
+
+        record_run(
+            args.output_dir,
+            kind="teacher",
+            event="checkpoint",
+            repo_root=REPO_ROOT,
+            best={"macro_f1": float(best_macro_f1), "epoch": int(best_epoch)},
+        )
 
         print(
             f"epoch {epoch:03d} | train_loss {train_loss:.4f} | val_acc {acc:.4f} | val_macroF1 {macro_f1:.4f} | ece {ece:.4f} | T* {t_star:.3f} | img {args.image_size} | epoch_sec {epoch_sec:.1f} | total_sec {total_sec:.1f}"
@@ -1510,20 +1847,20 @@ def main() -> int:
         if args.smoke:
             break
 
-    # Ensure ONNX artifacts exist at the end (even if skipped during training).
-    try:
-        _export_onnx(args.output_dir / "last.onnx")
-    except Exception as e:
-        print("WARN: Final ONNX export failed for last model:", e)
+    barrier(dist_info)
+    if not is_main:
+        return 0
+    # Checkpoints must be fully written before the final ONNX pass reads them.
+    ckpt_writer.close()
 
-    best_ckpt = args.output_dir / "best.pt"
-    if best_ckpt.exists():
-        try:
-            _load_model_from_checkpoint(best_ckpt)
-            _export_onnx(args.output_dir / "best.onnx")
-        except Exception as e:
-            print("WARN: Final ONNX export failed for best model:", e)
+    # Ensure ONNX artifacts exist at the end (even if skipped during training).
+    if onnx_watcher is not None:
+        if onnx_watcher.finish() != 0:
+            print("WARN: background ONNX exporter exited with an error")
+    else:
+        export_pass(args.output_dir, {})
 
+    record_run(args.output_dir, kind="teacher", event="end", repo_root=REPO_ROOT)
     return 0
 
 
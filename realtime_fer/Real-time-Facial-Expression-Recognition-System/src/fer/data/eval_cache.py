@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader
+from torchvision import transforms as T
+
+from src.fer.data.manifest_dataset import ManifestImageDataset, ManifestRow
+
+# Decoded validation sets kept in memory across epochs (--cache-val in the trainers).
+# The deterministic eval transform runs once, stopping before ToTensor/Normalize, and the
+# result is stored as uint8 NCHW (4x smaller than float); each eval batch is normalized
+# on the device. Batches look like DataLoader batches: (x, y, None).
+
+
+def split_normalize(transform: T.Compose) -> Tuple[T.Compose, Tuple[float, ...], Tuple[float, ...]]:
+    """Split an eval transform ([..., ToTensor, Normalize]) into a uint8 transform + mean/std."""
+    ops = list(transform.transforms)
+    if len(ops) < 2 or not (isinstance(ops[-1], T.Normalize) and isinstance(ops[-2], T.ToTensor)):
+        raise RuntimeError("Unexpected eval transform layout; expected [..., ToTensor, Normalize].")
+    norm = ops[-1]
+    return T.Compose(ops[:-2] + [T.PILToTensor()]), tuple(norm.mean), tuple(norm.std)
+
+
+def normalize_uint8_batch(
+    x_u8: torch.Tensor, device: torch.device, *, mean: Sequence[float], std: Sequence[float]
+) -> torch.Tensor:
+    # ToTensor (float / 255) followed by Normalize, batched.
+    x = x_u8.to(device, non_blocking=True).float().div(255)
+    m = torch.tensor(list(mean), dtype=x.dtype, device=x.device).view(1, -1, 1, 1)
+    s = torch.tensor(list(std), dtype=x.dtype, device=x.device).view(1, -1, 1, 1)
+    return x.sub_(m).div_(s)
+
+
+def stratified_indices(labels: Sequence[int], *, frac: float, seed: int = 0, min_per_class: int = 1) -> List[int]:
+    """Fixed class-proportional subset of range(len(labels)) (sorted), for proxy evaluation."""
+    y = np.asarray(list(labels), dtype=np.int64)
+    if y.size == 0 or frac <= 0:
+        return []
+    if frac >= 1:
+        return list(range(int(y.size)))
+    rng = np.random.default_rng(int(seed))
+    picked: List[np.ndarray] = []
+    for c in np.unique(y):
+        idx = np.flatnonzero(y == c)
+        k = min(idx.size, max(int(min_per_class), int(round(idx.size * float(frac)))))
+        picked.append(rng.choice(idx, size=k, replace=False))
+    return sorted(int(i) for i in np.concatenate(picked))
+
+
+class CachedEvalSet:
+    def __init__(
+        self, x_u8: torch.Tensor, y: torch.Tensor, *, mean: Sequence[float], std: Sequence[float], pin: bool = False
+    ) -> None:
+        self.x_u8 = x_u8.pin_memory() if pin else x_u8
+        self.y = y
+        self.mean = tuple(mean)
+        self.std = tuple(std)
+
+    def __len__(self) -> int:
+        return int(self.y.shape[0])
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.x_u8.numel() * self.x_u8.element_size())
+
+    @classmethod
+    def build(
+        cls,
+        rows: Sequence[ManifestRow],
+        *,
+        out_root: Path,
+        transform: T.Compose,
+        num_workers: int = 0,
+        batch_size: int = 256,
+        pin: bool = False,
+        log: Optional[Callable[[str], None]] = print,
+    ) -> "CachedEvalSet":
+        """Decode + preprocess every row once with the (deterministic) eval transform."""
+        u8_tf, mean, std = split_normalize(transform)
+        ds = ManifestImageDataset(list(rows), out_root=out_root, transform=u8_tf)
+        n = len(ds)
+        xs: Optional[torch.Tensor] = None
+        ys = torch.empty((n,), dtype=torch.int64)
+        kw: Dict[str, object] = {"batch_size": int(batch_size), "shuffle": False, "num_workers": int(num_workers)}
+        t0 = time.perf_counter()
+        i = 0
+        for x, y, _src in DataLoader(ds, **kw):  # type: ignore[arg-type]
+            if xs is None:
+                xs = torch.empty((n,) + tuple(x.shape[1:]), dtype=torch.uint8)
+            xs[i : i + x.shape[0]] = x
+            ys[i : i + x.shape[0]] = y
+            i += int(x.shape[0])
+        if xs is None:
+            xs = torch.zeros((0, 3, 1, 1), dtype=torch.uint8)
+        out = cls(xs, ys, mean=mean, std=std, pin=pin)
+        if log is not None:
+            log(f"Cached {n} val images ({out.nbytes / 1e6:.1f} MB uint8) in {time.perf_counter() - t0:.1f}s")
+        return out
+
+    def batches(
+        self, batch_size: int, device: torch.device, *, indices: Optional[Sequence[int]] = None
+    ) -> Iterator[Tuple[torch.Tensor, torch.Tensor, None]]:
+        idx = torch.as_tensor(list(indices), dtype=torch.int64) if indices is not None else None
+        n = len(self) if idx is None else int(idx.numel())
+        bs = max(1, int(batch_size))
+        for start in range(0, n, bs):
+            if idx is None:
+                xb, yb = self.x_u8[start : start + bs], self.y[start : start + bs]
+            else:
+                sel = idx[start : start + bs]
+                xb, yb = self.x_u8.index_select(0, sel), self.y.index_select(0, sel)
+            yield normalize_uint8_batch(xb, device, mean=self.mean, std=self.std), yb, None
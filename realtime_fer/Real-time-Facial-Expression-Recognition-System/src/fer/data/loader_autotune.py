@@ -0,0 +1,203 @@
+from __future__ import annotations
+
+import contextlib
+import os
+import time
+from dataclasses import asdict, dataclass, replace
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+# DataLoader throughput helpers for the trainers:
+# - StepTimer splits every training step into data-wait (blocked on the loader) and
+#   compute (everything until the next batch is requested).
+# - autotune_loader times a short window per candidate loader config and keeps the
+#   fastest (samples/sec), searching one knob at a time:
+#   num_workers -> prefetch_factor -> pin_memory -> batch_size.
+
+
+@dataclass(frozen=True)
+class LoaderConfig:
+    batch_size: int
+    num_workers: int
+    prefetch_factor: int
+    pin_memory: bool
+
+    def dataloader_kwargs(self) -> Dict[str, Any]:
+        kw: Dict[str, Any] = {
+            "batch_size": int(self.batch_size),
+            "num_workers": int(self.num_workers),
+            "pin_memory": bool(self.pin_memory),
+        }
+        if int(self.num_workers) > 0:
+            kw["prefetch_factor"] = int(self.prefetch_factor)
+            # Avoid re-spawning worker processes every epoch (especially important on Windows).
+            kw["persistent_workers"] = True
+        return kw
+
+
+def default_prefetch_factor(num_workers: int) -> int:
+    # Windows can hit "Couldn't open shared file mapping" (error 1455) when too many
+    # prefetched batches are in-flight (large batch_size * num_workers).
+    return 1 if (os.name == "nt" and int(num_workers) > 0) else 2
+
+
+class StepTimer:
+    """Accumulates data-wait vs compute time of a loop over a DataLoader.
+
+    Compute ends when the loop asks for the next batch, so the step body must already
+    synchronize with the device (the trainers read `loss.cpu()` every step).
+    """
+
+    def __init__(self) -> None:
+        self.steps = 0
+        self.samples = 0
+        self.data_wait_sec = 0.0
+        self.compute_sec = 0.0
+
+    def wrap(self, batches: Iterable[Any]) -> Iterator[Any]:
+        t_prev = time.perf_counter()
+        for batch in batches:
+            t_batch = time.perf_counter()
+            self.data_wait_sec += t_batch - t_prev
+            yield batch
+            t_prev = time.perf_counter()
+            self.compute_sec += t_prev - t_batch
+            self.steps += 1
+            self.samples += _batch_len(batch)
+
+    def summary(self) -> Dict[str, float]:
+        total = self.data_wait_sec + self.compute_sec
+        return {
+            "steps": int(self.steps),
+            "data_wait_sec": float(self.data_wait_sec),
+            "compute_sec": float(self.compute_sec),
+            "data_wait_pct": float(100.0 * self.data_wait_sec / total) if total > 0 else 0.0,
+            "samples_per_sec": float(self.samples / total) if total > 0 else 0.0,
+        }
+
+
+def _batch_len(batch: Any) -> int:
+    x = batch[0] if isinstance(batch, (tuple, list)) else batch
+    try:
+        return int(x.shape[0])
+    except Exception:
+        return 0
+
+
+def time_loader(
+    loader: Iterable[Any],
+    step_fn: Callable[[Any], None],
+    *,
+    warmup_steps: int,
+    measure_steps: int,
+) -> Dict[str, float]:
+    """Run step_fn over warmup+measure batches; timing covers only the measured ones."""
+    it = iter(loader)
+    for _ in range(int(warmup_steps)):
+        try:
+            step_fn(next(it))
+        except StopIteration:
+            break
+
+    def _measured() -> Iterator[Any]:
+        for _ in range(int(measure_steps)):
+            try:
+                yield next(it)
+            except StopIteration:
+                return
+
+    timer = StepTimer()
+    for batch in timer.wrap(_measured()):
+        step_fn(batch)
+    del it
+    return timer.summary()
+
+
+@contextlib.contextmanager
+def preserve_buffers(module: Any) -> Iterator[None]:
+    """Restore module buffers (BatchNorm running stats) after autotune forward passes."""
+    saved = {k: v.detach().clone() for k, v in module.named_buffers()}
+    try:
+        yield
+    finally:
+        for k, v in module.named_buffers():
+            if k in saved:
+                v.data.copy_(saved[k])
+
+
+def _candidates(
+    base: LoaderConfig, knob: str, *, cpu_count: int, cuda: bool, batch_sizes: Sequence[int]
+) -> List[LoaderConfig]:
+    if knob == "num_workers":
+        values = sorted({0, 2, 4, 8, base.num_workers, min(16, cpu_count)})
+        return [
+            replace(base, num_workers=w, prefetch_factor=default_prefetch_factor(w) if w else base.prefetch_factor)
+            for w in values
+            if w <= max(0, cpu_count)
+        ]
+    if knob == "prefetch_factor":
+        if base.num_workers <= 0:
+            return []
+        values = (1, 2) if os.name == "nt" else (1, 2, 4)
+        return [replace(base, prefetch_factor=p) for p in values]
+    if knob == "pin_memory":
+        return [replace(base, pin_memory=p) for p in (False, True)] if cuda else []
+    if knob == "batch_size":
+        return [replace(base, batch_size=int(b)) for b in sorted(set(int(b) for b in batch_sizes) | {base.batch_size})]
+    raise ValueError(f"Unknown loader knob: {knob}")
+
+
+def autotune_loader(
+    base: LoaderConfig,
+    *,
+    make_loader: Callable[[LoaderConfig], Iterable[Any]],
+    step_fn: Callable[[Any], None],
+    cuda: bool,
+    batch_sizes: Sequence[int] = (),
+    warmup_steps: int = 3,
+    measure_steps: int = 20,
+    log: Optional[Callable[[str], None]] = print,
+) -> Tuple[LoaderConfig, List[Dict[str, Any]]]:
+    """Coordinate search over loader knobs; returns (best config, per-trial results).
+
+    `step_fn` should run the real forward/backward (without an optimizer step) so the
+    data-wait vs compute split reflects training. Candidates that fail to build or
+    iterate (e.g. shared-memory limits) are recorded and skipped.
+    """
+    cpu_count = int(os.cpu_count() or 1)
+    trials: List[Dict[str, Any]] = []
+    measured: Dict[LoaderConfig, float] = {}
+
+    def _trial(cfg: LoaderConfig) -> float:
+        if cfg in measured:
+            return measured[cfg]
+        rec: Dict[str, Any] = {"config": asdict(cfg)}
+        try:
+            loader = make_loader(cfg)
+            rec.update(time_loader(loader, step_fn, warmup_steps=warmup_steps, measure_steps=measure_steps))
+            del loader
+            score = float(rec["samples_per_sec"])
+        except Exception as e:
+            rec["error"] = f"{type(e).__name__}: {e}"
+            score = -1.0
+        trials.append(rec)
+        measured[cfg] = score
+        if log is not None:
+            if "error" in rec:
+                log(f"[autotune-loader] {cfg}: FAILED {rec['error']}")
+            else:
+                log(
+                    f"[autotune-loader] {cfg}: {rec['samples_per_sec']:.1f} samples/s, "
+                    f"data_wait {rec['data_wait_pct']:.1f}%"
+                )
+        return score
+
+    best = base
+    best_score = _trial(base)
+    for knob in ("num_workers", "prefetch_factor", "pin_memory", "batch_size"):
+        for cfg in _candidates(best, knob, cpu_count=cpu_count, cuda=cuda, batch_sizes=batch_sizes):
+            score = _trial(cfg)
+            if score > best_score:
+                best, best_score = cfg, score
+    if log is not None:
+        log(f"[autotune-loader] selected {best} ({best_score:.1f} samples/s)")
+    return best, trials
@@ -10,17 +10,7 @@ from PIL import Image
 from torch.utils.data import Dataset
 from torchvision import transforms as T
 
-
-CANONICAL_7: Tuple[str, ...] = (
-    "Angry",
-    "Disgust",
-    "Fear",
-    "Happy",
-    "Sad",
-    "Surprise",
-    "Neutral",
-)
-LABEL_TO_INDEX: Dict[str, int] = {name: i for i, name in enumerate(CANONICAL_7)}
+from src.fer.inference.labels import CANONICAL_7, LABEL_TO_INDEX  # noqa: F401  (re-exported)
 
 
 @dataclass(frozen=True)
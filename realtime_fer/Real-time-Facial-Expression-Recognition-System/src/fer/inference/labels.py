@@ -0,0 +1,16 @@
+from __future__ import annotations
+
+from typing import Dict, Tuple
+
+# Class order shared by manifests, checkpoints, exported models and the demos.
+# Kept dependency-free so inference entry points can import it without torch.
+CANONICAL_7: Tuple[str, ...] = (
+    "Angry",
+    "Disgust",
+    "Fear",
+    "Happy",
+    "Sad",
+    "Surprise",
+    "Neutral",
+)
+LABEL_TO_INDEX: Dict[str, int] = {name: i for i, name in enumerate(CANONICAL_7)}
@@ -0,0 +1,182 @@
+from __future__ import annotations
+
+import http.client
+import json
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import urlsplit
+
+import numpy as np
+
+from src.fer.inference.labels import CANONICAL_7
+from src.fer.realtime.batcher import DynamicBatcher
+
+# Localhost HTTP/1.1 (keep-alive) with binary bodies, served by scripts/serve_inference.py:
+#   POST /infer        body: HxWx3 uint8 BGR crop (C order), header X-Shape: "H,W"
+#                      200 -> float32 little-endian [2, 7]: row 0 logits, row 1 probs
+#   GET  /meta         JSON model meta (same keys as the demo loaders) + batching settings
+#   GET  /stats        JSON DynamicBatcher.stats(); POST /stats/reset clears them
+# Errors return 4xx/5xx with a plain-text message.
+
+DEFAULT_URL = "http://127.0.0.1:8765"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    server: "InferenceServer"
+
+    def log_message(self, format: str, *args: object) -> None:  # noqa: A002 (BaseHTTPRequestHandler API)
+        return
+
+    def _send(self, code: int, body: bytes, content_type: str) -> None:
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, obj: object) -> None:
+        self._send(200, json.dumps(obj).encode("utf-8"), "application/json")
+
+    def _send_error(self, code: int, msg: str) -> None:
+        self._send(code, msg.encode("utf-8"), "text/plain; charset=utf-8")
+
+    def do_GET(self) -> None:  # noqa: N802
+        if self.path == "/meta":
+            self._send_json(self.server.meta)
+        elif self.path == "/stats":
+            self._send_json(self.server.batcher.stats())
+        else:
+            self._send_error(404, f"unknown path: {self.path}")
+
+    def do_POST(self) -> None:  # noqa: N802
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length > 0 else b""
+        if self.path == "/stats/reset":
+            self.server.batcher.reset_stats()
+            self._send_json({"ok": True})
+            return
+        if self.path != "/infer":
+            self._send_error(404, f"unknown path: {self.path}")
+            return
+        try:
+            h, w = (int(v) for v in str(self.headers.get("X-Shape") or "").split(","))
+            crop = np.frombuffer(body, dtype=np.uint8).reshape(h, w, 3)
+        except Exception:
+            self._send_error(400, f"expected X-Shape 'H,W' matching a HxWx3 uint8 body ({len(body)} bytes)")
+            return
+        try:
+            logits, probs = self.server.batcher.submit(crop).result()
+        except Exception as e:
+            self._send_error(500, f"inference failed: {e!r}")
+            return
+        out = np.stack([np.asarray(logits, dtype="<f4"), np.asarray(probs, dtype="<f4")])
+        self._send(200, out.tobytes(), "application/octet-stream")
+
+
+class InferenceServer(ThreadingHTTPServer):
+    """One handler thread per connection; all /infer requests share one DynamicBatcher."""
+
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], *, batcher: DynamicBatcher, meta: Dict[str, object]) -> None:
+        super().__init__(address, _Handler)
+        self.batcher = batcher
+        self.meta = meta
+
+
+def make_server(
+    infer_batch: Callable[[List[object]], Sequence[np.ndarray]],
+    meta: Dict[str, object],
+    *,
+    host: str = "127.0.0.1",
+    port: int = 8765,
+    max_batch: int = 16,
+    max_wait_ms: float = 3.0,
+) -> InferenceServer:
+    """Server for `infer_batch` (demo.realtime_demo._load_student_batch); call serve_forever()."""
+    batcher = DynamicBatcher(infer_batch, max_batch=max_batch, max_wait_ms=max_wait_ms).start()
+    served_meta = {
+        **meta,
+        "classes": list(CANONICAL_7),
+        "max_batch": int(max_batch),
+        "max_wait_ms": float(max_wait_ms),
+    }
+    return InferenceServer((host, int(port)), batcher=batcher, meta=served_meta)
+
+
+class InferenceClient:
+    """Client with the demo loaders' `infer(face_bgr) -> (logits, probs)` interface.
+
+    Keeps one keep-alive connection per calling thread, so one client can be shared by
+    several threads. A dropped connection is reopened once per request.
+    """
+
+    def __init__(self, url: str = DEFAULT_URL, *, timeout: float = 10.0) -> None:
+        parts = urlsplit(url if "://" in url else f"http://{url}")
+        self.url = url
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = int(parts.port or 80)
+        self.timeout = float(timeout)
+        self._local = threading.local()
+
+    def _connection(self, *, fresh: bool = False) -> http.client.HTTPConnection:
+        conn: Optional[http.client.HTTPConnection] = getattr(self._local, "conn", None)
+        if conn is None or fresh:
+            if conn is not None:
+                conn.close()
+            conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            conn.connect()
+            conn.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._local.conn = conn
+        return conn
+
+    def _request(
+        self, method: str, path: str, body: Optional[bytes] = None, headers: Optional[Dict[str, str]] = None
+    ) -> bytes:
+        for attempt in range(2):
+            try:
+                conn = self._connection(fresh=attempt > 0)
+                conn.request(method, path, body=body, headers=headers or {})
+                resp = conn.getresponse()
+                data = resp.read()
+                break
+            except (ConnectionError, http.client.HTTPException, socket.timeout):
+                if attempt > 0:
+                    raise
+        if resp.status != 200:
+            raise RuntimeError(f"{method} {self.url}{path} -> {resp.status}: {data.decode('utf-8', 'replace')}")
+        return data
+
+    def infer(self, face_bgr) -> Tuple[List[float], List[float]]:
+        crop = np.ascontiguousarray(face_bgr, dtype=np.uint8)
+        h, w = crop.shape[:2]
+        data = self._request(
+            "POST",
+            "/infer",
+            body=crop.tobytes(),
+            headers={"Content-Type": "application/octet-stream", "X-Shape": f"{h},{w}"},
+        )
+        out = np.frombuffer(data, dtype="<f4").reshape(2, -1).astype(np.float64)
+        return out[0].tolist(), out[1].tolist()
+
+    def meta(self) -> Dict[str, object]:
+        meta = json.loads(self._request("GET", "/meta"))
+        meta["device"] = f"service:{self.host}:{self.port} ({meta.get('device')})"
+        return meta
+
+    def stats(self, *, reset: bool = False) -> Dict[str, object]:
+        """Server batch statistics; `reset` clears them after reading."""
+        stats = json.loads(self._request("GET", "/stats"))
+        if reset:
+            self._request("POST", "/stats/reset", body=b"")
+        return stats
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
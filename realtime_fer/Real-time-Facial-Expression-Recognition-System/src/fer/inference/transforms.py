@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+from typing import Any
+
+import numpy as np
+from PIL import Image
+
+# Eval-time preprocessing shared by training (build_transforms in scripts/train_teacher.py)
+# and the demos: Resize((round(1.15*S),)*2) -> CenterCrop(S) -> optional CLAHE ->
+# ToTensor -> ImageNet Normalize. torchvision (and with it torch) is only imported by
+# build_eval_transform; preprocess_bgr is the numpy equivalent for onnxruntime callers.
+
+IMAGENET_MEAN = (0.485, 0.456, 0.406)
+IMAGENET_STD = (0.229, 0.224, 0.225)
+
+try:
+    import cv2  # type: ignore
+
+    _HAS_CV2 = True
+except Exception:
+    cv2 = None
+    _HAS_CV2 = False
+
+
+class CLAHETransform:
+    def __init__(self, *, clip_limit: float = 2.0, tile_grid_size: int = 8) -> None:
+        self.clip_limit = float(clip_limit)
+        self.tile_grid_size = int(tile_grid_size)
+
+    def __call__(self, img: Image.Image) -> Image.Image:
+        if not _HAS_CV2:
+            return img
+        arr = np.array(img)
+        # RGB -> LAB
+        lab = cv2.cvtColor(arr, cv2.COLOR_RGB2LAB)
+        l, a, b = cv2.split(lab)
+        clahe = cv2.createCLAHE(
+            clipLimit=self.clip_limit, tileGridSize=(self.tile_grid_size, self.tile_grid_size)
+        )
+        l2 = clahe.apply(l)
+        lab2 = cv2.merge((l2, a, b))
+        rgb2 = cv2.cvtColor(lab2, cv2.COLOR_LAB2RGB)
+        return Image.fromarray(rgb2)
+
+
+def eval_resize_size(image_size: int) -> int:
+    return int(round(int(image_size) * 1.15))
+
+
+def build_eval_transform(*, image_size: int, use_clahe: bool, clahe_clip: float = 2.0, clahe_tile: int = 8) -> Any:
+    """torchvision Compose for PIL RGB images -> normalized float CHW tensor."""
+    from torchvision import transforms as T
+
+    resize = eval_resize_size(image_size)
+    ops: list = [T.Resize((resize, resize)), T.CenterCrop((image_size, image_size))]
+    if use_clahe:
+        ops.append(CLAHETransform(clip_limit=clahe_clip, tile_grid_size=clahe_tile))
+    ops.extend([T.ToTensor(), T.Normalize(mean=list(IMAGENET_MEAN), std=list(IMAGENET_STD))])
+    return T.Compose(ops)
+
+
+def preprocess_bgr(
+    face_bgr: np.ndarray, *, image_size: int, use_clahe: bool = False, clahe_clip: float = 2.0, clahe_tile: int = 8
+) -> np.ndarray:
+    """BGR uint8 crop -> float32 [1, 3, S, S], matching build_eval_transform without torch."""
+    img = Image.fromarray(np.ascontiguousarray(face_bgr[:, :, ::-1]))
+    resize = eval_resize_size(image_size)
+    # PIL bilinear resize + torchvision's CenterCrop rounding, as T.Resize/T.CenterCrop do on PIL images.
+    img = img.resize((resize, resize), Image.BILINEAR)
+    top = int(round((resize - image_size) / 2.0))
+    img = img.crop((top, top, top + image_size, top + image_size))
+    if use_clahe:
+        img = CLAHETransform(clip_limit=clahe_clip, tile_grid_size=clahe_tile)(img)
+    x = np.asarray(img, dtype=np.float32).transpose(2, 0, 1) / 255.0
+    mean = np.asarray(IMAGENET_MEAN, dtype=np.float32).reshape(3, 1, 1)
+    std = np.asarray(IMAGENET_STD, dtype=np.float32).reshape(3, 1, 1)
+    return ((x - mean) / std)[None].astype(np.float32, copy=False)
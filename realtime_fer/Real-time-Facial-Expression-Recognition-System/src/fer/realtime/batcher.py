@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Callable, Deque, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+_STOP = object()
+
+
+class DynamicBatcher:
+    """Merge single-item requests from many threads into batched calls of `fn`.
+
+    `submit(item)` returns a Future. A worker thread takes the first pending request,
+    then keeps collecting until `max_batch` items are queued or `max_wait_ms` has passed
+    since that first request, and calls `fn(items)` once. `fn` returns a tuple of
+    batch-first arrays (e.g. infer_batch's (logits, probs)); request i resolves to
+    `tuple(arr[i] for arr in outputs)`. If `fn` raises, every request of that batch fails.
+    Batch statistics cover the last `history` batches.
+    """
+
+    def __init__(
+        self,
+        fn: Callable[[List[object]], Sequence[np.ndarray]],
+        *,
+        max_batch: int = 32,
+        max_wait_ms: float = 5.0,
+        history: int = 100_000,
+    ) -> None:
+        self.fn = fn
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._q: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self.history = max(1, int(history))
+        self.batch_sizes: Deque[int] = deque(maxlen=self.history)
+        self.batch_sec: Deque[float] = deque(maxlen=self.history)
+        self._stats_lock = threading.Lock()
+
+    def start(self) -> "DynamicBatcher":
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="dynamic-batcher", daemon=True)
+            self._thread.start()
+        return self
+
+    def submit(self, item: object) -> Future:
+        fut: Future = Future()
+        self._q.put((item, fut))
+        return fut
+
+    def close(self) -> None:
+        """Finish the queued requests, then stop the worker."""
+        if self._thread is not None:
+            self._q.put(_STOP)
+            self._thread.join()
+            self._thread = None
+
+    def reset_stats(self) -> None:
+        with self._stats_lock:
+            self.batch_sizes.clear()
+            self.batch_sec.clear()
+
+    def stats(self) -> Dict[str, object]:
+        with self._stats_lock:
+            sizes = np.asarray(self.batch_sizes, dtype=np.int64)
+            ms = np.asarray(self.batch_sec, dtype=np.float64) * 1000.0
+        if sizes.size == 0:
+            return {"batches": 0, "items": 0}
+        return {
+            "batches": int(sizes.size),
+            "items": int(sizes.sum()),
+            "mean_batch": round(float(sizes.mean()), 3),
+            "max_batch_seen": int(sizes.max()),
+            "batch_hist": {int(k): int(v) for k, v in zip(*np.unique(sizes, return_counts=True))},
+            "run_ms_p50": round(float(np.percentile(ms, 50)), 4),
+            "run_ms_p95": round(float(np.percentile(ms, 95)), 4),
+        }
+
+    def _collect(self) -> Tuple[List[Tuple[object, Future]], bool]:
+        first = self._q.get()
+        if first is _STOP:
+            return [], True
+        pending = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(pending) < self.max_batch:
+            timeout = deadline - time.perf_counter()
+            try:
+                nxt = self._q.get(timeout=timeout) if timeout > 0 else self._q.get_nowait()
+            except queue.Empty:
+                break
+            if nxt is _STOP:
+                return pending, True
+            pending.append(nxt)
+        return pending, False
+
+    def _loop(self) -> None:
+        stop = False
+        while not stop:
+            pending, stop = self._collect()
+            if not pending:
+                continue
+            t0 = time.perf_counter()
+            try:
+                outs = self.fn([item for item, _fut in pending])
+            except BaseException as e:
+                for _item, fut in pending:
+                    fut.set_exception(e)
+                continue
+            with self._stats_lock:
+                self.batch_sec.append(time.perf_counter() - t0)
+                self.batch_sizes.append(len(pending))
+            for i, (_item, fut) in enumerate(pending):
+                fut.set_result(tuple(arr[i] for arr in outs))
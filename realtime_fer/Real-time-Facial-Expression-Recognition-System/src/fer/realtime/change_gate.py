@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+from typing import Callable, Dict, List, Optional, Tuple
+
+import cv2  # type: ignore
+import numpy as np
+
+
+def crop_signature(face_bgr: np.ndarray, *, size: int = 16) -> np.ndarray:
+    """Cheap change signature: size x size grayscale thumbnail (float32, 0..255)."""
+    gray = cv2.cvtColor(face_bgr, cv2.COLOR_BGR2GRAY) if face_bgr.ndim == 3 else face_bgr
+    return cv2.resize(gray, (int(size), int(size)), interpolation=cv2.INTER_AREA).astype(np.float32)
+
+
+def signature_change(a: np.ndarray, b: np.ndarray) -> float:
+    """Mean absolute difference of two signatures, in [0, 1]."""
+    return float(np.abs(a - b).mean()) / 255.0
+
+
+class ChangeGatedInfer:
+    """Wrap an `infer(face_bgr) -> (logits, probs)` callable and skip it when the crop barely changed.
+
+    Each call compares the crop's signature (a downsampled grayscale thumbnail) with the
+    signature of the last crop that was actually inferred. If the mean absolute change is
+    below `threshold` (fraction of full scale) the previous (logits, probs) are returned,
+    but at most `max_stale` times in a row; the next call then runs the model regardless.
+    `reset()` (e.g. when the face is lost) forces the next call to infer. threshold <= 0
+    disables skipping.
+    """
+
+    def __init__(
+        self,
+        infer: Callable[[np.ndarray], Tuple[List[float], List[float]]],
+        *,
+        threshold: float = 0.02,
+        max_stale: int = 5,
+        size: int = 16,
+    ) -> None:
+        self.infer = infer
+        self.threshold = float(threshold)
+        self.max_stale = max(0, int(max_stale))
+        self.size = int(size)
+        self.calls = 0
+        self.skipped = 0
+        self.last_change: Optional[float] = None
+        self.last_skipped = False
+        self._sig: Optional[np.ndarray] = None
+        self._out: Optional[Tuple[List[float], List[float]]] = None
+        self._stale = 0
+
+    def reset(self) -> None:
+        self._sig = None
+        self._out = None
+        self._stale = 0
+
+    def __call__(self, face_bgr: np.ndarray) -> Tuple[List[float], List[float]]:
+        self.calls += 1
+        sig = crop_signature(face_bgr, size=self.size) if self.threshold > 0 else None
+        if sig is not None and self._sig is not None and self._out is not None:
+            self.last_change = signature_change(sig, self._sig)
+            if self.last_change < self.threshold and self._stale < self.max_stale:
+                self._stale += 1
+                self.skipped += 1
+                self.last_skipped = True
+                return self._out
+        self._out = self.infer(face_bgr)
+        self._sig = sig
+        self._stale = 0
+        self.last_skipped = False
+        return self._out
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "threshold": self.threshold,
+            "max_stale": self.max_stale,
+            "signature_size": self.size,
+            "calls": int(self.calls),
+            "inferred": int(self.calls - self.skipped),
+            "skipped": int(self.skipped),
+            "skip_fraction": round(self.skipped / self.calls, 4) if self.calls else 0.0,
+        }
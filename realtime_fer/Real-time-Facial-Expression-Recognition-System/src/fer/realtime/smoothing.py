@@ -0,0 +1,176 @@
+from __future__ import annotations
+
+from typing import Optional, Sequence
+
+import numpy as np
+
+
+class TemporalSmoother:
+    """Incremental EMA -> hysteresis -> vote smoothing with fixed-size NumPy state.
+
+    Mirrors the per-frame logic of `demo/realtime_demo.py` (EMA list comprehension,
+    `_apply_hysteresis`, `_vote_smooth` over a deque) but keeps all state in
+    preallocated arrays:
+    - EMA is updated in place.
+    - The vote window is a ring buffer with running per-class counts, so each frame
+      costs O(num_classes) regardless of the window length.
+    - State is batched per track (row), so multi-face sessions update all tracks at once.
+      The vote window length is shared: changing it trims every track's window.
+
+    Outputs are bit-exact with the list/Counter implementation, including the
+    Counter.most_common tie-break (earliest first occurrence in the window wins).
+    """
+
+    def __init__(self, num_classes: int, *, num_tracks: int = 1, vote_window: int = 15) -> None:
+        self.num_classes = int(num_classes)
+        self.num_tracks = int(num_tracks)
+        self.vote_window = max(1, int(vote_window))
+
+        self._ema = np.zeros((self.num_tracks, self.num_classes), dtype=np.float64)
+        self._has_ema = np.zeros((self.num_tracks,), dtype=bool)
+        self._hyster = np.full((self.num_tracks,), -1, dtype=np.int64)
+
+        self._ring = np.zeros((self.num_tracks, self.vote_window), dtype=np.int64)
+        self._head = np.zeros((self.num_tracks,), dtype=np.int64)
+        self._fill = np.zeros((self.num_tracks,), dtype=np.int64)
+        self._counts = np.zeros((self.num_tracks, self.num_classes), dtype=np.int64)
+
+    def reset(self, track: Optional[int] = None) -> None:
+        sel = slice(None) if track is None else int(track)
+        self._ema[sel] = 0.0
+        self._has_ema[sel] = False
+        self._hyster[sel] = -1
+        self._head[sel] = 0
+        self._fill[sel] = 0
+        self._counts[sel] = 0
+
+    def ema_probs(self, track: int = 0) -> Optional[np.ndarray]:
+        """Current EMA probabilities for a track (None before its first update)."""
+        t = int(track)
+        if not bool(self._has_ema[t]):
+            return None
+        return self._ema[t]
+
+    def hysteresis_idx(self, track: int = 0) -> Optional[int]:
+        v = int(self._hyster[int(track)])
+        return None if v < 0 else v
+
+    def _window_labels(self, track: int) -> np.ndarray:
+        """Labels currently in the vote window of a track, oldest first."""
+        cap = self._ring.shape[1]
+        n = int(self._fill[track])
+        start = (int(self._head[track]) - n) % cap
+        idx = (start + np.arange(n)) % cap
+        return self._ring[track, idx]
+
+    def _resize_window(self, window: int) -> None:
+        # Same semantics as `deque(votes, maxlen=window)`: keep the newest `window` labels.
+        window = max(1, int(window))
+        if window == self.vote_window:
+            return
+        ring = np.zeros((self.num_tracks, window), dtype=np.int64)
+        for t in range(self.num_tracks):
+            labels = self._window_labels(t)
+            dropped, kept = labels[: max(0, labels.size - window)], labels[-window:]
+            if dropped.size:
+                np.subtract.at(self._counts[t], dropped, 1)
+            ring[t, : kept.size] = kept
+            self._fill[t] = kept.size
+            self._head[t] = kept.size % window
+        self._ring = ring
+        self.vote_window = window
+
+    def update_batch(
+        self,
+        probs: np.ndarray,
+        tracks: Sequence[int],
+        *,
+        ema_alpha: float,
+        hysteresis_delta: float,
+        vote_window: int,
+        vote_min_count: int,
+    ) -> np.ndarray:
+        """Feed one probability row per track; returns voted labels (-1 = unstable).
+
+        `tracks` must not contain duplicates (one observation per track per frame).
+        """
+        p = np.asarray(probs, dtype=np.float64).reshape(-1, self.num_classes)
+        tr = np.asarray(tracks, dtype=np.int64).reshape(-1)
+        if tr.size != p.shape[0]:
+            raise ValueError(f"Got {p.shape[0]} probability rows for {tr.size} tracks")
+        if np.unique(tr).size != tr.size:
+            raise ValueError("Duplicate track ids in a single update_batch call")
+
+        self._resize_window(int(vote_window))
+
+        # EMA (in place; first observation initializes the track).
+        a = float(ema_alpha)
+        ema = self._ema[tr]
+        fresh = ~self._has_ema[tr]
+        ema *= a
+        ema += (1.0 - a) * p
+        ema[fresh] = p[fresh]
+        self._ema[tr] = ema
+        self._has_ema[tr] = True
+
+        # Hysteresis: switch only if the new top beats the current by delta.
+        rows = np.arange(tr.size)
+        top = np.argmax(ema, axis=1)
+        cur = self._hyster[tr]
+        cur_safe = np.where(cur < 0, top, cur)
+        switch = ema[rows, top] >= ema[rows, cur_safe] + float(hysteresis_delta)
+        hyst = np.where((cur < 0) | switch, top, cur)
+        self._hyster[tr] = hyst
+
+        # Vote ring buffer with running counts.
+        cap = self.vote_window
+        head = self._head[tr]
+        full = self._fill[tr] >= cap
+        if full.any():
+            old = self._ring[tr[full], head[full]]
+            self._counts[tr[full], old] -= 1
+        self._ring[tr, head] = hyst
+        self._counts[tr, hyst] += 1
+        self._head[tr] = (head + 1) % cap
+        self._fill[tr] = np.minimum(self._fill[tr] + 1, cap)
+
+        if cap <= 1:
+            return hyst.copy()
+
+        counts = self._counts[tr]
+        best = np.argmax(counts, axis=1)
+        best_cnt = counts[rows, best]
+        out = np.where(best_cnt >= int(vote_min_count), best, -1)
+
+        # Counter.most_common breaks ties by first occurrence in the window; only
+        # matters when the tied count clears the threshold, which is rare.
+        tied = (out >= 0) & ((counts == best_cnt[:, None]).sum(axis=1) > 1)
+        for i in np.flatnonzero(tied):
+            t = int(tr[i])
+            for lab in self._window_labels(t):
+                if self._counts[t, lab] == best_cnt[i]:
+                    out[i] = lab
+                    break
+        return out
+
+    def update(
+        self,
+        probs: Sequence[float],
+        *,
+        ema_alpha: float,
+        hysteresis_delta: float,
+        vote_window: int,
+        vote_min_count: int,
+        track: int = 0,
+    ) -> Optional[int]:
+        """Single-track convenience wrapper around `update_batch`."""
+        out = self.update_batch(
+            np.asarray(probs, dtype=np.float64).reshape(1, -1),
+            [int(track)],
+            ema_alpha=ema_alpha,
+            hysteresis_delta=hysteresis_delta,
+            vote_window=vote_window,
+            vote_min_count=vote_min_count,
+        )
+        v = int(out[0])
+        return None if v < 0 else v
@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import math
+from pathlib import Path
+from typing import Optional, Tuple
+
+import cv2  # type: ignore
+import numpy as np
+
+
+class SyntheticFaceSource:
+    """cv2.VideoCapture-like generator of frames with one moving face (no camera needed).
+
+    The face is `face_image` (any BGR image file) or, when omitted, a drawn placeholder
+    face. It drifts slowly and its brightness flickers slightly, so consecutive frames are
+    similar but not identical, like a live webcam. `box` is the pasted face's (x, y, w, h).
+    """
+
+    def __init__(
+        self,
+        *,
+        width: int = 640,
+        height: int = 480,
+        frames: int = 0,
+        face_image: Optional[Path] = None,
+        seed: int = 0,
+    ) -> None:
+        self.width = int(width)
+        self.height = int(height)
+        self.frames = int(frames)  # 0 = endless
+        self.index = 0
+        self.box: Tuple[int, int, int, int] = (0, 0, 0, 0)
+        rng = np.random.default_rng(int(seed))
+        noise = rng.integers(60, 110, size=(self.height // 8, self.width // 8, 3), dtype=np.uint8)
+        self._background = cv2.resize(noise, (self.width, self.height), interpolation=cv2.INTER_LINEAR)
+        side = max(32, int(min(self.width, self.height) * 0.45))
+        face = cv2.imread(str(face_image)) if face_image is not None else None
+        if face is None:
+            face = self._placeholder_face(side)
+        self._face = cv2.resize(face, (side, side), interpolation=cv2.INTER_AREA)
+        self._opened = True
+
+    @staticmethod
+    def _placeholder_face(side: int) -> np.ndarray:
+        img = np.full((side, side, 3), 90, dtype=np.uint8)
+        c = side // 2
+        cv2.ellipse(img, (c, c), (int(side * 0.36), int(side * 0.46)), 0, 0, 360, (150, 180, 225), -1)
+        for ex in (int(side * 0.36), int(side * 0.64)):
+            cv2.ellipse(img, (ex, int(side * 0.42)), (int(side * 0.07), int(side * 0.04)), 0, 0, 360, (40, 40, 40), -1)
+        cv2.ellipse(img, (c, int(side * 0.70)), (int(side * 0.14), int(side * 0.05)), 0, 0, 180, (60, 60, 150), 3)
+        return img
+
+    def isOpened(self) -> bool:  # noqa: N802 (cv2.VideoCapture interface)
+        return self._opened
+
+    def read(self) -> Tuple[bool, Optional[np.ndarray]]:
+        if not self._opened or (self.frames and self.index >= self.frames):
+            return False, None
+        i = self.index
+        self.index += 1
+        frame = self._background.copy()
+        fh, fw = self._face.shape[:2]
+        x = int((self.width - fw) / 2 + math.sin(i / 45.0) * self.width * 0.12)
+        y = int((self.height - fh) / 2 + math.cos(i / 60.0) * self.height * 0.06)
+        x = min(max(0, x), self.width - fw)
+        y = min(max(0, y), self.height - fh)
+        gain = 1.0 + 0.03 * math.sin(i / 7.0)
+        frame[y : y + fh, x : x + fw] = cv2.convertScaleAbs(self._face, alpha=gain, beta=0)
+        self.box = (x, y, fw, fh)
+        return True, frame
+
+    def get(self, prop: int) -> float:
+        if prop == cv2.CAP_PROP_FPS:
+            return 30.0
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return float(self.frames)
+        return 0.0
+
+    def release(self) -> None:
+        self._opened = False
+
+
+def open_source(
+    source: str,
+    *,
+    camera_index: int = 0,
+    synthetic_frames: int = 0,
+    synthetic_face: Optional[Path] = None,
+    synthetic_seed: int = 0,
+) -> Tuple[object, str]:
+    """'webcam[:N]' | 'synthetic' | 'synthetic:WxH' | video path -> (capture, input name)."""
+    s = str(source)
+    if s.lower() == "webcam" or s.lower().startswith("webcam:"):
+        if ":" in s:
+            camera_index = int(s.split(":", 1)[1])
+        return cv2.VideoCapture(int(camera_index)), f"webcam:{camera_index}"
+    if s.lower().startswith("synthetic"):
+        w, h = 640, 480
+        if ":" in s:
+            w, h = (int(v) for v in s.split(":", 1)[1].lower().split("x"))
+        cap = SyntheticFaceSource(
+            width=w, height=h, frames=int(synthetic_frames), face_image=synthetic_face, seed=int(synthetic_seed)
+        )
+        return cap, f"synthetic:{w}x{h}"
+    return cv2.VideoCapture(s), s
@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+class StageTimer:
+    """Per-frame stage latencies for the realtime loops (--benchmark).
+
+    `lap(name)` attributes the time since the previous lap (or `start_frame`) to `name`;
+    `end_frame()` also records the whole frame as "frame". Frames before `warmup` are
+    dropped. Disabled timers return immediately from every call.
+    """
+
+    def __init__(self, *, enabled: bool, warmup: int = 0) -> None:
+        self.enabled = bool(enabled)
+        self.warmup = max(0, int(warmup))
+        self.frames = 0
+        self._samples: Dict[str, List[float]] = {}
+        self._t_frame = 0.0
+        self._t_lap = 0.0
+        self._cur: Dict[str, float] = {}
+        self._t_first: Optional[float] = None
+        self._t_last = 0.0
+
+    def start_frame(self) -> None:
+        if not self.enabled:
+            return
+        self._t_frame = self._t_lap = time.perf_counter()
+        self._cur = {}
+
+    def lap(self, name: str) -> None:
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self._cur[name] = self._cur.get(name, 0.0) + (now - self._t_lap)
+        self._t_lap = now
+
+    def end_frame(self) -> None:
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self.frames += 1
+        if self.frames <= self.warmup:
+            return
+        if self._t_first is None:
+            self._t_first = self._t_frame
+        self._t_last = now
+        self._cur["frame"] = now - self._t_frame
+        for name, sec in self._cur.items():
+            self._samples.setdefault(name, []).append(sec)
+
+    def summary(self) -> Dict[str, object]:
+        """FPS over the measured frames and {stage: n/mean/p50/p95/p99 in ms}."""
+        measured = len(self._samples.get("frame", []))
+        wall = (self._t_last - self._t_first) if self._t_first is not None else 0.0
+        stages: Dict[str, Dict[str, float]] = {}
+        for name, vals in self._samples.items():
+            ms = np.asarray(vals, dtype=np.float64) * 1000.0
+            p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+            stages[name] = {
+                "n": int(ms.size),
+                "mean_ms": round(float(ms.mean()), 4),
+                "p50_ms": round(float(p50), 4),
+                "p95_ms": round(float(p95), 4),
+                "p99_ms": round(float(p99), 4),
+            }
+        return {
+            "frames": measured,
+            "warmup_frames": min(self.warmup, self.frames),
+            "wall_sec": round(wall, 4),
+            "fps": round(measured / wall, 3) if wall > 0 else None,
+            "stages": stages,
+        }
@@ -0,0 +1,334 @@
+from __future__ import annotations
+
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+# Checkpoint layout (next to the unchanged full resume checkpoint `<stem>.pt`):
+#   <stem>.meta.json   small JSON: args / epoch / global_step / best + stat of <stem>.pt
+#   <stem>.weights.pt  inference-only model state_dict (tensors only: weights_only + mmap)
+# Sidecars are trusted only while the recorded size/mtime of <stem>.pt still match, so
+# legacy checkpoints (or ones overwritten by older code) fall back to the full load.
+#
+# Every file is written to `<name>.tmp` and os.replace'd into place, so a crash mid-write
+# never leaves a truncated checkpoint behind. AsyncCheckpointWriter moves serialization
+# off the training loop: the loop only pays for a CPU snapshot of the state dicts.
+
+SIDECAR_FORMAT = 1
+
+
+def meta_path_for(ckpt_path: Path) -> Path:
+    return ckpt_path.with_name(ckpt_path.stem + ".meta.json")
+
+
+def weights_path_for(ckpt_path: Path) -> Path:
+    return ckpt_path.with_name(ckpt_path.stem + ".weights.pt")
+
+
+def _stat_key(path: Path) -> Optional[list]:
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return [int(st.st_size), int(st.st_mtime_ns)]
+
+
+def _jsonable(obj: Any) -> Any:
+    return json.loads(json.dumps(obj, default=str))
+
+
+def torch_load_full(path: Path) -> Dict[str, Any]:
+    """Full (legacy) load of a checkpoint dict: model + optimizer + scaler + nl."""
+    import torch
+
+    try:
+        return torch.load(str(path), map_location="cpu", weights_only=False)
+    except TypeError:
+        return torch.load(str(path), map_location="cpu")
+
+
+def _atomic_torch_save(obj: Any, path: Path) -> None:
+    import torch
+
+    tmp = path.with_name(path.name + ".tmp")
+    torch.save(obj, str(tmp))
+    os.replace(tmp, path)
+
+
+def _atomic_place(src: Path, dst: Path) -> None:
+    """Make dst a copy of the finished file src (hard link when possible, no re-serialization)."""
+    tmp = dst.with_name(dst.name + ".tmp")
+    try:
+        tmp.unlink()
+    except OSError:
+        pass
+    try:
+        os.link(src, tmp)
+    except OSError:
+        shutil.copyfile(src, tmp)
+    os.replace(tmp, dst)
+
+
+def _write_meta(ckpt: Dict[str, Any], ckpt_path: Path, *, has_weights: bool) -> None:
+    weights = weights_path_for(ckpt_path)
+    meta: Dict[str, Any] = {
+        "format": SIDECAR_FORMAT,
+        "checkpoint": ckpt_path.name,
+        "checkpoint_stat": _stat_key(ckpt_path),
+        "weights": weights.name if has_weights else None,
+        "weights_stat": _stat_key(weights) if has_weights else None,
+    }
+    for k in ("epoch", "global_step", "best", "args"):
+        if k in ckpt:
+            meta[k] = _jsonable(ckpt[k])
+    meta_path = meta_path_for(ckpt_path)
+    tmp = meta_path.with_name(meta_path.name + ".tmp")
+    tmp.write_text(json.dumps(meta, indent=2), encoding="utf-8")
+    os.replace(tmp, meta_path)
+
+
+def write_sidecars(ckpt: Dict[str, Any], ckpt_path: Path) -> None:
+    """Write <stem>.weights.pt and <stem>.meta.json for an already-saved checkpoint."""
+    model_state = ckpt.get("model")
+    has_weights = isinstance(model_state, dict)
+    if has_weights:
+        _atomic_torch_save(model_state, weights_path_for(ckpt_path))
+    _write_meta(ckpt, ckpt_path, has_weights=has_weights)
+
+
+def save_checkpoint(ckpt: Dict[str, Any], path: Path, *, also: Sequence[Path] = ()) -> None:
+    """torch.save the full resume checkpoint, then its lightweight sidecars.
+
+    `also` lists further paths that get the identical checkpoint (e.g. best.pt in the
+    epoch it is also checkpoint_last.pt); they are linked/copied, not serialized again.
+    """
+    _atomic_torch_save(ckpt, path)
+    sidecars_ok = True
+    try:
+        write_sidecars(ckpt, path)
+    except Exception as e:
+        # Sidecars are an optimization; readers fall back to the full checkpoint.
+        sidecars_ok = False
+        print(f"WARN: checkpoint sidecar write failed for {path}: {e}")
+
+    for other in also:
+        other = Path(other)
+        if other == path:
+            continue
+        _atomic_place(path, other)
+        if not sidecars_ok:
+            continue
+        try:
+            has_weights = isinstance(ckpt.get("model"), dict)
+            if has_weights:
+                _atomic_place(weights_path_for(path), weights_path_for(other))
+            _write_meta(ckpt, other, has_weights=has_weights)
+        except Exception as e:
+            print(f"WARN: checkpoint sidecar write failed for {other}: {e}")
+
+
+def snapshot_to_cpu(obj: Any) -> Any:
+    """Deep copy of a (nested) checkpoint payload with every tensor detached onto the CPU.
+
+    The copy no longer aliases live parameters/optimizer state, so training can keep
+    mutating them while a background thread serializes the snapshot.
+    """
+    import torch
+
+    cuda_copies = False
+
+    def _copy(x: Any) -> Any:
+        nonlocal cuda_copies
+        if isinstance(x, torch.Tensor):
+            if x.device.type == "cuda":
+                cuda_copies = True
+                return x.detach().to("cpu", non_blocking=True)
+            if x.device.type == "cpu":
+                return x.detach().clone()
+            return x.detach().cpu()
+        if isinstance(x, dict):
+            # Keeps OrderedDict (state_dict) types intact.
+            return type(x)((k, _copy(v)) for k, v in x.items())
+        if isinstance(x, list):
+            return [_copy(v) for v in x]
+        if isinstance(x, tuple):
+            return tuple(_copy(v) for v in x)
+        return x
+
+    out = _copy(obj)
+    if cuda_copies:
+        # non_blocking device->host copies are only valid after a sync.
+        torch.cuda.synchronize()
+    return out
+
+
+class AsyncCheckpointWriter:
+    """Runs checkpoint writes (and other artifact jobs such as ONNX export) on one background thread.
+
+    `save()` snapshots the payload to CPU memory on the caller's thread and returns; the
+    worker serializes it. At most `max_pending` jobs are in flight: a further call blocks
+    until one finishes, which bounds the extra host memory to `max_pending` snapshots.
+    With `enabled=False` jobs run inline (same atomic writes, no thread) and a failing
+    job raises immediately. Background failures are collected in `errors`; `check()`
+    (also called by `close()`) raises if any job has failed.
+
+    `take_stats()` reports, since the previous call, the seconds the training loop was
+    blocked by checkpointing and the seconds the worker spent writing (the wall time
+    saved per epoch is roughly background_sec - blocked_sec).
+    """
+
+    def __init__(self, *, enabled: bool = True, max_pending: int = 1) -> None:
+        self.enabled = bool(enabled)
+        self._slots = threading.BoundedSemaphore(max(1, int(max_pending)))
+        self._jobs: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._blocked_sec = 0.0
+        self._background_sec = 0.0
+        self._done = 0
+        self.errors: List[str] = []
+        self._thread: Optional[threading.Thread] = None
+        if self.enabled:
+            self._thread = threading.Thread(target=self._run, name="checkpoint-writer", daemon=True)
+            self._thread.start()
+
+    def save(self, ckpt: Dict[str, Any], path: Path, *, also: Sequence[Path] = ()) -> Dict[str, Any]:
+        """Snapshot `ckpt` now and write it to `path` (+ `also`) in the background.
+
+        Returns the payload being written (the CPU snapshot when async), so follow-up jobs
+        such as ONNX export can reuse its tensors instead of copying the model again.
+        """
+        t0 = time.perf_counter()
+        if not self.enabled:
+            self._call(f"save {path.name}", save_checkpoint, (ckpt, path), {"also": tuple(also)})
+            self._add_blocked(time.perf_counter() - t0)
+            return ckpt
+        self._slots.acquire()
+        snap = snapshot_to_cpu(ckpt)
+        self._jobs.put((f"save {path.name}", save_checkpoint, (snap, path), {"also": tuple(also)}))
+        self._add_blocked(time.perf_counter() - t0)
+        return snap
+
+    def submit(self, name: str, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> None:
+        """Queue an arbitrary job; `fn` must only touch data it owns (e.g. a CPU snapshot)."""
+        t0 = time.perf_counter()
+        if not self.enabled:
+            self._call(name, fn, args, kwargs)
+        else:
+            self._slots.acquire()
+            self._jobs.put((name, fn, args, kwargs))
+        self._add_blocked(time.perf_counter() - t0)
+
+    def wait(self) -> None:
+        """Block until every queued job has finished."""
+        if self._thread is None:
+            return
+        t0 = time.perf_counter()
+        self._jobs.join()
+        self._add_blocked(time.perf_counter() - t0)
+
+    def close(self) -> None:
+        self.wait()
+        if self._thread is not None:
+            self._jobs.put(None)
+            self._thread.join()
+            self._thread = None
+        self.check()
+
+    def check(self) -> None:
+        """Raise RuntimeError if any job has failed so far."""
+        if self.errors:
+            raise RuntimeError(f"{len(self.errors)} checkpoint job(s) failed: " + "; ".join(self.errors))
+
+    def take_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out = {
+                "mode": "async" if self.enabled else "sync",
+                "blocked_sec": round(self._blocked_sec, 4),
+                "background_sec": round(self._background_sec, 4) if self.enabled else 0.0,
+                "jobs_done": int(self._done),
+            }
+            self._blocked_sec = 0.0
+            self._background_sec = 0.0
+            self._done = 0
+        return out
+
+    def _add_blocked(self, sec: float) -> None:
+        with self._lock:
+            self._blocked_sec += float(sec)
+
+    def _call(self, name: str, fn: Callable[..., Any], args: tuple, kwargs: Dict[str, Any]) -> None:
+        try:
+            fn(*args, **kwargs)
+        except Exception as e:
+            if not self.enabled:
+                raise
+            msg = f"{name}: {type(e).__name__}: {e}"
+            self.errors.append(msg)
+            print(f"WARN: background job failed: {msg}")
+        with self._lock:
+            self._done += 1
+
+    def _run(self) -> None:
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                self._jobs.task_done()
+                return
+            t0 = time.perf_counter()
+            try:
+                self._call(*job)
+            finally:
+                with self._lock:
+                    self._background_sec += time.perf_counter() - t0
+                self._slots.release()
+                self._jobs.task_done()
+
+
+def read_checkpoint_meta(ckpt_path: Path) -> Optional[Dict[str, Any]]:
+    """Sidecar metadata if present and still matching the checkpoint file, else None."""
+    meta_path = meta_path_for(ckpt_path)
+    try:
+        meta = json.loads(meta_path.read_text(encoding="utf-8"))
+    except Exception:
+        return None
+    if not isinstance(meta, dict) or int(meta.get("format") or 0) != SIDECAR_FORMAT:
+        return None
+    if meta.get("checkpoint_stat") != _stat_key(ckpt_path):
+        return None
+    return meta
+
+
+def load_checkpoint_args(ckpt_path: Path) -> Dict[str, Any]:
+    """Training args of a checkpoint; reads only the sidecar JSON when available."""
+    meta = read_checkpoint_meta(ckpt_path)
+    if meta is not None and isinstance(meta.get("args"), dict):
+        return dict(meta["args"])
+    ckpt = torch_load_full(ckpt_path)
+    args = ckpt.get("args") if isinstance(ckpt, dict) else None
+    return dict(args) if isinstance(args, dict) else {}
+
+
+def load_model_state(ckpt_path: Path, *, mmap: bool = True) -> Dict[str, Any]:
+    """Model state_dict of a checkpoint without deserializing optimizer/scaler/NL state.
+
+    Uses <stem>.weights.pt (weights_only, memory-mapped) when its sidecar is valid;
+    otherwise falls back to the full checkpoint load.
+    """
+    import torch
+
+    meta = read_checkpoint_meta(ckpt_path)
+    weights = weights_path_for(ckpt_path)
+    if meta is not None and meta.get("weights") and meta.get("weights_stat") == _stat_key(weights):
+        try:
+            return torch.load(str(weights), map_location="cpu", weights_only=True, mmap=bool(mmap))
+        except TypeError:
+            # Older torch without weights_only/mmap.
+            return torch.load(str(weights), map_location="cpu")
+    ckpt = torch_load_full(ckpt_path)
+    state = ckpt.get("model") if isinstance(ckpt, dict) else None
+    return state if isinstance(state, dict) else {}
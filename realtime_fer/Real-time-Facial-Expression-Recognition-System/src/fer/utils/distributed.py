@@ -0,0 +1,189 @@
+from __future__ import annotations
+
+import atexit
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, List, Sequence, Tuple
+
+import torch
+import torch.distributed as dist
+
+from src.fer.utils.device import DeviceInfo
+
+# Multi-process (DDP) helpers for the trainers. Launch with torchrun, e.g.
+#   torchrun --standalone --nproc_per_node 4 scripts/train_teacher.py ...
+# torchrun sets WORLD_SIZE / RANK / LOCAL_RANK; without them everything here is a no-op
+# and the trainers behave exactly like the single-process scripts.
+
+
+@dataclass(frozen=True)
+class DistInfo:
+    world_size: int = 1
+    rank: int = 0
+    local_rank: int = 0
+    backend: str = ""
+
+    @property
+    def enabled(self) -> bool:
+        return self.world_size > 1
+
+    @property
+    def is_main(self) -> bool:
+        return self.rank == 0
+
+
+def init_distributed(backend: str = "auto") -> DistInfo:
+    """Join the torchrun process group (nccl on CUDA, gloo otherwise)."""
+    world_size = int(os.environ.get("WORLD_SIZE", "1") or 1)
+    if world_size <= 1:
+        return DistInfo()
+    rank = int(os.environ.get("RANK", "0") or 0)
+    local_rank = int(os.environ.get("LOCAL_RANK", "0") or 0)
+
+    backend = (backend or "auto").lower()
+    if backend == "auto":
+        backend = "nccl" if torch.cuda.is_available() else "gloo"
+    if backend == "nccl":
+        torch.cuda.set_device(local_rank)
+    if not dist.is_initialized():
+        dist.init_process_group(backend=backend)
+        atexit.register(shutdown_distributed)
+    return DistInfo(world_size=world_size, rank=rank, local_rank=local_rank, backend=backend)
+
+
+def shutdown_distributed() -> None:
+    if dist.is_available() and dist.is_initialized():
+        try:
+            dist.destroy_process_group()
+        except Exception:
+            pass
+
+
+def device_for_rank(info: DistInfo, device_info: DeviceInfo) -> DeviceInfo:
+    """One device per process: cuda:<local_rank> under nccl, CPU under gloo (DirectML has no DDP)."""
+    if not info.enabled:
+        return device_info
+    if info.backend == "nccl":
+        dev = torch.device("cuda", info.local_rank)
+        return DeviceInfo(backend="cuda", device=dev, detail=torch.cuda.get_device_name(dev))
+    return DeviceInfo(backend="cpu", device=torch.device("cpu"), detail=f"cpu (gloo rank {info.rank})")
+
+
+def barrier(info: DistInfo) -> None:
+    if info.enabled:
+        dist.barrier()
+
+
+def broadcast_object(obj: Any, info: DistInfo) -> Any:
+    """Rank 0's value of a picklable object on every rank."""
+    if not info.enabled:
+        return obj
+    box = [obj]
+    dist.broadcast_object_list(box, src=0)
+    return box[0]
+
+
+def shard_range(n: int, info: DistInfo) -> range:
+    """Contiguous, unpadded slice of range(n) owned by this rank (for evaluation)."""
+    lo = (int(n) * info.rank) // info.world_size
+    hi = (int(n) * (info.rank + 1)) // info.world_size
+    return range(lo, hi)
+
+
+def all_reduce_mean(value: float, info: DistInfo) -> float:
+    if not info.enabled:
+        return float(value)
+    t = torch.tensor([float(value)], dtype=torch.float64)
+    if info.backend == "nccl":
+        t = t.cuda()
+    dist.all_reduce(t, op=dist.ReduceOp.SUM)
+    return float(t.item()) / float(info.world_size)
+
+
+def all_gather_rows(tensors: Sequence[torch.Tensor], info: DistInfo) -> Tuple[torch.Tensor, ...]:
+    """Concatenate per-rank CPU tensors along dim 0 in rank order (row counts may differ).
+
+    Used to rebuild the full validation logits/labels from sharded evaluation, so
+    metrics, confusion matrices and temperature fits match a single-process run.
+    """
+    if not info.enabled:
+        return tuple(tensors)
+    dev = torch.device("cuda", info.local_rank) if info.backend == "nccl" else torch.device("cpu")
+    n_local = torch.tensor([int(tensors[0].shape[0])], dtype=torch.int64, device=dev)
+    counts = [torch.zeros_like(n_local) for _ in range(info.world_size)]
+    dist.all_gather(counts, n_local)
+    sizes = [int(c.item()) for c in counts]
+    n_max = max(sizes)
+
+    out: List[torch.Tensor] = []
+    for t in tensors:
+        padded = torch.zeros((n_max,) + tuple(t.shape[1:]), dtype=t.dtype, device=dev)
+        padded[: t.shape[0]] = t.to(dev)
+        parts = [torch.empty_like(padded) for _ in range(info.world_size)]
+        dist.all_gather(parts, padded)
+        out.append(torch.cat([p[:s] for p, s in zip(parts, sizes)], dim=0).cpu())
+    return tuple(out)
+
+
+def all_reduce_gradients(params: Sequence[torch.nn.Parameter], info: DistInfo) -> None:
+    """Average .grad across ranks with one flattened all-reduce per dtype.
+
+    For training loops that cannot route every forward through DistributedDataParallel
+    (auxiliary modules, forward_features/forward_head calls).
+    """
+    if not info.enabled:
+        return
+    by_dtype: Dict[torch.dtype, List[torch.Tensor]] = {}
+    for p in params:
+        if not p.requires_grad:
+            continue
+        if p.grad is None:
+            # Keep the flattened layout identical on every rank.
+            p.grad = torch.zeros_like(p)
+        by_dtype.setdefault(p.grad.dtype, []).append(p.grad)
+    for grads in by_dtype.values():
+        flat = torch.cat([g.reshape(-1) for g in grads])
+        dist.all_reduce(flat, op=dist.ReduceOp.SUM)
+        flat.div_(float(info.world_size))
+        offset = 0
+        for g in grads:
+            n = g.numel()
+            g.copy_(flat[offset : offset + n].view_as(g))
+            offset += n
+
+
+def all_reduce_tensor_(t: torch.Tensor, info: DistInfo, *, average: bool = True) -> torch.Tensor:
+    """In-place SUM (or mean) of a tensor across ranks."""
+    if info.enabled:
+        dist.all_reduce(t, op=dist.ReduceOp.SUM)
+        if average:
+            t.div_(float(info.world_size))
+    return t
+
+
+def broadcast_parameters(params: Sequence[torch.Tensor], info: DistInfo) -> None:
+    """Copy rank 0's parameters to every rank (what DDP does at construction)."""
+    if not info.enabled:
+        return
+    with torch.no_grad():
+        for p in params:
+            dist.broadcast(p.data, src=0)
+
+
+def broadcast_buffers(module: torch.nn.Module, info: DistInfo) -> None:
+    """Copy rank 0's buffers (e.g. BatchNorm running stats) to every rank before evaluation."""
+    if not info.enabled:
+        return
+    for b in module.buffers():
+        dist.broadcast(b, src=0)
+
+
+def rescale_global_step(global_step: int, *, ckpt_steps_per_epoch: int, steps_per_epoch: int) -> int:
+    """Map a checkpoint's global_step onto the current steps_per_epoch.
+
+    Steps per epoch shrink with the number of processes (each rank sees 1/world_size of
+    the batches), so resuming with a different world size must rescale the LR position.
+    """
+    if ckpt_steps_per_epoch <= 0 or steps_per_epoch <= 0 or ckpt_steps_per_epoch == steps_per_epoch:
+        return int(global_step)
+    return int(round(float(global_step) * float(steps_per_epoch) / float(ckpt_steps_per_epoch)))
@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+from typing import Dict, Optional
+
+# Validation cadence for the trainers (--eval-schedule / --proxy-eval-frac).
+#
+# fixed:    full eval exactly where the trainer's --eval-every rule says.
+# adaptive: full eval every `interval` epochs, starting at --eval-every; the interval
+#           doubles (up to --eval-max-every) whenever a full eval improves the best
+#           macro-F1 by less than --eval-flat-delta, and resets on a real improvement.
+#           The first and last epochs are always fully evaluated.
+# Epochs without a full eval run a proxy eval on a fixed stratified val subset when
+# enabled; a proxy macro-F1 that beats the best proxy so far by --proxy-promote-delta
+# promotes that epoch to a full eval (so best.pt is not missed between full evals).
+
+
+class EvalScheduler:
+    def __init__(
+        self,
+        *,
+        adaptive: bool,
+        min_every: int,
+        max_every: int,
+        flat_delta: float,
+        proxy: bool,
+        promote_delta: float,
+        last_epoch: int,
+    ) -> None:
+        self.adaptive = bool(adaptive)
+        self.min_every = max(1, int(min_every))
+        self.max_every = max(self.min_every, int(max_every))
+        self.flat_delta = float(flat_delta)
+        self.proxy = bool(proxy)
+        self.promote_delta = float(promote_delta)
+        self.last_epoch = int(last_epoch)
+
+        self.interval = self.min_every
+        self._next_full: Optional[int] = None
+        self._best_full: Optional[float] = None
+        self._best_proxy: Optional[float] = None
+        self._sec: Dict[str, float] = {"full": 0.0, "proxy": 0.0}
+        self._count: Dict[str, int] = {"full": 0, "proxy": 0}
+
+    def plan(self, epoch: int, *, fixed_full: bool) -> str:
+        """'full', 'proxy' or 'skip' for this epoch (`fixed_full` = the trainer's fixed rule)."""
+        if not self.adaptive:
+            full = bool(fixed_full)
+        else:
+            full = self._next_full is None or epoch >= self._next_full or epoch >= self.last_epoch
+        if full:
+            return "full"
+        return "proxy" if self.proxy else "skip"
+
+    def should_promote(self, proxy_macro_f1: float) -> bool:
+        return self._best_proxy is not None and float(proxy_macro_f1) >= self._best_proxy + self.promote_delta
+
+    def record(self, epoch: int, kind: str, macro_f1: float, sec: float) -> None:
+        self._sec[kind] = self._sec.get(kind, 0.0) + float(sec)
+        self._count[kind] = self._count.get(kind, 0) + 1
+        if kind == "proxy":
+            self._best_proxy = float(macro_f1) if self._best_proxy is None else max(self._best_proxy, float(macro_f1))
+            return
+        if self._best_full is None or float(macro_f1) - self._best_full >= self.flat_delta:
+            self.interval = self.min_every
+        else:
+            self.interval = min(self.max_every, self.interval * 2)
+        self._best_full = float(macro_f1) if self._best_full is None else max(self._best_full, float(macro_f1))
+        self._next_full = int(epoch) + self.interval
+
+    def summary(self, wall_sec: float) -> Dict[str, float]:
+        """Cumulative validation time and its share of the run's wall time so far."""
+        eval_sec = sum(self._sec.values())
+        return {
+            "interval": int(self.interval),
+            "full_evals": int(self._count.get("full", 0)),
+            "proxy_evals": int(self._count.get("proxy", 0)),
+            "full_sec": round(self._sec.get("full", 0.0), 3),
+            "proxy_sec": round(self._sec.get("proxy", 0.0), 3),
+            "wall_frac": round(eval_sec / wall_sec, 4) if wall_sec > 0 else 0.0,
+        }
@@ -0,0 +1,412 @@
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+
+REGISTRY_NAME = "run_registry.jsonl"
+
+# Files whose (size, mtime_ns) make up a run's fingerprint; a run directory is any
+# directory that directly contains at least one of them.
+ARTIFACT_FILES = (
+    "checkpoint_last.pt",
+    "best.pt",
+    "history.json",
+    "reliabilitymetrics.json",
+    "calibration.json",
+    "ensemble_metrics.json",
+    "best.onnx",
+    "last.onnx",
+)
+METRIC_FILES = ("reliabilitymetrics.json", "ensemble_metrics.json")
+
+
+@dataclass
+class RunEntry:
+    """Folded view of every registry record for one run directory."""
+
+    key: str
+    run_dir: Path
+    kind: Optional[str] = None
+    args: Optional[Dict[str, Any]] = None
+    args_hash: Optional[str] = None
+    best: Optional[Dict[str, Any]] = None
+    metrics: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    artifacts: Dict[str, List[int]] = field(default_factory=dict)
+    history_head: Optional[Dict[str, Any]] = None
+    args_checked: bool = False  # a checkpoint was already searched for args
+    missing: bool = False  # run directory (or all of its artifacts) deleted since indexing
+    updated: float = 0.0
+
+    @property
+    def name(self) -> str:
+        return self.run_dir.name
+
+    def metric(self, file_name: str, *keys: str) -> Optional[float]:
+        """Scalar lookup, e.g. entry.metric("reliabilitymetrics.json", "raw", "macro_f1").
+
+        None when the metrics file is not among the run's current artifacts.
+        """
+        if file_name not in self.artifacts:
+            return None
+        cur: Any = self.metrics.get(file_name)
+        for k in keys:
+            if not isinstance(cur, dict):
+                return None
+            cur = cur.get(k)
+        if isinstance(cur, bool) or not isinstance(cur, (int, float)):
+            return None
+        return float(cur)
+
+
+def default_registry_path(repo_root: Path) -> Path:
+    return repo_root / "outputs" / REGISTRY_NAME
+
+
+def args_to_jsonable(args: Any) -> Dict[str, Any]:
+    """vars(Namespace) -> plain JSON types (Paths and other objects become str)."""
+    d = vars(args) if isinstance(args, argparse.Namespace) else dict(args)
+    return json.loads(json.dumps(d, default=str))
+
+
+def args_hash(args_dict: Dict[str, Any]) -> str:
+    blob = json.dumps(args_dict, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.blake2b(blob.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def _run_key(run_dir: Path, repo_root: Path) -> str:
+    p = run_dir.resolve()
+    try:
+        return p.relative_to(repo_root.resolve()).as_posix()
+    except ValueError:
+        return p.as_posix()
+
+
+def _key_to_path(key: str, repo_root: Path) -> Path:
+    p = Path(key)
+    return p if p.is_absolute() else (repo_root.resolve() / p)
+
+
+def _artifact_stats(run_dir: Path) -> Dict[str, List[int]]:
+    out: Dict[str, List[int]] = {}
+    for name in ARTIFACT_FILES:
+        try:
+            st = (run_dir / name).stat()
+        except OSError:
+            continue
+        out[name] = [int(st.st_size), int(st.st_mtime_ns)]
+    return out
+
+
+def _scalars(obj: Any, depth: int = 3) -> Any:
+    """Keep scalar leaves of a metrics JSON (drop per-class lists, confusion matrices)."""
+    if isinstance(obj, dict):
+        if depth <= 0:
+            return None
+        out = {}
+        for k, v in obj.items():
+            s = _scalars(v, depth - 1)
+            if s is not None:
+                out[str(k)] = s
+        return out or None
+    if isinstance(obj, (int, float, str, bool)):
+        return obj
+    return None
+
+
+def _read_metrics(run_dir: Path, artifacts: Dict[str, List[int]]) -> Dict[str, Dict[str, Any]]:
+    out: Dict[str, Dict[str, Any]] = {}
+    for name in METRIC_FILES:
+        if name not in artifacts:
+            continue
+        try:
+            data = json.loads((run_dir / name).read_text(encoding="utf-8"))
+        except Exception:
+            continue
+        if isinstance(data, dict):
+            s = _scalars(data)
+            out[name] = s if isinstance(s, dict) else {}
+    return out
+
+
+def _read_history_head(run_dir: Path) -> Optional[Dict[str, Any]]:
+    # First epoch record's nl/negl blocks (signature fallback for runs without checkpoint args).
+    try:
+        hist = json.loads((run_dir / "history.json").read_text(encoding="utf-8"))
+    except Exception:
+        return None
+    if not (isinstance(hist, list) and hist and isinstance(hist[0], dict)):
+        return None
+    return {k: hist[0][k] for k in ("nl", "negl") if isinstance(hist[0].get(k), dict)}
+
+
+def _load_checkpoint_args(path: Path) -> Optional[Dict[str, Any]]:
+    # Sidecar JSON when present (see checkpoint_io), otherwise a full unpickle.
+    from src.fer.utils.checkpoint_io import load_checkpoint_args
+
+    try:
+        args = load_checkpoint_args(path)
+    except Exception:
+        return None
+    return args_to_jsonable(args) if args else None
+
+
+def _append(path: Path, records: Sequence[Dict[str, Any]]) -> None:
+    if not records:
+        return
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # One write() per call keeps concurrent appenders line-atomic in practice.
+    blob = "".join(json.dumps(r, separators=(",", ":"), default=str) + "\n" for r in records)
+    with path.open("a", encoding="utf-8") as fp:
+        fp.write(blob)
+
+
+def _fold(entries: Dict[str, RunEntry], rec: Dict[str, Any], repo_root: Path) -> None:
+    key = rec.get("run_dir")
+    if not isinstance(key, str) or not key:
+        return
+    e = entries.get(key)
+    if e is None:
+        e = entries[key] = RunEntry(key=key, run_dir=_key_to_path(key, repo_root))
+    if rec.get("kind"):
+        e.kind = str(rec["kind"])
+    if isinstance(rec.get("args"), dict):
+        e.args = rec["args"]
+        e.args_hash = rec.get("args_hash") or args_hash(rec["args"])
+        e.args_checked = True
+    if rec.get("args_checked"):
+        e.args_checked = True
+    if isinstance(rec.get("best"), dict):
+        e.best = rec["best"]
+    if isinstance(rec.get("artifacts"), dict):
+        e.artifacts = rec["artifacts"]
+        # Records with artifacts carry the metrics of exactly those files; anything else
+        # cached (e.g. a deleted reliabilitymetrics.json) is stale.
+        e.metrics = dict(rec["metrics"]) if isinstance(rec.get("metrics"), dict) else {}
+    elif isinstance(rec.get("metrics"), dict):
+        e.metrics.update(rec["metrics"])
+        # Tombstones carry missing=True; any later record with artifacts revives the run.
+        e.missing = bool(rec.get("missing"))
+    if isinstance(rec.get("history_head"), dict):
+        e.history_head = rec["history_head"]
+    try:
+        e.updated = float(rec.get("time") or e.updated)
+    except (TypeError, ValueError):
+        pass
+
+
+def _read_lines(path: Path) -> Iterable[Dict[str, Any]]:
+    if not path.exists():
+        return
+    with path.open("r", encoding="utf-8") as fp:
+        for line in fp:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                rec = json.loads(line)
+            except json.JSONDecodeError:
+                # Torn last line from a killed writer.
+                continue
+            if isinstance(rec, dict):
+                yield rec
+
+
+def load_registry(path: Path, *, repo_root: Path) -> Dict[str, RunEntry]:
+    entries: Dict[str, RunEntry] = {}
+    for rec in _read_lines(path):
+        _fold(entries, rec, repo_root)
+    return entries
+
+
+def record_run(
+    run_dir: Path,
+    *,
+    kind: str,
+    event: str,
+    repo_root: Path,
+    args: Any = None,
+    best: Optional[Dict[str, Any]] = None,
+    registry: Optional[Path] = None,
+) -> None:
+    """Append one record for a run (called by trainers). Best-effort: never raises."""
+    try:
+        artifacts = _artifact_stats(run_dir)
+        rec: Dict[str, Any] = {
+            "run_dir": _run_key(run_dir, repo_root),
+            "time": time.time(),
+            "event": str(event),
+            "kind": str(kind),
+            "artifacts": artifacts,
+            "metrics": _read_metrics(run_dir, artifacts),
+        }
+        if args is not None:
+            a = args_to_jsonable(args)
+            rec["args"] = a
+            rec["args_hash"] = args_hash(a)
+        if best is not None:
+            rec["best"] = dict(best)
+        _append(registry or default_registry_path(repo_root), [rec])
+    except Exception as e:
+        print(f"WARN: run registry update failed: {e}")
+
+
+def _iter_run_dirs(root: Path) -> Iterable[Path]:
+    stack = [str(root)]
+    names = set(ARTIFACT_FILES)
+    while stack:
+        d = stack.pop()
+        try:
+            it = os.scandir(d)
+        except OSError:
+            continue
+        is_run = False
+        with it:
+            for e in it:
+                try:
+                    if e.is_dir(follow_symlinks=False):
+                        stack.append(e.path)
+                    elif e.name in names:
+                        is_run = True
+                except OSError:
+                    continue
+        if is_run:
+            yield Path(d)
+
+
+def refresh_registry(
+    path: Path,
+    roots: Sequence[Path],
+    *,
+    repo_root: Path,
+    load_checkpoint_args: bool = True,
+    persist: bool = False,
+) -> Dict[str, RunEntry]:
+    """Load the registry and index any run under `roots` whose artifacts changed.
+
+    Unchanged runs (same artifact sizes/mtimes as the last record) cost one stat per
+    artifact. Changed or unknown runs get their metrics JSON re-read; checkpoints are
+    unpickled at most once, and only for runs with no args in the registry (legacy
+    runs) when `load_checkpoint_args` is set. Known runs under `roots` that are no
+    longer found (directory or every artifact deleted) get a tombstone record.
+
+    The new records are folded into the returned entries; they are appended to the log
+    only with `persist=True` (index_runs.py, or a query tool's explicit opt-in), so
+    read-only queries never write to outputs/.
+    """
+    entries = load_registry(path, repo_root=repo_root)
+    new: List[Dict[str, Any]] = []
+    seen: set = set()
+    for root in roots:
+        if not root.exists():
+            continue
+        for run_dir in _iter_run_dirs(root):
+            key = _run_key(run_dir, repo_root)
+            seen.add(key)
+            artifacts = _artifact_stats(run_dir)
+            e = entries.get(key)
+            want_args = (
+                load_checkpoint_args
+                and "checkpoint_last.pt" in artifacts
+                and (e is None or (e.args is None and not e.args_checked))
+            )
+            if e is not None and e.artifacts == artifacts and not want_args:
+                continue
+            rec: Dict[str, Any] = {
+                "run_dir": key,
+                "time": time.time(),
+                "event": "scan",
+                "artifacts": artifacts,
+                "metrics": _read_metrics(run_dir, artifacts),
+            }
+            if e is None or e.args is None:
+                a = None
+                if want_args:
+                    a = _load_checkpoint_args(run_dir / "checkpoint_last.pt")
+                    rec["args_checked"] = True
+                if a is not None:
+                    rec["args"] = a
+                    rec["args_hash"] = args_hash(a)
+                elif "history.json" in artifacts:
+                    head = _read_history_head(run_dir)
+                    if head is not None:
+                        rec["history_head"] = head
+            new.append(rec)
+            _fold(entries, rec, repo_root)
+    scanned = [r.resolve() for r in roots if r.exists()]
+    for e in list(entries.values()):
+        if e.missing or e.key in seen or not any(_is_under(e.run_dir, r) for r in scanned):
+            continue
+        rec = {"run_dir": e.key, "time": time.time(), "event": "missing", "missing": True, "artifacts": {}}
+        new.append(rec)
+        _fold(entries, rec, repo_root)
+    if persist:
+        _append(path, new)
+    return entries
+
+
+def _is_under(path: Path, root: Path) -> bool:
+    try:
+        path.relative_to(root)
+    except ValueError:
+        return False
+    return True
+
+
+def entries_under(entries: Dict[str, RunEntry], *roots: Path) -> List[RunEntry]:
+    """Live entries whose run directory is inside any of `roots`, sorted by path.
+
+    Tombstoned runs and runs whose directory no longer exists are skipped.
+    """
+    rs = [r.resolve() for r in roots]
+    out: List[RunEntry] = []
+    for e in entries.values():
+        if e.missing or not any(_is_under(e.run_dir, r) for r in rs):
+            continue
+        if not e.run_dir.is_dir():
+            continue
+        out.append(e)
+    return sorted(out, key=lambda e: e.run_dir.as_posix())
+
+
+def compact_registry(path: Path, *, repo_root: Path) -> int:
+    """Rewrite the log as one record per live run (tombstones are dropped).
+
+    Do not run while trainers are writing.
+    """
+    entries = load_registry(path, repo_root=repo_root)
+    records = []
+    for key in sorted(entries):
+        e = entries[key]
+        if e.missing:
+            continue
+        rec: Dict[str, Any] = {
+            "run_dir": key,
+            "time": e.updated,
+            "event": "compact",
+            "kind": e.kind,
+            "artifacts": e.artifacts,
+            "metrics": e.metrics,
+        }
+        if e.args is not None:
+            rec["args"] = e.args
+            rec["args_hash"] = e.args_hash
+        if e.best is not None:
+            rec["best"] = e.best
+        if e.history_head is not None:
+            rec["history_head"] = e.history_head
+        if e.args_checked:
+            rec["args_checked"] = True
+        records.append(rec)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(
+        "".join(json.dumps(r, separators=(",", ":"), default=str) + "\n" for r in records), encoding="utf-8"
+    )
+    os.replace(tmp, path)
+    return len(records)
@@ -0,0 +1,167 @@
+from __future__ import annotations
+
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import torch
+
+# Per-phase step timing for the trainers (--profile).
+#
+# Phases are laps: `switch("forward")` closes the open phase and starts the next one,
+# `step()` closes the last phase of a training step. Wall time uses perf_counter; on
+# CUDA each lap boundary also records an event, so device time per phase is resolved
+# one step later without forcing extra synchronization. Disabled profilers return
+# immediately from every call (and `wrap` returns the loader itself).
+#
+# Optionally a torch.profiler window (steps [trace_wait, trace_wait + trace_steps) of the
+# first profiled epoch) is exported as a Chrome trace, with each phase as a labelled range.
+
+
+class StepProfiler:
+    def __init__(
+        self,
+        *,
+        enabled: bool,
+        device: torch.device,
+        trace_path: Optional[Path] = None,
+        trace_wait: int = 5,
+        trace_steps: int = 5,
+    ) -> None:
+        self.enabled = bool(enabled)
+        self.cuda = self.enabled and getattr(device, "type", "") == "cuda"
+        self._trace_path = trace_path if (self.enabled and trace_path is not None and int(trace_steps) > 0) else None
+        self._trace_wait = max(0, int(trace_wait))
+        self._trace_steps = int(trace_steps)
+        self._prof: Optional[Any] = None
+        self._record: Optional[Any] = None
+
+        self._phase: Optional[str] = None
+        self._t_phase = 0.0
+        self._evt_phase: Optional[Any] = None
+        self._pending: List[Tuple[str, Any, Any]] = []
+        self._reset()
+
+    def _reset(self) -> None:
+        self.steps = 0
+        self._wall: Dict[str, float] = {}
+        self._device: Dict[str, float] = {}
+        self._t_epoch = time.perf_counter()
+
+    # -- epoch lifecycle -------------------------------------------------------
+
+    def start_epoch(self) -> None:
+        if not self.enabled:
+            return
+        self._reset()
+        if self._trace_path is not None and self._prof is None:
+            activities = [torch.profiler.ProfilerActivity.CPU]
+            if self.cuda:
+                activities.append(torch.profiler.ProfilerActivity.CUDA)
+            path = self._trace_path
+
+            def _export(prof: Any) -> None:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                prof.export_chrome_trace(str(path))
+
+            self._prof = torch.profiler.profile(
+                activities=activities,
+                schedule=torch.profiler.schedule(wait=self._trace_wait, warmup=1, active=self._trace_steps, repeat=1),
+                on_trace_ready=_export,
+                record_shapes=False,
+            )
+            self._prof.__enter__()
+
+    def end_epoch(self) -> Optional[Dict[str, Any]]:
+        """Close the profiler window (first epoch only) and return this epoch's breakdown."""
+        if not self.enabled:
+            return None
+        self._close_phase()
+        if self._prof is not None:
+            self._prof.__exit__(None, None, None)
+            self._prof = None
+            self._trace_path = None  # one trace per run
+        if self.cuda:
+            torch.cuda.synchronize()
+        self._resolve(block=True)
+
+        epoch_wall = max(1e-9, time.perf_counter() - self._t_epoch)
+        phases: Dict[str, Dict[str, float]] = {}
+        for name, wall in self._wall.items():
+            rec = {
+                "wall_ms_per_step": 1000.0 * wall / max(1, self.steps),
+                "wall_pct": 100.0 * wall / epoch_wall,
+            }
+            if name in self._device:
+                rec["device_ms_per_step"] = self._device[name] / max(1, self.steps)
+            phases[name] = {k: round(float(v), 4) for k, v in rec.items()}
+        return {"steps": int(self.steps), "epoch_wall_sec": round(epoch_wall, 3), "phases": phases}
+
+    # -- per-step API ----------------------------------------------------------
+
+    def wrap(self, loader: Iterable[Any]) -> Iterable[Any]:
+        """Time fetching each batch as the 'data' phase."""
+        if not self.enabled:
+            return loader
+        return self._wrap(loader)
+
+    def _wrap(self, loader: Iterable[Any]) -> Iterator[Any]:
+        it = iter(loader)
+        while True:
+            self.switch("data")
+            try:
+                batch = next(it)
+            except StopIteration:
+                self._close_phase()
+                return
+            yield batch
+
+    def switch(self, name: str) -> None:
+        if not self.enabled:
+            return
+        self._close_phase()
+        self._phase = name
+        self._t_phase = time.perf_counter()
+        if self.cuda:
+            evt = torch.cuda.Event(enable_timing=True)
+            evt.record()
+            self._evt_phase = evt
+        if self._prof is not None:
+            self._record = torch.profiler.record_function(name)
+            self._record.__enter__()
+
+    def step(self) -> None:
+        """End of one optimizer step."""
+        if not self.enabled:
+            return
+        self._close_phase()
+        self.steps += 1
+        if self._prof is not None:
+            self._prof.step()
+        self._resolve(block=False)
+
+    # -- internals -------------------------------------------------------------
+
+    def _close_phase(self) -> None:
+        if self._phase is None:
+            return
+        name = self._phase
+        self._wall[name] = self._wall.get(name, 0.0) + (time.perf_counter() - self._t_phase)
+        if self._record is not None:
+            self._record.__exit__(None, None, None)
+            self._record = None
+        if self.cuda and self._evt_phase is not None:
+            end = torch.cuda.Event(enable_timing=True)
+            end.record()
+            self._pending.append((name, self._evt_phase, end))
+            self._evt_phase = None
+        self._phase = None
+
+    def _resolve(self, *, block: bool) -> None:
+        keep: List[Tuple[str, Any, Any]] = []
+        for name, start, end in self._pending:
+            if block or end.query():
+                self._device[name] = self._device.get(name, 0.0) + float(start.elapsed_time(end))
+            else:
+                keep.append((name, start, end))
+        self._pending = keep
@@ -19,6 +19,7 @@ COLUMNS = [
     "bbox_left",
     "bbox_right",
     "bbox_bottom",
+    "dup_group",
 ]
 
 
@@ -67,6 +68,7 @@ def _filter_manifest(
             "bbox_left": (r.get("bbox_left") or "").strip(),
             "bbox_right": (r.get("bbox_right") or "").strip(),
             "bbox_bottom": (r.get("bbox_bottom") or "").strip(),
+            "dup_group": (r.get("dup_group") or "").strip(),
         }
 
 
@@ -80,6 +82,7 @@ def _dedupe_rows(
     Supported keys:
     - image_path: exact path match
     - expw_orig_face: (orig_image, face_id) if present, otherwise fallback to image_path
+    - dup_group: content-hash duplicate group (tools/data/hash_index.py), otherwise fallback to image_path
     """
 
     seen: Set[str] = set()
@@ -93,6 +96,9 @@ def _dedupe_rows(
                 k = f"orig_image={orig}|face_id={face}"
             else:
                 k = (r.get("image_path") or "").strip()
+        elif key == "dup_group":
+            group = (r.get("dup_group") or "").strip()
+            k = f"dup_group={group}" if group else (r.get("image_path") or "").strip()
         else:
             raise ValueError(f"Unsupported dedupe key: {key}")
 
@@ -104,6 +110,15 @@ def _dedupe_rows(
         yield r
 
 
+def _drop_dup_groups(rows: Iterable[Dict[str, str]], groups: Set[str]) -> Iterable[Dict[str, str]]:
+    """Drop rows whose dup_group is in `groups` (e.g. eval images duplicated in train)."""
+    for r in rows:
+        group = (r.get("dup_group") or "").strip()
+        if group and group in groups:
+            continue
+        yield r
+
+
 def summarize(csv_path: Path) -> Dict[str, Counter]:
     by_source = Counter()
     by_source_split = Counter()
@@ -172,8 +187,16 @@ def main() -> None:
         "--dedupe-key",
         type=str,
         default="image_path",
-        choices=["image_path", "expw_orig_face"],
-        help="De-duplication key (default: image_path).",
+        choices=["image_path", "expw_orig_face", "dup_group"],
+        help=(
+            "De-duplication key (default: image_path). dup_group needs the base and ExpW-HQ manifests "
+            "annotated together by tools/data/hash_index.py (one run, both --manifest paths)."
+        ),
+    )
+    p.add_argument(
+        "--drop-eval-dups-of-train",
+        action="store_true",
+        help="Drop eval rows whose dup_group also appears in the train manifest (cross-dataset leakage; see --dedupe-key).",
     )
 
     args = p.parse_args()
@@ -214,7 +237,11 @@ def main() -> None:
         yield from rows
 
     n_train = _write_rows(args.out_train, _iter_train())
-    n_eval = _write_rows(args.out_eval, _iter_eval())
+    if args.drop_eval_dups_of_train:
+        train_groups = {g for g in ((r.get("dup_group") or "") for r in _read_rows(args.out_train)) if g}
+        n_eval = _write_rows(args.out_eval, _drop_dup_groups(_iter_eval(), train_groups))
+    else:
+        n_eval = _write_rows(args.out_eval, _iter_eval())
 
     print(f"Wrote train manifest: {args.out_train} (rows={n_train})")
     print(f"Wrote eval  manifest: {args.out_eval} (rows={n_eval})")
@@ -5,13 +5,20 @@ import hashlib
 import json
 import os
 import shutil
+import sys
 import csv
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, Iterable, List, Optional, Tuple
+from typing import Dict, Iterable, List, Optional, Set, Tuple
 
 import yaml
 
+REPO_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(REPO_ROOT))
+
+from tools.data.hash_index import IMAGE_EXTS, annotate_manifests, scan_files  # noqa: E402
+
 
 CANONICAL = ["Angry", "Disgust", "Fear", "Happy", "Sad", "Surprise", "Neutral"]
 
@@ -56,13 +63,43 @@ def safe_link_or_copy(src: Path, dst: Path, mode: str) -> None:
     if dst.exists():
         return
     if mode == "link":
-        os.link(src, dst)
+        try:
+            os.link(src, dst)
+        except FileExistsError:
+            return
     elif mode == "copy":
         shutil.copy2(src, dst)
     else:
         raise ValueError(f"Unknown mode: {mode}")
 
 
+def link_or_copy_many(pairs: List[Tuple[Path, Path]], mode: str, workers: int) -> None:
+    """Parallel `safe_link_or_copy`; the first pair wins when several share a destination."""
+    if mode not in {"link", "copy"}:
+        raise ValueError(f"Unknown mode: {mode}")
+    unique: Dict[Path, Path] = {}
+    for src, dst in pairs:
+        unique.setdefault(dst, src)
+    if not unique:
+        return
+    for d in {dst.parent for dst in unique}:
+        d.mkdir(parents=True, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=max(1, int(workers))) as ex:
+        # list() re-raises the first worker error.
+        list(ex.map(lambda item: safe_link_or_copy(item[1], item[0], mode), unique.items()))
+
+
+def _is_same_file(src: Path, dst: Path) -> bool:
+    # Output of an earlier run: same inode (link) or copy2-preserved size + mtime (copy).
+    try:
+        if os.path.samefile(src, dst):
+            return True
+        a, b = src.stat(), dst.stat()
+    except OSError:
+        return False
+    return a.st_size == b.st_size and a.st_mtime_ns == b.st_mtime_ns
+
+
 def unique_name_for(src: Path, rel: Path) -> str:
     # Avoid collisions when different datasets share filenames
     h = hashlib.sha1(str(rel).encode("utf-8")).hexdigest()[:10]
@@ -120,6 +157,7 @@ def clean_folder_dataset(
     out_root: Path,
     mode: str,
     apply: bool,
+    workers: int = 8,
 ) -> dict:
     report: dict = {
         "type": "folder",
@@ -136,6 +174,12 @@ def clean_folder_dataset(
         report["notes"].append("No standard split folders found; skipped.")
         return report
 
+    # Walk every class directory of every split in parallel.
+    class_dirs = [c for split_path in splits for c in sorted(p for p in split_path.iterdir() if p.is_dir())]
+    files_by_dir = scan_files(class_dirs, workers=workers)
+
+    pairs: List[Tuple[Path, Path]] = []
+    planned: Set[Path] = set()
     for split_path in splits:
         split_name = split_path.name
         split_counts = {k: 0 for k in CANONICAL}
@@ -143,27 +187,30 @@ def clean_folder_dataset(
 
         for class_dir in sorted([p for p in split_path.iterdir() if p.is_dir()]):
             canonical = map_to_canonical(class_dir.name)
-            files = [p for p in class_dir.rglob("*") if p.is_file()]
+            files = [Path(fs.path) for fs in files_by_dir[class_dir]]
             if canonical is None:
                 excluded_counts[class_dir.name] = excluded_counts.get(class_dir.name, 0) + len(files)
                 continue
 
+            # Re-home to: out_root/<dataset>/<split>/<Canonical>/<file>
+            dst_dir = out_root / spec.name / split_name / canonical
             for f in files:
                 rel = f.relative_to(spec.root)
-                # Re-home to: out_root/<dataset>/<split>/<Canonical>/<file>
-                dst_dir = out_root / spec.name / split_name / canonical
-                # Keep filename but avoid collisions
+                # Keep filename but avoid collisions (on disk or earlier in this run)
                 dst = dst_dir / f.name
-                if dst.exists():
+                if dst in planned or (dst.exists() and not _is_same_file(f, dst)):
                     dst = dst_dir / unique_name_for(f, rel)
+                planned.add(dst)
                 split_counts[canonical] += 1
-                if apply:
-                    safe_link_or_copy(f, dst, mode)
+                pairs.append((f, dst))
 
         report["splits"][split_name] = split_counts
         if excluded_counts:
             report["excluded"][split_name] = excluded_counts
 
+    if apply:
+        link_or_copy_many(pairs, mode, workers)
+
     return report
 
 
@@ -177,7 +224,9 @@ def _parse_yolo_names(data: dict) -> List[str]:
     raise ValueError("data.yaml missing 'names' list/dict")
 
 
-def clean_yolo_dataset(spec: YoloDatasetSpec, out_root: Path, mode: str, apply: bool) -> dict:
+def clean_yolo_dataset(
+    spec: YoloDatasetSpec, out_root: Path, mode: str, apply: bool, workers: int = 8
+) -> dict:
     report: dict = {
         "type": "yolo",
         "dataset": spec.name,
@@ -224,6 +273,7 @@ def clean_yolo_dataset(spec: YoloDatasetSpec, out_root: Path, mode: str, apply:
         (out_root / spec.name).mkdir(parents=True, exist_ok=True)
         (out_root / spec.name / "data.yaml").write_text(yaml.safe_dump(new_yaml, sort_keys=False), encoding="utf-8")
 
+    image_pairs: List[Tuple[Path, Path]] = []
     for split in split_dirs:
         for sub in ["images", "labels"]:
             src_sub = split / sub
@@ -236,8 +286,7 @@ def clean_yolo_dataset(spec: YoloDatasetSpec, out_root: Path, mode: str, apply:
                 out_path = out_root / spec.name / rel
 
                 if sub == "images":
-                    if apply:
-                        safe_link_or_copy(f, out_path, mode)
+                    image_pairs.append((f, out_path))
                     continue
 
                 # labels: rewrite
@@ -265,6 +314,8 @@ def clean_yolo_dataset(spec: YoloDatasetSpec, out_root: Path, mode: str, apply:
                     out_path.parent.mkdir(parents=True, exist_ok=True)
                     out_path.write_text("\n".join(new_lines) + ("\n" if new_lines else ""), encoding="utf-8")
 
+    if apply:
+        link_or_copy_many(image_pairs, mode, workers)
     return report
 
 
@@ -295,7 +346,9 @@ def _find_raf_image(root: Path, filename: str) -> Optional[Path]:
     return None
 
 
-def clean_rafdb_basic(spec: RafDbBasicSpec, out_root: Path, mode: str, apply: bool) -> dict:
+def clean_rafdb_basic(
+    spec: RafDbBasicSpec, out_root: Path, mode: str, apply: bool, workers: int = 8
+) -> dict:
     report: dict = {
         "type": "rafdb_basic",
         "dataset": spec.name,
@@ -310,6 +363,7 @@ def clean_rafdb_basic(spec: RafDbBasicSpec, out_root: Path, mode: str, apply: bo
         report["notes"].append("list_patition_label.txt not found; skipped.")
         return report
 
+    pairs: List[Tuple[Path, Path]] = []
     for line in spec.label_file.read_text(encoding="utf-8").splitlines():
         line = line.strip()
         if not line:
@@ -334,9 +388,10 @@ def clean_rafdb_basic(spec: RafDbBasicSpec, out_root: Path, mode: str, apply: bo
         dst_dir = out_root / spec.name / split / canonical
         dst = dst_dir / src_img.name
         report["splits"][split][canonical] += 1
-        if apply:
-            safe_link_or_copy(src_img, dst, mode)
+        pairs.append((src_img, dst))
 
+    if apply:
+        link_or_copy_many(pairs, mode, workers)
     return report
 
 
@@ -355,7 +410,9 @@ _RAF_COMPOUND_ID_TO_PRIMARY: Dict[int, str] = {
 }
 
 
-def clean_raf_compound(spec: RafCompoundSpec, out_root: Path, mode: str, apply: bool) -> dict:
+def clean_raf_compound(
+    spec: RafCompoundSpec, out_root: Path, mode: str, apply: bool, workers: int = 8
+) -> dict:
     report: dict = {
         "type": "raf_compound",
         "dataset": spec.name,
@@ -372,6 +429,7 @@ def clean_raf_compound(spec: RafCompoundSpec, out_root: Path, mode: str, apply:
         report["notes"].append("list_patition_label.txt not found; skipped.")
         return report
 
+    pairs: List[Tuple[Path, Path]] = []
     for line in spec.label_file.read_text(encoding="utf-8").splitlines():
         line = line.strip()
         if not line:
@@ -395,16 +453,19 @@ def clean_raf_compound(spec: RafCompoundSpec, out_root: Path, mode: str, apply:
         dst_dir = out_root / spec.name / split / canonical
         dst = dst_dir / src_img.name
         report["splits"][split][canonical] += 1
-        if apply:
-            safe_link_or_copy(src_img, dst, mode)
+        pairs.append((src_img, dst))
 
+    if apply:
+        link_or_copy_many(pairs, mode, workers)
     return report
 
 
 _RAFML_COLS: List[str] = ["Surprise", "Fear", "Disgust", "Happy", "Sad", "Angry"]
 
 
-def clean_rafml(spec: RafMlSpec, out_root: Path, mode: str, apply: bool) -> dict:
+def clean_rafml(
+    spec: RafMlSpec, out_root: Path, mode: str, apply: bool, workers: int = 8
+) -> dict:
     report: dict = {
         "type": "rafml",
         "dataset": spec.name,
@@ -428,6 +489,7 @@ def clean_rafml(spec: RafMlSpec, out_root: Path, mode: str, apply: bool) -> dict
             continue
         partition[parts[0]] = int(parts[1])
 
+    pairs: List[Tuple[Path, Path]] = []
     for line in spec.distribution_file.read_text(encoding="utf-8").splitlines():
         parts = line.strip().split()
         if len(parts) < 2:
@@ -452,20 +514,22 @@ def clean_rafml(spec: RafMlSpec, out_root: Path, mode: str, apply: bool) -> dict
         dst_dir = out_root / spec.name / split / canonical
         dst = dst_dir / src_img.name
         report["splits"][split][canonical] += 1
-        if apply:
-            safe_link_or_copy(src_img, dst, mode)
+        pairs.append((src_img, dst))
 
+    if apply:
+        link_or_copy_many(pairs, mode, workers)
     return report
 
 
-def write_classification_manifest(out_root: Path, manifest_path: Path) -> dict:
+def write_classification_manifest(out_root: Path, manifest_path: Path, workers: int = 8) -> dict:
     # Build CSV from folder datasets under out_root (skip YOLO-style).
-    exts = {".jpg", ".jpeg", ".png", ".bmp"}
     split_map = {"valid": "val", "validation": "val", "val": "val"}
 
     rows: List[dict] = []
     counts = {k: 0 for k in CANONICAL}
 
+    # (class_dir, split, source) for every canonical class folder, then walk them in parallel.
+    class_dirs: List[Tuple[Path, str, str]] = []
     for dataset_dir in sorted([p for p in out_root.iterdir() if p.is_dir()]):
         if dataset_dir.name == "affectnet_yolo_format":
             continue
@@ -477,19 +541,21 @@ def write_classification_manifest(out_root: Path, manifest_path: Path) -> dict:
             for class_dir in sorted([p for p in split_dir.iterdir() if p.is_dir()]):
                 if class_dir.name not in CANONICAL:
                     continue
-                for f in class_dir.rglob("*"):
-                    if not f.is_file() or f.suffix.lower() not in exts:
-                        continue
-                    rel = f.relative_to(out_root)
-                    rows.append(
-                        {
-                            "image_path": str(rel).replace("\\", "/"),
-                            "label": class_dir.name,
-                            "split": split_name,
-                            "source": dataset_dir.name,
-                        }
-                    )
-                    counts[class_dir.name] += 1
+                class_dirs.append((class_dir, split_name, dataset_dir.name))
+
+    files_by_dir = scan_files([c for c, _, _ in class_dirs], exts=IMAGE_EXTS, workers=workers)
+    for class_dir, split_name, source in class_dirs:
+        for fs in files_by_dir[class_dir]:
+            rel = Path(fs.path).relative_to(out_root)
+            rows.append(
+                {
+                    "image_path": str(rel).replace("\\", "/"),
+                    "label": class_dir.name,
+                    "split": split_name,
+                    "source": source,
+                }
+            )
+            counts[class_dir.name] += 1
 
     manifest_path.parent.mkdir(parents=True, exist_ok=True)
     with manifest_path.open("w", newline="", encoding="utf-8") as fp:
@@ -528,7 +594,38 @@ def main() -> int:
         default=Path("Training_data_cleaned") / "classification_manifest.csv",
         help="Where to write the classification CSV manifest (only when --apply).",
     )
+    ap.add_argument(
+        "--workers",
+        type=int,
+        default=0,
+        help="Threads for scanning/linking and processes for hashing (0 = os.cpu_count()).",
+    )
+    ap.add_argument(
+        "--content-dedupe",
+        action="store_true",
+        help="Hash manifest images and add content_hash/phash/dup_group columns (only when --apply).",
+    )
+    ap.add_argument(
+        "--hash-index",
+        type=Path,
+        default=Path("Training_data_cleaned") / "hash_index.sqlite",
+        help="Persistent hash index for --content-dedupe (re-runs only hash new/changed files).",
+    )
+    ap.add_argument(
+        "--content-dedupe-with",
+        type=Path,
+        nargs="*",
+        default=[Path("Training_data_cleaned") / "expw_hq_manifest.csv"],
+        help="Other manifests annotated in the same --content-dedupe pass (skipped if missing) so dup_group ids link across them.",
+    )
+    ap.add_argument(
+        "--phash-distance",
+        type=int,
+        default=2,
+        help="Max dHash Hamming distance from a group's centre image (-1 = exact duplicates only).",
+    )
     args = ap.parse_args()
+    workers = int(args.workers) or (os.cpu_count() or 1)
 
     src = args.source_root
     out = args.out_root
@@ -583,19 +680,28 @@ def main() -> int:
     }
 
     for spec in folder_specs:
-        full_report["reports"].append(clean_folder_dataset(spec, out, args.mode, args.apply))
+        full_report["reports"].append(clean_folder_dataset(spec, out, args.mode, args.apply, workers))
 
-    full_report["reports"].append(clean_yolo_dataset(yolo_spec, out, args.mode, args.apply))
+    full_report["reports"].append(clean_yolo_dataset(yolo_spec, out, args.mode, args.apply, workers))
 
-    full_report["reports"].append(clean_rafdb_basic(rafdb_basic, out, args.mode, args.apply))
-    full_report["reports"].append(clean_raf_compound(raf_compound, out, args.mode, args.apply))
-    full_report["reports"].append(clean_rafml(rafml, out, args.mode, args.apply))
+    full_report["reports"].append(clean_rafdb_basic(rafdb_basic, out, args.mode, args.apply, workers))
+    full_report["reports"].append(clean_raf_compound(raf_compound, out, args.mode, args.apply, workers))
+    full_report["reports"].append(clean_rafml(rafml, out, args.mode, args.apply, workers))
 
     if args.apply:
         out.mkdir(parents=True, exist_ok=True)
         args.report.parent.mkdir(parents=True, exist_ok=True)
-        manifest_summary = write_classification_manifest(out, args.manifest)
+        manifest_summary = write_classification_manifest(out, args.manifest, workers)
         full_report["manifest"] = manifest_summary
+        if args.content_dedupe:
+            extra = [m for m in args.content_dedupe_with if m.exists() and m.resolve() != args.manifest.resolve()]
+            full_report["content_dedupe"] = annotate_manifests(
+                [(m, m) for m in [args.manifest, *extra]],
+                root=out,
+                index_path=args.hash_index,
+                workers=workers,
+                max_hamming=int(args.phash_distance),
+            )
         args.report.write_text(json.dumps(full_report, indent=2), encoding="utf-8")
 
     # Print quick summary
@@ -607,6 +713,9 @@ def main() -> int:
     if args.apply:
         print("report:", args.report)
         print("manifest:", args.manifest)
+        if "content_dedupe" in full_report:
+            d = full_report["content_dedupe"]
+            print(f"dup_groups: {d['dup_groups']} (redundant rows: {d['redundant_rows']})")
 
     return 0
 
@@ -0,0 +1,469 @@
+"""Parallel dataset scanning + content-hash duplicate detection for FER manifests.
+
+- `scan_files`: walks dataset trees with os.scandir on a thread pool (one task per subtree).
+- `HashIndex`: persistent SQLite cache of content hashes keyed by (path, bbox) and
+  invalidated by (size, mtime_ns), so re-runs only hash new/changed files.
+- Hashes are computed on a process pool:
+  - exact: streaming BLAKE2b of the file bytes (+ bbox for ExpW-style crop rows)
+  - near-duplicate: 64-bit difference hash (dHash) of the face image / crop
+- `group_duplicates`: equal exact hashes form a group; near-duplicates are grouped around
+  a centre image (every member within the dHash Hamming distance of the centre, no
+  transitive chaining), so the same face photo mirrored across FER2013/RAF/AffectNet trees
+  lands in one `dup_group` without merging merely similar faces.
+
+CLI: annotate one or more manifests with `content_hash`, `phash` and `dup_group` columns
+(empty `dup_group` = no duplicate found). Groups are computed over the union of all
+--manifest files, so pass every manifest that build_curated_manifests.py combines (base +
+ExpW-HQ) in one run; it can then dedupe on `dup_group` and drop eval rows that duplicate
+training images.
+
+Usage (PowerShell):
+  .\.venv\Scripts\python.exe tools\data\hash_index.py --manifest Training_data_cleaned\classification_manifest.csv Training_data_cleaned\expw_hq_manifest.csv
+  .\.venv\Scripts\python.exe tools\data\hash_index.py --manifest Training_data_cleaned\classification_manifest.csv --phash-distance 0
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import hashlib
+import os
+import sqlite3
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".bmp"}
+
+
+@dataclass(frozen=True)
+class FileStat:
+    path: str
+    size: int
+    mtime_ns: int
+
+
+@dataclass(frozen=True)
+class HashTask:
+    path: str
+    bbox: str  # "top,left,right,bottom" or "" for the whole image
+    size: int
+    mtime_ns: int
+
+
+@dataclass(frozen=True)
+class HashRecord:
+    path: str
+    bbox: str
+    size: int
+    mtime_ns: int
+    content_hash: str
+    phash: str  # 16 hex chars, "" if the image could not be decoded
+
+
+def _walk_subtree(root: str, exts: Optional[Set[str]]) -> List[FileStat]:
+    out: List[FileStat] = []
+    stack = [root]
+    while stack:
+        d = stack.pop()
+        try:
+            it = os.scandir(d)
+        except OSError:
+            continue
+        with it:
+            for e in it:
+                try:
+                    if e.is_dir(follow_symlinks=False):
+                        stack.append(e.path)
+                        continue
+                    if not e.is_file():
+                        continue
+                    if exts is not None and os.path.splitext(e.name)[1].lower() not in exts:
+                        continue
+                    st = e.stat()
+                except OSError:
+                    continue
+                out.append(FileStat(path=e.path, size=int(st.st_size), mtime_ns=int(st.st_mtime_ns)))
+    return out
+
+
+def scan_files(
+    roots: Sequence[Path],
+    *,
+    exts: Optional[Set[str]] = None,
+    workers: int = 8,
+) -> Dict[Path, List[FileStat]]:
+    """Recursively list files under each root in parallel; returns {root: files sorted by path}."""
+    roots = list(roots)
+    if not roots:
+        return {}
+    with ThreadPoolExecutor(max_workers=max(1, min(int(workers), len(roots)))) as ex:
+        results = list(ex.map(lambda r: _walk_subtree(str(r), exts), roots))
+    return {r: sorted(files, key=lambda f: f.path) for r, files in zip(roots, results)}
+
+
+def _dhash_hex(im, size: int = 8) -> str:
+    """64-bit difference hash of a PIL image (grayscale, (size+1) x size)."""
+    from PIL import Image
+
+    g = im.convert("L").resize((size + 1, size), Image.BILINEAR)
+    px = list(g.getdata())
+    bits = 0
+    for y in range(size):
+        row = px[y * (size + 1) : (y + 1) * (size + 1)]
+        for x in range(size):
+            bits = (bits << 1) | (1 if row[x] > row[x + 1] else 0)
+    return f"{bits:016x}"
+
+
+def hash_file(task: HashTask) -> HashRecord:
+    """Exact + perceptual hash of one file (or one bbox crop of it). Runs in worker processes."""
+    h = hashlib.blake2b(digest_size=16)
+    with open(task.path, "rb") as fp:
+        for chunk in iter(lambda: fp.read(1 << 20), b""):
+            h.update(chunk)
+    if task.bbox:
+        h.update(b"|bbox=" + task.bbox.encode("ascii"))
+
+    phash = ""
+    try:
+        from PIL import Image, ImageFile
+
+        ImageFile.LOAD_TRUNCATED_IMAGES = True
+        with Image.open(task.path) as im:
+            if task.bbox:
+                top, left, right, bottom = (int(v) for v in task.bbox.split(","))
+                im = im.convert("RGB")
+                w, hgt = im.size
+                top = max(0, min(top, hgt - 1))
+                left = max(0, min(left, w - 1))
+                right = max(left + 1, min(right, w))
+                bottom = max(top + 1, min(bottom, hgt))
+                im = im.crop((left, top, right, bottom))
+            else:
+                # JPEG: decode at reduced scale, we only need a 9x8 thumbnail.
+                im.draft("L", (64, 64))
+            phash = _dhash_hex(im)
+    except Exception:
+        phash = ""
+
+    return HashRecord(
+        path=task.path,
+        bbox=task.bbox,
+        size=task.size,
+        mtime_ns=task.mtime_ns,
+        content_hash=h.hexdigest(),
+        phash=phash,
+    )
+
+
+class HashIndex:
+    """SQLite-backed cache: (path, bbox) -> hashes, valid while (size, mtime_ns) match."""
+
+    def __init__(self, db_path: Path) -> None:
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.db_path = db_path
+        self.conn = sqlite3.connect(str(db_path))
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS hashes ("
+            "path TEXT NOT NULL, bbox TEXT NOT NULL, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, "
+            "content_hash TEXT NOT NULL, phash TEXT NOT NULL, PRIMARY KEY (path, bbox))"
+        )
+        self.conn.commit()
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def lookup(self, tasks: Iterable[HashTask]) -> Tuple[Dict[Tuple[str, str], HashRecord], List[HashTask]]:
+        """Split tasks into cached records and tasks that still need hashing."""
+        cached: Dict[Tuple[str, str], HashRecord] = {}
+        missing: List[HashTask] = []
+        cur = self.conn.cursor()
+        for t in tasks:
+            row = cur.execute(
+                "SELECT size, mtime_ns, content_hash, phash FROM hashes WHERE path = ? AND bbox = ?",
+                (t.path, t.bbox),
+            ).fetchone()
+            if row is not None and int(row[0]) == t.size and int(row[1]) == t.mtime_ns:
+                cached[(t.path, t.bbox)] = HashRecord(t.path, t.bbox, t.size, t.mtime_ns, str(row[2]), str(row[3]))
+            else:
+                missing.append(t)
+        return cached, missing
+
+    def put_many(self, records: Iterable[HashRecord]) -> None:
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO hashes (path, bbox, size, mtime_ns, content_hash, phash) VALUES (?, ?, ?, ?, ?, ?)",
+            [(r.path, r.bbox, r.size, r.mtime_ns, r.content_hash, r.phash) for r in records],
+        )
+        self.conn.commit()
+
+
+def hash_with_index(
+    tasks: Sequence[HashTask],
+    *,
+    index: Optional[HashIndex],
+    workers: int,
+    chunksize: int = 64,
+) -> Dict[Tuple[str, str], HashRecord]:
+    """Hash every task, reusing the index where (size, mtime) still match."""
+    if index is not None:
+        out, missing = index.lookup(tasks)
+    else:
+        out, missing = {}, list(tasks)
+
+    t0 = time.perf_counter()
+    fresh: List[HashRecord] = []
+    if missing:
+        if int(workers) <= 1:
+            fresh = [hash_file(t) for t in missing]
+        else:
+            with ProcessPoolExecutor(max_workers=int(workers)) as ex:
+                for i, rec in enumerate(ex.map(hash_file, missing, chunksize=max(1, int(chunksize))), start=1):
+                    fresh.append(rec)
+                    if i % 20000 == 0:
+                        rate = i / max(1e-9, time.perf_counter() - t0)
+                        print(f"hashed {i}/{len(missing)} ({rate:.0f} files/s)")
+        if index is not None:
+            index.put_many(fresh)
+    for r in fresh:
+        out[(r.path, r.bbox)] = r
+    print(f"hashes: cached={len(tasks) - len(missing)} computed={len(missing)} ({time.perf_counter() - t0:.1f}s)")
+    return out
+
+
+def group_duplicates(records: Sequence[HashRecord], *, max_hamming: int = 2) -> List[int]:
+    """Duplicate groups: exact-hash matches, plus dHash matches within `max_hamming` bits of a centre.
+
+    Returns a group id per record: the index of the group's first record (records in the
+    same group share it). Records with equal content hashes are always grouped. For
+    near-duplicates, records are visited in order and each one not yet grouped becomes a
+    centre that claims every ungrouped record within `max_hamming` bits of *itself*, so
+    A~B and B~C do not pull an unrelated C into A's group. Candidates come from
+    multi-index hashing: with the 64-bit hash split into (max_hamming + 1) bands, any
+    pair within the distance agrees on at least one band.
+    """
+    n = len(records)
+    group = list(range(n))
+
+    # Exact duplicates: one representative (the first record) per content hash.
+    first_by_hash: Dict[str, int] = {}
+    reps: List[int] = []
+    for i, r in enumerate(records):
+        j = first_by_hash.setdefault(r.content_hash, i)
+        group[i] = j
+        if j == i:
+            reps.append(i)
+
+    if max_hamming >= 0:
+        values = {i: int(records[i].phash, 16) for i in reps if records[i].phash}
+        n_bands = max(1, min(64, int(max_hamming) + 1))
+        edges = [round(k * 64 / n_bands) for k in range(n_bands + 1)]
+        bands = [(edges[b], (1 << (edges[b + 1] - edges[b])) - 1) for b in range(n_bands)]
+        buckets: List[Dict[int, List[int]]] = [{} for _ in bands]
+        for i, v in values.items():
+            for b, (lo, mask) in enumerate(bands):
+                buckets[b].setdefault((v >> lo) & mask, []).append(i)
+
+        centre_of: Dict[int, int] = {}
+        for i in reps:  # ascending, so a centre is always its group's first record
+            if i in centre_of or i not in values:
+                continue
+            centre_of[i] = i
+            vi = values[i]
+            for b, (lo, mask) in enumerate(bands):
+                for j in buckets[b].get((vi >> lo) & mask, ()):
+                    if j not in centre_of and bin(vi ^ values[j]).count("1") <= max_hamming:
+                        centre_of[j] = i
+        for i in range(n):
+            group[i] = centre_of.get(group[i], group[i])
+
+    return group
+
+
+def group_size_histogram(groups: Sequence[int]) -> Dict[int, int]:
+    """{group size: number of groups} over a group_duplicates() result."""
+    return dict(sorted(Counter(Counter(groups).values()).items()))
+
+
+def _row_task(r: Dict[str, str], root: Path) -> Optional[HashTask]:
+    image_path = (r.get("image_path") or "").strip()
+    if not image_path:
+        return None
+    p = Path(image_path)
+    if not p.is_absolute():
+        p = root / p
+    try:
+        st = p.stat()
+    except OSError:
+        return None
+    keys = ("bbox_top", "bbox_left", "bbox_right", "bbox_bottom")
+    vals = [(r.get(k) or "").strip() for k in keys]
+    bbox = ""
+    if all(vals):
+        try:
+            bbox = ",".join(str(int(float(v))) for v in vals)
+        except ValueError:
+            bbox = ""
+    return HashTask(path=str(p), bbox=bbox, size=int(st.st_size), mtime_ns=int(st.st_mtime_ns))
+
+
+def annotate_manifests(
+    manifests: Sequence[Tuple[Path, Path]],
+    *,
+    root: Path,
+    index_path: Optional[Path],
+    workers: int,
+    max_hamming: int,
+) -> Dict[str, object]:
+    """Add content_hash / phash / dup_group columns to each (manifest, out_csv) pair.
+
+    Duplicate groups are computed over the rows of all manifests together, so a
+    `dup_group` id links rows across manifests (e.g. ExpW-HQ crops and base rows).
+    """
+    tables: List[Tuple[Path, List[str], List[Dict[str, str]]]] = []
+    for manifest, out_csv in manifests:
+        with manifest.open("r", newline="", encoding="utf-8") as fp:
+            reader = csv.DictReader(fp)
+            tables.append((out_csv, list(reader.fieldnames or []), [dict(r) for r in reader]))
+
+    # (table index, row index, task) for every row whose image exists.
+    row_tasks: List[Tuple[int, int, HashTask]] = []
+    for ti, (_, _, rows) in enumerate(tables):
+        for ri, r in enumerate(rows):
+            t = _row_task(r, root)
+            if t is not None:
+                row_tasks.append((ti, ri, t))
+    unique_tasks = list({(t.path, t.bbox): t for _, _, t in row_tasks}.values())
+
+    index = HashIndex(index_path) if index_path is not None else None
+    try:
+        by_key = hash_with_index(unique_tasks, index=index, workers=workers)
+    finally:
+        if index is not None:
+            index.close()
+
+    keyed = [by_key[(t.path, t.bbox)] for _, _, t in row_tasks]
+    groups = group_duplicates(keyed, max_hamming=int(max_hamming))
+    group_size = Counter(groups)
+
+    for out_csv, fieldnames, rows in tables:
+        for name in ("content_hash", "phash", "dup_group"):
+            if name not in fieldnames:
+                fieldnames.append(name)
+        for r in rows:
+            r["content_hash"] = ""
+            r["phash"] = ""
+            r["dup_group"] = ""
+    for (ti, ri, _), rec, g in zip(row_tasks, keyed, groups):
+        row = tables[ti][2][ri]
+        row["content_hash"] = rec.content_hash
+        row["phash"] = rec.phash
+        if group_size[g] > 1:
+            # Group id = content hash of the group's first row (stable across re-runs).
+            row["dup_group"] = keyed[g].content_hash[:16]
+
+    for out_csv, fieldnames, rows in tables:
+        tmp = out_csv.with_name(out_csv.name + ".tmp")
+        out_csv.parent.mkdir(parents=True, exist_ok=True)
+        with tmp.open("w", newline="", encoding="utf-8") as fp:
+            writer = csv.DictWriter(fp, fieldnames=fieldnames)
+            writer.writeheader()
+            writer.writerows(rows)
+        os.replace(tmp, out_csv)
+
+    n_rows = sum(len(rows) for _, _, rows in tables)
+    dup_groups = sum(1 for s in group_size.values() if s > 1)
+    dup_rows = sum(s for s in group_size.values() if s > 1)
+    return {
+        "manifests": len(tables),
+        "rows": n_rows,
+        "rows_hashed": len(keyed),
+        "rows_missing_file": n_rows - len(keyed),
+        "dup_groups": dup_groups,
+        "rows_in_dup_groups": dup_rows,
+        "redundant_rows": dup_rows - dup_groups,
+        "largest_group": max(group_size.values(), default=0),
+        "group_size_hist": {str(k): v for k, v in group_size_histogram(groups).items() if k > 1},
+    }
+
+
+def annotate_manifest(
+    manifest: Path,
+    out_csv: Path,
+    *,
+    root: Path,
+    index_path: Optional[Path],
+    workers: int,
+    max_hamming: int,
+) -> Dict[str, object]:
+    """Single-manifest annotate_manifests()."""
+    return annotate_manifests(
+        [(manifest, out_csv)], root=root, index_path=index_path, workers=workers, max_hamming=max_hamming
+    )
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Annotate manifests with content hashes and duplicate groups.")
+    ap.add_argument(
+        "--manifest",
+        type=Path,
+        nargs="+",
+        required=True,
+        help="Manifest CSV(s) with an image_path column; duplicate groups span all of them.",
+    )
+    ap.add_argument(
+        "--out",
+        type=Path,
+        nargs="+",
+        default=None,
+        help="Output CSV per --manifest, in the same order (default: overwrite each --manifest).",
+    )
+    ap.add_argument(
+        "--root",
+        type=Path,
+        default=Path("Training_data_cleaned"),
+        help="Root for relative image_path values (default: Training_data_cleaned).",
+    )
+    ap.add_argument(
+        "--index",
+        type=Path,
+        default=Path("Training_data_cleaned") / "hash_index.sqlite",
+        help="Persistent hash index (re-runs only hash new/changed files).",
+    )
+    ap.add_argument("--no-index", action="store_true", help="Do not read or write the hash index.")
+    ap.add_argument("--workers", type=int, default=0, help="Hashing processes (0 = os.cpu_count()).")
+    ap.add_argument(
+        "--phash-distance",
+        type=int,
+        default=2,
+        help="Max dHash Hamming distance from a group's centre image (-1 = exact duplicates only).",
+    )
+    args = ap.parse_args()
+
+    for m in args.manifest:
+        if not m.exists():
+            raise SystemExit(f"Manifest not found: {m}")
+    outs = args.out or args.manifest
+    if len(outs) != len(args.manifest):
+        raise SystemExit(f"--out needs one path per --manifest ({len(args.manifest)}), got {len(outs)}")
+
+    stats = annotate_manifests(
+        list(zip(args.manifest, outs)),
+        root=args.root,
+        index_path=None if args.no_index else args.index,
+        workers=int(args.workers) or (os.cpu_count() or 1),
+        max_hamming=int(args.phash_distance),
+    )
+    for k, v in stats.items():
+        print(f"{k}: {v}")
+    for m in outs:
+        print("manifest:", m)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -2,13 +2,18 @@ from __future__ import annotations
 
 import argparse
 import csv
+import hashlib
+import io
 import json
+import os
 import random
 import sys
+import time
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 
 from PIL import Image
 from PIL import ImageFile
@@ -127,6 +132,196 @@ def stratified_split(items: List[ExpwRow], train_frac: float, val_frac: float, s
     return split_for_index
 
 
+# (top, left, right, bottom, dst) for one face crop.
+CropTask = Tuple[int, int, int, int, str]
+# (orig_image, crops) for one source image; each image is decoded once per group.
+ImageTask = Tuple[str, List[CropTask]]
+
+
+@dataclass(frozen=True)
+class CropOptions:
+    images_dir: str
+    pad_ratio: float
+    jpeg_quality: int
+    jpeg_subsampling: int
+    verify: str  # "size" | "hash" | "none"
+
+    def fingerprint(self) -> str:
+        # Ledger entries written with different crop settings or source images are not reused on resume.
+        src = Path(self.images_dir).resolve().as_posix()
+        return f"src={src}|pad={self.pad_ratio}|q={self.jpeg_quality}|ss={self.jpeg_subsampling}"
+
+
+def _crop_source(image_name: str, crop: CropTask) -> str:
+    """Per-crop part of the ledger key: source image + (unpadded) bbox."""
+    top, left, right, bottom, _dst = crop
+    return f"{image_name}|{top},{left},{right},{bottom}"
+
+
+def _crop_is_done(dst: Path, expected: Optional[Tuple[int, str]], verify: str) -> bool:
+    """Resume check: an existing crop is kept only if it matches the ledger entry."""
+    if expected is None or not dst.exists():
+        return False
+    size, digest = expected
+    try:
+        if dst.stat().st_size != int(size):
+            return False
+        if verify == "hash":
+            return hashlib.blake2b(dst.read_bytes(), digest_size=16).hexdigest() == digest
+    except OSError:
+        return False
+    return True
+
+
+def write_crop_chunk(
+    chunk: List[ImageTask],
+    opts: CropOptions,
+    ledger: Dict[str, Tuple[int, str]],
+) -> Tuple[List[Tuple[str, int, str]], int]:
+    """Write the crops of a chunk of source images (runs in a worker process).
+
+    Returns ([(dst, size, blake2b), ...] for crops written, number of crops skipped).
+    Crops are encoded in memory and written via temp file + rename, so an interrupted
+    import never leaves a truncated JPEG behind.
+    """
+    written: List[Tuple[str, int, str]] = []
+    skipped = 0
+    for image_name, crops in chunk:
+        todo = [
+            c for c in crops if opts.verify == "none" or not _crop_is_done(Path(c[4]), ledger.get(c[4]), opts.verify)
+        ]
+        skipped += len(crops) - len(todo)
+        if not todo:
+            continue
+
+        with Image.open(Path(opts.images_dir) / image_name) as im:
+            im = im.convert("RGB")
+            w, h = im.size
+            for top, left, right, bottom, dst_s in todo:
+                top, left, right, bottom = clamp_bbox(top, left, right, bottom, w=w, h=h)
+                top, left, right, bottom = pad_bbox(
+                    top,
+                    left,
+                    right,
+                    bottom,
+                    w=w,
+                    h=h,
+                    pad_ratio=opts.pad_ratio,
+                )
+                face = im.crop((left, top, right, bottom))
+
+                buf = io.BytesIO()
+                face.save(
+                    buf,
+                    format="JPEG",
+                    quality=int(opts.jpeg_quality),
+                    subsampling=int(opts.jpeg_subsampling),
+                    optimize=True,
+                )
+                data = buf.getvalue()
+
+                dst = Path(dst_s)
+                dst.parent.mkdir(parents=True, exist_ok=True)
+                tmp = dst.with_name(dst.name + ".tmp")
+                tmp.write_bytes(data)
+                os.replace(tmp, dst)
+                written.append((dst_s, len(data), hashlib.blake2b(data, digest_size=16).hexdigest()))
+    return written, skipped
+
+
+def _read_ledger(path: Path, fingerprint: str) -> Dict[str, Tuple[int, str, str]]:
+    """dst -> (size, blake2b, crop source) of the latest entry written with `fingerprint`."""
+    ledger: Dict[str, Tuple[int, str, str]] = {}
+    if not path.exists():
+        return ledger
+    with path.open("r", encoding="utf-8") as fp:
+        for line in fp:
+            try:
+                obj = json.loads(line)
+                if obj.get("opts") != fingerprint:
+                    ledger.pop(str(obj["dst"]), None)
+                    continue
+                ledger[str(obj["dst"])] = (int(obj["size"]), str(obj["blake2b"]), str(obj.get("src") or ""))
+            except Exception:
+                continue
+    return ledger
+
+
+def write_crops_parallel(
+    tasks: List[ImageTask],
+    opts: CropOptions,
+    *,
+    ledger_path: Path,
+    workers: int,
+    chunk_size: int,
+) -> Dict[str, object]:
+    """Fan image groups out over a process pool; append written crops to the resume ledger."""
+    fingerprint = opts.fingerprint()
+    ledger = _read_ledger(ledger_path, fingerprint) if opts.verify != "none" else {}
+    total = sum(len(c) for _, c in tasks)
+    chunks = [tasks[i : i + max(1, int(chunk_size))] for i in range(0, len(tasks), max(1, int(chunk_size)))]
+
+    # dst -> crop source for this run; a crop is only reused if it was cut from the same image + bbox.
+    sources = {c[4]: _crop_source(name, c) for name, crops in tasks for c in crops}
+
+    def _sub_ledger(chunk: List[ImageTask]) -> Dict[str, Tuple[int, str]]:
+        out: Dict[str, Tuple[int, str]] = {}
+        for _, crops in chunk:
+            for c in crops:
+                entry = ledger.get(c[4])
+                if entry is not None and entry[2] == sources[c[4]]:
+                    out[c[4]] = (entry[0], entry[1])
+        return out
+
+    done = 0
+    n_written = 0
+    n_skipped = 0
+    t0 = time.perf_counter()
+    last_print = t0
+    ledger_path.parent.mkdir(parents=True, exist_ok=True)
+    with ledger_path.open("a", encoding="utf-8") as ledger_fp:
+
+        def _consume(written: List[Tuple[str, int, str]], skipped: int) -> None:
+            nonlocal done, n_written, n_skipped, last_print
+            for dst_s, size, digest in written:
+                rec = {"dst": dst_s, "src": sources[dst_s], "size": size, "blake2b": digest, "opts": fingerprint}
+                ledger_fp.write(json.dumps(rec) + "\n")
+            ledger_fp.flush()
+            n_written += len(written)
+            n_skipped += int(skipped)
+            done += len(written) + int(skipped)
+            now = time.perf_counter()
+            if now - last_print >= 5.0 or done >= total:
+                last_print = now
+                rate = n_written / max(1e-9, now - t0)
+                eta = f"{(total - done) / rate / 60.0:.1f} min" if rate > 0 else "n/a"
+                print(
+                    f"crops {done}/{total} (written={n_written} skipped={n_skipped}) "
+                    f"{rate:.1f} crops/s eta={eta}"
+                )
+
+        if int(workers) <= 1:
+            for chunk in chunks:
+                _consume(*write_crop_chunk(chunk, opts, _sub_ledger(chunk)))
+        else:
+            with ProcessPoolExecutor(max_workers=int(workers)) as ex:
+                futs = [ex.submit(write_crop_chunk, chunk, opts, _sub_ledger(chunk)) for chunk in chunks]
+                for fut in as_completed(futs):
+                    _consume(*fut.result())
+
+    elapsed = time.perf_counter() - t0
+    return {
+        "crops_total": total,
+        "crops_written": n_written,
+        "crops_skipped": n_skipped,
+        "source_images": len(tasks),
+        "workers": int(workers),
+        "elapsed_sec": float(elapsed),
+        "crops_per_sec": float(n_written / elapsed) if elapsed > 0 else 0.0,
+        "ledger": str(ledger_path),
+    }
+
+
 def main() -> int:
     ap = argparse.ArgumentParser(description="Build a separate high-quality ExpW manifest + optional face crops")
     ap.add_argument(
@@ -196,6 +391,28 @@ def main() -> int:
         default=0.0,
         help="Pad bbox by this fraction of bbox size before cropping (e.g., 0.10 adds 10% context).",
     )
+    ap.add_argument(
+        "--workers",
+        type=int,
+        default=0,
+        help="Processes for writing crops (0 = os.cpu_count(), 1 = in-process).",
+    )
+    ap.add_argument(
+        "--chunk-size",
+        type=int,
+        default=64,
+        help="Source images per worker task when writing crops.",
+    )
+    ap.add_argument(
+        "--verify",
+        type=str,
+        choices=["size", "hash", "none"],
+        default="size",
+        help=(
+            "Resume check for crops already written (recorded in <out-dataset>/_import_ledger.jsonl): "
+            "size (fast), hash (blake2b), or none (rewrite everything)."
+        ),
+    )
     ap.add_argument(
         "--absolute-paths",
         action="store_true",
@@ -262,8 +479,8 @@ def main() -> int:
     manifest_rows: List[dict] = []
     name_counters: Dict[str, int] = defaultdict(int)
 
-    processed = 0
-    written = 0
+    # Crop tasks grouped by source image so each image is decoded once, in first-seen order.
+    crop_tasks: Dict[str, List[CropTask]] = {}
 
     for i, r in enumerate(kept):
         split = split_for_index.get(i, "train")
@@ -271,36 +488,13 @@ def main() -> int:
         src = images_dir / r.image_name
 
         if args.write_crops:
-            with Image.open(src) as im:
-                im = im.convert("RGB")
-                w, h = im.size
-                top, left, right, bottom = clamp_bbox(r.top, r.left, r.right, r.bottom, w=w, h=h)
-                top, left, right, bottom = pad_bbox(
-                    top,
-                    left,
-                    right,
-                    bottom,
-                    w=w,
-                    h=h,
-                    pad_ratio=args.bbox_pad_ratio,
-                )
-                face = im.crop((left, top, right, bottom))
-
             stem = Path(r.image_name).stem
             key = f"{stem}_f{r.face_id}"
             name_counters[key] += 1
             suffix = name_counters[key]
             out_name = f"{key}_{suffix:02d}.jpg"
             dst = out_dataset_dir / split / label / out_name
-            dst.parent.mkdir(parents=True, exist_ok=True)
-            face.save(
-                dst,
-                format="JPEG",
-                quality=int(args.jpeg_quality),
-                subsampling=int(args.jpeg_subsampling),
-                optimize=True,
-            )
-            written += 1
+            crop_tasks.setdefault(r.image_name, []).append((r.top, r.left, r.right, r.bottom, str(dst)))
             rel_image_path = dst.relative_to(args.out_root).as_posix()
         else:
             # No crops written: point manifest at original image file.
@@ -324,9 +518,21 @@ def main() -> int:
         )
         counts[f"{split}|{label}"] += 1
 
-        processed += 1
-        if args.write_crops and (processed % 5000 == 0):
-            print(f"processed {processed}/{len(kept)} (written={written})")
+    crop_stats: Optional[Dict[str, object]] = None
+    if args.write_crops:
+        crop_stats = write_crops_parallel(
+            list(crop_tasks.items()),
+            CropOptions(
+                images_dir=str(images_dir),
+                pad_ratio=float(args.bbox_pad_ratio),
+                jpeg_quality=int(args.jpeg_quality),
+                jpeg_subsampling=int(args.jpeg_subsampling),
+                verify=str(args.verify),
+            ),
+            ledger_path=out_dataset_dir / "_import_ledger.jsonl",
+            workers=int(args.workers) or (os.cpu_count() or 1),
+            chunk_size=int(args.chunk_size),
+        )
 
     args.manifest.parent.mkdir(parents=True, exist_ok=True)
     with args.manifest.open("w", newline="", encoding="utf-8") as fp:
@@ -364,6 +570,7 @@ def main() -> int:
         "split_fracs": {"train": args.train_frac, "val": args.val_frac, "test": max(0.0, 1.0 - args.train_frac - args.val_frac)},
         "seed": args.seed,
         "counts": dict(sorted(counts.items())),
+        "crops": crop_stats,
     }
 
     args.report.parent.mkdir(parents=True, exist_ok=True)
@@ -0,0 +1,159 @@
+"""Multi-process CPU (gloo) smoke benchmark for the DDP training mode.
+
+Runs the teacher's training step (TeacherNet ArcFace forward, CE, backward with
+DDP gradient all-reduce, AdamW step) on synthetic batches at 1..N processes, and reports
+throughput and scaling efficiency = throughput(N) / (N * throughput(1)).
+Per-process batch size is fixed (as with torchrun), so the global batch grows with N.
+
+Usage (PowerShell):
+  .\.venv\Scripts\python.exe tools\diagnostics\bench_ddp_scaling.py --procs 1,2,4
+  .\.venv\Scripts\python.exe tools\diagnostics\bench_ddp_scaling.py --model convnext_tiny --image-size 128 --procs 1,2 --out outputs\bench_ddp.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import socket
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(REPO_ROOT))
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return int(s.getsockname()[1])
+
+
+def _worker(rank: int, world_size: int, port: int, cfg: Dict[str, object], result_path: str) -> None:
+    os.environ.update(
+        {
+            "WORLD_SIZE": str(world_size),
+            "RANK": str(rank),
+            "LOCAL_RANK": str(rank),
+            "MASTER_ADDR": "127.0.0.1",
+            "MASTER_PORT": str(port),
+        }
+    )
+    import torch
+    import torch.nn.functional as F
+    from torch.nn.parallel import DistributedDataParallel
+
+    from scripts.train_teacher import TeacherNet
+    from src.fer.utils.distributed import barrier, init_distributed
+
+    torch.set_num_threads(int(cfg["threads"]))
+    info = init_distributed(backend="gloo")
+    torch.manual_seed(1337 + rank)
+
+    model = TeacherNet(
+        model_name=str(cfg["model"]),
+        num_classes=7,
+        embed_dim=int(cfg["embed_dim"]),
+        arc_s=30.0,
+        arc_m=0.35,
+        pretrained=False,
+    )
+    train_model = DistributedDataParallel(model, find_unused_parameters=True) if info.enabled else model
+    opt = torch.optim.AdamW(model.parameters(), lr=1e-4)
+
+    bs = int(cfg["batch_size"])
+    size = int(cfg["image_size"])
+    x = torch.randn(bs, 3, size, size)
+    y = torch.randint(0, 7, (bs,))
+
+    def _step() -> None:
+        logits = train_model(x, y, margin=0.2)
+        loss = F.cross_entropy(logits, y)
+        opt.zero_grad(set_to_none=True)
+        loss.backward()
+        opt.step()
+
+    model.train()
+    for _ in range(int(cfg["warmup"])):
+        _step()
+    barrier(info)
+    t0 = time.perf_counter()
+    for _ in range(int(cfg["steps"])):
+        _step()
+    barrier(info)
+    elapsed = time.perf_counter() - t0
+
+    if info.is_main:
+        Path(result_path).write_text(json.dumps({"elapsed_sec": elapsed}), encoding="utf-8")
+
+
+def _run(world_size: int, cfg: Dict[str, object], tmp_dir: Path) -> float:
+    import torch.multiprocessing as mp
+
+    # world_size=1 is the plain single-process baseline (init_distributed is a no-op).
+    result_path = tmp_dir / f"bench_ddp_{world_size}.json"
+    mp.start_processes(
+        _worker,
+        args=(world_size, _free_port(), cfg, str(result_path)),
+        nprocs=world_size,
+        start_method="spawn",
+    )
+    return float(json.loads(result_path.read_text(encoding="utf-8"))["elapsed_sec"])
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="CPU/gloo DDP scaling smoke benchmark (teacher training step).")
+    ap.add_argument("--procs", type=str, default="1,2", help="Comma-separated process counts (default: 1,2)")
+    ap.add_argument("--model", type=str, default="resnet18")
+    ap.add_argument("--image-size", type=int, default=96)
+    ap.add_argument("--embed-dim", type=int, default=512)
+    ap.add_argument("--batch-size", type=int, default=16, help="Per-process batch size")
+    ap.add_argument("--steps", type=int, default=10)
+    ap.add_argument("--warmup", type=int, default=2)
+    ap.add_argument(
+        "--threads",
+        type=int,
+        default=0,
+        help="torch threads per process (0 = cpu_count // max(procs), same for every run)",
+    )
+    ap.add_argument("--out", type=Path, default=None, help="Optional JSON report path")
+    args = ap.parse_args()
+
+    procs = sorted({int(p) for p in args.procs.split(",") if p.strip()})
+    if not procs or procs[0] < 1:
+        raise SystemExit("--procs must list positive integers")
+    threads = int(args.threads) or max(1, (os.cpu_count() or 1) // procs[-1])
+    cfg: Dict[str, object] = {
+        "model": str(args.model),
+        "image_size": int(args.image_size),
+        "embed_dim": int(args.embed_dim),
+        "batch_size": int(args.batch_size),
+        "steps": int(args.steps),
+        "warmup": int(args.warmup),
+        "threads": threads,
+    }
+    rows: List[Dict[str, float]] = []
+    base_thr = None
+    for n in procs:
+        with tempfile.TemporaryDirectory() as tmp:
+            elapsed = _run(n, cfg, Path(tmp))
+        thr = float(n * int(args.batch_size) * int(args.steps)) / max(1e-9, elapsed)
+        if n == 1:
+            base_thr = thr
+        eff = (thr / (n * base_thr)) if base_thr else None
+        rows.append({"procs": n, "elapsed_sec": elapsed, "img_per_sec": thr, "efficiency": eff})  # type: ignore[dict-item]
+        eff_s = "-" if eff is None else f"{eff:.2f}"
+        print(f"procs={n} threads/proc={threads} | {elapsed:.2f}s | {thr:.1f} img/s | efficiency {eff_s}")
+
+    if args.out is not None:
+        args.out.parent.mkdir(parents=True, exist_ok=True)
+        args.out.write_text(json.dumps({"config": cfg, "results": rows}, indent=2), encoding="utf-8")
+        print(f"Wrote: {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,148 @@
+"""Benchmark demo startup: import cost (-X importtime) and time-to-first-frame.
+
+Each repeat runs a fresh interpreter with `-X importtime` that imports the demo module,
+optionally loads a model through the demo's own loader and classifies one synthetic
+face crop. Reported per run (median over --repeats):
+- wall_sec: process spawn -> first inferred frame (includes interpreter startup)
+- import_sec / load_sec / first_infer_sec: phases measured inside the child
+- importtime: total import time and the slowest top-level imports (by cumulative time)
+
+Usage (PowerShell):
+  .\.venv\Scripts\python.exe tools\diagnostics\bench_demo_startup.py
+  .\.venv\Scripts\python.exe tools\diagnostics\bench_demo_startup.py --target mvp
+  .\.venv\Scripts\python.exe tools\diagnostics\bench_demo_startup.py --model-kind student --model-ckpt outputs\students\RUN\best.pt --out outputs\startup_bench.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+
+_MARKER = "__STARTUP_BENCH__"
+
+_CHILD = r"""
+import json, sys, time
+t0 = time.perf_counter()
+sys.path.insert(0, {repo!r})
+sys.argv = ["bench"]
+import importlib
+mod = importlib.import_module({module!r})
+t_import = time.perf_counter()
+kind, ckpt = {kind!r}, {ckpt!r}
+t_load = t_import
+t_infer = t_import
+if kind != "none":
+    from pathlib import Path
+    import numpy as np
+    rd = importlib.import_module("demo.realtime_demo")
+    if kind == "teacher":
+        infer, _meta = rd._load_teacher_from_checkpoint(Path(ckpt), prefer_device="cpu")
+    elif ckpt.lower().endswith(".onnx"):
+        infer, _meta = rd._load_student_from_onnx(Path(ckpt))
+    else:
+        infer, _meta = rd._load_student_from_checkpoint(Path(ckpt), prefer_device="cpu")
+    t_load = time.perf_counter()
+    crop = np.random.default_rng(0).integers(0, 256, size=(160, 140, 3), dtype=np.uint8)
+    infer(crop)
+    t_infer = time.perf_counter()
+print({marker!r} + json.dumps({{
+    "import_sec": t_import - t0,
+    "load_sec": t_load - t_import,
+    "first_infer_sec": t_infer - t_load,
+    "modules": len(sys.modules),
+}}), flush=True)
+"""
+
+
+def parse_importtime(stderr: str) -> Tuple[float, List[Tuple[str, float]]]:
+    """(total seconds, [(top-level module, cumulative seconds)]) from -X importtime output."""
+    top: List[Tuple[str, float]] = []
+    for ln in stderr.splitlines():
+        if not ln.startswith("import time:"):
+            continue
+        parts = ln[len("import time:") :].split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2]
+        # Nested imports are indented under their importer; only count outermost ones.
+        if name.startswith(" ") and not name.startswith("  "):
+            top.append((name.strip(), int(parts[1]) / 1e6))
+    return sum(sec for _, sec in top), sorted(top, key=lambda t: t[1], reverse=True)
+
+
+def run_once(module: str, kind: str, ckpt: Optional[str]) -> Dict[str, object]:
+    code = _CHILD.format(repo=str(REPO_ROOT), module=module, kind=kind, ckpt=ckpt or "", marker=_MARKER)
+    t0 = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True, cwd=str(REPO_ROOT)
+    )
+    wall = time.perf_counter() - t0
+    lines = [ln for ln in proc.stdout.splitlines() if ln.startswith(_MARKER)]
+    if proc.returncode != 0 or not lines:
+        tail = "\n".join(ln for ln in proc.stderr.splitlines() if not ln.startswith("import time:"))[-2000:]
+        raise SystemExit(f"Benchmark child failed (rc={proc.returncode}):\n{tail}")
+    rec: Dict[str, object] = json.loads(lines[-1][len(_MARKER) :])
+    total, top = parse_importtime(proc.stderr)
+    rec.update({"wall_sec": wall, "importtime_total_sec": total, "top_imports": top[:15]})
+    return rec
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Benchmark demo import time and time-to-first-frame.")
+    ap.add_argument("--target", type=str, choices=["realtime", "mvp"], default="realtime")
+    ap.add_argument("--model-kind", type=str, choices=["none", "student", "teacher"], default="none")
+    ap.add_argument("--model-ckpt", type=Path, default=None, help="Student .pt/.onnx or teacher .pt")
+    ap.add_argument("--repeats", type=int, default=3)
+    ap.add_argument("--out", type=Path, default=None, help="Optional JSON report")
+    args = ap.parse_args()
+
+    if args.model_kind != "none" and args.model_ckpt is None:
+        raise SystemExit("--model-ckpt is required with --model-kind student/teacher")
+    module = "demo.realtime_demo" if args.target == "realtime" else "demo.mvp_demo"
+    ckpt = str(args.model_ckpt.resolve()) if args.model_ckpt is not None else None
+
+    runs = [run_once(module, str(args.model_kind), ckpt) for _ in range(max(1, int(args.repeats)))]
+
+    def _med(key: str) -> float:
+        return float(statistics.median(float(r[key]) for r in runs))  # type: ignore[arg-type]
+
+    report = {
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "target": module,
+        "model_kind": str(args.model_kind),
+        "model_ckpt": ckpt,
+        "repeats": len(runs),
+        "wall_sec": _med("wall_sec"),
+        "import_sec": _med("import_sec"),
+        "load_sec": _med("load_sec"),
+        "first_infer_sec": _med("first_infer_sec"),
+        "importtime_total_sec": _med("importtime_total_sec"),
+        "modules": int(runs[-1]["modules"]),  # type: ignore[arg-type]
+        "top_imports": runs[-1]["top_imports"],
+    }
+
+    print(f"{module} (model={args.model_kind}, median of {len(runs)}):")
+    print(
+        f"  time-to-first-frame {report['wall_sec']:.2f}s | import {report['import_sec']:.2f}s | "
+        f"load {report['load_sec']:.2f}s | first infer {report['first_infer_sec']:.3f}s | {report['modules']} modules"
+    )
+    print("  slowest top-level imports (cumulative):")
+    for name, sec in report["top_imports"][:8]:  # type: ignore[index]
+        print(f"    {sec:7.3f}s  {name}")
+    if args.out is not None:
+        args.out.parent.mkdir(parents=True, exist_ok=True)
+        args.out.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
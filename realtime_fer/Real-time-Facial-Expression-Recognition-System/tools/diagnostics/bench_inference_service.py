@@ -0,0 +1,216 @@
+"""Load-test scripts/serve_inference.py: throughput and tail latency vs. client concurrency.
+
+For each --concurrency level, that many client threads (one keep-alive connection each)
+send face crops in a closed loop for --duration seconds. Reported per level: requests/s,
+latency mean/p50/p95/p99 (client side, includes transport) and the server's batch-size
+statistics for that level (GET /stats, reset between levels). Failed requests are counted
+under "errors" and excluded from the throughput and latency figures.
+
+Point it at a running server with --url, or let it start one with --serve-ckpt (the
+--max-batch/--max-wait-ms/--threads flags are then passed to the server).
+
+Usage (PowerShell):
+  .\.venv\Scripts\python.exe tools\diagnostics\bench_inference_service.py --url http://127.0.0.1:8765
+  .\.venv\Scripts\python.exe tools\diagnostics\bench_inference_service.py --serve-ckpt outputs\students\RUN\best.pt --concurrency 1,2,4,8,16,32 --max-wait-ms 4 --out outputs\service_bench.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(REPO_ROOT))
+
+from src.fer.inference.service import DEFAULT_URL, InferenceClient  # noqa: E402
+
+
+def _start_server(args: argparse.Namespace) -> subprocess.Popen:
+    cmd = [
+        sys.executable,
+        str(REPO_ROOT / "scripts" / "serve_inference.py"),
+        "--model-ckpt",
+        str(args.serve_ckpt),
+        "--port",
+        str(args.port),
+        "--max-batch",
+        str(args.max_batch),
+        "--max-wait-ms",
+        str(args.max_wait_ms),
+        "--threads",
+        str(args.threads),
+        "--device",
+        str(args.device),
+    ]
+    proc = subprocess.Popen(cmd, cwd=str(REPO_ROOT))
+    client = InferenceClient(f"http://127.0.0.1:{args.port}", timeout=2.0)
+    deadline = time.time() + float(args.startup_timeout)
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"Server exited during startup (rc={proc.returncode}).")
+        try:
+            client.meta()
+            return proc
+        except Exception:
+            time.sleep(0.25)
+    proc.terminate()
+    raise SystemExit(f"Server did not come up within {args.startup_timeout}s.")
+
+
+def run_level(
+    url: str, *, concurrency: int, duration: float, warmup: int, crops: List[np.ndarray]
+) -> Dict[str, object]:
+    latencies: List[List[float]] = [[] for _ in range(concurrency)]  # successful requests only
+    errors = [0] * concurrency
+    warmup_errors = [0] * concurrency
+    client_timeout = 10.0
+    # ready: all clients connected and warmed up; go: server stats reset, clock started.
+    # The timeout only guards against a stuck client; warmup requests are individually bounded.
+    barrier_timeout = client_timeout * (int(warmup) + 1) + 30.0
+    ready = threading.Barrier(concurrency + 1, timeout=barrier_timeout)
+    go = threading.Barrier(concurrency + 1, timeout=barrier_timeout)
+    t_end = [0.0]
+
+    def worker(i: int) -> None:
+        client = InferenceClient(url, timeout=client_timeout)
+        try:
+            for k in range(warmup):
+                try:
+                    client.infer(crops[(i + k) % len(crops)])
+                except Exception:
+                    warmup_errors[i] += 1
+            ready.wait()
+            go.wait()
+            k = 0
+            while time.perf_counter() < t_end[0]:
+                crop = crops[(i * 7 + k) % len(crops)]
+                k += 1
+                t0 = time.perf_counter()
+                try:
+                    client.infer(crop)
+                except Exception:
+                    errors[i] += 1
+                    continue
+                latencies[i].append(time.perf_counter() - t0)
+        except threading.BrokenBarrierError:
+            pass
+        except BaseException:
+            # Never leave the other threads waiting on a barrier this one will not reach.
+            ready.abort()
+            go.abort()
+            raise
+        finally:
+            client.close()
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    for th in threads:
+        th.start()
+    try:
+        ready.wait()
+        InferenceClient(url).stats(reset=True)
+        t0 = time.perf_counter()
+        t_end[0] = t0 + float(duration)
+        go.wait()
+    except BaseException as e:
+        ready.abort()
+        go.abort()
+        if isinstance(e, threading.BrokenBarrierError):
+            raise RuntimeError(f"concurrency {concurrency}: a client thread failed or timed out before the run") from e
+        raise
+    for th in threads:
+        th.join()
+    wall = time.perf_counter() - t0
+    server_stats = InferenceClient(url).stats(reset=True)
+
+    ms = np.concatenate([np.asarray(v, dtype=np.float64) for v in latencies]) * 1000.0
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99]) if ms.size else (0.0, 0.0, 0.0)
+    return {
+        "concurrency": int(concurrency),
+        "requests": int(ms.size),
+        "errors": int(sum(errors)),
+        "warmup_errors": int(sum(warmup_errors)),
+        "wall_sec": round(wall, 3),
+        "throughput_rps": round(ms.size / wall, 2) if wall > 0 else 0.0,
+        "latency_ms": {
+            "mean": round(float(ms.mean()), 3) if ms.size else 0.0,
+            "p50": round(float(p50), 3),
+            "p95": round(float(p95), 3),
+            "p99": round(float(p99), 3),
+        },
+        "server": server_stats,
+    }
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Throughput / tail latency of the FER inference service.")
+    ap.add_argument("--url", type=str, default=None, help=f"Running server (default {DEFAULT_URL}).")
+    ap.add_argument("--serve-ckpt", type=Path, default=None, help="Start scripts/serve_inference.py with this model.")
+    ap.add_argument("--port", type=int, default=8765, help="Port for --serve-ckpt.")
+    ap.add_argument("--max-batch", type=int, default=16, help="Server setting for --serve-ckpt.")
+    ap.add_argument("--max-wait-ms", type=float, default=3.0, help="Server setting for --serve-ckpt.")
+    ap.add_argument("--threads", type=int, default=0, help="Server setting for --serve-ckpt.")
+    ap.add_argument("--device", type=str, default="auto", choices=["auto", "cpu", "cuda", "dml"])
+    ap.add_argument("--startup-timeout", type=float, default=120.0)
+    ap.add_argument("--concurrency", type=str, default="1,2,4,8,16", help="Comma-separated client thread counts.")
+    ap.add_argument("--duration", type=float, default=5.0, help="Seconds per concurrency level.")
+    ap.add_argument("--warmup", type=int, default=3, help="Untimed requests per client before each level.")
+    ap.add_argument("--crop-size", type=int, default=160, help="Crop side in pixels (demo crops are ~100-250 px).")
+    ap.add_argument("--out", type=Path, default=None, help="Optional JSON report")
+    args = ap.parse_args()
+
+    proc: Optional[subprocess.Popen] = None
+    if args.serve_ckpt is not None:
+        proc = _start_server(args)
+        url = f"http://127.0.0.1:{args.port}"
+    else:
+        url = str(args.url or DEFAULT_URL)
+
+    rng = np.random.default_rng(0)
+    s = int(args.crop_size)
+    crops = [rng.integers(0, 256, size=(s + (i % 5) * 4, s, 3), dtype=np.uint8) for i in range(16)]
+    levels: List[Dict[str, object]] = []
+    try:
+        meta = InferenceClient(url).meta()
+        print(
+            f"{url}: {meta.get('model')} ({meta.get('device')}) | max batch {meta.get('max_batch')}, "
+            f"max wait {meta.get('max_wait_ms')} ms"
+        )
+        for c in (int(v) for v in str(args.concurrency).split(",") if v.strip()):
+            res = run_level(url, concurrency=c, duration=float(args.duration), warmup=int(args.warmup), crops=crops)
+            levels.append(res)
+            lat = res["latency_ms"]
+            srv = res["server"]
+            print(
+                f"  c={c:3d}: {res['throughput_rps']:8.2f} req/s | p50 {lat['p50']:8.2f} ms | p95 {lat['p95']:8.2f} | "  # type: ignore[index]
+                f"p99 {lat['p99']:8.2f} | mean batch {srv.get('mean_batch', 0)} | errors {res['errors']}"  # type: ignore[union-attr, index]
+            )
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=30)
+
+    if args.out is not None:
+        report = {
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "url": url,
+            "model": meta,
+            "crop_size": s,
+            "duration_sec": float(args.duration),
+            "levels": levels,
+        }
+        args.out.parent.mkdir(parents=True, exist_ok=True)
+        args.out.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
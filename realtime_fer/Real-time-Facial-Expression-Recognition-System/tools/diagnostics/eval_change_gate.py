@@ -0,0 +1,300 @@
+"""Trade-off of change-gated inference skipping (realtime_demo --skip-threshold) on a recording.
+
+One pass over the video runs detection and the full model on every frame (batched) and
+keeps each face crop's 16x16 grayscale signature. Then, for every
+--thresholds x --max-stales setting, ChangeGatedInfer is replayed on those signatures
+(identical decisions to the live gate, no extra model calls), the demo smoothing is
+applied and the result is written as a per_frame.csv and scored with
+scripts/score_live_results.py (transition-fair accuracy, jitter flips/min).
+
+Reported per setting: skip fraction (share of model calls saved), accuracy / jitter and
+their delta vs. threshold 0, and agreement of the smoothed labels with threshold 0.
+Accuracy needs manual labels: pass the events.csv of a labeled live session recorded to
+this video via --manual-events (same convention as scripts/process_video_offline.py).
+
+Usage (PowerShell):
+  .\.venv\Scripts\python.exe tools\diagnostics\eval_change_gate.py --video recordings\session1.mp4 --manual-events demo\outputs\RUN\events.csv
+  .\.venv\Scripts\python.exe tools\diagnostics\eval_change_gate.py --video recordings\session1.mp4 --thresholds 0.005,0.01,0.02,0.04 --max-stales 2,5,10 --out-dir outputs\change_gate
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import cv2  # type: ignore
+import numpy as np
+
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(REPO_ROOT))
+
+import demo.realtime_demo as rd  # noqa: E402
+from scripts.process_video_offline import _manual_label_at, _read_manual_events  # noqa: E402
+from scripts.score_live_results import _score_file  # noqa: E402
+from src.fer.inference.labels import CANONICAL_7  # noqa: E402
+from src.fer.realtime.change_gate import ChangeGatedInfer, crop_signature  # noqa: E402
+from src.fer.realtime.smoothing import TemporalSmoother  # noqa: E402
+from src.fer.realtime.sources import open_source  # noqa: E402
+
+
+def _floats(spec: str) -> List[float]:
+    return [float(v) for v in str(spec).split(",") if v.strip()]
+
+
+def collect(
+    cap, *, detector: "rd.FaceDetector", infer_batch, max_frames: int, chunk: int, size: int
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Every frame: (has_face [N], probs [N, 7], uint8 signatures [N, size, size])."""
+    has_face: List[bool] = []
+    sigs: List[np.ndarray] = []
+    probs: List[np.ndarray] = []
+    pending: List[np.ndarray] = []
+    empty_sig = np.zeros((size, size), dtype=np.uint8)
+
+    def flush() -> None:
+        if pending:
+            probs.append(np.asarray(infer_batch(pending)[1], dtype=np.float64))
+            pending.clear()
+
+    n = 0
+    while not max_frames or n < max_frames:
+        ok, frame = cap.read()
+        if not ok:
+            break
+        n += 1
+        box = rd._largest_face(detector.detect(frame))
+        has_face.append(box is not None)
+        if box is None:
+            sigs.append(empty_sig)
+            continue
+        crop = rd._crop_with_margin(frame, box)
+        # crop_signature yields whole numbers (uint8 resize), so uint8 storage is lossless.
+        sigs.append(crop_signature(crop, size=size).astype(np.uint8))
+        pending.append(crop)
+        if len(pending) >= chunk:
+            flush()
+    flush()
+
+    mask = np.asarray(has_face, dtype=bool)
+    full = np.zeros((mask.size, len(CANONICAL_7)), dtype=np.float64)
+    if probs:
+        full[mask] = np.concatenate(probs)
+    return mask, full, np.stack(sigs) if sigs else np.zeros((0, size, size), dtype=np.uint8)
+
+
+def replay(
+    has_face: np.ndarray,
+    probs: np.ndarray,
+    sigs: np.ndarray,
+    *,
+    threshold: float,
+    max_stale: int,
+    params: "rd.Params",
+) -> Tuple[np.ndarray, List[Optional[int]], Dict[str, object]]:
+    """Gate + demo smoothing over precomputed per-frame probabilities."""
+    cur = [0]
+    # The stored signature stands in for the crop: a size x size gray image is its own signature.
+    gate = ChangeGatedInfer(
+        lambda _sig: ([], probs[cur[0]].tolist()), threshold=threshold, max_stale=max_stale, size=sigs.shape[-1]
+    )
+    smoother = TemporalSmoother(len(CANONICAL_7), vote_window=params.vote_window)
+    out = np.zeros_like(probs)
+    preds: List[Optional[int]] = []
+    for i in range(has_face.size):
+        if not has_face[i]:
+            gate.reset()
+            preds.append(None)
+            continue
+        cur[0] = i
+        _logits, p = gate(sigs[i])
+        out[i] = p
+        preds.append(
+            smoother.update(
+                p,
+                ema_alpha=params.ema_alpha,
+                hysteresis_delta=params.hysteresis_delta,
+                vote_window=params.vote_window,
+                vote_min_count=params.vote_min_count,
+            )
+        )
+    return out, preds, gate.stats()
+
+
+def _write_per_frame(
+    path: Path,
+    *,
+    probs: np.ndarray,
+    preds: List[Optional[int]],
+    fps: float,
+    manual_events,
+    detector: str,
+    model_meta: Dict[str, object],
+) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(
+            f,
+            fieldnames=[
+                "frame_index",
+                "time_sec",
+                "manual_label",
+                "pred_label",
+                *[f"prob_{name}" for name in CANONICAL_7],
+                "detector",
+                "model",
+                "ckpt",
+            ],
+        )
+        w.writeheader()
+        for i, pred_idx in enumerate(preds):
+            w.writerow(
+                {
+                    "frame_index": i,
+                    "time_sec": f"{i / fps:.6f}",
+                    "manual_label": _manual_label_at(manual_events, i),
+                    "pred_label": CANONICAL_7[pred_idx] if pred_idx is not None else "(unstable)",
+                    **{f"prob_{name}": f"{float(probs[i, k]):.6f}" for k, name in enumerate(CANONICAL_7)},
+                    "detector": detector,
+                    "model": model_meta.get("model"),
+                    "ckpt": model_meta.get("ckpt"),
+                }
+            )
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Accuracy / jitter / compute trade-off of change-gated inference.")
+    ap.add_argument("--video", type=str, required=True, help="Video file (or 'synthetic[:WxH]' with --max-frames).")
+    ap.add_argument("--model-ckpt", type=Path, default=None, help="Student .pt or float-input .onnx (default: best).")
+    ap.add_argument("--temperature", type=float, default=None)
+    ap.add_argument("--temperature-json", type=Path, default=None)
+    ap.add_argument("--device", type=str, default="auto", choices=["auto", "cpu", "cuda", "dml"])
+    ap.add_argument("--detector", type=str, choices=["yunet", "dnn", "haar"], default="yunet")
+    ap.add_argument("--max-frames", type=int, default=0)
+    ap.add_argument("--batch", type=int, default=32, help="Crops per model call in the collection pass.")
+    ap.add_argument("--thresholds", type=str, default="0.005,0.01,0.02,0.03,0.05")
+    ap.add_argument("--max-stales", type=str, default="2,5,10")
+    ap.add_argument("--thresholds-json", type=Path, default=None, help="Demo thresholds.json (smoothing params).")
+    ap.add_argument("--manual-events", type=Path, default=None, help="events.csv of a labeled session of this video.")
+    ap.add_argument("--min-hold-ms", type=float, default=600.0)
+    ap.add_argument("--exclusion-ms", type=float, default=250.0)
+    ap.add_argument(
+        "--out-dir",
+        type=Path,
+        default=REPO_ROOT / "outputs" / "change_gate" / time.strftime("%Y%m%d_%H%M%S"),
+    )
+    args = ap.parse_args()
+
+    ckpt_path: Optional[Path] = args.model_ckpt or rd._find_best_student_ckpt()
+    if ckpt_path is None or not ckpt_path.exists():
+        raise SystemExit(f"Checkpoint not found: {ckpt_path}")
+    infer_batch, model_meta = rd._load_student_batch(
+        ckpt_path, temperature=args.temperature, temperature_json=args.temperature_json, prefer_device=str(args.device)
+    )
+    detector = rd.FaceDetector(args.detector, model_dir=REPO_ROOT / "demo" / "models")
+
+    params = rd.Params()
+    if args.thresholds_json is not None:
+        th = json.loads(args.thresholds_json.read_text(encoding="utf-8"))
+        params.ema_alpha = float(th.get("ema_alpha", params.ema_alpha))
+        params.hysteresis_delta = float(th.get("hysteresis_delta", params.hysteresis_delta))
+        params.vote_window = int(th.get("vote_window", params.vote_window))
+        params.vote_min_count = int(th.get("vote_min_count", params.vote_min_count))
+    manual_events = _read_manual_events(args.manual_events) if args.manual_events is not None else []
+
+    cap, input_name = open_source(str(args.video), synthetic_frames=int(args.max_frames))
+    if not cap.isOpened():
+        raise SystemExit(f"Failed to open video: {args.video}")
+    fps = float(cap.get(cv2.CAP_PROP_FPS) or 0.0) or 30.0
+    t0 = time.perf_counter()
+    has_face, probs, sigs = collect(
+        cap, detector=detector, infer_batch=infer_batch, max_frames=int(args.max_frames), chunk=int(args.batch), size=16
+    )
+    cap.release()
+    print(f"{input_name}: {has_face.size} frames, {int(has_face.sum())} with a face ({time.perf_counter() - t0:.1f}s)")
+
+    # Threshold 0 (infer every frame) is the reference for the deltas.
+    stales = [int(v) for v in _floats(args.max_stales)]
+    settings = [(0.0, 0)] + [(t, k) for t in _floats(args.thresholds) if t > 0 for k in stales]
+    out_dir: Path = args.out_dir
+    rows: List[Dict[str, object]] = []
+    base_preds: List[Optional[int]] = []
+    for thr, stale in settings:
+        gated, preds, gstats = replay(has_face, probs, sigs, threshold=thr, max_stale=stale, params=params)
+        if thr == 0.0:
+            base_preds = preds
+        per_frame = out_dir / f"thr{thr:g}_stale{stale}" / "per_frame.csv"
+        _write_per_frame(
+            per_frame,
+            probs=gated,
+            preds=preds,
+            fps=fps,
+            manual_events=manual_events,
+            detector=args.detector,
+            model_meta=model_meta,
+        )
+        score = _score_file(per_frame, float(args.min_hold_ms), float(args.exclusion_ms)) or {}
+        agree = [a == b for a, b in zip(preds, base_preds) if a is not None or b is not None]
+        rows.append(
+            {
+                "threshold": thr,
+                "max_stale": stale,
+                "skip_fraction": gstats["skip_fraction"],
+                "inferred": gstats["inferred"],
+                "accuracy": (score.get("scored") or {}).get("accuracy"),  # type: ignore[union-attr]
+                "scored_frames": (score.get("scored") or {}).get("scored_frames"),  # type: ignore[union-attr]
+                "jitter_flips_per_min": score.get("jitter_flips_per_min"),
+                "label_agreement_vs_ungated": round(float(np.mean(agree)), 4) if agree else None,
+                "mean_abs_prob_diff": round(float(np.abs(gated - probs)[has_face].mean()), 6) if has_face.any() else 0.0,
+                "per_frame": str(per_frame),
+            }
+        )
+
+    base = rows[0]
+    for r in rows:
+        for key in ("accuracy", "jitter_flips_per_min"):
+            if r[key] is not None and base[key] is not None:
+                r[f"delta_{key}"] = round(float(r[key]) - float(base[key]), 4)  # type: ignore[arg-type]
+
+    with (out_dir / "change_gate_tradeoff.csv").open("w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=list(rows[-1].keys()), extrasaction="ignore")
+        w.writeheader()
+        w.writerows(rows)
+    (out_dir / "change_gate_tradeoff.json").write_text(
+        json.dumps(
+            {
+                "input": input_name,
+                "model": model_meta,
+                "frames": int(has_face.size),
+                "face_frames": int(has_face.sum()),
+                "manual_events": str(args.manual_events) if args.manual_events else None,
+                "smoothing": {
+                    "ema_alpha": params.ema_alpha,
+                    "hysteresis_delta": params.hysteresis_delta,
+                    "vote_window": params.vote_window,
+                    "vote_min_count": params.vote_min_count,
+                },
+                "settings": rows,
+            },
+            indent=2,
+        ),
+        encoding="utf-8",
+    )
+
+    print(f"{'thr':>7s} {'stale':>5s} {'skip':>7s} {'acc':>7s} {'jitter/min':>10s} {'agree':>7s}")
+    for r in rows:
+        acc = "-" if r["accuracy"] is None or not manual_events else f"{float(r['accuracy']):.4f}"  # type: ignore[arg-type]
+        jit = "-" if r["jitter_flips_per_min"] is None else f"{float(r['jitter_flips_per_min']):.2f}"  # type: ignore[arg-type]
+        agr = "-" if r["label_agreement_vs_ungated"] is None else f"{float(r['label_agreement_vs_ungated']):.4f}"  # type: ignore[arg-type]
+        print(f"{r['threshold']:7g} {r['max_stale']:5d} {float(r['skip_fraction']):7.1%} {acc:>7s} {jit:>10s} {agr:>7s}")  # type: ignore[arg-type]
+    print(f"\nWrote: {out_dir / 'change_gate_tradeoff.csv'}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -2,7 +2,9 @@
 
 This is intended for quick workspace cleanup on Windows.
 
-- Reads `checkpoint_last.pt` (preferred) to extract `ckpt["args"]`.
+- Reads run args from the run registry (outputs/run_registry.jsonl); legacy runs are
+  indexed by unpickling `checkpoint_last.pt` for `ckpt["args"]` (saved to the registry
+  only with --update-registry or by tools/diagnostics/index_runs.py).
 - Builds a stable signature from a selected subset of args ("same knobs").
 - Groups runs by signature and marks all but one per group as redundant.
 - Keeps any run explicitly requested, plus runs referenced in markdown files.
@@ -26,6 +28,12 @@ from dataclasses import dataclass
 from pathlib import Path
 from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
 
+REPO_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(REPO_ROOT))
+
+from src.fer.utils.checkpoint_io import load_checkpoint_args  # noqa: E402
+from src.fer.utils.run_registry import RunEntry, default_registry_path, refresh_registry  # noqa: E402
+
 
 def _norm_path(p: Any) -> Optional[str]:
     if p is None:
@@ -203,18 +211,6 @@ def _extract_md_keeps(md_paths: Sequence[Path]) -> List[str]:
     return sorted(set(keep))
 
 
-def _torch_load_checkpoint(path: Path) -> Optional[Dict[str, Any]]:
-    try:
-        import torch  # type: ignore
-
-        try:
-            return torch.load(path, map_location="cpu", weights_only=False)
-        except TypeError:
-            return torch.load(path, map_location="cpu")
-    except Exception:
-        return None
-
-
 @dataclass
 class RunInfo:
     run_dir: Path
@@ -240,7 +236,75 @@ def _read_macro_f1(run_dir: Path) -> Optional[float]:
         return None
 
 
-def _collect_kd_runs(kd_root: Path, keys: Tuple[str, ...]) -> List[RunInfo]:
+def _args_from_history_head(head: Dict[str, Any]) -> Dict[str, Any]:
+    # Fallback: infer minimal signature from history.json (nl/negl only)
+    args_dict: Dict[str, Any] = {
+        "mode": "kd",
+        "model": None,
+        "image_size": None,
+        "seed": None,
+    }
+    if isinstance(head.get("nl"), dict):
+        nl = head["nl"]
+        args_dict.update(
+            {
+                "use_nl": bool(nl.get("enabled")),
+                "nl_kind": nl.get("kind"),
+                "nl_embed": nl.get("embed"),
+                "nl_dim": nl.get("dim"),
+                "nl_momentum": nl.get("momentum"),
+                "nl_proto_gate": nl.get("proto_gate"),
+                "nl_consistency_thresh": nl.get("consistency_thresh"),
+                "nl_topk_frac": nl.get("topk_frac"),
+                "nl_weight": nl.get("weight"),
+            }
+        )
+    if isinstance(head.get("negl"), dict):
+        negl = head["negl"]
+        args_dict.update(
+            {
+                "use_negl": bool(negl.get("enabled")),
+                "negl_weight": negl.get("weight"),
+                "negl_ratio": negl.get("ratio"),
+                "negl_gate": negl.get("gate"),
+                "negl_entropy_thresh": negl.get("entropy_thresh"),
+            }
+        )
+    return args_dict
+
+
+def _run_args_from_files(d: Path) -> Dict[str, Any]:
+    ckpt_path = d / "checkpoint_last.pt"
+    if ckpt_path.exists():
+        try:
+            args_dict = load_checkpoint_args(ckpt_path)  # sidecar JSON when present
+        except Exception:
+            args_dict = {}
+        if args_dict:
+            return args_dict
+    hist = _safe_load_json(d / "history.json")
+    if isinstance(hist, list) and hist and isinstance(hist[0], dict):
+        return _args_from_history_head(hist[0])
+    return {}
+
+
+def _run_args_from_entry(entry: Optional[RunEntry]) -> Dict[str, Any]:
+    if entry is None:
+        return {}
+    if entry.args is not None:
+        return dict(entry.args)
+    if entry.history_head is not None:
+        return _args_from_history_head(entry.history_head)
+    return {}
+
+
+def _collect_kd_runs(
+    kd_root: Path,
+    keys: Tuple[str, ...],
+    *,
+    entries: Optional[Dict[Path, RunEntry]] = None,
+) -> List[RunInfo]:
+    """Collect KD runs; with `entries` (registry, keyed by resolved run dir) no checkpoint is loaded."""
     runs: List[RunInfo] = []
     for d in sorted(kd_root.iterdir() if kd_root.exists() else []):
         if not d.is_dir():
@@ -248,49 +312,13 @@ def _collect_kd_runs(kd_root: Path, keys: Tuple[str, ...]) -> List[RunInfo]:
         if "_KD_" not in d.name:
             continue
 
-        ckpt_path = d / "checkpoint_last.pt"
-        args_dict: Dict[str, Any] = {}
-
-        ckpt = _torch_load_checkpoint(ckpt_path) if ckpt_path.exists() else None
-        if isinstance(ckpt, dict) and isinstance(ckpt.get("args"), dict):
-            args_dict = dict(ckpt["args"])  # shallow copy
+        if entries is not None:
+            entry = entries.get(d.resolve())
+            args_dict = _run_args_from_entry(entry)
+            macro_f1 = entry.metric("reliabilitymetrics.json", "raw", "macro_f1") if entry is not None else None
         else:
-            # Fallback: infer minimal signature from history.json (nl/negl only)
-            hist = _safe_load_json(d / "history.json")
-            if isinstance(hist, list) and hist and isinstance(hist[0], dict):
-                args_dict = {
-                    "mode": "kd",
-                    "model": args_dict.get("model"),
-                    "image_size": args_dict.get("image_size"),
-                    "seed": args_dict.get("seed"),
-                }
-                first = hist[0]
-                if isinstance(first.get("nl"), dict):
-                    nl = first["nl"]
-                    args_dict.update(
-                        {
-                            "use_nl": bool(nl.get("enabled")),
-                            "nl_kind": nl.get("kind"),
-                            "nl_embed": nl.get("embed"),
-                            "nl_dim": nl.get("dim"),
-                            "nl_momentum": nl.get("momentum"),
-                            "nl_proto_gate": nl.get("proto_gate"),
-                            "nl_consistency_thresh": nl.get("consistency_thresh"),
-                            "nl_topk_frac": nl.get("topk_frac"),
-                            "nl_weight": nl.get("weight"),
-                        }
-                    )
-                if isinstance(first.get("negl"), dict):
-                    negl = first["negl"]
-                    args_dict.update(
-                        {
-                            "use_negl": bool(negl.get("enabled")),
-                            "negl_weight": negl.get("weight"),
-                            "negl_ratio": negl.get("ratio"),
-                            "negl_gate": negl.get("gate"),
-                            "negl_entropy_thresh": negl.get("entropy_thresh"),
-                        }
-                    )
+            args_dict = _run_args_from_files(d)
+            macro_f1 = _read_macro_f1(d)
 
         sig = _prune_irrelevant_signature_fields(_build_signature(args_dict, keys))
         skey = _signature_key(sig)
@@ -301,7 +329,7 @@ def _collect_kd_runs(kd_root: Path, keys: Tuple[str, ...]) -> List[RunInfo]:
                 mtime=d.stat().st_mtime,
                 signature=sig,
                 signature_key=skey,
-                raw_macro_f1=_read_macro_f1(d),
+                raw_macro_f1=macro_f1,
             )
         )
 
@@ -357,6 +385,22 @@ def main() -> int:
         default="knobs",
         help="How strict the duplicate detection is: 'knobs' ignores runtime knobs; 'full' is stricter.",
     )
+    ap.add_argument(
+        "--registry",
+        type=str,
+        default=None,
+        help="Run registry JSONL (default: <repo-root>/outputs/run_registry.jsonl).",
+    )
+    ap.add_argument(
+        "--no-registry",
+        action="store_true",
+        help="Ignore the run registry and load every checkpoint (slow; previous behavior).",
+    )
+    ap.add_argument(
+        "--update-registry",
+        action="store_true",
+        help="Append newly indexed runs to the registry (default: read it without writing).",
+    )
     args = ap.parse_args()
 
     repo_root = Path(args.repo_root).resolve()
@@ -375,7 +419,12 @@ def main() -> int:
     forced_keep_names.update(_extract_md_keeps(md_paths))
 
     keys = _SIGNATURE_KEYS_KNOBS if args.signature_level == "knobs" else _SIGNATURE_KEYS_FULL
-    runs = _collect_kd_runs(kd_root, keys)
+    entries: Optional[Dict[Path, RunEntry]] = None
+    if not args.no_registry:
+        registry = Path(args.registry) if args.registry else default_registry_path(repo_root)
+        folded = refresh_registry(registry, [kd_root], repo_root=repo_root, persist=bool(args.update_registry))
+        entries = {e.run_dir.resolve(): e for e in folded.values()}
+    runs = _collect_kd_runs(kd_root, keys, entries=entries)
     by_sig: Dict[str, List[RunInfo]] = {}
     for r in runs:
         by_sig.setdefault(r.signature_key, []).append(r)
@@ -0,0 +1,79 @@
+"""Build/refresh the run registry (outputs/run_registry.jsonl) and list indexed runs.
+
+Trainers append to the registry at run start and every checkpoint; this tool indexes
+legacy runs (incrementally, keyed by artifact size/mtime) and can compact the log.
+
+Usage (PowerShell):
+  .\.venv\Scripts\python.exe tools\diagnostics\index_runs.py
+  .\.venv\Scripts\python.exe tools\diagnostics\index_runs.py --root outputs\students --list
+  .\.venv\Scripts\python.exe tools\diagnostics\index_runs.py --compact
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(REPO_ROOT))
+
+from src.fer.utils.run_registry import (  # noqa: E402
+    compact_registry,
+    default_registry_path,
+    entries_under,
+    refresh_registry,
+)
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Index outputs/ runs into the run registry.")
+    ap.add_argument(
+        "--root",
+        type=Path,
+        action="append",
+        default=None,
+        help="Folder to index (repeatable; default: outputs).",
+    )
+    ap.add_argument("--registry", type=Path, default=None, help="Default: outputs/run_registry.jsonl")
+    ap.add_argument(
+        "--no-checkpoint-args",
+        action="store_true",
+        help="Do not unpickle checkpoint_last.pt of legacy runs to recover their args.",
+    )
+    ap.add_argument("--compact", action="store_true", help="Rewrite the log as one record per run (no trainers running).")
+    ap.add_argument("--list", action="store_true", help="Print one line per indexed run under --root.")
+    args = ap.parse_args()
+
+    registry = args.registry or default_registry_path(REPO_ROOT)
+    roots = args.root or [REPO_ROOT / "outputs"]
+    roots = [r if r.is_absolute() else (REPO_ROOT / r) for r in roots]
+
+    t0 = time.perf_counter()
+    entries = refresh_registry(
+        registry,
+        roots,
+        repo_root=REPO_ROOT,
+        load_checkpoint_args=not bool(args.no_checkpoint_args),
+        persist=True,
+    )
+    print(f"registry: {registry} ({len(entries)} runs, {time.perf_counter() - t0:.2f}s)")
+
+    if args.compact:
+        n = compact_registry(registry, repo_root=REPO_ROOT)
+        print(f"compacted: {n} records")
+
+    if args.list:
+        for root in roots:
+            for e in entries_under(entries, root):
+                mf1 = e.metric("reliabilitymetrics.json", "raw", "macro_f1")
+                if mf1 is None:
+                    mf1 = e.metric("ensemble_metrics.json", "macro_f1")
+                mf1_s = "-" if mf1 is None else f"{mf1:.4f}"
+                print(f"{e.key}\tkind={e.kind or '-'}\targs={e.args_hash or '-'}\tmacro_f1={mf1_s}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -6,6 +6,10 @@ It prints:
 - how many duplicate groups exist at the given signature level
 - which signature fields vary the most
 
+Run args come from the run registry (outputs/run_registry.jsonl); checkpoints are only
+unpickled for legacy runs that are not indexed yet (or with --no-registry). The registry
+is read-only unless --update-registry is given.
+
 Usage:
   python tools/diagnostics/inspect_kd_signature_variation.py --signature-level knobs
 """
@@ -14,9 +18,16 @@ from __future__ import annotations
 
 import argparse
 import json
+import sys
 from collections import Counter, defaultdict
 from pathlib import Path
-from typing import Any, Dict, Iterable, List, Tuple
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(REPO_ROOT))
+
+from src.fer.utils.checkpoint_io import load_checkpoint_args  # noqa: E402
+from src.fer.utils.run_registry import default_registry_path, refresh_registry  # noqa: E402
 
 
 def _norm_path(p: Any) -> str | None:
@@ -84,18 +95,6 @@ def _signature_key(sig: Dict[str, Any]) -> str:
     return json.dumps(sig, sort_keys=True, separators=(",", ":"))
 
 
-def _torch_load_checkpoint(path: Path) -> Dict[str, Any] | None:
-    try:
-        import torch  # type: ignore
-
-        try:
-            return torch.load(path, map_location="cpu", weights_only=False)
-        except TypeError:
-            return torch.load(path, map_location="cpu")
-    except Exception:
-        return None
-
-
 def _iter_kd_run_dirs(kd_root: Path) -> Iterable[Path]:
     for d in sorted(kd_root.iterdir() if kd_root.exists() else []):
         if d.is_dir() and "_KD_" in d.name:
@@ -108,6 +107,13 @@ def main() -> int:
     ap.add_argument("--kd-root", type=str, default="outputs/students/KD")
     ap.add_argument("--signature-level", choices=["knobs", "full"], default="knobs")
     ap.add_argument("--top", type=int, default=20)
+    ap.add_argument("--registry", type=str, default=None, help="Default: <repo-root>/outputs/run_registry.jsonl")
+    ap.add_argument("--no-registry", action="store_true", help="Load every checkpoint instead of the registry.")
+    ap.add_argument(
+        "--update-registry",
+        action="store_true",
+        help="Append newly indexed runs to the registry (default: read it without writing).",
+    )
     args = ap.parse_args()
 
     repo_root = Path(args.repo_root).resolve()
@@ -121,12 +127,25 @@ def main() -> int:
     sigs: List[Dict[str, Any]] = []
     names: List[str] = []
 
+    registry_args: Optional[Dict[Path, Dict[str, Any]]] = None
+    if not args.no_registry:
+        registry = Path(args.registry) if args.registry else default_registry_path(repo_root)
+        entries = refresh_registry(registry, [kd_root], repo_root=repo_root, persist=bool(args.update_registry))
+        registry_args = {e.run_dir.resolve(): e.args for e in entries.values() if e.args is not None}
+
     for d in _iter_kd_run_dirs(kd_root):
-        ckpt_path = d / "checkpoint_last.pt"
-        ckpt = _torch_load_checkpoint(ckpt_path) if ckpt_path.exists() else None
-        if not isinstance(ckpt, dict) or not isinstance(ckpt.get("args"), dict):
-            continue
-        args_dict = dict(ckpt["args"])
+        if registry_args is not None:
+            if d.resolve() not in registry_args:
+                continue
+            args_dict = dict(registry_args[d.resolve()])
+        else:
+            ckpt_path = d / "checkpoint_last.pt"
+            try:
+                args_dict = load_checkpoint_args(ckpt_path) if ckpt_path.exists() else {}
+            except Exception:
+                args_dict = {}
+            if not args_dict:
+                continue
         sig = _build_signature(args_dict, keys)
         sigs.append(sig)
         sig_keys.append(_signature_key(sig))
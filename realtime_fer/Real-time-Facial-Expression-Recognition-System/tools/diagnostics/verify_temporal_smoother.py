@@ -0,0 +1,131 @@
+"""Verify TemporalSmoother against the reference list/Counter smoothing on recorded sessions.
+
+Replays the logged per-frame probabilities (`prob_*` columns of demo per_frame.csv) through:
+- the reference loop from demo/realtime_demo.py (EMA list comprehension, `_apply_hysteresis`,
+  `deque` + `_vote_smooth`), and
+- `src.fer.realtime.smoothing.TemporalSmoother`,
+for a few smoothing settings, and requires identical EMA values and voted labels on every frame.
+
+Frames without a detected face (all probabilities logged as 0) are skipped, as in the demo.
+
+Usage (PowerShell):
+  .\.venv\Scripts\python.exe tools\diagnostics\verify_temporal_smoother.py
+  .\.venv\Scripts\python.exe tools\diagnostics\verify_temporal_smoother.py --glob "demo/outputs/*/per_frame.csv"
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import glob
+import sys
+from collections import deque
+from pathlib import Path
+from typing import Deque, List, Optional, Tuple
+
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(REPO_ROOT))
+
+import demo.realtime_demo as rd  # noqa: E402
+from src.fer.data.manifest_dataset import CANONICAL_7  # noqa: E402
+from src.fer.realtime.smoothing import TemporalSmoother  # noqa: E402
+
+
+# (ema_alpha, hysteresis_delta, vote_window, vote_min_count)
+SETTINGS: List[Tuple[float, float, int, int]] = [
+    (0.70, 0.08, 15, 8),
+    (0.50, 0.00, 9, 3),
+    (0.90, 0.20, 31, 10),
+    (0.00, 0.04, 1, 1),
+    (0.85, 0.02, 6, 2),
+]
+
+
+def _read_face_probs(path: Path) -> List[List[float]]:
+    cols = [f"prob_{name}" for name in CANONICAL_7]
+    out: List[List[float]] = []
+    with path.open("r", newline="", encoding="utf-8") as f:
+        for d in csv.DictReader(f):
+            try:
+                probs = [float(d.get(c) or 0.0) for c in cols]
+            except ValueError:
+                continue
+            if any(p != 0.0 for p in probs):
+                out.append(probs)
+    return out
+
+
+def _reference(
+    seq: List[List[float]], alpha: float, delta: float, window: int, min_count: int
+) -> Tuple[List[Optional[int]], List[List[float]]]:
+    ema_probs: Optional[List[float]] = None
+    hyster_idx: Optional[int] = None
+    votes: Deque[int] = deque(maxlen=window)
+    preds: List[Optional[int]] = []
+    emas: List[List[float]] = []
+    for probs in seq:
+        if ema_probs is None:
+            ema_probs = list(probs)
+        else:
+            a = float(alpha)
+            ema_probs = [a * e + (1.0 - a) * p for e, p in zip(ema_probs, probs)]
+        hyster_idx = rd._apply_hysteresis(ema_probs, hyster_idx, delta)
+        votes = deque(votes, maxlen=window)
+        if hyster_idx is not None:
+            votes.append(int(hyster_idx))
+        preds.append(rd._vote_smooth(votes, window=window, min_count=min_count))
+        emas.append(ema_probs)
+    return preds, emas
+
+
+def _verify_one(seq: List[List[float]], setting: Tuple[float, float, int, int]) -> Optional[int]:
+    """Return the first mismatching frame index (within face frames), or None."""
+    alpha, delta, window, min_count = setting
+    ref_preds, ref_emas = _reference(seq, alpha, delta, window, min_count)
+    sm = TemporalSmoother(len(CANONICAL_7), vote_window=window)
+    for i, probs in enumerate(seq):
+        pred = sm.update(
+            probs,
+            ema_alpha=alpha,
+            hysteresis_delta=delta,
+            vote_window=window,
+            vote_min_count=min_count,
+        )
+        ema = sm.ema_probs()
+        if pred != ref_preds[i] or ema is None or ema.tolist() != ref_emas[i]:
+            return i
+    return None
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Bit-exact check of TemporalSmoother vs reference smoothing.")
+    ap.add_argument(
+        "--glob",
+        action="append",
+        default=None,
+        help="Glob(s) for per_frame.csv files (default: demo/outputs/*/per_frame.csv).",
+    )
+    args = ap.parse_args()
+
+    patterns = args.glob or [str(REPO_ROOT / "demo" / "outputs" / "*" / "per_frame.csv")]
+    paths = sorted({Path(m) for pat in patterns for m in glob.glob(pat, recursive=True)})
+    if not paths:
+        raise SystemExit(f"No per_frame.csv files matched: {patterns}")
+
+    failures = 0
+    for path in paths:
+        seq = _read_face_probs(path)
+        for setting in SETTINGS:
+            bad = _verify_one(seq, setting)
+            status = "OK" if bad is None else f"MISMATCH at face-frame {bad}"
+            if bad is not None:
+                failures += 1
+            print(f"{path} frames={len(seq)} setting={setting}: {status}")
+
+    print(f"\nchecked={len(paths) * len(SETTINGS)} failures={failures}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
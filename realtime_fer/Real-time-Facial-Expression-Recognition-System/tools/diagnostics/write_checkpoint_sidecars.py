@@ -0,0 +1,62 @@
+"""Backfill `<stem>.meta.json` + `<stem>.weights.pt` sidecars for existing checkpoints.
+
+New checkpoints get sidecars from the trainers; this converts legacy `.pt` files once so
+demo startup and tooling can read args/weights without unpickling optimizer state.
+The original checkpoints are not modified.
+
+Usage (PowerShell):
+  .\.venv\Scripts\python.exe tools\diagnostics\write_checkpoint_sidecars.py
+  .\.venv\Scripts\python.exe tools\diagnostics\write_checkpoint_sidecars.py --root outputs\students --force
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(REPO_ROOT))
+
+from src.fer.utils.checkpoint_io import read_checkpoint_meta, torch_load_full, write_sidecars  # noqa: E402
+
+
+_CHECKPOINT_NAMES = ("checkpoint_last.pt", "best.pt")
+
+
+def _iter_checkpoints(root: Path):
+    for p in sorted(root.rglob("*.pt")):
+        if p.name.endswith(".weights.pt"):
+            continue
+        if p.name in _CHECKPOINT_NAMES or p.name.startswith("checkpoint_epoch"):
+            yield p
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Write lightweight sidecars for existing checkpoints.")
+    ap.add_argument("--root", type=Path, default=REPO_ROOT / "outputs", help="Folder to scan (default: outputs)")
+    ap.add_argument("--force", action="store_true", help="Rewrite sidecars even when they are up to date.")
+    args = ap.parse_args()
+
+    written = skipped = failed = 0
+    for ckpt_path in _iter_checkpoints(args.root):
+        if not args.force and read_checkpoint_meta(ckpt_path) is not None:
+            skipped += 1
+            continue
+        try:
+            ckpt = torch_load_full(ckpt_path)
+            if not isinstance(ckpt, dict):
+                raise ValueError("not a checkpoint dict")
+            write_sidecars(ckpt, ckpt_path)
+            written += 1
+            print(f"Wrote sidecars: {ckpt_path}")
+        except Exception as e:
+            failed += 1
+            print(f"WARN: {ckpt_path}: {e}")
+
+    print(f"written={written} up_to_date={skipped} failed={failed}")
+    return 0 if failed == 0 else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
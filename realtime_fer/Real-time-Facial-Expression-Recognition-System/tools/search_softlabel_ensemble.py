@@ -0,0 +1,321 @@
+"""Search ensemble weights/temperatures over cached per-teacher validation logits.
+
+Input: one or more export dirs written by
+  scripts/export_softlabels.py --split val --save-members ...
+(softlabels_members.npy [K, N, 7] + softlabels_index.jsonl + export_meta.json). Members
+from several dirs are stacked into one (teachers x samples x classes) array, so no
+teacher is re-run during the search.
+
+Every candidate is scored vectorized over a chunk of combinations at once: combined
+logits sum_k w_k * L_k / T_k, then softmax NLL, accuracy and macro-F1 from batched
+confusion matrices. Search:
+  grid:  simplex grid over weights (--weight-steps) x per-teacher temperature grid
+  coord: coordinate ascent, one teacher's (weight, temperature) at a time (many teachers)
+  auto:  grid when it has at most --max-grid combinations, else coord
+The winner is rescaled by the NLL-optimal global temperature (argmax is unchanged) and
+written as a config for scripts/export_softlabels.py --config.
+
+Usage (PowerShell):
+  .\.venv\Scripts\python.exe scripts\export_softlabels.py --split val --save-members --teacher outputs\teachers\A\best.pt --teacher outputs\teachers\B\best.pt --out-dir outputs\softlabels\_val_AB
+  .\.venv\Scripts\python.exe tools\search_softlabel_ensemble.py --members outputs\softlabels\_val_AB --out-dir outputs\softlabels\_search_AB
+  .\.venv\Scripts\python.exe scripts\export_softlabels.py --config outputs\softlabels\_search_AB\best_config.json --out-dir outputs\softlabels\AB_search
+"""
+
+from __future__ import annotations
+
+import argparse
+import itertools
+import json
+import math
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+import torch
+
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+from scripts.train_teacher import fit_temperature  # noqa: E402
+from src.fer.data.manifest_dataset import CANONICAL_7, LABEL_TO_INDEX  # noqa: E402
+
+OBJECTIVES = ("macro_f1", "accuracy", "nll")
+
+
+def _read_index(path: Path) -> Tuple[List[str], List[int]]:
+    paths: List[str] = []
+    labels: List[int] = []
+    with path.open("r", encoding="utf-8") as f:
+        for ln in f:
+            ln = ln.strip()
+            if not ln:
+                continue
+            rec = json.loads(ln)
+            paths.append(str(rec["image_path"]))
+            labels.append(int(LABEL_TO_INDEX[str(rec["label"])]))
+    return paths, labels
+
+
+def load_members(dirs: Sequence[Path]) -> Tuple[torch.Tensor, torch.Tensor, List[Dict[str, object]], str]:
+    """Stack softlabels_members.npy of several export dirs -> (L [K,N,C], y [N], teachers, tta)."""
+    blocks: List[np.ndarray] = []
+    teachers: List[Dict[str, object]] = []
+    ref_paths: List[str] = []
+    ref_labels: List[int] = []
+    tta = None
+    for d in dirs:
+        members_path = d / "softlabels_members.npy"
+        if not members_path.exists():
+            raise SystemExit(f"{members_path} not found (export with --save-members)")
+        meta = json.loads((d / "export_meta.json").read_text(encoding="utf-8"))
+        if meta.get("split") != "val":
+            print(f"WARNING: {d} was exported on split={meta.get('split')!r}; weights fit there may overfit.")
+        if tta is not None and meta.get("tta") != tta:
+            raise SystemExit(f"TTA differs between export dirs ({tta!r} vs {meta.get('tta')!r})")
+        tta = str(meta.get("tta") or "none")
+        paths, labels = _read_index(d / "softlabels_index.jsonl")
+        if not ref_paths:
+            ref_paths, ref_labels = paths, labels
+        elif paths != ref_paths:
+            raise SystemExit(f"{d} covers different rows (or order) than {dirs[0]}; export with the same manifest/split")
+        arr = np.load(members_path, mmap_mode="r")
+        if arr.shape[0] != len(meta.get("teachers") or []) or arr.shape[1] != len(paths):
+            raise SystemExit(f"{members_path} shape {arr.shape} does not match export_meta.json / index")
+        blocks.append(np.asarray(arr, dtype=np.float32))
+        for t in meta["teachers"]:
+            teachers.append({"checkpoint": t["checkpoint"], "image_size": t.get("image_size"), "source_dir": str(d)})
+    logits = torch.from_numpy(np.concatenate(blocks, axis=0))
+    y = torch.tensor(ref_labels, dtype=torch.int64)
+    return logits, y, teachers, str(tta)
+
+
+def score_combinations(logits: torch.Tensor, y: torch.Tensor, coef: torch.Tensor, *, chunk: int = 256) -> Dict[str, torch.Tensor]:
+    """Metrics for M combinations; coef [M, K] holds w_k / T_k. Returns tensors of shape [M]."""
+    k, n, c = logits.shape
+    flat = logits.reshape(k, n * c)
+    idx_base = y * c
+    out: Dict[str, List[torch.Tensor]] = {"macro_f1": [], "accuracy": [], "nll": []}
+    for lo in range(0, int(coef.shape[0]), max(1, int(chunk))):
+        a = coef[lo : lo + chunk]
+        m = int(a.shape[0])
+        z = (a @ flat).view(m, n, c)
+        nll = -(z.log_softmax(dim=2).gather(2, y.view(1, n, 1).expand(m, n, 1)).squeeze(2).mean(dim=1))
+        pred = z.argmax(dim=2)
+        # Batched confusion matrices: one bincount over (combo, true, pred) cells.
+        cell = torch.arange(m).view(m, 1) * (c * c) + idx_base.view(1, n) + pred
+        cm = torch.bincount(cell.reshape(-1), minlength=m * c * c).view(m, c, c).float()
+        tp = cm.diagonal(dim1=1, dim2=2)
+        fp = cm.sum(dim=1) - tp
+        fn = cm.sum(dim=2) - tp
+        f1 = (2 * tp) / (2 * tp + fp + fn).clamp_min(1e-12)
+        # Mean over all classes (absent ones count as 0), as in train_teacher.f1_from_confusion.
+        out["macro_f1"].append(f1.mean(dim=1))
+        out["accuracy"].append(tp.sum(dim=1) / float(n))
+        out["nll"].append(nll)
+    return {key: torch.cat(v) for key, v in out.items()}
+
+
+def _objective(scores: Dict[str, torch.Tensor], objective: str) -> torch.Tensor:
+    # Higher is better; NLL breaks F1/accuracy ties.
+    if objective == "nll":
+        return -scores["nll"]
+    return scores[objective] - 1e-6 * scores["nll"]
+
+
+def simplex_grid(k: int, steps: int) -> torch.Tensor:
+    """All weight vectors with entries in {0, 1/steps, ..., 1} summing to 1 (at least one > 0)."""
+    rows = [c for c in itertools.product(range(steps + 1), repeat=k) if sum(c) == steps]
+    return torch.tensor(rows, dtype=torch.float32) / float(steps)
+
+
+def search_grid(
+    logits: torch.Tensor, y: torch.Tensor, *, weights: torch.Tensor, temps: Sequence[float], chunk: int
+) -> Tuple[torch.Tensor, torch.Tensor, Dict[str, torch.Tensor]]:
+    """Exhaustive simplex x temperature grid -> (W [M,K], T [M,K], scores)."""
+    k = int(logits.shape[0])
+    t_grid = torch.tensor(list(itertools.product(list(temps), repeat=k)), dtype=torch.float32)
+    w_all = weights.repeat(int(t_grid.shape[0]), 1)
+    t_all = t_grid.repeat_interleave(int(weights.shape[0]), dim=0)
+    return w_all, t_all, score_combinations(logits, y, w_all / t_all, chunk=chunk)
+
+
+def search_coordinate(
+    logits: torch.Tensor,
+    y: torch.Tensor,
+    *,
+    weight_values: Sequence[float],
+    temps: Sequence[float],
+    objective: str,
+    chunk: int,
+    max_rounds: int = 10,
+) -> Tuple[torch.Tensor, torch.Tensor, Dict[str, torch.Tensor]]:
+    """Coordinate ascent from equal weights / T=1; returns every evaluated candidate."""
+    k = int(logits.shape[0])
+    w = torch.full((k,), 1.0 / k)
+    t = torch.ones((k,))
+    pairs = torch.tensor(list(itertools.product(list(weight_values), list(temps))), dtype=torch.float32)
+    seen_w: List[torch.Tensor] = [w.view(1, k)]
+    seen_t: List[torch.Tensor] = [t.view(1, k)]
+    seen_s: List[Dict[str, torch.Tensor]] = [score_combinations(logits, y, (w / t).view(1, k), chunk=chunk)]
+    best = float(_objective(seen_s[0], objective)[0])
+    for _ in range(int(max_rounds)):
+        improved = False
+        for i in range(k):
+            cw = w.repeat(pairs.shape[0], 1)
+            ct = t.repeat(pairs.shape[0], 1)
+            cw[:, i] = pairs[:, 0]
+            ct[:, i] = pairs[:, 1]
+            keep = cw.sum(dim=1) > 0
+            cw, ct = cw[keep], ct[keep]
+            cw = cw / cw.sum(dim=1, keepdim=True)
+            s = score_combinations(logits, y, cw / ct, chunk=chunk)
+            seen_w.append(cw)
+            seen_t.append(ct)
+            seen_s.append(s)
+            obj = _objective(s, objective)
+            j = int(obj.argmax())
+            if float(obj[j]) > best + 1e-9:
+                best = float(obj[j])
+                w, t = cw[j].clone(), ct[j].clone()
+                improved = True
+        if not improved:
+            break
+    scores = {key: torch.cat([s[key] for s in seen_s]) for key in seen_s[0]}
+    return torch.cat(seen_w), torch.cat(seen_t), scores
+
+
+def _floats(s: str) -> List[float]:
+    return [float(v) for v in s.split(",") if v.strip()]
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Search ensemble weights/temperatures over cached teacher val logits.")
+    ap.add_argument(
+        "--members",
+        type=Path,
+        action="append",
+        required=True,
+        help="export_softlabels.py --split val --save-members output dir (repeatable)",
+    )
+    ap.add_argument("--out-dir", type=Path, required=True)
+    ap.add_argument("--objective", type=str, choices=list(OBJECTIVES), default="macro_f1")
+    ap.add_argument("--search", type=str, choices=["auto", "grid", "coord"], default="auto")
+    ap.add_argument("--weight-steps", type=int, default=10, help="Simplex grid resolution (weights in 1/steps)")
+    ap.add_argument("--temperatures", type=str, default="0.5,0.75,1,1.5,2,3", help="Per-teacher temperature grid")
+    ap.add_argument("--max-grid", type=int, default=2_000_000, help="auto: largest grid before switching to coord")
+    ap.add_argument("--chunk", type=int, default=256, help="Combinations scored per vectorized batch")
+    ap.add_argument("--threads", type=int, default=0, help="torch CPU threads (0 = all cores)")
+    ap.add_argument("--top", type=int, default=20, help="Candidates kept in search_results.json")
+    ap.add_argument("--no-calibrate", action="store_true", help="Skip the final NLL-optimal global temperature")
+    args = ap.parse_args()
+
+    torch.set_num_threads(int(args.threads) if int(args.threads) > 0 else (os.cpu_count() or 1))
+    logits, y, teachers, tta = load_members(list(args.members))
+    k, n, c = logits.shape
+    if c != len(CANONICAL_7):
+        raise SystemExit(f"Expected {len(CANONICAL_7)} classes, got {c}")
+    temps = _floats(args.temperatures)
+    steps = max(1, int(args.weight_steps))
+    print(f"Loaded {k} teacher(s) x {n} val rows (tta={tta}) | threads={torch.get_num_threads()}")
+
+    t0 = time.perf_counter()
+    grid_size = math.comb(steps + k - 1, k - 1) * len(temps) ** k
+    mode = args.search
+    if mode == "auto":
+        mode = "grid" if grid_size <= int(args.max_grid) else "coord"
+    if mode == "grid":
+        w_all, t_all, scores = search_grid(logits, y, weights=simplex_grid(k, steps), temps=temps, chunk=int(args.chunk))
+    else:
+        w_all, t_all, scores = search_coordinate(
+            logits,
+            y,
+            weight_values=[i / steps for i in range(steps + 1)],
+            temps=temps,
+            objective=args.objective,
+            chunk=int(args.chunk),
+        )
+    search_sec = time.perf_counter() - t0
+    n_eval = int(w_all.shape[0])
+    print(f"Search ({mode}): {n_eval} combinations in {search_sec:.1f}s ({n_eval / max(1e-9, search_sec):.0f}/s)")
+
+    obj = _objective(scores, args.objective)
+    order = torch.argsort(obj, descending=True)[: max(1, int(args.top))]
+    best_w, best_t = w_all[order[0]], t_all[order[0]]
+
+    # Global rescale: NLL-optimal temperature of the winning ensemble (predictions unchanged).
+    scale = 1.0
+    if not args.no_calibrate:
+        scale = fit_temperature(torch.einsum("k,knc->nc", best_w / best_t, logits), y, init_t=1.0)
+    final_t = best_t * scale
+    final = score_combinations(logits, y, (best_w / final_t).view(1, k))
+
+    def _row(i: int) -> Dict[str, object]:
+        return {
+            "weights": [round(float(v), 6) for v in w_all[i]],
+            "temperatures": [float(v) for v in t_all[i]],
+            **{key: float(scores[key][i]) for key in scores},
+        }
+
+    eye = torch.eye(k)
+    members = score_combinations(logits, y, eye)
+    equal = score_combinations(logits, y, torch.full((1, k), 1.0 / k))
+    results = {
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "members_dirs": [str(d) for d in args.members],
+        "teachers": teachers,
+        "tta": tta,
+        "n": int(n),
+        "objective": args.objective,
+        "search": mode,
+        "combinations": n_eval,
+        "search_sec": round(search_sec, 3),
+        "global_scale": float(scale),
+        "best": {
+            "weights": [round(float(v), 6) for v in best_w],
+            "temperatures": [round(float(v), 6) for v in final_t],
+            **{key: float(final[key][0]) for key in final},
+        },
+        "equal_weights": {key: float(equal[key][0]) for key in equal},
+        "members": [
+            {"checkpoint": t["checkpoint"], **{key: float(members[key][i]) for key in members}}
+            for i, t in enumerate(teachers)
+        ],
+        "top": [_row(int(i)) for i in order],
+    }
+
+    config = {
+        "teachers": [
+            {"checkpoint": t["checkpoint"], "weight": round(float(w), 6), "temperature": round(float(tt), 6)}
+            for t, w, tt in zip(teachers, best_w, final_t)
+            if float(w) > 0
+        ],
+        "tta": tta,
+        "search": {
+            "objective": args.objective,
+            "val_macro_f1": results["best"]["macro_f1"],
+            "val_nll": results["best"]["nll"],
+            "results": str(args.out_dir / "search_results.json"),
+        },
+    }
+    args.out_dir.mkdir(parents=True, exist_ok=True)
+    (args.out_dir / "search_results.json").write_text(json.dumps(results, indent=2), encoding="utf-8")
+    (args.out_dir / "best_config.json").write_text(json.dumps(config, indent=2), encoding="utf-8")
+
+    for i, t in enumerate(teachers):
+        print(f"  member {i}: macro_f1 {float(members['macro_f1'][i]):.4f} | {t['checkpoint']}")
+    print(f"  equal weights: macro_f1 {float(equal['macro_f1'][0]):.4f} | nll {float(equal['nll'][0]):.4f}")
+    b = results["best"]
+    print(
+        f"  best: macro_f1 {b['macro_f1']:.4f} | acc {b['accuracy']:.4f} | nll {b['nll']:.4f} | "
+        f"w {[round(v, 3) for v in b['weights']]} | T {[round(v, 3) for v in b['temperatures']]}"
+    )
+    print(f"Wrote {args.out_dir / 'best_config.json'}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
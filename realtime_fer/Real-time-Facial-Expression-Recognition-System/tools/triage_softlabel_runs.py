@@ -1,12 +1,18 @@
 from __future__ import annotations
 
 import argparse
-import json
+import sys
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Dict, Iterable, List, Optional, Tuple
 
 
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+from src.fer.utils.run_registry import default_registry_path, entries_under, refresh_registry  # noqa: E402
+
+
 @dataclass(frozen=True)
 class Run:
     name: str
@@ -28,19 +34,25 @@ def _fget(m: Dict[str, object], key: str) -> Optional[float]:
 
 
 def load_runs(root: Path) -> List[Run]:
+    # Indexed via the run registry: only new/changed run dirs get their JSON re-read.
+    # Read-only: the refreshed view is not written back (tools/diagnostics/index_runs.py does that).
+    entries = refresh_registry(
+        default_registry_path(REPO_ROOT), [root], repo_root=REPO_ROOT, load_checkpoint_args=False
+    )
+    root_abs = root.resolve()
     runs: List[Run] = []
-    for metrics_path in root.rglob("ensemble_metrics.json"):
-        try:
-            m = json.loads(metrics_path.read_text(encoding="utf-8"))
-        except Exception:
+    for entry in entries_under(entries, root):
+        m = entry.metrics.get("ensemble_metrics.json")
+        if m is None or "ensemble_metrics.json" not in entry.artifacts:
             continue
 
         macro_f1 = _fget(m, "macro_f1")
         accuracy = _fget(m, "accuracy")
+        path = root / entry.run_dir.relative_to(root_abs)
         runs.append(
             Run(
-                name=metrics_path.parent.name,
-                path=metrics_path.parent,
+                name=path.name,
+                path=path,
                 macro_f1=-1.0 if macro_f1 is None else macro_f1,
                 accuracy=-1.0 if accuracy is None else accuracy,
                 nll=_fget(m, "nll"),